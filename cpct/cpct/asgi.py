@@ -0,0 +1,20 @@
+"""
+ASGI config for CPCT project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+"""
+
+import os
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cpct.settings")
+
+# get_asgi_application(), with a handler that can stream the lint result rows as they are produced
+django.setup(set_prefix=False)
+
+from profiles.streaming import StreamingASGIHandler  # noqa: E402
+
+application = StreamingASGIHandler()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/2.0/ref/settings/
 
 import os
 import sys
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'profiles.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     # 'django.contrib.sessions.middleware.SessionMiddleware',
@@ -75,6 +77,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'cpct.wsgi.application'
+ASGI_APPLICATION = 'cpct.asgi.application'
 
 
 # Database
@@ -87,6 +90,70 @@ DATABASES = {
     }
 }
 
+# Lint results are cached by SHA-256 of the uploaded file so repeat uploads (and the hash-first lookup
+# made by the upload page) skip parsing and linting. The file cache is shared by all gunicorn workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'cpct-cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 2000,
+        },
+    }
+}
+
+LINT_RESULT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# threads per process available to the async views for parsing and linting
+LINT_MAX_THREADS = 4
+
+# linting runs in this many worker processes per web process; a certificate that takes longer than
+# LINT_TIMEOUT seconds gets its worker killed, workers are replaced after LINT_MAX_JOBS_PER_WORKER jobs
+#
+# Sizing: every gunicorn worker (2 in the Procfile) starts a forkserver plus LINT_WORKERS lint processes,
+# each around 25 MB resident once the profiles are loaded, next to the ~50 MB web process itself. That is
+# about 2 * (50 + 25 + 25 * LINT_WORKERS) MB, so the 128M in manifest.yml only fits a single lint worker
+# per web process. Raise the memory in manifest.yml before raising this.
+LINT_WORKERS = 1
+LINT_TIMEOUT = 10
+LINT_MAX_JOBS_PER_WORKER = 500
+
+# lint jobs wait in a bounded queue per priority (see profiles.scheduler), a full queue answers 503 with
+# Retry-After. Each client gets LINT_CLIENT_BURST certificates at once and LINT_CLIENT_RATE per second.
+#
+# The queues and the client token buckets live in each gunicorn worker process, nothing is shared
+# between them. A client whose requests are spread over the workers gets up to LINT_CLIENT_RATE *
+# workers (2 in the Procfile) certificates per second, and as much burst. Scale these down with the
+# worker count if the limit has to hold across the whole app.
+LINT_QUEUE_LIMITS = {
+    'interactive': 32,
+    'batch': 256,
+    'background': 1024,
+}
+LINT_CLIENT_RATE = 2
+LINT_CLIENT_BURST = 20
+
+# zip, pem bundle and .p7b uploads, certificates past this many are not linted
+LINT_BUNDLE_MAX_CERTIFICATES = 500
+
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'cpct': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
@@ -21,6 +21,10 @@ from profiles.views import *
 urlpatterns = [
     url(r'^$', dashboard, name='dashboard'),
     url(r'^file/', upload_file, name='upload'),
+    url(r'^lookup/', lookup_result, name='lookup'),
+    url(r'^result/(?P<result_id>[0-9a-f]{64})/$', stored_result, name='result'),
+    url(r'^fragment/(?P<result_id>[0-9a-f]{64})/(?P<row_key>[0-9A-Za-z_.]+)/$', result_fragment, name='fragment'),
+    url(r'^metrics/?$', metrics_view, name='metrics'),
     url(r'^help/', help, name='help'),
     url(r'^privacy-policy/', privacy, name='privacy-policy'),
     url(r'^contact-us/', contact, name='contact-us'),
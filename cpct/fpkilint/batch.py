@@ -0,0 +1,282 @@
+"""
+Bulk linting outside the web app. Reads certificates from any mix of pem bundles, .p7b / .p7c files and
+der files (see fpkilint.cert_stream), lints them against one profile in a pool of worker processes and
+writes one JSON line per certificate, in input order.
+
+    cd cpct && python -m fpkilint.batch fbca/1.9/5-ee-signature.json certs/*.pem --workers 8 > results.jsonl
+
+Each line has the source file, the byte offset of the certificate in it, its sha256 and either the
+verdict and findings or an error. Only a bounded number of certificates are read ahead of the results
+being written, so memory stays flat however big the input is. With --revocation-index (see
+fpkilint.revocation) each result also says whether a local CRL has already revoked the certificate.
+"""
+from fpkilint.cert_stream import iter_certificates, iter_file_certificates
+from fpkilint.cert_utils import parse_certificate_or_tbs
+from fpkilint.html_output import load_all_profiles
+from fpkilint.lint_server import lint, VERDICT_PASS, VERDICT_WARN, VERDICT_FAIL, SEVERITY_INFO, SEVERITY_WARN, \
+    SEVERITY_FAIL
+from fpkilint.profile_conformance import compile_profile, is_cert_profile
+from fpkilint.revocation import RevocationIndex, RevocationIndexError
+import argparse
+import collections
+import functools
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+
+logger = logging.getLogger(__name__)
+
+BatchItem = collections.namedtuple('BatchItem', 'source offset der error metadata')
+BatchItem.__doc__ = """
+source: where the certificate came from, usually a file name
+offset: byte offset of the certificate in the source, or None
+der: certificate or tbs certificate der, None when it could not be read
+error: why it could not be read, None when there is der
+metadata: dict copied into the result, or None
+"""
+
+_verdict_names = {VERDICT_PASS: 'PASS', VERDICT_WARN: 'WARN', VERDICT_FAIL: 'FAIL'}
+_severity_names = {SEVERITY_INFO: 'INFO', SEVERITY_WARN: 'WARN', SEVERITY_FAIL: 'FAIL'}
+
+# certificates read ahead of the results, per worker
+_read_ahead = 16
+
+# set in each worker by init_worker
+_cert_profile = None
+_timeout = None
+_extra_lint = None
+_revocation_index = None
+
+
+class _LintTimeout(Exception):
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise _LintTimeout()
+
+
+def load_cert_profile(template):
+    """
+    :return: the compiled profile for template, for init_worker
+    """
+    return compile_profile(load_all_profiles()[template])
+
+
+def init_worker(cert_profile, timeout, extra_lint=None, revocation_index=None):
+    """
+    Pool initializer, sets up a worker process for lint_der.
+    :param extra_lint: extra_lint(cert), run after the profile checks; returns a list of more
+    (severity, code, message) findings and a dict of fields to add to the result
+    :param revocation_index: revocation index path, adds a 'revocation' field to each result
+    """
+    global _cert_profile, _timeout, _extra_lint, _revocation_index
+
+    # the parent handles ctrl-c and stops the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGALRM, _on_alarm)
+    _cert_profile = cert_profile
+    _timeout = timeout
+    _extra_lint = extra_lint
+    if revocation_index is not None:
+        # each worker maps the index itself, the pages are shared through the page cache
+        _revocation_index = RevocationIndex(revocation_index)
+
+
+def lint_der(der):
+    """
+    :return: result dict, verdict and findings or error
+    """
+    signal.setitimer(signal.ITIMER_REAL, _timeout)
+    try:
+        try:
+            cert = parse_certificate_or_tbs(der)
+        except _LintTimeout:
+            raise
+        except Exception as e:
+            return {'error': 'Could not be parsed: {}'.format(e)}
+
+        verdict, findings = lint(cert, _cert_profile)
+        fields = {}
+        if _extra_lint is not None:
+            extra_findings, fields = _extra_lint(cert)
+            findings.extend(extra_findings)
+            verdict = _get_verdict(verdict, extra_findings)
+
+        result = {'verdict': _verdict_names[verdict],
+                  'findings': [{'severity': _severity_names[severity], 'code': code, 'message': message}
+                               for severity, code, message in findings]}
+        result.update(fields)
+        if _revocation_index is not None:
+            result['revocation'] = dict(_revocation_index.get_status(cert)._asdict())
+
+        return result
+    except _LintTimeout:
+        return {'error': 'Linting took longer than {} seconds'.format(_timeout)}
+    except Exception as e:
+        logger.exception('Lint failed')
+        return {'error': '{}: {}'.format(type(e).__name__, e)}
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _get_verdict(verdict, findings):
+    for severity, code, message in findings:
+        if severity == SEVERITY_FAIL:
+            verdict = VERDICT_FAIL
+        elif severity == SEVERITY_WARN and verdict == VERDICT_PASS:
+            verdict = VERDICT_WARN
+
+    return verdict
+
+
+def _make_result(item, lint_result):
+    result = {'source': item.source, 'offset': item.offset}
+    if item.der is not None:
+        result['sha256'] = hashlib.sha256(item.der).hexdigest()
+    if item.metadata:
+        result['metadata'] = item.metadata
+    result.update(lint_result)
+
+    return result
+
+
+def iter_lint_batch(items, template, workers=None, timeout=10.0, extra_lint=None, revocation_index=None):
+    """
+    Lints certificates in worker processes. Items are only read from the iterable as results are
+    handed back, at most _read_ahead per worker are in flight.
+    :param items: iterable of BatchItem
+    :param template: profile template path, e.g. fbca/1.9/5-ee-signature.json
+    :param workers: worker process count, defaults to the cpu count
+    :param timeout: seconds allowed per certificate
+    :param extra_lint: see init_worker, must be picklable
+    :param revocation_index: see init_worker
+    :return: generator of (BatchItem, result dict) in input order
+    """
+    workers = workers or os.cpu_count() or 1
+    cert_profile = load_cert_profile(template)
+    pending = collections.deque()
+
+    with multiprocessing.Pool(workers, init_worker, (cert_profile, timeout, extra_lint, revocation_index)) as pool:
+        for item in items:
+            if item.der is None:
+                pending.append((item, None))
+            else:
+                pending.append((item, pool.apply_async(lint_der, (item.der,))))
+
+            while pending and (len(pending) >= workers * _read_ahead or pending[0][1] is None or
+                               pending[0][1].ready()):
+                yield _pop_result(pending)
+
+        while pending:
+            yield _pop_result(pending)
+
+
+def _pop_result(pending):
+    item, async_result = pending.popleft()
+    if async_result is None:
+        return item, _make_result(item, {'error': item.error})
+
+    return item, _make_result(item, async_result.get())
+
+
+def iter_file_items(paths):
+    """
+    :param paths: certificate file paths, - for stdin
+    :return: generator of BatchItem, one per certificate in each file, or one with the error for a file
+        that could not be read or has no certificates in it
+    """
+    for path in paths:
+        if path == '-':
+            entries = iter_certificates(sys.stdin.buffer)
+        else:
+            entries = iter_file_certificates(path)
+
+        found = False
+        try:
+            for entry in entries:
+                found = True
+                yield BatchItem(path, entry.offset, entry.der, entry.error, None)
+        except OSError as e:
+            yield BatchItem(path, None, None, str(e), None)
+            continue
+
+        if not found:
+            yield BatchItem(path, None, None, "No certificates found", None)
+
+
+def write_results(results, output):
+    """
+    Writes a JSON line per result to output.
+    :param results: iterable of (item, result dict), e.g. from iter_lint_batch
+    :return: {'PASS': n, 'WARN': n, 'FAIL': n, 'ERROR': n}
+    """
+    counts = collections.Counter({'PASS': 0, 'WARN': 0, 'FAIL': 0, 'ERROR': 0})
+
+    for item, result in results:
+        counts[result.get('verdict', 'ERROR')] += 1
+        output.write(json.dumps(result))
+        output.write('\n')
+
+    return dict(counts)
+
+
+def add_lint_arguments(parser):
+    parser.add_argument('template', help='profile template, e.g. fbca/1.9/5-ee-signature.json')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--timeout', type=float, default=10.0, help='seconds allowed per certificate')
+    parser.add_argument('--output', help='write results here instead of stdout')
+    parser.add_argument('--revocation-index', help='revocation index from fpkilint.revocation, adds the '
+                                                   'revocation status of each certificate to its result')
+
+
+def run_from_arguments(parser, args, lint):
+    """
+    Shared main() for the batch command line tools: lints as described by the arguments from
+    add_lint_arguments, writes the results and prints the counts to stderr.
+    :param lint: lint(template, workers, timeout, revocation_index=None), returns an iterable of
+    (item, result dict)
+    """
+    json_profiles = load_all_profiles()
+    if args.template not in json_profiles:
+        parser.error('unknown profile {}'.format(args.template))
+    if not is_cert_profile(json_profiles[args.template]):
+        parser.error('{} is not a certificate profile'.format(args.template))
+
+    lint_kwargs = {}
+    if args.revocation_index:
+        try:
+            RevocationIndex(args.revocation_index).close()
+        except (OSError, RevocationIndexError) as e:
+            parser.error(str(e))
+        lint_kwargs['revocation_index'] = args.revocation_index
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(process)d %(levelname)s %(message)s')
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        counts = write_results(lint(args.template, args.workers, args.timeout, **lint_kwargs), output)
+    finally:
+        if args.output:
+            output.close()
+
+    print(', '.join('{} {}'.format(count, verdict) for verdict, count in counts.items()), file=sys.stderr)
+
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Lint certificate files in bulk')
+    add_lint_arguments(parser)
+    parser.add_argument('files', nargs='+', help='pem, der, .p7b or .p7c files, - for stdin')
+    args = parser.parse_args(argv)
+
+    return run_from_arguments(parser, args, functools.partial(iter_lint_batch, iter_file_items(args.files)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Certificates in an upload: a single certificate, a pem bundle, a der, pem or base64 .p7b / .p7c, or a zip
+of any of those. Each file is read with fpkilint.cert_stream, one certificate at a time, so an upload is
+never held in memory as a whole.
+"""
+from fpkilint.cert_stream import iter_certificates
+import collections
+import itertools
+import logging
+import os
+import zipfile
+import zlib
+
+logger = logging.getLogger(__name__)
+
+BundleEntry = collections.namedtuple('BundleEntry', 'name der error')
+BundleEntry.__doc__ = """
+name: the upload name for a single certificate, e.g. certs.zip/ca/root.cer or chain.pem#2 in a bundle
+der: certificate or tbs certificate der, None when it could not be read
+error: why it could not be read, None when there is der
+"""
+
+_zip_magic = b'PK\x03\x04'
+
+# entries bigger than this can't be a certificate; keeps a small zip from expanding into gigabytes
+_max_entry_size = 1024 * 1024
+
+_skipped_prefixes = ('__MACOSX/', '.')
+
+
+def is_zip(file_obj):
+    """
+    :param file_obj: seekable binary file object, left where it was
+    """
+    position = file_obj.tell()
+    magic = file_obj.read(len(_zip_magic))
+    file_obj.seek(position)
+
+    return magic == _zip_magic
+
+
+def _make_bundle_entry(name, entry):
+    if entry.error is None:
+        return BundleEntry(name, entry.der, None)
+
+    return BundleEntry(name, None, "{} at offset {}".format(entry.error, entry.offset))
+
+
+def _iter_named_entries(entries, name):
+    """
+    Names the certificates of one file: a file with a single certificate is named as is, those in a
+    bundle get #1, #2... appended. A file without any certificate is one entry with an error.
+    """
+    first = next(entries, None)
+    second = next(entries, None)
+
+    if first is None:
+        yield BundleEntry(name, None, "No certificates found")
+        return
+
+    if second is None:
+        yield _make_bundle_entry(name, first)
+        return
+
+    for index, entry in enumerate(itertools.chain((first, second), entries), 1):
+        yield _make_bundle_entry('{}#{}'.format(name, index), entry)
+
+
+def _iter_zip_certificates(file_obj, name):
+    with zipfile.ZipFile(file_obj) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or os.path.basename(info.filename).startswith(_skipped_prefixes) or \
+                    info.filename.startswith(_skipped_prefixes):
+                continue
+
+            entry_name = '{}/{}'.format(name, info.filename)
+
+            # the stream for an entry stops at file_size, so this bounds what is decompressed
+            if info.file_size > _max_entry_size:
+                logger.info('Skipping %s, %d bytes is too big for a certificate', entry_name, info.file_size)
+                yield BundleEntry(entry_name, None, "Too big to be a certificate")
+                continue
+
+            try:
+                with archive.open(info) as entry:
+                    for bundle_entry in _iter_named_entries(iter_certificates(entry), entry_name):
+                        yield bundle_entry
+            except (zipfile.BadZipFile, zlib.error, EOFError, NotImplementedError, RuntimeError) as e:
+                # a broken or encrypted entry is reported like any other unreadable certificate
+                logger.info('Could not extract %s: %s', entry_name, e)
+                yield BundleEntry(entry_name, None, "Could not be extracted: {}".format(e))
+
+
+def iter_bundle_certificates(file_obj, name):
+    """
+    Extracts the certificates from an upload one at a time. Zip entries may themselves be certificates,
+    pem bundles or .p7b files; a zip inside the zip isn't read.
+    :param file_obj: seekable binary file object, e.g. the UploadedFile
+    :param name: uploaded file name, used to name the certificates
+    :return: generator of BundleEntry
+    :raises zipfile.BadZipFile: a zip upload could not be read
+    """
+    if is_zip(file_obj):
+        return _iter_zip_certificates(file_obj, name)
+
+    return _iter_named_entries(iter_certificates(file_obj), name)
@@ -0,0 +1,190 @@
+"""
+Incremental certificate reader for inputs too big to read into memory: pem bundles (which may also
+hold pem PKCS #7 blocks), der or base64 PKCS #7 certs-only files (.p7b / .p7c) and back to back der
+certificates and PKCS #7 files. Reads the input once, front to back, holding at most one certificate
+(or one read chunk) at a time.
+
+Every certificate comes with the byte offset it starts at, so entries that fail to parse can be found
+in the input. Offsets in a base64 file are offsets into the decoded data, offsets of certificates
+inside a pem encoded PKCS #7 are the offset of its BEGIN line.
+"""
+from fpkilint.der_reader import Base64Stream, Reader, enter, has_more, is_base64, leave, max_line_length, \
+    peek_header, skip_element
+import base64
+import binascii
+import collections
+import io
+
+CertificateEntry = collections.namedtuple('CertificateEntry', 'offset der error')
+CertificateEntry.__doc__ = """
+offset: byte offset of the entry in the input
+der: certificate der, None if the entry could not be read
+error: why the entry could not be read, None for a certificate
+"""
+
+# certificates bigger than this are reported as errors instead of being buffered
+max_certificate_size = 1024 * 1024
+
+# SEQUENCE { OID id-signedData, [0] { SignedData } }
+_signed_data_oid = bytes.fromhex('06092a864886f70d010702')
+
+_certificate_labels = {b'CERTIFICATE', b'X509 CERTIFICATE'}
+_pkcs7_labels = {b'PKCS7', b'CMS', b'CERTIFICATE CHAIN'}
+
+
+def _read_certificate(reader, offset):
+    tag, header_length, length = peek_header(reader)
+    if tag != 0x30 or length is None:
+        raise ValueError("Not a certificate")
+
+    if header_length + length > max_certificate_size:
+        if reader.skip(header_length + length) < header_length + length:
+            raise ValueError("Truncated")
+        return CertificateEntry(offset, None, "Certificate is bigger than {} bytes".format(max_certificate_size))
+
+    der = reader.read(header_length + length)
+    if len(der) < header_length + length:
+        raise ValueError("Truncated")
+
+    return CertificateEntry(offset, der, None)
+
+
+def _is_pkcs7(reader):
+    tag, header_length, length = peek_header(reader)
+    return tag == 0x30 and reader.peek(header_length + len(_signed_data_oid))[header_length:] == _signed_data_oid
+
+
+def _iter_pkcs7(reader):
+    """
+    Walks ContentInfo { signedData, [0] SignedData { version, digestAlgorithms, encapContentInfo,
+    [0] certificates, ... } } without reading more than one certificate at a time.
+    """
+    containers = [enter(reader, 0x30)]
+    reader.read(len(_signed_data_oid))
+    containers.append(enter(reader, 0xA0))
+    containers.append(enter(reader, 0x30))
+
+    # version, digestAlgorithms and encapContentInfo
+    for _ in range(3):
+        skip_element(reader)
+
+    if has_more(reader, containers[-1]) and reader.peek(1) == b'\xA0':
+        end = enter(reader, 0xA0)
+        while has_more(reader, end):
+            offset = reader.offset
+            # attribute certificates and other certificate formats are left out
+            if reader.peek(1) == b'\x30':
+                yield _read_certificate(reader, offset)
+            else:
+                skip_element(reader)
+        leave(reader, end)
+
+    # crls and signerInfos
+    for end in reversed(containers):
+        leave(reader, end)
+
+
+def _iter_der(reader, offset_base=None):
+    """
+    :param offset_base: report every entry at this offset instead of its own
+    """
+    while not reader.at_eof():
+        offset = reader.offset if offset_base is None else offset_base
+        try:
+            if _is_pkcs7(reader):
+                for entry in _iter_pkcs7(reader):
+                    yield entry if offset_base is None else entry._replace(offset=offset_base)
+            else:
+                yield _read_certificate(reader, offset)
+        except ValueError as e:
+            # without a length there's no telling where the next certificate starts
+            yield CertificateEntry(offset, None, str(e))
+            return
+
+
+def _decode_pem_block(block):
+    if b':' in block:
+        # pem headers (Proc-Type: and the like) come before the base64
+        block = b''.join(line for line in block.splitlines() if b':' not in line)
+    try:
+        return base64.b64decode(b''.join(block.split()), validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError("Bad base64: {}".format(e))
+
+
+def _iter_pem(reader):
+    # a pem block this big can't hold a certificate we'd read
+    max_block_size = max_certificate_size * 4 // 3 + max_line_length
+
+    while reader.skip_to(b'-----BEGIN '):
+        offset = reader.offset
+        label = reader.readline()[11:].split(b'-----')[0]
+
+        size = reader.find(b'-----END', max_block_size)
+        if size < 0:
+            if reader.skip_to(b'-----END'):
+                yield CertificateEntry(offset, None, "Certificate is bigger than {} bytes".format(max_certificate_size))
+                reader.readline()
+                continue
+            yield CertificateEntry(offset, None, "No END line for {}".format(label.decode('ascii', 'replace')))
+            return
+
+        if label not in _certificate_labels and label not in _pkcs7_labels:
+            # keys, requests, crls
+            reader.skip(size)
+            reader.readline()
+            continue
+
+        block = reader.read(size)
+        reader.readline()
+
+        try:
+            der = _decode_pem_block(block)
+        except ValueError as e:
+            yield CertificateEntry(offset, None, str(e))
+            continue
+
+        if label in _pkcs7_labels:
+            for entry in _iter_der(Reader(io.BytesIO(der)), offset):
+                yield entry
+        elif len(der) > max_certificate_size:
+            # max_block_size leaves room for line breaks, the same limit as der applies to what they decode to
+            yield CertificateEntry(offset, None, "Certificate is bigger than {} bytes".format(max_certificate_size))
+        else:
+            yield CertificateEntry(offset, der, None)
+
+
+def iter_certificates(file_obj):
+    """
+    :param file_obj: binary file object, read once from its current position
+    :return: generator of CertificateEntry
+    """
+    reader = Reader(file_obj)
+
+    # skip leading blank lines to find out what this is
+    while reader.peek(1).isspace():
+        reader.read(1)
+
+    start = reader.peek(64)
+    if not start:
+        return
+
+    if start[0] == 0x30:
+        entries = _iter_der(reader)
+    elif is_base64(start):
+        entries = _iter_der(Reader(Base64Stream(reader)))
+    else:
+        # pem, possibly with text around the blocks
+        entries = _iter_pem(reader)
+
+    for entry in entries:
+        yield entry
+
+
+def iter_file_certificates(path):
+    """
+    :return: generator of CertificateEntry for the certificates in the file at path
+    """
+    with open(path, 'rb') as f:
+        for entry in iter_certificates(f):
+            yield entry
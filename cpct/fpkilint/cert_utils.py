@@ -1,7 +1,10 @@
 import base64
-from asn1crypto import pem, x509
+import logging
+from asn1crypto import crl, pem, x509
 from fpkilint.name_utils import get_general_name_string, get_general_name_type, get_short_name_from_dn
 
+logger = logging.getLogger(__name__)
+
 
 def parse_certificate(byte_data):
 
@@ -29,10 +32,10 @@ def parse_certificate(byte_data):
     return x509cert
 
 
-def parse_tbs_certificate(byte_data):
+def parse_certificate_or_tbs(byte_data):
     """
     :param byte_data - certificate data to parse - can be pem or binary, a signed cert or a tbs cert:
-    :return: x509.TbsCertificate
+    :return: x509.Certificate or x509.TbsCertificate
     """
 
     if not isinstance(byte_data, bytes):
@@ -58,24 +61,39 @@ def parse_tbs_certificate(byte_data):
     tag = byte_data[2 + (byte_data[1] & 0x0F)]
     if tag == 0x30:
         x509cert = x509.Certificate.load(byte_data)
-        tbs_certificate = x509cert['tbs_certificate']
+        x509cert.issuer  # forces lazy parse to occur now
+        return x509cert
     elif tag == 0xA0:
         tbs_certificate = x509.TbsCertificate.load(byte_data)
+        tbs_certificate['serial_number']  # forces lazy parse to occur now
+        return tbs_certificate
     else:
         raise TypeError("Data is not a Certificate nor a TbsCertificate")
 
-    tbs_certificate['serial_number']  # forces lazy parse to occur now
 
-    return tbs_certificate
+def parse_tbs_certificate(byte_data):
+    """
+    :param byte_data - certificate data to parse - can be pem or binary, a signed cert or a tbs cert:
+    :return: x509.TbsCertificate
+    """
+    cert = parse_certificate_or_tbs(byte_data)
+
+    if isinstance(cert, x509.Certificate):
+        return cert['tbs_certificate']
+
+    return cert
 
 
 def get_5280_method_1_key_id(cert):
     """
-    :param cert: x509.Certificate
+    :param cert: x509.Certificate or x509.TbsCertificate
     :return: rfc5280 method 1 key id
     """
+    if isinstance(cert, x509.TbsCertificate):
+        return cert['subject_public_key_info'].sha1
+
     if not cert.public_key.sha1 == cert['tbs_certificate']['subject_public_key_info'].sha1:
-        print('hmmmmm')
+        logger.warning('public key sha1 does not match subject_public_key_info sha1')
 
     return cert.public_key.sha1
 
@@ -101,10 +119,13 @@ def get_extension_list(tbs_cert, oid=None):
     if oid and not isinstance(oid, str):
         raise TypeError("oid must be dotted oid string")
 
-    if not isinstance(tbs_cert, x509.TbsCertificate):
-        raise TypeError("cert must be x509.TbsCertificate")
+    if isinstance(tbs_cert, x509.TbsCertificate):
+        extensions = tbs_cert['extensions']
+    elif isinstance(tbs_cert, crl.TbsCertList):
+        extensions = tbs_cert['crl_extensions']
+    else:
+        raise TypeError("cert must be x509.TbsCertificate or crl.TbsCertList")
 
-    extensions = tbs_cert['extensions']
     extension_list = list()
 
     for e in extensions:
@@ -0,0 +1,562 @@
+"""
+Chain linting. Each certificate is linted against its profile as usual and then, with a pool of CA
+certificates to find issuers in, the path from it up to a self-signed certificate is built and the links
+checked: AKID against the issuer's SKID, issuer DN against the issuer's subject DN, validity nesting and
+the issuer's basic constraints and key usage. Signatures are verified with the issuer's public key (see
+fpkilint.signatures). The names in each certificate are checked against the name constraints of every CA
+above it (see fpkilint.name_constraints). Certificate policies are processed over the whole path (see
+fpkilint.policy_graph) against the profile's required policies, or the --user-policy OIDs.
+
+    cd cpct && python -m fpkilint.chain fbca/1.9/5-ee-signature.json certs/*.pem --ca fbca-cas.p7b > results.jsonl
+
+Issuers are looked up in hash indexes over the CA pool, by SKID, by canonical subject DN key (see
+name_utils.get_dn_key) and by the RFC 5280 method 1 hash of the public key, so finding the candidates
+for a certificate doesn't depend on the size of the pool. Each result gets a chain field listing the CA
+certificates in the path and a policies field with the authorities-constrained and user-constrained
+policy sets.
+"""
+from fpkilint.batch import add_lint_arguments, iter_file_items, iter_lint_batch, load_cert_profile, \
+    run_from_arguments
+from fpkilint.cert_stream import iter_file_certificates
+from fpkilint.cert_utils import get_short_name_from_cert, parse_certificate_or_tbs
+from fpkilint.html_output import load_all_profiles
+from fpkilint.lint_server import SEVERITY_INFO, SEVERITY_WARN, SEVERITY_FAIL
+from fpkilint.name_constraints import NameConstraints, get_constrained_names
+from fpkilint.name_utils import get_dn_key
+from fpkilint.policy_graph import any_policy, get_policy_info, process_policies
+from fpkilint.signatures import SignatureError, verify_certificate_signature
+from fpkilint.profile_conformance import OutputRow, lint_warning_prefix, lint_info_prefix
+from asn1crypto import x509
+from collections import OrderedDict
+import argparse
+import functools
+import hashlib
+import sys
+
+_severity_codes = {'INFO': SEVERITY_INFO, 'WARN': SEVERITY_WARN, 'FAIL': SEVERITY_FAIL}
+
+# bounds on path building, CA meshes can have many paths through them
+_max_path_length = 12
+_max_candidates = 256
+
+
+class ChainCertificate:
+    """
+    The parts of a certificate that chaining looks at, decoded once. The CA pool is held as these.
+    """
+    def __init__(self, cert, der=None):
+        """
+        :param cert: x509.Certificate or x509.TbsCertificate
+        :param der: der of cert, when already at hand
+        """
+        self.cert = cert
+        self.der = der if der is not None else cert.dump()
+        self.sha256 = hashlib.sha256(self.der).digest()
+
+        tbs = cert['tbs_certificate'] if isinstance(cert, x509.Certificate) else cert
+        self.tbs = tbs
+        self.subject_der = tbs['subject'].dump()
+        self.issuer_der = tbs['issuer'].dump()
+        self.subject_key = get_dn_key(tbs['subject']).digest
+        self.issuer_key = get_dn_key(tbs['issuer']).digest
+        self.self_issued = self.subject_key == self.issuer_key
+        self.key_hash = tbs['subject_public_key_info'].sha1
+        self.not_before = tbs['validity']['not_before'].native
+        self.not_after = tbs['validity']['not_after'].native
+        self.short_name = get_short_name_from_cert(cert)
+        self.policy_info = get_policy_info(tbs)
+        self.name_constraints = NameConstraints.from_tbs(tbs)
+        self._constrained_names = None
+        self._self_signed = None
+
+        self.skid = None
+        self.akid = None
+        self.ca = False
+        self.path_len = None
+        self.key_usage = None
+
+        for extension in tbs['extensions']:
+            name = extension['extn_id'].native
+            if name == 'key_identifier':
+                self.skid = extension['extn_value'].parsed.native
+            elif name == 'authority_key_identifier':
+                self.akid = extension['extn_value'].parsed
+            elif name == 'basic_constraints':
+                basic_constraints = extension['extn_value'].parsed
+                self.ca = bool(basic_constraints['ca'].native)
+                self.path_len = basic_constraints['path_len_constraint'].native
+            elif name == 'key_usage':
+                self.key_usage = extension['extn_value'].parsed.native
+
+    @property
+    def constrained_names(self):
+        """
+        :return: the names name constraints apply to, see name_constraints.get_constrained_names
+        """
+        if self._constrained_names is None:
+            self._constrained_names = get_constrained_names(self.tbs)
+
+        return self._constrained_names
+
+    @property
+    def self_signed(self):
+        """
+        :return: whether the certificate is self-issued and signed with its own key, so it can end a path. A
+        key rollover certificate is self-issued but signed with the previous key. When the signature can't be
+        checked the AKID decides.
+        """
+        if self._self_signed is None:
+            self._self_signed = self.self_issued and self._is_signed_with_own_key()
+
+        return self._self_signed
+
+    def _is_signed_with_own_key(self):
+        if isinstance(self.cert, x509.Certificate):
+            try:
+                return verify_certificate_signature(self.cert, self.tbs['subject_public_key_info'])
+            except SignatureError:
+                pass
+
+        key_id = self.akid_key_id
+        return key_id is None or key_id in (self.skid, self.key_hash)
+
+    @property
+    def akid_key_id(self):
+        if self.akid is None:
+            return None
+
+        return self.akid['key_identifier'].native
+
+    @classmethod
+    def load(cls, der):
+        return cls(parse_certificate_or_tbs(der), der)
+
+
+class IssuerIndex:
+    """
+    Hash indexes over a pool of CA certificates.
+    """
+    def __init__(self, certs=()):
+        """
+        :param certs: iterable of ChainCertificate
+        """
+        self.by_sha256 = {}
+        self.by_skid = {}
+        self.by_subject = {}
+        self.by_key_hash = {}
+
+        for cert in certs:
+            self.add(cert)
+
+    def __len__(self):
+        return len(self.by_sha256)
+
+    def add(self, cert):
+        if cert.sha256 in self.by_sha256:
+            return
+
+        self.by_sha256[cert.sha256] = cert
+        if cert.skid is not None:
+            self.by_skid.setdefault(cert.skid, []).append(cert)
+        self.by_subject.setdefault(cert.subject_key, []).append(cert)
+        self.by_key_hash.setdefault(cert.key_hash, []).append(cert)
+
+    def find_issuers(self, cert):
+        """
+        :return: list of certificates in the pool that may have issued cert, best matches first
+        """
+        candidates = OrderedDict()
+        key_id = cert.akid_key_id
+        if key_id is not None:
+            for issuer in self.by_skid.get(key_id, []) + self.by_key_hash.get(key_id, []):
+                candidates[issuer.sha256] = issuer
+        for issuer in self.by_subject.get(cert.issuer_key, ()):
+            candidates[issuer.sha256] = issuer
+        candidates.pop(cert.sha256, None)
+
+        return sorted(candidates.values(), key=functools.partial(_rank_issuer, cert))
+
+
+def _rank_issuer(cert, issuer):
+    key_id = cert.akid_key_id
+
+    return (issuer.subject_key != cert.issuer_key,
+            issuer.subject_der != cert.issuer_der,
+            key_id is None or key_id not in (issuer.skid, issuer.key_hash),
+            not issuer.not_before <= cert.not_before <= issuer.not_after,
+            not issuer.ca,
+            not issuer.self_signed)
+
+
+def build_path(cert, index):
+    """
+    :param cert: ChainCertificate to build the path for
+    :param index: IssuerIndex of the CA pool
+    :return: (path, complete) where path is [cert, its issuer, ...] and complete is whether the path ends at
+    a self-signed certificate; when no complete path is found the longest path is returned. Self-issued
+    certificates signed with another key (key rollover) are passed through like any other CA.
+    """
+    best = [cert]
+    budget = [_max_candidates]
+
+    def extend(path, seen):
+        nonlocal best
+
+        if len(path) > len(best):
+            best = list(path)
+        if path[-1].self_signed:
+            return True
+        if len(path) >= _max_path_length:
+            return False
+
+        for issuer in index.find_issuers(path[-1]):
+            if issuer.sha256 in seen or budget[0] <= 0:
+                continue
+            budget[0] -= 1
+            path.append(issuer)
+            seen.add(issuer.sha256)
+            if extend(path, seen):
+                return True
+            path.pop()
+            seen.discard(issuer.sha256)
+
+        return False
+
+    path = [cert]
+    if extend(path, {cert.sha256}):
+        return path, True
+
+    return best, False
+
+
+def _describe_link(child, issuer):
+    return "{} issued by {}".format(child.short_name, issuer.short_name)
+
+
+class ChainPath:
+    """
+    A path from build_path and what the chain checks work out about it.
+    """
+    def __init__(self, certs, complete, policy_settings=None):
+        """
+        :param certs: [certificate, its issuer, ...]
+        :param complete: whether the path ends at a self-signed certificate
+        :param policy_settings: dict of keyword arguments for policy_graph.process_policies, the RFC 5280
+        user initial policy set and initial inhibit settings
+        """
+        self.certs = certs
+        self.complete = complete
+        self.policy_settings = policy_settings or {}
+        self._policies = None
+
+    def iter_links(self):
+        """
+        :return: iterable of (certificate, its issuer)
+        """
+        return zip(self.certs, self.certs[1:])
+
+    @property
+    def policies(self):
+        """
+        :return: policy_graph.PolicyResult for the path, None when the path doesn't reach a trust anchor
+        """
+        if self._policies is None and self.complete and len(self.certs) > 1:
+            # processed from the trust anchor down, the trust anchor itself is not part of the path
+            self._policies = process_policies([cert.policy_info for cert in reversed(self.certs[:-1])],
+                                              **self.policy_settings)
+
+        return self._policies
+
+
+def lint_chain_path(chain):
+    r = OutputRow("Certification Path")
+    path = chain.certs
+
+    for cert in path[1:]:
+        r.add_content(cert.short_name)
+
+    if not chain.complete:
+        if len(path) == 1:
+            r.add_error("No issuer was found in the CA pool")
+        else:
+            r.add_error("Path ends at {}, its issuer is not in the CA pool".format(path[-1].short_name),
+                        lint_warning_prefix)
+
+    return r
+
+
+def lint_chain_akid(chain):
+    r = OutputRow("Chain Key Identifiers")
+
+    for child, issuer in chain.iter_links():
+        if child.akid is None:
+            if not child.self_issued:
+                r.add_error("{} has no AKID".format(child.short_name))
+            continue
+
+        key_id = child.akid_key_id
+        if key_id is not None:
+            if issuer.skid is None:
+                r.add_error("{}: the issuer has no SKID to match the AKID".format(_describe_link(child, issuer)),
+                            lint_warning_prefix)
+            elif key_id != issuer.skid:
+                if key_id == issuer.key_hash:
+                    r.add_error("{}: AKID matches the issuer's public key hash but not its SKID".format(
+                        _describe_link(child, issuer)))
+                else:
+                    r.add_error("{}: AKID does not match the issuer's SKID".format(_describe_link(child, issuer)))
+
+        authority_cert_serial_number = child.akid['authority_cert_serial_number'].native
+        if authority_cert_serial_number is not None and \
+                authority_cert_serial_number != issuer.tbs['serial_number'].native:
+            r.add_error("{}: AKID serial number is not the issuer's serial number".format(
+                _describe_link(child, issuer)))
+
+    return r
+
+
+def lint_chain_issuer(chain):
+    r = OutputRow("Chain Issuer Names")
+
+    for child, issuer in chain.iter_links():
+        if child.issuer_der == issuer.subject_der:
+            continue
+        if child.issuer_key == issuer.subject_key:
+            r.add_error("{}: issuer DN only matches the issuer's subject DN after RFC 5280 name "
+                        "comparison, the encodings differ".format(_describe_link(child, issuer)), lint_warning_prefix)
+        else:
+            r.add_error("{}: issuer DN does not match the issuer's subject DN".format(_describe_link(child, issuer)))
+
+    return r
+
+
+def lint_chain_validity(chain):
+    r = OutputRow("Chain Validity")
+
+    for child, issuer in chain.iter_links():
+        if child.not_before < issuer.not_before:
+            r.add_error("{}: notBefore {} is before the issuer's notBefore {}".format(
+                _describe_link(child, issuer), child.not_before, issuer.not_before), lint_warning_prefix)
+        if child.not_after > issuer.not_after:
+            r.add_error("{}: notAfter {} is after the issuer's notAfter {}".format(
+                _describe_link(child, issuer), child.not_after, issuer.not_after), lint_warning_prefix)
+        if child.not_before > issuer.not_after:
+            r.add_error("{}: issued after the issuer expired".format(_describe_link(child, issuer)))
+
+    return r
+
+
+def lint_chain_basic_constraints(chain):
+    r = OutputRow("Chain Issuer Constraints")
+
+    for position, (child, issuer) in enumerate(chain.iter_links(), 1):
+        if not issuer.ca:
+            r.add_error("{}: the issuer is not a CA".format(_describe_link(child, issuer)))
+        if issuer.key_usage is not None and 'key_cert_sign' not in issuer.key_usage:
+            r.add_error("{}: the issuer's key usage does not include keyCertSign".format(
+                _describe_link(child, issuer)))
+
+        if issuer.path_len is not None:
+            # non self-issued intermediate certificates below the issuer
+            intermediates = sum(1 for cert in chain.certs[1:position] if not cert.self_issued)
+            if intermediates > issuer.path_len:
+                r.add_error("{} allows a path length of {} but is followed by {} intermediate CAs".format(
+                    issuer.short_name, issuer.path_len, intermediates))
+
+    return r
+
+
+def lint_chain_name_constraints(chain):
+    r = OutputRow("Chain Name Constraints")
+
+    for position, ca in enumerate(chain.certs[1:], 1):
+        if ca.name_constraints is None:
+            continue
+
+        for subtrees in (ca.name_constraints.permitted, ca.name_constraints.excluded):
+            if subtrees is not None and subtrees.unsupported:
+                r.add_error("{} has name constraints that are not enforced: {}".format(
+                    ca.short_name, ", ".join(subtrees.unsupported)), lint_info_prefix)
+
+        # RFC 5280 6.1.3 (b), self-issued intermediate certificates are not checked
+        for cert in chain.certs[:position]:
+            if cert.self_issued and cert is not chain.certs[0]:
+                continue
+            for display, violation in ca.name_constraints.iter_violations(cert.constrained_names):
+                r.add_error("{} in {} is {} by the name constraints of {}".format(
+                    display, cert.short_name, violation, ca.short_name))
+
+    return r
+
+
+def _lint_signature(r, cert, issuer):
+    if not isinstance(cert.cert, x509.Certificate):
+        # a TBS certificate has no signature
+        return
+
+    try:
+        if not verify_certificate_signature(cert.cert, issuer.tbs['subject_public_key_info']):
+            r.add_error("{}: the signature does not verify with the issuer's public key".format(
+                _describe_link(cert, issuer)))
+    except SignatureError as e:
+        r.add_error("{}: the signature could not be checked: {}".format(_describe_link(cert, issuer), e),
+                    lint_info_prefix)
+
+
+def lint_chain_signatures(chain):
+    r = OutputRow("Chain Signatures")
+
+    for child, issuer in chain.iter_links():
+        _lint_signature(r, child, issuer)
+
+    if chain.complete and len(chain.certs) > 1:
+        trust_anchor = chain.certs[-1]
+        _lint_signature(r, trust_anchor, trust_anchor)
+
+    return r
+
+
+def _format_policy_set(policies):
+    if not policies:
+        return "(none)"
+
+    return ", ".join("anyPolicy" if policy == any_policy else policy for policy in sorted(policies))
+
+
+def lint_chain_policies(chain):
+    r = OutputRow("Chain Policies")
+
+    result = chain.policies
+    if result is None:
+        return r
+
+    r.add_content("Authorities-constrained: {}".format(_format_policy_set(result.authorities_constrained)))
+    r.add_content("User-constrained: {}".format(_format_policy_set(result.user_constrained)))
+
+    if result.error is not None:
+        r.add_error(result.error)
+    elif not result.user_constrained:
+        r.add_error("The path is not valid for any of the acceptable policies", lint_warning_prefix)
+
+    return r
+
+
+chain_check_functions = OrderedDict([
+    ('chain_path', lint_chain_path),
+    ('chain_akid', lint_chain_akid),
+    ('chain_issuer', lint_chain_issuer),
+    ('chain_validity', lint_chain_validity),
+    ('chain_basic_constraints', lint_chain_basic_constraints),
+    ('chain_signatures', lint_chain_signatures),
+    ('chain_name_constraints', lint_chain_name_constraints),
+    ('chain_policies', lint_chain_policies),
+])
+
+
+def iter_chain_conformance(chain):
+    """
+    :param chain: ChainPath
+    :return: generator of OutputRow
+    """
+    for config_section, check in chain_check_functions.items():
+        r = check(chain)
+        r.config_section = config_section
+        if len(r.content) > 0 or len(r.analysis) > 0:
+            yield r
+
+
+class ChainLinter:
+    """
+    Chain checks for batch.iter_lint_batch (extra_lint). Pickles as the der of the CA pool, the index is
+    rebuilt in each worker.
+    """
+    def __init__(self, ca_ders, policy_settings=None):
+        """
+        :param policy_settings: see ChainPath
+        """
+        self.policy_settings = policy_settings
+        self._set_index(ca_ders)
+
+    def _set_index(self, ca_ders):
+        self.ca_ders = list(ca_ders)
+        self.index = IssuerIndex(ChainCertificate.load(der) for der in self.ca_ders)
+
+    def __getstate__(self):
+        return self.ca_ders, self.policy_settings
+
+    def __setstate__(self, state):
+        ca_ders, self.policy_settings = state
+        self._set_index(ca_ders)
+
+    def __call__(self, cert):
+        """
+        :return: ([(severity, code, message), ...], dict of chain fields for the result)
+        """
+        chain = ChainPath(*build_path(ChainCertificate(cert), self.index), policy_settings=self.policy_settings)
+
+        findings = []
+        for r in iter_chain_conformance(chain):
+            for severity, message in r.findings:
+                findings.append((_severity_codes[severity], r.config_section, message))
+
+        fields = {'chain': [{'sha256': cert.sha256.hex(), 'subject': cert.short_name} for cert in chain.certs[1:]],
+                  'chain_complete': chain.complete}
+        if chain.policies is not None:
+            fields['policies'] = {'authorities_constrained': sorted(chain.policies.authorities_constrained),
+                                  'user_constrained': sorted(chain.policies.user_constrained)}
+
+        return findings, fields
+
+
+def iter_ca_ders(paths):
+    for path in paths:
+        for entry in iter_file_certificates(path):
+            if entry.der is None:
+                print('{} at {}: {}'.format(path, entry.offset, entry.error), file=sys.stderr)
+            else:
+                yield entry.der
+
+
+def _get_required_policies(template):
+    cert_policies = load_cert_profile(template).get('cert_policies', {})
+    if 'required_policy_list' not in cert_policies:
+        return None
+
+    return cert_policies['required_policy_list'].value.split() or None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Lint certificates and the paths to their issuers')
+    add_lint_arguments(parser)
+    parser.add_argument('files', nargs='+', help='pem, der, .p7b or .p7c files, - for stdin')
+    parser.add_argument('--ca', action='append', required=True,
+                        help='file of CA certificates to build paths from, can be repeated')
+    parser.add_argument('--user-policy', action='append',
+                        help='acceptable policy OID, can be repeated (default: the profile\'s required policies, '
+                             'or anyPolicy)')
+    parser.add_argument('--explicit-policy', action='store_true', help='require the path to be valid for a policy')
+    parser.add_argument('--inhibit-policy-mapping', action='store_true')
+    parser.add_argument('--inhibit-any-policy', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.template not in load_all_profiles():
+        parser.error('unknown profile {}'.format(args.template))
+
+    policy_settings = {
+        'user_initial_policy_set': args.user_policy or _get_required_policies(args.template) or (any_policy,),
+        'initial_explicit_policy': args.explicit_policy,
+        'initial_policy_mapping_inhibit': args.inhibit_policy_mapping,
+        'initial_any_policy_inhibit': args.inhibit_any_policy,
+    }
+
+    try:
+        chain_linter = ChainLinter(iter_ca_ders(args.ca), policy_settings)
+    except (OSError, TypeError, ValueError) as e:
+        parser.error('could not load the CA pool: {}'.format(e))
+
+    return run_from_arguments(parser, args, functools.partial(iter_lint_batch, iter_file_items(args.files),
+                                                              extra_lint=chain_linter))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+Packed certificate corpus, for linting the same large set of certificates over and over. Packing reads
+the certificates once (see fpkilint.cert_stream); after that a lint run maps the corpus file and slices
+certificates straight out of the mapping, without opening, reading or decoding a file per certificate.
+
+    cd cpct && python -m fpkilint.corpus pack fleet.corpus certs/*.pem
+    cd cpct && python -m fpkilint.corpus lint fleet.corpus fbca/1.9/5-ee-signature.json --workers 8
+
+Layout, all integers big endian:
+    header   8 byte magic, 4 byte version, 8 byte certificate count, 8 byte index offset, 4 bytes padding
+    data     the der certificates back to back
+    index    one record per certificate: 8 byte offset, 4 byte length, 32 byte sha256 of the der
+
+Lint workers each map the file themselves and are only sent ranges of certificate numbers, so the
+certificates are shared through the page cache instead of being pickled to every worker.
+"""
+from fpkilint.batch import BatchItem, add_lint_arguments, init_worker, lint_der, load_cert_profile, \
+    run_from_arguments
+from fpkilint.cert_stream import iter_file_certificates
+import argparse
+import collections
+import hashlib
+import mmap
+import multiprocessing
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+_magic = b'CPCTPACK'
+_version = 1
+_header = struct.Struct('>8sIQQ4x')
+_record = struct.Struct('>QI32s')
+
+# certificates sent to a worker at a time, and ranges in flight per worker
+_range_size = 64
+_read_ahead = 4
+
+# set in each worker by _init_corpus_worker
+_corpus = None
+
+
+class CorpusError(Exception):
+    pass
+
+
+def pack(path, entries):
+    """
+    Writes a corpus file.
+    :param path: corpus file to create
+    :param entries: iterable of der certificates
+    :return: number of certificates written
+    """
+    count = 0
+
+    with open(path, 'wb') as f, tempfile.TemporaryFile() as index:
+        f.write(_header.pack(_magic, _version, 0, 0))
+        offset = _header.size
+
+        for der in entries:
+            f.write(der)
+            index.write(_record.pack(offset, len(der), hashlib.sha256(der).digest()))
+            offset += len(der)
+            count += 1
+
+        index.seek(0)
+        shutil.copyfileobj(index, f)
+        f.seek(0)
+        f.write(_header.pack(_magic, _version, count, offset))
+
+    return count
+
+
+class Corpus:
+    """
+    Read only view of a corpus file. Certificates are memoryviews into the mapping; close() fails
+    with BufferError while any of them are still held.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise CorpusError("{} is empty".format(path))
+        self._view = memoryview(self._mmap)
+
+        try:
+            magic, version, self._count, self._index_offset = _header.unpack_from(self._view)
+        except struct.error:
+            magic, version = None, None
+        if magic != _magic or version != _version:
+            self.close()
+            raise CorpusError("{} is not a version {} corpus file".format(path, _version))
+
+        if self._index_offset + self._count * _record.size != len(self._view):
+            self.close()
+            raise CorpusError("{} is truncated".format(path))
+
+    def __len__(self):
+        return self._count
+
+    def entry(self, number):
+        """
+        :return: (offset, length, sha256 digest) of certificate number
+        """
+        if not 0 <= number < self._count:
+            raise IndexError(number)
+
+        return _record.unpack_from(self._view, self._index_offset + number * _record.size)
+
+    def __getitem__(self, number):
+        """
+        :return: memoryview of the der for certificate number
+        """
+        offset, length, sha256 = self.entry(number)
+
+        return self._view[offset:offset + length]
+
+    def close(self):
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _init_corpus_worker(path, cert_profile, timeout, revocation_index=None):
+    global _corpus
+
+    init_worker(cert_profile, timeout, revocation_index=revocation_index)
+    _corpus = Corpus(path)
+
+
+def _lint_range(start, stop):
+    # asn1crypto only parses bytes, so this is the one copy each certificate costs
+    return [lint_der(bytes(_corpus[number])) for number in range(start, stop)]
+
+
+def iter_lint_corpus(path, template, workers=None, timeout=10.0, revocation_index=None):
+    """
+    Lints every certificate in a corpus file, see batch.iter_lint_batch.
+    :return: generator of (BatchItem, result dict) in corpus order; the item offset is the certificate's
+    offset in the corpus file and has no der
+    """
+    workers = workers or os.cpu_count() or 1
+    cert_profile = load_cert_profile(template)
+    pending = collections.deque()
+
+    with Corpus(path) as corpus, \
+            multiprocessing.Pool(workers, _init_corpus_worker,
+                                 (path, cert_profile, timeout, revocation_index)) as pool:
+        count = len(corpus)
+
+        for start in range(0, count, _range_size):
+            stop = min(start + _range_size, count)
+            pending.append((start, pool.apply_async(_lint_range, (start, stop))))
+
+            while pending and (len(pending) >= workers * _read_ahead or pending[0][1].ready()):
+                for item in _pop_results(corpus, pending):
+                    yield item
+
+        while pending:
+            for item in _pop_results(corpus, pending):
+                yield item
+
+
+def _pop_results(corpus, pending):
+    start, async_result = pending.popleft()
+    for number, lint_result in enumerate(async_result.get(), start):
+        offset, length, sha256 = corpus.entry(number)
+        item = BatchItem(corpus.path, offset, None, None, None)
+        result = {'source': corpus.path, 'offset': offset, 'sha256': sha256.hex()}
+        result.update(lint_result)
+        yield item, result
+
+
+def _iter_pack_entries(paths):
+    for path in paths:
+        for entry in iter_file_certificates(path):
+            if entry.der is None:
+                print('{} at {}: {}'.format(path, entry.offset, entry.error), file=sys.stderr)
+            else:
+                yield entry.der
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pack certificates into a corpus file and lint it')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    pack_parser = commands.add_parser('pack', help='pack certificate files into a corpus file')
+    pack_parser.add_argument('corpus')
+    pack_parser.add_argument('files', nargs='+', help='pem, der, .p7b or .p7c files')
+
+    lint_parser = commands.add_parser('lint', help='lint every certificate in a corpus file')
+    lint_parser.add_argument('corpus')
+    add_lint_arguments(lint_parser)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'pack':
+        count = pack(args.corpus, _iter_pack_entries(args.files))
+        print('{} certificates packed into {}'.format(count, args.corpus), file=sys.stderr)
+        return 0
+
+    try:
+        Corpus(args.corpus).close()
+    except (OSError, CorpusError) as e:
+        lint_parser.error(str(e))
+
+    return run_from_arguments(lint_parser, args, lambda *lint_args, **lint_kwargs:
+                              iter_lint_corpus(args.corpus, *lint_args, **lint_kwargs))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
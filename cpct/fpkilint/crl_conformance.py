@@ -0,0 +1,622 @@
+"""
+CRL linting against a CRL profile, e.g. fbca/1.9/4-crl.json. The CRL is read with fpkilint.crl_stream
+and the entries are checked one at a time as they are read. Only counts and the first entry with each
+finding are kept, so a CRL with a million entries is linted in the same memory as one with ten.
+
+    cd cpct && python -m fpkilint.crl_conformance fbca/1.9/4-crl.json crls/*.crl --issuer ca.cer > results.jsonl
+
+Once the entries are through, the rest of the CRL (version, signature algorithm, issuer, thisUpdate and
+nextUpdate, the CRL extensions) goes through checks written like the certificate checks, several of
+them shared with profile_conformance. With the certificate of the issuing CA, the issuer DN and AKID are
+also checked against it. Each CRL file gets a JSON line with its verdict and findings.
+"""
+from fpkilint.batch import write_results
+from fpkilint.cert_utils import get_extension_and_criticality, parse_certificate
+from fpkilint.crl_stream import CRLReader, get_time_key
+from fpkilint.html_output import load_all_profiles
+from fpkilint.name_utils import get_general_name_string, get_pretty_dn, is_same_dn
+from fpkilint.profile_conformance import OutputRow, compile_profile, format_display_time_span, \
+    get_processed_extensions, lint_akid, lint_and_format_x509_time, lint_cert_indent, lint_cert_newline, \
+    lint_error_prefix, lint_issuer, lint_other_extensions, lint_signature_algorithm, \
+    lint_warning_prefix, _do_presence_test, _process_common_extension_options
+from fpkilint.timing import timed
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+import argparse
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+crl_number_oid = '2.5.29.20'
+delta_crl_indicator_oid = '2.5.29.27'
+issuing_distribution_point_oid = '2.5.29.28'
+
+# oid: (profile item, display name)
+_entry_extensions = OrderedDict([
+    ('2.5.29.21', ('reason_code', 'reasonCode')),
+    ('2.5.29.23', ('hold_instruction_code', 'holdInstructionCode')),
+    ('2.5.29.24', ('invalidity_date', 'invalidityDate')),
+    ('2.5.29.29', ('certificate_issuer', 'certificateIssuer')),
+])
+
+_reason_code_oid = '2.5.29.21'
+_invalidity_date_oid = '2.5.29.24'
+_certificate_issuer_oid = '2.5.29.29'
+
+# distinct entry findings kept, the rest are only counted
+_max_entry_findings = 256
+
+
+def _get_int_option(config_options, item):
+    if item in config_options and len(config_options[item].value) > 0:
+        return int(config_options[item].value)
+
+    return 0
+
+
+def _get_time_error(time_type, contents, name):
+    """
+    The RFC 5280 5.1.2.4 encoding rules for a time in a CRL.
+    :return: what is wrong with the encoding of the time, or None
+    """
+    if not contents.endswith(b'Z'):
+        return "{} is not expressed in GMT".format(name)
+    if time_type == 'utc_time':
+        if len(contents) != 13:
+            return "{} format is not YYMMDDHHMMSSZ".format(name)
+    elif len(contents) != 15:
+        return "{} format is not YYYYMMDDHHMMSSZ".format(name)
+    elif contents[:4] < b'2050':
+        return "{} must be UTCTime for dates before 2050".format(name)
+
+    return None
+
+
+def _get_serial_string(serial_bytes):
+    return ' '.join('%02X' % c for c in serial_bytes)
+
+
+class EntrySummary:
+    """
+    What the entry checks found. The entries themselves are not kept, only counts and, for each finding,
+    where it was first seen.
+    """
+    def __init__(self):
+        self.count = 0
+        self.with_extensions = 0
+        self.reasons = Counter()
+        self.certificate_issuer = None  # [count, offset, serial bytes]
+        self.remove_from_crl = None  # [count, offset, serial bytes]
+        self.findings = OrderedDict()  # (preface, message): [count, offset, serial bytes]
+        self.other_findings = 0
+
+    def add_finding(self, message, offset, serial_bytes, preface=lint_error_prefix):
+        finding = self.findings.get((preface, message))
+        if finding is not None:
+            finding[0] += 1
+        elif len(self.findings) < _max_entry_findings:
+            self.findings[(preface, message)] = [1, offset, serial_bytes]
+        else:
+            self.other_findings += 1
+
+
+def _count(tally, offset, serial_bytes):
+    if tally is None:
+        return [1, offset, serial_bytes]
+
+    tally[0] += 1
+    return tally
+
+
+class EntryChecker:
+    """
+    Checks revokedCertificates entries as they are read, against the revoked_certificates section of a
+    CRL profile.
+    """
+    def __init__(self, config_options, this_update):
+        """
+        :param config_options: revoked_certificates section of the compiled profile
+        :param this_update: x509.Time thisUpdate of the CRL
+        """
+        self.summary = EntrySummary()
+        self.serial_max_length = _get_int_option(config_options, 'serial_max_length')
+        self.other_entry_extensions = _get_int_option(config_options, 'other_entry_extensions')
+        self.extension_options = {oid: _get_int_option(config_options, item)
+                                  for oid, (item, display) in _entry_extensions.items()}
+        self.required_extensions = [oid for oid, option in self.extension_options.items() if option == 2]
+        self.this_update_key = get_time_key(this_update.name, this_update.chosen.contents)
+
+    def check(self, revoked_entry):
+        """
+        :param revoked_entry: crl_stream.RevokedEntry
+        """
+        summary = self.summary
+        summary.count += 1
+        offset = revoked_entry.offset
+
+        if revoked_entry.error is not None:
+            summary.add_finding(revoked_entry.error, offset, None)
+            return
+
+        serial_bytes = revoked_entry.serial_number
+        try:
+            self._check_serial(serial_bytes, offset)
+
+            error = _get_time_error(*revoked_entry.revocation_date, name='revocationDate')
+            if error:
+                summary.add_finding(error, offset, serial_bytes)
+            revocation_key = get_time_key(*revoked_entry.revocation_date)
+            if revocation_key > self.this_update_key:
+                summary.add_finding("revocationDate is after thisUpdate", offset, serial_bytes, lint_warning_prefix)
+
+            if revoked_entry.extensions is not None:
+                summary.with_extensions += 1
+                self._check_extensions(revoked_entry.extensions, revocation_key, offset, serial_bytes)
+            elif self.required_extensions:
+                for oid in self.required_extensions:
+                    summary.add_finding("{} is missing".format(_entry_extensions[oid][1]), offset, serial_bytes)
+        except ValueError as e:
+            summary.add_finding("Entry could not be parsed: {}".format(e), offset, serial_bytes)
+
+    def _check_serial(self, serial_bytes, offset):
+        summary = self.summary
+
+        if len(serial_bytes) > 1 and ((serial_bytes[0] == 0 and serial_bytes[1] & 0x80 != 0x80) or
+                                      (serial_bytes[0] == 0xFF and serial_bytes[1] & 0x80 == 0x80)):
+            summary.add_finding("Invalid serial number encoding. INTEGER must be encoded with the minimum number "
+                                "of octets", offset, serial_bytes)
+
+        if serial_bytes[:1] >= b'\x80':
+            summary.add_finding("Serial number is negative", offset, serial_bytes, lint_warning_prefix)
+        elif not serial_bytes.strip(b'\x00'):
+            summary.add_finding("Serial number is zero", offset, serial_bytes, lint_warning_prefix)
+
+        if self.serial_max_length and len(serial_bytes) > self.serial_max_length:
+            summary.add_finding("Serial number is longer than {} octets".format(self.serial_max_length), offset,
+                                serial_bytes)
+
+    def _check_extensions(self, extensions, revocation_key, offset, serial_bytes):
+        summary = self.summary
+        seen = set()
+
+        for extension in extensions:
+            oid = extension['extn_id'].dotted
+            is_critical = extension['critical'].native
+
+            if oid in seen:
+                summary.add_finding("Entry has more than one {} extension".format(oid), offset, serial_bytes)
+                continue
+            seen.add(oid)
+
+            if oid not in _entry_extensions:
+                if is_critical:
+                    summary.add_finding("Unrecognized critical entry extension {}".format(oid), offset, serial_bytes)
+                elif self.other_entry_extensions == 1:
+                    summary.add_finding("Entry extension {} is not permitted".format(oid), offset, serial_bytes)
+                continue
+
+            display = _entry_extensions[oid][1]
+            if self.extension_options[oid] == 1:
+                summary.add_finding("{} is not permitted".format(display), offset, serial_bytes)
+
+            if oid == _reason_code_oid:
+                if is_critical:
+                    summary.add_finding("reasonCode must not be critical", offset, serial_bytes)
+                reason = extension['extn_value'].parsed.native
+                summary.reasons[reason] += 1
+                if reason == 'unspecified':
+                    summary.add_finding("reasonCode unspecified should be omitted (RFC5280)", offset, serial_bytes,
+                                        lint_warning_prefix)
+                elif reason == 'remove_from_crl':
+                    summary.remove_from_crl = _count(summary.remove_from_crl, offset, serial_bytes)
+
+            elif oid == _invalidity_date_oid:
+                if is_critical:
+                    summary.add_finding("invalidityDate must not be critical", offset, serial_bytes)
+                if extension['extn_value'].parsed.contents[:14] > revocation_key:
+                    summary.add_finding("invalidityDate is after revocationDate", offset, serial_bytes,
+                                        lint_warning_prefix)
+
+            elif oid == _certificate_issuer_oid:
+                if not is_critical:
+                    summary.add_finding("certificateIssuer must be critical", offset, serial_bytes)
+                summary.certificate_issuer = _count(summary.certificate_issuer, offset, serial_bytes)
+
+        for oid in self.required_extensions:
+            if oid not in seen:
+                summary.add_finding("{} is missing".format(_entry_extensions[oid][1]), offset, serial_bytes)
+
+
+def _format_entry_finding(message, count, offset, serial_bytes):
+    if serial_bytes is None:
+        where = "at offset {}".format(offset)
+    else:
+        where = "serial {} at offset {}".format(_get_serial_string(serial_bytes), offset)
+
+    if count == 1:
+        return "{} ({})".format(message, where)
+
+    return "{} ({} entries, first {})".format(message, count, where)
+
+
+class StreamedCRL:
+    """
+    A CRL as the CRL checks see it: the CRL without its entries, what the entry checks found and,
+    optionally, the certificate of the CA that issued it.
+    """
+    def __init__(self, certificate_list, entries, issuer_cert=None):
+        """
+        :param certificate_list: crl.CertificateList, from CRLReader.read_trailer
+        :param entries: EntrySummary
+        :param issuer_cert: x509.Certificate or None
+        """
+        self.certificate_list = certificate_list
+        self.tbs = certificate_list['tbs_cert_list']
+        self.entries = entries
+        self.issuer_cert = issuer_cert
+
+    def get_extension(self, oid):
+        return get_extension_and_criticality(self.tbs, oid)[0]
+
+
+def lint_crl_version(config_options, crl):
+    tbs = crl.tbs
+    crl_version = 0 if tbs['version'].native is None else int(tbs['version'])
+
+    r = OutputRow("Version", "v%i" % (crl_version + 1))
+
+    if crl_version > 1:
+        r.add_error("CRL version must be v1 or v2")
+
+    if (tbs['crl_extensions'] or crl.entries.with_extensions) and crl_version != 1:
+        r.add_error("Extensions must not appear in {} CRLs".format(tbs['version'].native or 'v1'))
+
+    min_version_num = _get_int_option(config_options, 'min_version')
+    if crl_version < min_version_num:
+        r.add_error("Minimum permitted version is v{}".format(str(min_version_num + 1)))
+
+    return r
+
+
+def lint_crl_signature_algorithm(config_options, crl):
+    return lint_signature_algorithm(config_options, crl.certificate_list)
+
+
+def lint_crl_issuer(config_options, crl):
+    r = lint_issuer(config_options, crl.tbs)
+
+    if crl.issuer_cert is not None:
+        issuer_tbs = crl.issuer_cert['tbs_certificate']
+        if not is_same_dn(crl.tbs['issuer'], issuer_tbs['subject']):
+            r.add_error("CRL issuer does not match the subject of the issuing CA certificate ({})".format(
+                get_pretty_dn(issuer_tbs['subject'], ', ', '=')))
+        key_usage = crl.issuer_cert.key_usage_value
+        if key_usage is not None and 'crl_sign' not in key_usage.native:
+            r.add_error("The issuing CA certificate does not assert cRLSign")
+
+    return r
+
+
+def lint_crl_validity(config_options, crl):
+    r = OutputRow("Update Times")
+
+    this_update = crl.tbs['this_update']
+    next_update = crl.tbs['next_update']
+    now = datetime.now(timezone.utc)
+
+    r.add_content(lint_and_format_x509_time(this_update, 'This Update', r))
+    error = _get_time_error(this_update.name, this_update.chosen.contents, 'thisUpdate')
+    if error:
+        r.add_error(error)
+    if this_update.native > now:
+        r.add_error("thisUpdate is in the future", lint_warning_prefix)
+
+    _do_presence_test(r, config_options, 'next_update', 'nextUpdate', bool(next_update))
+    if not next_update:
+        return r
+
+    r.add_content(lint_and_format_x509_time(next_update, 'Next Update', r))
+    error = _get_time_error(next_update.name, next_update.chosen.contents, 'nextUpdate')
+    if error:
+        r.add_error(error)
+
+    interval = next_update.native - this_update.native
+    if interval <= timedelta(0):
+        r.add_error("nextUpdate is not after thisUpdate")
+    else:
+        r.add_content("Update interval of {}".format(format_display_time_span(interval)))
+
+    next_update_max_hours = _get_int_option(config_options, 'next_update_max_hours')
+    if next_update_max_hours and interval > timedelta(hours=next_update_max_hours):
+        r.add_error("nextUpdate is more than {} hours after thisUpdate".format(next_update_max_hours))
+
+    if next_update.native < now:
+        r.add_content("CRL is stale")
+        r.add_error("nextUpdate has passed", lint_warning_prefix)
+
+    return r
+
+
+def lint_revoked_certificates(config_options, crl):
+    r = OutputRow("Revoked Certificates")
+    entries = crl.entries
+
+    r.add_content("{} entries".format(entries.count))
+    for reason, count in sorted(entries.reasons.items()):
+        r.add_content("{}{}: {}".format(lint_cert_indent, reason, count))
+
+    for (preface, message), (count, offset, serial_bytes) in entries.findings.items():
+        r.add_error(_format_entry_finding(message, count, offset, serial_bytes), preface)
+    if entries.other_findings:
+        r.add_error("{} more entry findings not shown".format(entries.other_findings))
+
+    if entries.certificate_issuer is not None:
+        idp = crl.get_extension(issuing_distribution_point_oid)
+        if idp is None or not idp['extn_value'].parsed['indirect_crl'].native:
+            r.add_error(_format_entry_finding("certificateIssuer is only permitted in indirect CRLs",
+                                              *entries.certificate_issuer))
+
+    if entries.remove_from_crl is not None and crl.get_extension(delta_crl_indicator_oid) is None:
+        r.add_error(_format_entry_finding("reasonCode removeFromCRL is only permitted in delta CRLs",
+                                          *entries.remove_from_crl))
+
+    return r
+
+
+def lint_crl_akid(config_options, crl):
+    r = lint_akid(config_options, crl.tbs)
+
+    extension = crl.get_extension('2.5.29.35')
+    if crl.issuer_cert is not None and extension is not None:
+        key_id = extension['extn_value'].parsed['key_identifier'].native
+        issuer_key_id = crl.issuer_cert.key_identifier
+        if key_id is not None and issuer_key_id is not None and key_id != issuer_key_id:
+            r.add_error("Key ID does not match the SKID of the issuing CA certificate ({})".format(
+                ''.join('%02X' % c for c in issuer_key_id)))
+
+    return r
+
+
+def _lint_integer_encoding(integer, name, r, max_length=0):
+    contents = integer.contents
+
+    if len(contents) > 1 and ((contents[0] == 0 and contents[1] & 0x80 != 0x80) or
+                              (contents[0] == 0xFF and contents[1] & 0x80 == 0x80)):
+        r.add_error("Invalid encoding. INTEGER must be encoded with the minimum number of octets")
+    if integer.native < 0:
+        r.add_error("{} may not be negative (RFC5280)".format(name))
+    if max_length and len(contents) > max_length:
+        r.add_error("Maximum permitted length is {} octets".format(str(max_length)))
+
+
+def lint_crl_number(config_options, crl):
+    r = OutputRow("CRL Number")
+
+    extension = _process_common_extension_options(config_options, crl.tbs, r)
+    if extension is not None:
+        crl_number = extension['extn_value'].parsed
+        r.add_content("{}{}({})".format(crl_number.native, lint_cert_newline,
+                                        _get_serial_string(crl_number.contents)))
+        _lint_integer_encoding(crl_number, "CRL number", r, _get_int_option(config_options, 'max_length'))
+
+    return r
+
+
+def lint_delta_crl_indicator(config_options, crl):
+    r = OutputRow("Delta CRL Indicator")
+
+    extension = _process_common_extension_options(config_options, crl.tbs, r)
+    if extension is not None:
+        base_crl_number = extension['extn_value'].parsed
+        r.add_content("Base CRL Number: {}".format(base_crl_number.native))
+        _lint_integer_encoding(base_crl_number, "Base CRL number", r)
+
+        crl_number = crl.get_extension(crl_number_oid)
+        if crl_number is None:
+            r.add_error("A delta CRL must have a CRL number")
+        elif base_crl_number.native >= crl_number['extn_value'].parsed.native:
+            r.add_error("Base CRL number must be less than the CRL number")
+
+    return r
+
+
+def lint_idp(config_options, crl):
+    r = OutputRow("Issuing Distribution Point")
+
+    extension = _process_common_extension_options(config_options, crl.tbs, r)
+    if extension is None:
+        return r
+
+    idp = extension['extn_value'].parsed
+    distribution_point = idp['distribution_point']
+    distribution_point_name = None if distribution_point.native is None else distribution_point.name
+
+    if distribution_point_name == 'full_name':
+        r.add_content("Distribution Point:")
+        for general_name in distribution_point.chosen:
+            r.add_content("{}{}".format(lint_cert_indent, get_general_name_string(general_name)))
+    elif distribution_point_name == 'name_relative_to_crl_issuer':
+        r.add_content("Distribution Point relative to the CRL issuer")
+
+    flags = [(field, idp[field].native) for field in ('only_contains_user_certs', 'only_contains_ca_certs',
+                                                      'indirect_crl', 'only_contains_attribute_certs')]
+    for field, value in flags:
+        if value:
+            r.add_content("{} = TRUE".format(field))
+    if idp['only_some_reasons'].native:
+        r.add_content("only_some_reasons = {}".format(', '.join(sorted(idp['only_some_reasons'].native))))
+
+    if distribution_point_name is None and not idp['only_some_reasons'].native and not any(v for f, v in flags):
+        r.add_error("Issuing distribution point must not consist of only default values (RFC5280)")
+
+    if sum(bool(idp[field].native) for field in ('only_contains_user_certs', 'only_contains_ca_certs',
+                                                 'only_contains_attribute_certs')) > 1:
+        r.add_error("At most one of onlyContainsUserCerts, onlyContainsCACerts and onlyContainsAttributeCerts "
+                    "may be TRUE")
+    if idp['only_contains_attribute_certs'].native:
+        r.add_error("onlyContainsAttributeCerts must be FALSE (RFC5280)")
+
+    _do_presence_test(r, config_options, 'distribution_point', 'Distribution point',
+                      distribution_point_name is not None)
+    _do_presence_test(r, config_options, 'only_some_reasons', 'onlySomeReasons',
+                      bool(idp['only_some_reasons'].native))
+    _do_presence_test(r, config_options, 'indirect_crl', 'indirectCRL', bool(idp['indirect_crl'].native))
+
+    return r
+
+
+crl_check_functions = OrderedDict([
+    ('version', lint_crl_version),
+    ('signature_algorithm', lint_crl_signature_algorithm),
+    ('issuer', lint_crl_issuer),
+    ('validity', lint_crl_validity),
+    ('revoked_certificates', lint_revoked_certificates),
+
+    ('akid', lint_crl_akid),
+    ('crl_number', lint_crl_number),
+    ('delta_crl_indicator', lint_delta_crl_indicator),
+    ('idp', lint_idp),
+    # other extensions are handled separately
+])
+
+
+def is_crl_profile(crl_profile):
+    """
+    :param crl_profile: profile from compile_profile()
+    :return: whether the CRL checks know every section, they don't know those of a certificate profile
+    """
+    return all(config_section in crl_check_functions or config_section in ('other_extensions', 'profile')
+               for config_section in crl_profile)
+
+
+def read_crl(crl_reader, crl_profile, issuer_cert=None):
+    """
+    Reads the rest of the CRL, checking the entries as they go by.
+    :param crl_reader: crl_stream.CRLReader
+    :param crl_profile: profile from compile_profile()
+    :return: StreamedCRL
+    """
+    entry_checker = EntryChecker(crl_profile.get('revoked_certificates', {}), crl_reader.header['this_update'])
+
+    with timed('crl.entries'):
+        for revoked_entry in crl_reader.iter_entries():
+            entry_checker.check(revoked_entry)
+
+    return StreamedCRL(crl_reader.read_trailer(), entry_checker.summary, issuer_cert)
+
+
+def iter_crl_conformance(crl, crl_profile):
+    """
+    :param crl: StreamedCRL
+    :param crl_profile: profile from compile_profile()
+    :return: generator of OutputRow
+    """
+    for config_section in crl_profile:
+        if config_section not in crl_check_functions and config_section not in ('other_extensions', 'profile'):
+            logger.error('Unrecognized config section: %s', config_section)
+
+    for config_section, check in crl_check_functions.items():
+        if config_section not in crl_profile:
+            continue
+        try:
+            with timed('crl.' + config_section):
+                r = check(crl_profile[config_section], crl)
+        except ValueError as e:
+            logger.warning('Failed to parse content for %s: %s', config_section, e)
+            r = OutputRow(config_section, "Failed to parse content")
+            r.add_error(str(e), "")
+        r.config_section = config_section
+        if len(r.content) > 0 or len(r.analysis) > 0:
+            yield r
+
+    if 'other_extensions' in crl_profile:
+        other_extensions_rows = lint_other_extensions(crl_profile['other_extensions'], crl.tbs,
+                                                      get_processed_extensions(crl_profile))
+        for r in other_extensions_rows.values():
+            yield r
+
+
+def lint_crl_file(path, crl_profile, issuer_cert=None):
+    """
+    :param crl_profile: profile from compile_profile()
+    :param issuer_cert: x509.Certificate of the CA that issued the CRL, or None
+    :return: result dict, verdict and findings or error
+    """
+    result = {'source': path}
+
+    crl_reader = None
+    try:
+        with open(path, 'rb') as f:
+            crl_reader = CRLReader(f)
+            crl = read_crl(crl_reader, crl_profile, issuer_cert)
+    except (OSError, ValueError) as e:
+        if crl_reader is not None:
+            result['error'] = 'Could not be read at offset {}: {}'.format(crl_reader.offset, e)
+        else:
+            result['error'] = 'Could not be read: {}'.format(e)
+        return result
+
+    verdict = 'PASS'
+    findings = []
+    for r in iter_crl_conformance(crl, crl_profile):
+        for severity, message in r.findings:
+            findings.append({'severity': severity, 'code': r.config_section, 'message': message})
+            if severity == 'FAIL':
+                verdict = 'FAIL'
+            elif severity == 'WARN' and verdict == 'PASS':
+                verdict = 'WARN'
+
+    crl_number = crl.get_extension(crl_number_oid)
+    result.update({
+        'verdict': verdict,
+        'findings': findings,
+        'entries': crl.entries.count,
+        'crl_number': str(crl_number['extn_value'].parsed.native) if crl_number is not None else None,
+        'this_update': crl.tbs['this_update'].native.isoformat(),
+        'next_update': crl.tbs['next_update'].native.isoformat() if crl.tbs['next_update'] else None,
+    })
+
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Lint CRL files against a CRL profile')
+    parser.add_argument('template', help='CRL profile template, e.g. fbca/1.9/4-crl.json')
+    parser.add_argument('files', nargs='+', help='der, pem or base64 CRL files')
+    parser.add_argument('--issuer', help='certificate of the CA that issued the CRLs')
+    parser.add_argument('--output', help='write results here instead of stdout')
+    args = parser.parse_args(argv)
+
+    json_profiles = load_all_profiles()
+    if args.template not in json_profiles:
+        parser.error('unknown profile {}'.format(args.template))
+    crl_profile = compile_profile(json_profiles[args.template])
+    if not is_crl_profile(crl_profile):
+        parser.error('{} is not a CRL profile'.format(args.template))
+
+    issuer_cert = None
+    if args.issuer:
+        try:
+            with open(args.issuer, 'rb') as f:
+                issuer_cert = parse_certificate(f.read())
+        except (OSError, TypeError, ValueError) as e:
+            parser.error('could not load the issuer certificate: {}'.format(e))
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(process)d %(levelname)s %(message)s')
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        counts = write_results(((path, lint_crl_file(path, crl_profile, issuer_cert)) for path in args.files),
+                               output)
+    finally:
+        if args.output:
+            output.close()
+
+    print(', '.join('{} {}'.format(count, verdict) for verdict, count in counts.items()), file=sys.stderr)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""
+Incremental CRL reader. A CRL with hundreds of thousands of entries is one der structure of tens of
+megabytes, and loading it with asn1crypto (let alone .native) holds all of it, decoded, at once. This
+reads a der, pem or base64 CRL front to back with fpkilint.der_reader: the fields
+around revokedCertificates are read whole, the entries one at a time, so memory doesn't depend on the
+number of entries.
+
+    crl_reader = CRLReader(f)
+    crl_reader.header                          TbsCertList without revokedCertificates and crlExtensions
+    for entry in crl_reader.iter_entries():    RevokedEntry
+        ...
+    crl_reader.read_trailer()                  CertificateList without revokedCertificates
+
+Entry offsets are byte offsets into the der, which for a pem or base64 file is the decoded data.
+"""
+from asn1crypto import crl
+from fpkilint.der_reader import Base64Stream, Reader, enter, has_more, is_base64, leave, peek_header, skip_element
+import collections
+import io
+
+RevokedEntry = collections.namedtuple('RevokedEntry', 'offset serial_number revocation_date extensions error')
+RevokedEntry.__doc__ = """
+offset: byte offset of the entry in the der
+serial_number: contents octets of the userCertificate INTEGER
+revocation_date: ('utc_time' or 'general_time', contents octets)
+extensions: crl.CRLEntryExtensions, None without crlEntryExtensions
+error: why the entry could not be read, None for an entry
+"""
+
+# entries bigger than this are reported as errors instead of being buffered
+max_entry_size = 64 * 1024
+
+# the other fields, the crlExtensions hold the biggest of them
+_max_field_size = 1024 * 1024
+
+_time_tags = {0x17: 'utc_time', 0x18: 'general_time'}
+
+
+class CRLError(ValueError):
+    pass
+
+
+class _PemBodyStream(io.RawIOBase):
+    """
+    The lines of a pem block up to its END line.
+    """
+    def __init__(self, reader):
+        self._reader = reader
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        lines = []
+        length = 0
+        while not self._done and (size < 0 or length < size):
+            line = self._reader.readline()
+            if not line or line.startswith(b'-----END'):
+                self._done = True
+                break
+            if b':' not in line:
+                # pem headers (Proc-Type: and the like) come before the base64
+                lines.append(line)
+                length += len(line)
+
+        return b''.join(lines)
+
+
+def _read_element(reader, max_size=_max_field_size):
+    """
+    :return: der of the next element
+    """
+    tag, header_length, length = peek_header(reader)
+    if length is None:
+        raise CRLError("Indefinite length at offset {}".format(reader.offset))
+    if header_length + length > max_size:
+        raise CRLError("{} byte element at offset {} is bigger than {} bytes".format(header_length + length,
+                                                                                    reader.offset, max_size))
+
+    der = reader.read(header_length + length)
+    if len(der) < header_length + length:
+        raise CRLError("Truncated at offset {}".format(reader.offset))
+
+    return der
+
+
+def _der_length(length):
+    if length < 0x80:
+        return bytes([length])
+
+    length_bytes = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes([0x80 | len(length_bytes)]) + length_bytes
+
+
+def _iter_elements(data):
+    """
+    :param data: contents of a constructed der value
+    :return: generator of (tag, contents, der) for each element in it
+    """
+    offset = 0
+    while offset < len(data):
+        if offset + 2 > len(data):
+            raise CRLError("Truncated element")
+        start = offset
+        tag = data[offset]
+        length = data[offset + 1]
+        offset += 2
+        if length & 0x80:
+            count = length & 0x7F
+            if count == 0 or count > 4:
+                raise CRLError("Bad length")
+            length = int.from_bytes(data[offset:offset + count], 'big')
+            offset += count
+        if offset + length > len(data):
+            raise CRLError("Truncated element")
+        yield tag, data[offset:offset + length], data[start:offset + length]
+        offset += length
+
+
+def _parse_entry(offset, der):
+    """
+    Splits an entry without asn1crypto, which would take most of the time for a big CRL. Only the
+    extensions, which most entries don't have, are left to asn1crypto.
+    :return: RevokedEntry
+    """
+    elements = list(_iter_elements(next(_iter_elements(der))[1]))
+    if len(elements) not in (2, 3) or elements[0][0] != 0x02 or elements[1][0] not in _time_tags or \
+            (len(elements) == 3 and elements[2][0] != 0x30):
+        raise CRLError("Not a revokedCertificates entry")
+
+    extensions = None
+    if len(elements) == 3:
+        extensions = crl.CRLEntryExtensions.load(elements[2][2])
+
+    return RevokedEntry(offset, elements[0][1], (_time_tags[elements[1][0]], elements[1][1]), extensions, None)
+
+
+def get_time_key(time_type, contents):
+    """
+    :param time_type: 'utc_time' or 'general_time'
+    :param contents: contents octets of the time
+    :return: YYYYMMDDHHMMSS bytes, orders like the times without decoding them
+    """
+    if time_type == 'utc_time':
+        return (b'19' if contents[:2] >= b'50' else b'20') + contents[:12]
+
+    return contents[:14]
+
+
+def _der_sequence(parts):
+    contents = b''.join(parts)
+
+    return b'\x30' + _der_length(len(contents)) + contents
+
+
+class CRLReader:
+    """
+    Reads one CRL from a binary file object. The header is read when the reader is created, the entries
+    are read by iter_entries and the rest by read_trailer, in that order.
+    """
+    def __init__(self, file_obj):
+        """
+        :raises ValueError: the input doesn't start with a CRL
+        """
+        reader = Reader(file_obj)
+
+        # skip leading blank lines to find out what this is
+        while reader.peek(1).isspace():
+            reader.read(1)
+
+        start = reader.peek(64)
+        if not start:
+            raise CRLError("No CRL found")
+
+        if start[0] == 0x30:
+            pass
+        elif is_base64(start):
+            reader = Reader(Base64Stream(reader))
+        else:
+            if not reader.skip_to(b'-----BEGIN X509 CRL-----'):
+                raise CRLError("No X509 CRL pem block found")
+            reader.readline()
+            reader = Reader(Base64Stream(_PemBodyStream(reader)))
+
+        self._reader = reader
+        self._crl_end = enter(reader, 0x30)
+        self._tbs_end = enter(reader, 0x30)
+        self._tbs_parts = []
+
+        if reader.peek(1) == b'\x02':
+            self._tbs_parts.append(_read_element(reader))
+        # signature and issuer
+        self._tbs_parts.append(_read_element(reader))
+        self._tbs_parts.append(_read_element(reader))
+        if reader.peek(1)[:1] not in (b'\x17', b'\x18'):
+            raise CRLError("thisUpdate is not a UTCTime or GeneralizedTime")
+        self._tbs_parts.append(_read_element(reader))
+        if has_more(reader, self._tbs_end) and reader.peek(1)[:1] in (b'\x17', b'\x18'):
+            self._tbs_parts.append(_read_element(reader))
+
+        self.header = crl.TbsCertList.load(_der_sequence(self._tbs_parts))
+        self.entry_count = 0
+        self._entries_read = False
+
+    @property
+    def offset(self):
+        return self._reader.offset
+
+    def iter_entries(self):
+        """
+        :return: generator of RevokedEntry
+        """
+        if self._entries_read:
+            raise CRLError("The entries have already been read")
+        self._entries_read = True
+
+        reader = self._reader
+        if not has_more(reader, self._tbs_end) or reader.peek(1) != b'\x30':
+            return
+
+        end = enter(reader, 0x30)
+        while has_more(reader, end):
+            offset = reader.offset
+            tag, header_length, length = peek_header(reader)
+            self.entry_count += 1
+            if tag != 0x30:
+                skip_element(reader)
+                yield RevokedEntry(offset, None, None, None, "Expected a SEQUENCE, found tag 0x{:02X}".format(tag))
+            elif length is not None and header_length + length > max_entry_size:
+                skip_element(reader)
+                yield RevokedEntry(offset, None, None, None, "Entry is bigger than {} bytes".format(max_entry_size))
+            else:
+                der = _read_element(reader)
+                try:
+                    revoked_entry = _parse_entry(offset, der)
+                except CRLError as e:
+                    revoked_entry = RevokedEntry(offset, None, None, None, str(e))
+                yield revoked_entry
+        leave(reader, end)
+
+    def read_trailer(self):
+        """
+        Reads the rest of the CRL. When the entries weren't iterated over they are skipped whole, which
+        is the quick way to get at the crlExtensions.
+        :return: crl.CertificateList without its revokedCertificates
+        """
+        reader = self._reader
+        if not self._entries_read:
+            self._entries_read = True
+            if has_more(reader, self._tbs_end) and reader.peek(1) == b'\x30':
+                skip_element(reader)
+
+        if has_more(reader, self._tbs_end) and reader.peek(1) == b'\xA0':
+            self._tbs_parts.append(_read_element(reader))
+        if has_more(reader, self._tbs_end):
+            raise CRLError("Unexpected data at offset {} at the end of the TBSCertList".format(reader.offset))
+        leave(reader, self._tbs_end)
+
+        signature_algorithm = _read_element(reader)
+        signature = _read_element(reader)
+        if has_more(reader, self._crl_end):
+            raise CRLError("Unexpected data at offset {} after the signature".format(reader.offset))
+        leave(reader, self._crl_end)
+
+        return crl.CertificateList.load(_der_sequence([_der_sequence(self._tbs_parts), signature_algorithm,
+                                                       signature]))
@@ -0,0 +1,428 @@
+"""
+Certificate Transparency log dumps for the batch linter. Reads log entries mirrored to local files,
+either get-entries JSON (RFC 6962 section 4.6: whole responses, or one entry per line) or static CT
+API data tiles, optionally gzipped, and lints the certificates in them.
+
+    cd cpct && python -m fpkilint.ct_log fbca/1.9/5-ee-signature.json mirror/ --workers 8 > results.jsonl
+
+Directories are searched for *.json, *.jsonl and *.json.gz files and for data tiles (tile/data/...).
+
+A precertificate entry is linted as the TBS certificate the log signed, which is the precertificate
+with the poison extension removed, i.e. what the issued certificate holds apart from the SCT list.
+With --precertificates the precertificate itself is linted instead, poison extension included.
+"""
+from fpkilint.batch import BatchItem, add_lint_arguments, iter_lint_batch, run_from_arguments
+import argparse
+import base64
+import binascii
+import functools
+import gzip
+import io
+import json
+import os
+import re
+import struct
+import sys
+
+X509_ENTRY = 0
+PRECERT_ENTRY = 1
+
+_entry_type_names = {X509_ENTRY: 'x509_entry', PRECERT_ENTRY: 'precert_entry'}
+
+_gzip_magic = b'\x1f\x8b'
+_json_chunk_size = 1024 * 1024
+
+# get-entries responses are decoded one entry at a time, a bigger JSON value isn't an entry
+_max_json_value_size = 16 * 1024 * 1024
+_json_whitespace = re.compile(r'\s*')
+
+# a data tile holds at most 256 entries
+_max_tile_size = 64 * 1024 * 1024
+_tile_width = 256
+_tile_path = re.compile(r'tile/data/((?:x\d{3}/)*\d{3})(?:\.p/\d+)?$')
+
+_json_suffixes = ('.json', '.jsonl', '.json.gz', '.jsonl.gz')
+
+
+class CTLogError(ValueError):
+    pass
+
+
+def _read_opaque(data, offset, length_size):
+    """
+    :return: (TLS opaque<..2^(8*length_size)-1> value, offset past it)
+    """
+    end = offset + length_size
+    if end > len(data):
+        raise CTLogError("Truncated entry")
+    length = int.from_bytes(data[offset:end], 'big')
+    if end + length > len(data):
+        raise CTLogError("Truncated entry")
+
+    return data[end:end + length], end + length
+
+
+def parse_timestamped_entry(data, offset=0):
+    """
+    :param data: bytes holding an RFC 6962 TimestampedEntry at offset
+    :return: (timestamp in ms, entry type, der, offset past the entry); der is the certificate for an
+    x509_entry and the TBS certificate for a precert_entry
+    """
+    if offset + 10 > len(data):
+        raise CTLogError("Truncated entry")
+    timestamp, entry_type = struct.unpack_from('>QH', data, offset)
+    offset += 10
+
+    if entry_type == PRECERT_ENTRY:
+        # issuer_key_hash
+        offset += 32
+    elif entry_type != X509_ENTRY:
+        raise CTLogError("Unknown entry type {}".format(entry_type))
+
+    der, offset = _read_opaque(data, offset, 3)
+    extensions, offset = _read_opaque(data, offset, 2)
+
+    return timestamp, entry_type, der, offset
+
+
+def parse_merkle_tree_leaf(leaf_input):
+    """
+    :param leaf_input: MerkleTreeLeaf from get-entries
+    :return: (timestamp in ms, entry type, der), see parse_timestamped_entry
+    """
+    if leaf_input[:2] != b'\x00\x00':
+        raise CTLogError("Not a version 1 timestamped entry leaf")
+
+    timestamp, entry_type, der, offset = parse_timestamped_entry(leaf_input, 2)
+    if offset != len(leaf_input):
+        raise CTLogError("Unexpected data after the entry")
+
+    return timestamp, entry_type, der
+
+
+def _make_item(source, offset, metadata, timestamp, entry_type, der, pre_certificate, precertificates):
+    metadata['timestamp'] = timestamp
+    metadata['entry_type'] = _entry_type_names[entry_type]
+
+    if entry_type == PRECERT_ENTRY and precertificates:
+        if pre_certificate is None:
+            return BatchItem(source, offset, None, "Entry has no precertificate", metadata)
+        der = pre_certificate
+
+    return BatchItem(source, offset, der, None, metadata)
+
+
+class _JSONReader:
+    """
+    Reads a text file of JSON one value at a time, holding only the value being decoded in memory.
+    """
+    def __init__(self, text_file):
+        self._file = text_file
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._position = 0
+        self._eof = False
+
+    def _fill(self):
+        """
+        :return: False at the end of the file
+        """
+        if self._eof:
+            return False
+
+        chunk = self._file.read(_json_chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        if len(self._buffer) > _max_json_value_size + _json_chunk_size:
+            raise CTLogError("JSON value is bigger than {} bytes".format(_max_json_value_size))
+
+        return True
+
+    def peek(self):
+        """
+        :return: the next character that isn't whitespace, '' at the end of the file
+        """
+        while True:
+            self._position = _json_whitespace.match(self._buffer, self._position).end()
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._fill():
+                return ''
+
+    def take(self, characters):
+        """
+        :return: the next character that isn't whitespace, which must be one of characters
+        """
+        character = self.peek()
+        if not character or character not in characters:
+            raise CTLogError("Bad JSON: expected one of {} but got {!r}".format(characters, character))
+        self._position += 1
+
+        return character
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except ValueError as e:
+                # the rest of the value is in the next chunk
+                if not self._fill():
+                    raise CTLogError("Bad JSON: {}".format(e))
+                continue
+
+            # so is the rest of a number that ends the chunk
+            if end == len(self._buffer) and self._fill():
+                continue
+
+            self._position = end
+            return value
+
+    def iter_array(self):
+        """
+        Decodes the array starting at the next character one element at a time.
+        """
+        self.take('[')
+        if self.peek() == ']':
+            self.take(']')
+            return
+
+        while True:
+            yield self.decode()
+            if self.take(',]') == ']':
+                return
+
+
+def _iter_entries_of(value):
+    if isinstance(value, dict) and 'entries' in value:
+        value = value['entries']
+    if isinstance(value, dict):
+        value = [value]
+    if not isinstance(value, list):
+        raise CTLogError("Expected get-entries JSON")
+
+    return iter(value)
+
+
+def _iter_json_object_entries(reader):
+    """
+    A get-entries response, whose entries array is decoded one entry at a time, or a single entry.
+    """
+    reader.take('{')
+    fields = {}
+    streamed = False
+
+    if reader.peek() == '}':
+        reader.take('}')
+    else:
+        while True:
+            key = reader.decode()
+            if not isinstance(key, str):
+                raise CTLogError("Bad JSON: object key {!r} isn't a string".format(key))
+            reader.take(':')
+
+            if key == 'entries' and reader.peek() == '[':
+                streamed = True
+                for entry in reader.iter_array():
+                    yield entry
+            else:
+                fields[key] = reader.decode()
+
+            if reader.take(',}') == '}':
+                break
+
+    if not streamed:
+        for entry in _iter_entries_of(fields):
+            yield entry
+
+
+def _iter_json_entries(text_file):
+    """
+    :param text_file: get-entries responses, entries or arrays of entries, one after the other
+    :return: generator of the entries, each is decoded on its own
+    """
+    reader = _JSONReader(text_file)
+
+    while True:
+        character = reader.peek()
+        if not character:
+            return
+
+        if character == '{':
+            entries = _iter_json_object_entries(reader)
+        elif character == '[':
+            entries = reader.iter_array()
+        else:
+            entries = _iter_entries_of(reader.decode())
+
+        for entry in entries:
+            yield entry
+
+
+def iter_json_items(text_file, source, precertificates=False):
+    """
+    :param text_file: text file of get-entries responses or entries, one after the other
+    :return: generator of BatchItem
+    """
+    number = 0
+    try:
+        for entry in _iter_json_entries(text_file):
+            metadata = {'entry': number}
+            number += 1
+            if not isinstance(entry, dict):
+                yield BatchItem(source, None, None, "Bad entry: expected a JSON object", metadata)
+                continue
+            for key in ('index', 'leaf_index'):
+                if key in entry:
+                    metadata['log_index'] = entry[key]
+
+            try:
+                timestamp, entry_type, der = parse_merkle_tree_leaf(base64.b64decode(entry['leaf_input']))
+                pre_certificate = None
+                if entry_type == PRECERT_ENTRY and entry.get('extra_data'):
+                    # PrecertChainEntry, the precertificate and then its chain
+                    pre_certificate, offset = _read_opaque(base64.b64decode(entry['extra_data']), 0, 3)
+            except (CTLogError, KeyError, TypeError, binascii.Error) as e:
+                yield BatchItem(source, None, None, "Bad entry: {}".format(e), metadata)
+                continue
+
+            yield _make_item(source, None, metadata, timestamp, entry_type, der, pre_certificate, precertificates)
+    except (CTLogError, UnicodeDecodeError, EOFError, OSError) as e:
+        # EOFError and OSError are a truncated or corrupt gzip file
+        yield BatchItem(source, None, None, str(e), {'entry': number})
+
+
+def get_tile_start_index(path):
+    """
+    :return: log index of the first entry in the data tile at path, None if path isn't a tile path
+    """
+    match = _tile_path.search(path.replace(os.sep, '/'))
+    if match is None:
+        return None
+
+    return int(match.group(1).replace('x', '').replace('/', '')) * _tile_width
+
+
+def iter_tile_items(data, source, start_index=None, precertificates=False):
+    """
+    :param data: static CT API data tile, TileLeaf entries back to back
+    :param start_index: log index of the first entry, when known
+    :return: generator of BatchItem, the offset is the entry's offset in the tile
+    """
+    offset = 0
+    number = 0
+    while offset < len(data):
+        entry_offset = offset
+        metadata = {'entry': number}
+        if start_index is not None:
+            metadata['log_index'] = start_index + number
+        number += 1
+
+        try:
+            timestamp, entry_type, der, offset = parse_timestamped_entry(data, offset)
+            pre_certificate = None
+            if entry_type == PRECERT_ENTRY:
+                pre_certificate, offset = _read_opaque(data, offset, 3)
+            # fingerprints of the chain
+            fingerprints, offset = _read_opaque(data, offset, 2)
+        except CTLogError as e:
+            # the next entry can't be found without this one's length
+            yield BatchItem(source, entry_offset, None, str(e), metadata)
+            return
+
+        yield _make_item(source, entry_offset, metadata, timestamp, entry_type, der, pre_certificate,
+                         precertificates)
+
+
+def iter_dump_file_items(path, precertificates=False):
+    """
+    :return: generator of BatchItem for the entries in a get-entries JSON file or data tile
+    """
+    try:
+        f = open(path, 'rb')
+    except OSError as e:
+        yield BatchItem(path, None, None, str(e), None)
+        return
+
+    with f:
+        if f.peek(2)[:2] == _gzip_magic:
+            f = gzip.GzipFile(fileobj=f)
+
+        try:
+            start = f.peek(64)[:64].lstrip()
+        except (EOFError, OSError) as e:
+            yield BatchItem(path, None, None, str(e), None)
+            return
+
+        if start[:1] in (b'{', b'['):
+            items = iter_json_items(io.TextIOWrapper(f, 'utf-8'), path, precertificates)
+        else:
+            try:
+                data = f.read(_max_tile_size + 1)
+            except (EOFError, OSError) as e:
+                yield BatchItem(path, None, None, str(e), None)
+                return
+            if len(data) > _max_tile_size:
+                yield BatchItem(path, None, None, "Too big to be a data tile", None)
+                return
+            items = iter_tile_items(data, path, get_tile_start_index(path), precertificates)
+
+        for item in items:
+            yield item
+
+
+def _is_dump_file(path):
+    if path.endswith(_json_suffixes):
+        return True
+
+    # a partial tile is left out when the full tile is there too
+    return get_tile_start_index(path) is not None and not ('.p/' in path.replace(os.sep, '/') and
+                                                           os.path.exists(path.split('.p' + os.sep)[0]))
+
+
+def iter_dump_files(paths):
+    """
+    :param paths: files, and directories to search for dump files
+    :return: generator of file paths
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+
+        for dir_path, dir_names, file_names in os.walk(path):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                file_path = os.path.join(dir_path, file_name)
+                if _is_dump_file(file_path):
+                    yield file_path
+
+
+def iter_dump_items(paths, precertificates=False):
+    """
+    :return: generator of BatchItem for every entry in the dump files, see iter_dump_files
+    """
+    for path in iter_dump_files(paths):
+        for item in iter_dump_file_items(path, precertificates):
+            yield item
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Lint certificates from Certificate Transparency log dumps')
+    add_lint_arguments(parser)
+    parser.add_argument('paths', nargs='+', help='get-entries JSON files, data tiles or directories of them')
+    parser.add_argument('--precertificates', action='store_true',
+                        help='lint precertificates instead of the TBS certificates the log signed')
+    args = parser.parse_args(argv)
+
+    items = iter_dump_items(args.paths, args.precertificates)
+
+    return run_from_arguments(parser, args, functools.partial(iter_lint_batch, items))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
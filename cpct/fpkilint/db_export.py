@@ -0,0 +1,199 @@
+"""
+CA database exports for the batch linter: CSV files and SQLite databases of issued certificates, one
+certificate per row. Other columns (request id, template name, ...) are carried through to each result
+so findings can be joined back to the CA's records.
+
+    cd cpct && python -m fpkilint.db_export fbca/1.9/5-ee-signature.json issued.csv \\
+        --certificate-column RawCertificate --metadata-column RequestID --metadata-column template=CertificateTemplate
+
+    cd cpct && python -m fpkilint.db_export fbca/1.9/5-ee-signature.json ca.sqlite \\
+        --query "SELECT der, serial, profile FROM issued" --certificate-column der --metadata-column serial
+
+Certificate values can be der (a SQLite blob), base64, hex (also 0x or \\x prefixed) or pem; each value
+is decoded on its own, so a column can mix them. Blob metadata values (e.g. a serial number) are written
+to the results as hex. Rows are read as they are linted, never all at once.
+"""
+from fpkilint.batch import BatchItem, add_lint_arguments, iter_lint_batch, run_from_arguments
+from asn1crypto import pem
+import argparse
+import base64
+import binascii
+import csv
+import functools
+import os
+import re
+import sqlite3
+import sys
+import urllib.parse
+
+_hex_value = re.compile(r'^(?:0x|\\x)?((?:30)[0-9a-fA-F\s]*)$')
+
+# a csv field bigger than this can't hold a certificate
+_max_field_size = 4 * 1024 * 1024
+
+_sqlite_magic = b'SQLite format 3\x00'
+
+
+class ExportError(ValueError):
+    pass
+
+
+def decode_certificate_value(value):
+    """
+    :param value: column value, bytes or str
+    :return: der
+    :raises ExportError: the value isn't der, base64, hex or pem
+    """
+    if value is None or value == '' or value == b'':
+        raise ExportError("No certificate in the row")
+
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+        if value[:1] == b'\x30':
+            return value
+        try:
+            value = value.decode('ascii')
+        except UnicodeDecodeError:
+            raise ExportError("Binary value is not der")
+
+    if not isinstance(value, str):
+        raise ExportError("Certificate column holds a {}".format(type(value).__name__))
+
+    value = value.strip()
+
+    if value.startswith('-----BEGIN'):
+        try:
+            file_type, headers, der = pem.unarmor(value.encode('ascii'))
+        except (ValueError, UnicodeEncodeError) as e:
+            raise ExportError("Bad pem: {}".format(e))
+        return der
+
+    match = _hex_value.match(value)
+    if match is not None:
+        try:
+            return bytes.fromhex(''.join(match.group(1).split()))
+        except ValueError as e:
+            raise ExportError("Bad hex: {}".format(e))
+
+    try:
+        return base64.b64decode(''.join(value.split()), validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise ExportError("Not base64, hex or pem: {}".format(e))
+
+
+def _get_metadata_value(value):
+    # the results are JSON, which has no bytes
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+
+    return value
+
+
+def _make_item(source, row_number, row, certificate_column, metadata_columns):
+    """
+    :param row: mapping of column name to value
+    :param metadata_columns: {result metadata name: column name}
+    """
+    metadata = {'row': row_number}
+    try:
+        for name, column in metadata_columns.items():
+            metadata[name] = _get_metadata_value(row[column])
+        der = decode_certificate_value(row[certificate_column])
+    except KeyError as e:
+        return BatchItem(source, None, None, "No column {}".format(e), metadata)
+    except ExportError as e:
+        return BatchItem(source, None, None, str(e), metadata)
+
+    return BatchItem(source, None, der, None, metadata)
+
+
+def iter_csv_items(text_file, source, certificate_column, metadata_columns, delimiter=','):
+    """
+    :param text_file: CSV file object with a header row, opened with newline=''
+    :return: generator of BatchItem, the metadata holds the row number (1 is the first row after the
+    header) and the metadata columns
+    """
+    csv.field_size_limit(max(csv.field_size_limit(), _max_field_size))
+
+    for row_number, row in enumerate(csv.DictReader(text_file, delimiter=delimiter), 1):
+        yield _make_item(source, row_number, row, certificate_column, metadata_columns)
+
+
+def iter_sqlite_items(path, query, certificate_column, metadata_columns):
+    """
+    :param query: SELECT returning the certificate and metadata columns
+    :return: generator of BatchItem, see iter_csv_items
+    """
+    # quoted, so a ? or # in the file name isn't read as part of the uri
+    connection = sqlite3.connect('file:{}?mode=ro'.format(urllib.parse.quote(os.path.abspath(path))), uri=True)
+    try:
+        cursor = connection.execute(query)
+        columns = [description[0] for description in cursor.description]
+        for row_number, values in enumerate(cursor, 1):
+            yield _make_item(path, row_number, dict(zip(columns, values)), certificate_column, metadata_columns)
+    finally:
+        connection.close()
+
+
+def is_sqlite_file(path):
+    with open(path, 'rb') as f:
+        return f.read(len(_sqlite_magic)) == _sqlite_magic
+
+
+def iter_export_items(paths, certificate_column, metadata_columns, query=None, delimiter=','):
+    """
+    :param paths: CSV files and SQLite databases, told apart by their content; - for CSV on stdin
+    :param query: SELECT to run against each SQLite database
+    :return: generator of BatchItem
+    """
+    for path in paths:
+        try:
+            if path == '-':
+                for item in iter_csv_items(sys.stdin, path, certificate_column, metadata_columns, delimiter):
+                    yield item
+            elif is_sqlite_file(path):
+                if query is None:
+                    yield BatchItem(path, None, None, "SQLite databases need a --query", None)
+                    continue
+                for item in iter_sqlite_items(path, query, certificate_column, metadata_columns):
+                    yield item
+            else:
+                with open(path, newline='', encoding='utf-8-sig') as f:
+                    for item in iter_csv_items(f, path, certificate_column, metadata_columns, delimiter):
+                        yield item
+        except (OSError, UnicodeDecodeError, csv.Error, sqlite3.Error) as e:
+            yield BatchItem(path, None, None, str(e), None)
+
+
+def _parse_metadata_columns(values):
+    """
+    :param values: column or name=column strings
+    :return: {result metadata name: column name}
+    """
+    metadata_columns = {}
+    for value in values or ():
+        name, separator, column = value.partition('=')
+        metadata_columns[name] = column if separator else name
+
+    return metadata_columns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Lint the certificates in CA database exports (CSV or SQLite)')
+    add_lint_arguments(parser)
+    parser.add_argument('files', nargs='+', help='CSV files or SQLite databases, - for CSV on stdin')
+    parser.add_argument('--certificate-column', required=True, help='column holding the certificate')
+    parser.add_argument('--metadata-column', action='append',
+                        help='column to copy into the results, as name=column to rename it; can be repeated')
+    parser.add_argument('--query', help='SELECT to run against SQLite databases')
+    parser.add_argument('--delimiter', default=',', help='CSV field delimiter')
+    args = parser.parse_args(argv)
+
+    items = iter_export_items(args.files, args.certificate_column, _parse_metadata_columns(args.metadata_column),
+                              args.query, args.delimiter)
+
+    return run_from_arguments(parser, args, functools.partial(iter_lint_batch, items))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
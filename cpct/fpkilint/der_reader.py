@@ -0,0 +1,239 @@
+"""
+Forward only der reading from a binary file object, shared by fpkilint.cert_stream and
+fpkilint.crl_stream. Reader buffers one read chunk at a time and keeps track of the absolute offset;
+the element functions walk der (and ber indefinite lengths) header by header, so nothing is read whole
+unless the caller reads it.
+
+    reader = Reader(f)
+    end = enter(reader, 0x30)                  into a SEQUENCE
+    while has_more(reader, end):
+        tag, header_length, length = peek_header(reader)
+        ...                                    read or skip_element each element
+    leave(reader, end)
+
+All of them raise ValueError for input that isn't der.
+"""
+from asn1crypto import pem
+import base64
+import io
+
+# Reader.readline returns lines longer than this in pieces
+max_line_length = 64 * 1024
+
+_chunk_size = 1024 * 1024
+_max_depth = 32
+
+base64_characters = frozenset(b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=\r\n')
+
+
+class Reader:
+    """
+    Forward only reader over a binary file object that keeps track of the absolute offset and can
+    look ahead without consuming.
+    """
+    def __init__(self, file_obj, chunk_size=_chunk_size):
+        self.offset = 0
+        self._file = file_obj
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._start = 0
+        self._eof = False
+
+    def _fill(self, length):
+        while len(self._buffer) - self._start < length and not self._eof:
+            chunk = self._file.read(max(self._chunk_size, length - (len(self._buffer) - self._start)))
+            if not chunk:
+                self._eof = True
+                break
+            if self._start:
+                del self._buffer[:self._start]
+                self._start = 0
+            self._buffer += chunk
+
+        return len(self._buffer) - self._start
+
+    def peek(self, length):
+        self._fill(length)
+        return bytes(self._buffer[self._start:self._start + length])
+
+    def read(self, length):
+        data = self.peek(length)
+        self._start += len(data)
+        self.offset += len(data)
+        return data
+
+    def skip(self, length):
+        """
+        :return: bytes skipped, less than length at the end of the input
+        """
+        skipped = 0
+        while skipped < length:
+            available = self._fill(1)
+            if not available:
+                break
+            step = min(available, length - skipped)
+            self._start += step
+            self.offset += step
+            skipped += step
+
+        return skipped
+
+    def readline(self):
+        """
+        :return: the next line including its newline, lines longer than max_line_length are returned
+        in pieces
+        """
+        while True:
+            available = len(self._buffer) - self._start
+            end = self._buffer.find(b'\n', self._start, self._start + max_line_length)
+            if end >= 0:
+                return self.read(end + 1 - self._start)
+            if available >= max_line_length or self._fill(available + 1) == available:
+                return self.read(max_line_length)
+
+    def find(self, pattern, limit):
+        """
+        :return: where pattern starts, relative to the current position, looking at most limit bytes
+        ahead; -1 if it isn't there
+        """
+        searched = 0
+        while True:
+            index = self._buffer.find(pattern, self._start + searched, self._start + limit)
+            if index >= 0:
+                return index - self._start
+            available = len(self._buffer) - self._start
+            if available >= limit or self._fill(available + 1) == available:
+                return -1
+            searched = max(0, available - len(pattern) + 1)
+
+    def skip_to(self, pattern):
+        """
+        Skips up to the next pattern.
+        :return: False if the end of the input came first
+        """
+        while True:
+            index = self.find(pattern, self._chunk_size)
+            if index >= 0:
+                self.skip(index)
+                return True
+            available = self._fill(1)
+            if available < len(pattern):
+                self.skip(available)
+                return False
+            self.skip(available - len(pattern) + 1)
+
+    def at_eof(self):
+        return not self._fill(1)
+
+
+class Base64Stream(io.RawIOBase):
+    """
+    Decodes a base64 file object as it is read, ignoring line breaks.
+    """
+    def __init__(self, file_obj):
+        self._file = file_obj
+        self._pending = b''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while True:
+            chunk = self._file.read(_chunk_size if size < 0 else max(size * 4 // 3 + 4, 4))
+            data = self._pending + b''.join(chunk.split())
+            if not chunk:
+                self._pending = b''
+                # a partial group at the end is dropped, the certificate it belongs to is reported as truncated
+                return base64.b64decode(data[:len(data) - len(data) % 4])
+            usable = len(data) - len(data) % 4
+            self._pending = data[usable:]
+            if usable:
+                return base64.b64decode(data[:usable])
+
+
+def peek_header(reader):
+    """
+    :return: (tag, header length, content length or None when indefinite)
+    :raises ValueError: not a der/ber header
+    """
+    header = reader.peek(6)
+    if len(header) < 2:
+        raise ValueError("Truncated header")
+
+    tag = header[0]
+    if tag & 0x1F == 0x1F:
+        raise ValueError("Unexpected tag 0x{:02X}".format(tag))
+
+    first = header[1]
+    if first < 0x80:
+        return tag, 2, first
+    if first == 0x80:
+        if not tag & 0x20:
+            raise ValueError("Indefinite length on a primitive value")
+        return tag, 2, None
+
+    count = first & 0x7F
+    if count > 4 or len(header) < 2 + count:
+        raise ValueError("Bad length")
+
+    return tag, 2 + count, int.from_bytes(header[2:2 + count], 'big')
+
+
+def skip_element(reader, depth=0):
+    if depth > _max_depth:
+        raise ValueError("Too deeply nested")
+
+    tag, header_length, length = peek_header(reader)
+    reader.read(header_length)
+    if length is not None:
+        if reader.skip(length) < length:
+            raise ValueError("Truncated")
+        return
+
+    while reader.peek(2) != b'\x00\x00':
+        if reader.at_eof():
+            raise ValueError("Truncated")
+        skip_element(reader, depth + 1)
+    reader.read(2)
+
+
+def enter(reader, expected_tag):
+    """
+    Consumes a constructed header.
+    :return: offset of the end of the contents, None when indefinite
+    """
+    tag, header_length, length = peek_header(reader)
+    if tag != expected_tag:
+        raise ValueError("Expected tag 0x{:02X}, found 0x{:02X}".format(expected_tag, tag))
+    reader.read(header_length)
+
+    return None if length is None else reader.offset + length
+
+
+def has_more(reader, end):
+    if end is None:
+        return reader.peek(2) != b'\x00\x00' and not reader.at_eof()
+
+    return reader.offset < end
+
+
+def leave(reader, end):
+    """
+    Skips whatever is left of a constructed value entered with enter.
+    """
+    while has_more(reader, end):
+        skip_element(reader)
+
+    if end is None:
+        if reader.read(2) != b'\x00\x00':
+            raise ValueError("Truncated")
+    elif reader.offset != end:
+        raise ValueError("Element overruns its container")
+
+
+def is_base64(start):
+    """
+    :param start: the first bytes of the input
+    :return: whether the input looks like base64 der, which starts with M for a SEQUENCE
+    """
+    return start[:1] == b'M' and not pem.detect(start) and all(b in base64_characters for b in start)
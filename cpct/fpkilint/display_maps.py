@@ -261,6 +261,9 @@ map_extension_oid_to_display = {
     '2.5.29.17': 'Subject Alt Name',
     '2.5.29.18': 'Issuer Alt Name',
     '2.5.29.19': 'Basic Constraints',
+    '2.5.29.20': 'CRL Number',
+    '2.5.29.27': 'Delta CRL Indicator',
+    '2.5.29.28': 'Issuing Distribution Point',
     '2.5.29.30': 'Name Constraints',
     '2.5.29.31': 'CRL Distribution Points',
     '2.5.29.32': 'Certificate Policies',
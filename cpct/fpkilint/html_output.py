@@ -1,27 +1,89 @@
-
 from fpkilint.profile_conformance import *
 from fpkilint.text2html import text_to_html
+from fpkilint.timing import timed
+import hashlib
 import json
+import os
 
 # _header = "<thead><tr><th>Field</th><th>Content</th><th>Analysis</th></tr></thead>"
 #_cols = "|:-------- |: -------------------------------------- |:--------------------------------------------------- |\n"
 # _all_was_good = "<img class=ok-result src=/static/check-circle.svg border=0 width=20 />"
 _extension_is_critical = "Critical = TRUE<br/>"
 
-def analyze_certificate(cert, profile_file):
+# content for these rows (hex modulus, der2ascii dumps) is sent as a short summary when it is large,
+# the full content is fetched on demand
+_deferred_sections = {'subject_public_key_info', 'other_extensions'}
+_deferred_content_length = 512
+_summary_line_count = 2
 
-    _add_profile_url = True
-    _add_profile_string = True
 
-    with open('fpkilint/profiles/' + profile_file) as json_data:
-        json_profile = json.load(json_data)
+_profiles_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles', '')
+
+# parsed and compiled profiles by template path, the conformance checks only read them
+_json_profiles = {}
+_cert_profiles = {}
+# sha256 of each profile file, see get_profile_digest
+_profile_digests = {}
+
+
+def _load_json_profile(profile_file):
+    json_profile = _json_profiles.get(profile_file)
+    if json_profile is None:
+        with open(_profiles_dir + profile_file) as json_data:
+            json_profile = json.load(json_data)
+        _cert_profiles[profile_file] = compile_profile(json_profile)
+        _json_profiles[profile_file] = json_profile
+
+    return json_profile
+
+
+def _load_cert_profile(profile_file):
+    """
+    :return: the profile from compile_profile(), compiled once per template
+    """
+    cert_profile = _cert_profiles.get(profile_file)
+    if cert_profile is None:
+        _load_json_profile(profile_file)
+        cert_profile = _cert_profiles[profile_file]
+
+    return cert_profile
 
-    output_rows, other_extensions_rows, profile_info = check_cert_conformance(cert, json_profile)
+
+def load_all_profiles():
+    """
+    Parses and compiles every profile up front so the first certificate linted against each one doesn't pay
+    for it.
+    :return: {template path: json profile}
+    """
+    for dir_path, dir_names, file_names in os.walk(_profiles_dir):
+        for file_name in file_names:
+            if file_name.endswith('.json'):
+                _load_json_profile(os.path.relpath(os.path.join(dir_path, file_name), _profiles_dir))
+
+    return dict(_json_profiles)
+
+
+def get_profile_digest(profile_file):
+    """
+    :return: sha256 (hex) of the profile file, it changes whenever the profile is edited
+    """
+    digest = _profile_digests.get(profile_file)
+    if digest is None:
+        with open(_profiles_dir + profile_file, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        _profile_digests[profile_file] = digest
+
+    return digest
+
+
+def _get_profile_strings(profile_info):
+
+    _add_profile_url = True
+    _add_profile_string = True
 
     cert_type = None
     profile_string = None
     profile_url = None
-    short_name = get_short_name_from_cert(cert)
 
     if profile_info is not None:
         if 'cert_type' in profile_info and len(profile_info['cert_type'].value) > 0:
@@ -35,29 +97,81 @@ def analyze_certificate(cert, profile_file):
         if _add_profile_url and 'more_info_url' in profile_info and len(profile_info['more_info_url'].value) > 0:
             profile_url = profile_info['more_info_url'].value
 
-    rows = []
-    for i, (key, r) in enumerate(other_extensions_rows.items()):
-        output_rows[key] = r
+    return cert_type, profile_string, profile_url
 
-    for key, r in output_rows.items():
-        name = r.row_name
 
-        if r.extension_is_critical:
-            content = _extension_is_critical
-        else:
-            content = ""
+def _get_row_key(r):
+    if r.config_section == 'other_extensions':
+        return r.extension_oid
+    return r.config_section
 
-        content += text_to_html(r.content, lint_cert_indent, lint_cert_newline)
 
-        # Analysis
-        if r.analysis:
-            analysis = text_to_html(r.analysis, lint_cert_indent, lint_cert_newline)
-        else:
-            analysis = None
+def _get_content_summary(r):
+    if r.config_section not in _deferred_sections or len(r.content) <= _deferred_content_length:
+        return None
+
+    lines = [line for line in r.content.split(lint_cert_newline) if line.strip()]
+    summary = lint_cert_newline.join(lines[:_summary_line_count])
+
+    return text_to_html(summary, lint_cert_indent, lint_cert_newline)
+
+
+def _format_row(r):
+    with timed('text_to_html'):
+        return _format_row_html(r)
+
+
+def _format_row_html(r):
+    name = r.row_name
+
+    if r.extension_is_critical:
+        content = _extension_is_critical
+    else:
+        content = ""
+
+    content += text_to_html(r.content, lint_cert_indent, lint_cert_newline)
+
+    # Analysis
+    if r.analysis:
+        analysis = text_to_html(r.analysis, lint_cert_indent, lint_cert_newline)
+    else:
+        analysis = None
+
+    summary = _get_content_summary(r)
+    if summary is not None and r.extension_is_critical:
+        summary = _extension_is_critical + summary
+
+    # findings for other extensions are told apart by the extension oid
+    findings = [{'code': _get_row_key(r), 'severity': severity, 'message': message}
+                for severity, message in r.findings]
+
+    return {'name': name, 'content': content, 'analysis': analysis, 'key': _get_row_key(r), 'summary': summary,
+            'findings': findings}
+
+
+def iter_analyze_certificate(cert, profile_file):
+    """
+    Streaming version of analyze_certificate. The first item is the header dict (type, string, url and
+    short_name), every following item is a row dict, yielded as soon as its conformance check completes.
+    """
+    cert_profile = _load_cert_profile(profile_file)
+
+    cert_type, profile_string, profile_url = _get_profile_strings(get_profile_info_section(cert_profile))
+
+    yield {'type': cert_type, 'string': profile_string, 'url': profile_url,
+           'short_name': get_short_name_from_cert(cert)}
+
+    for r in iter_cert_conformance(cert, cert_profile):
+        yield _format_row(r)
+
+
+def analyze_certificate(cert, profile_file):
 
-        rows.append({'name': name, 'content': content, 'analysis': analysis})
+    results = iter_analyze_certificate(cert, profile_file)
+    header = next(results)
+    rows = list(results)
 
-    return rows, cert_type, profile_string, profile_url, short_name
+    return rows, header['type'], header['string'], header['url'], header['short_name']
 
 
 
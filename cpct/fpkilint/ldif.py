@@ -0,0 +1,223 @@
+"""
+LDIF directory exports for the batch linter. Reads the export one line at a time and lints every
+certificate in the userCertificate, cACertificate and crossCertificatePair attributes (with or without
+;binary), each with the DN of the entry it came from.
+
+    cd cpct && python -m fpkilint.ldif fbca/1.9/5-ee-signature.json export.ldif --workers 8 > results.jsonl
+
+Change records (changetype: add or modify) are read the same way, so certificates added or replaced
+by an update file are linted too.
+
+Only the current line is held in memory, so the size of the export doesn't matter. Values written to
+files by ldapsearch -t (attr:< file://...) are read from those files.
+"""
+from fpkilint.batch import BatchItem, add_lint_arguments, iter_lint_batch, run_from_arguments
+from asn1crypto import parser as asn1_parser
+import argparse
+import base64
+import binascii
+import functools
+import sys
+import urllib.parse
+import urllib.request
+
+certificate_attributes = ('usercertificate', 'cacertificate', 'crosscertificatepair')
+
+_cross_certificate_pair = 'crosscertificatepair'
+_pair_names = {0: 'forward', 1: 'reverse'}
+
+# an attribute value read from a file can't be bigger than this and be a certificate
+_max_value_size = 1024 * 1024
+
+
+class LDIFError(ValueError):
+    pass
+
+
+def _iter_logical_lines(f):
+    """
+    Unfolds continuation lines and drops comments.
+    :return: generator of (offset, line), b'' for the blank line ending each entry
+    """
+    offset = 0
+    parts = None
+    parts_offset = 0
+    comment = False
+
+    for raw_line in f:
+        line = raw_line.rstrip(b'\r\n')
+        line_offset = offset
+        offset += len(raw_line)
+
+        if line.startswith(b' ') and (parts is not None or comment):
+            if not comment:
+                parts.append(line[1:])
+            continue
+
+        if parts is not None:
+            yield parts_offset, b''.join(parts)
+        parts = None
+        comment = False
+
+        if not line:
+            yield line_offset, b''
+        elif line.startswith(b'#'):
+            comment = True
+        else:
+            parts = [line]
+            parts_offset = line_offset
+
+    if parts is not None:
+        yield parts_offset, b''.join(parts)
+
+
+def _read_url(url):
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme != 'file':
+        raise LDIFError("Only file:// values can be read, not {}".format(url))
+
+    with open(urllib.request.url2pathname(parsed.path), 'rb') as f:
+        value = f.read(_max_value_size + 1)
+    if len(value) > _max_value_size:
+        raise LDIFError("{} is too big to be a certificate".format(url))
+
+    return value
+
+
+def _decode_value(value):
+    """
+    :param value: what follows the attribute name and first colon
+    """
+    if value.startswith(b':'):
+        try:
+            return base64.b64decode(value[1:].strip(), validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise LDIFError("Bad base64: {}".format(e))
+
+    if value.startswith(b'<'):
+        try:
+            return _read_url(value[1:].strip().decode('utf-8'))
+        except (OSError, UnicodeDecodeError) as e:
+            raise LDIFError(str(e))
+
+    return value.lstrip(b' ')
+
+
+def split_certificate_pair(der):
+    """
+    :param der: CertificatePair ::= SEQUENCE { forward [0] Certificate OPTIONAL,
+                                               reverse [1] Certificate OPTIONAL }
+    :return: [('forward' or 'reverse', certificate der), ...]
+    """
+    try:
+        class_, method, tag, header, contents, trailer = asn1_parser.parse(der, strict=True)
+    except ValueError as e:
+        raise LDIFError("Bad crossCertificatePair: {}".format(e))
+    if class_ != 0 or tag != 16:
+        raise LDIFError("crossCertificatePair is not a SEQUENCE")
+
+    certificates = []
+    offset = 0
+    while offset < len(contents):
+        try:
+            class_, method, tag, header, value, trailer = asn1_parser.parse(contents[offset:])
+        except ValueError as e:
+            raise LDIFError("Bad crossCertificatePair: {}".format(e))
+        offset += len(header) + len(value) + len(trailer)
+        if class_ != 2 or tag not in _pair_names:
+            raise LDIFError("Unexpected element in crossCertificatePair")
+        certificates.append((_pair_names[tag], value))
+
+    return certificates
+
+
+def iter_ldif_items(f, source, attributes=certificate_attributes):
+    """
+    :param f: binary file object of the LDIF export
+    :param attributes: lower case attribute names to read certificates from, options (;binary) aside
+    :return: generator of BatchItem, the offset is that of the attribute's line and the metadata holds
+    the entry's dn and the attribute
+    """
+    dn = None
+
+    for offset, line in _iter_logical_lines(f):
+        if not line:
+            dn = None
+            continue
+
+        # ends a modification in a change record (changetype: modify), the entry goes on
+        if line.rstrip(b' ') == b'-':
+            continue
+
+        name, separator, value = line.partition(b':')
+        if not separator:
+            yield BatchItem(source, offset, None, "Not an LDIF attribute line", {'dn': dn})
+            continue
+
+        name = name.decode('utf-8', 'replace')
+        base_name = name.split(';')[0].lower()
+
+        if base_name == 'dn':
+            try:
+                dn = _decode_value(value).decode('utf-8')
+            except (LDIFError, UnicodeDecodeError) as e:
+                dn = None
+                yield BatchItem(source, offset, None, "Bad dn: {}".format(e), None)
+            continue
+
+        if base_name not in attributes:
+            continue
+
+        metadata = {'dn': dn, 'attribute': name}
+        try:
+            der = _decode_value(value)
+            if base_name == _cross_certificate_pair:
+                certificates = split_certificate_pair(der)
+            else:
+                certificates = [(None, der)]
+        except LDIFError as e:
+            yield BatchItem(source, offset, None, str(e), metadata)
+            continue
+
+        for pair_name, der in certificates:
+            if pair_name is not None:
+                metadata = dict(metadata, pair=pair_name)
+            yield BatchItem(source, offset, der, None, metadata)
+
+
+def iter_ldif_file_items(paths, attributes=certificate_attributes):
+    """
+    :param paths: LDIF files, - for stdin
+    :return: generator of BatchItem, see iter_ldif_items
+    """
+    for path in paths:
+        if path == '-':
+            for item in iter_ldif_items(sys.stdin.buffer, path, attributes):
+                yield item
+            continue
+
+        try:
+            with open(path, 'rb') as f:
+                for item in iter_ldif_items(f, path, attributes):
+                    yield item
+        except OSError as e:
+            yield BatchItem(path, None, None, str(e), None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Lint the certificates in LDIF directory exports')
+    add_lint_arguments(parser)
+    parser.add_argument('files', nargs='+', help='LDIF files, - for stdin')
+    parser.add_argument('--attribute', action='append', dest='attributes',
+                        help='attribute holding certificates, can be repeated (default: {})'.format(
+                            ', '.join(certificate_attributes)))
+    args = parser.parse_args(argv)
+
+    attributes = tuple(a.lower() for a in args.attributes) if args.attributes else certificate_attributes
+    items = iter_ldif_file_items(args.files, attributes)
+
+    return run_from_arguments(parser, args, functools.partial(iter_lint_batch, items))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Load generator for fpkilint.lint_server. Opens one connection per client process and sends the given
+certificates round robin as fast as the server answers, then reports throughput and latency percentiles.
+
+    python -m fpkilint.lint_bench /run/cpct/lint.sock fbca/1.9/5-ee-signature.json cert1.cer cert2.cer \\
+        --clients 4 --requests 2000
+"""
+from fpkilint.lint_server import LintClient, KIND_CERTIFICATE, KIND_TBS_CERTIFICATE
+from fpkilint.cert_utils import parse_certificate
+import argparse
+import multiprocessing
+import sys
+import time
+
+
+def _load_der(file_name, tbs):
+    with open(file_name, 'rb') as f:
+        cert = parse_certificate(f.read())
+
+    if tbs:
+        return cert['tbs_certificate'].dump()
+
+    return cert.dump()
+
+
+def _client(path, template, ders, requests, kind, warmup):
+    latencies = []
+    with LintClient(path) as client:
+        for i in range(warmup):
+            client.lint(ders[i % len(ders)], template, kind)
+
+        for i in range(requests):
+            start = time.perf_counter()
+            client.lint(ders[i % len(ders)], template, kind)
+            latencies.append(time.perf_counter() - start)
+
+    return latencies
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Lint server load generator')
+    parser.add_argument('socket')
+    parser.add_argument('template', help='profile template, e.g. fbca/1.9/5-ee-signature.json')
+    parser.add_argument('certs', nargs='+', help='certificate files (pem or der)')
+    parser.add_argument('--clients', type=int, default=1, help='concurrent client processes')
+    parser.add_argument('--requests', type=int, default=1000, help='requests per client')
+    parser.add_argument('--warmup', type=int, default=50, help='untimed requests per client')
+    parser.add_argument('--tbs', action='store_true', help='send the TBS certificates instead')
+    args = parser.parse_args(argv)
+
+    ders = [_load_der(file_name, args.tbs) for file_name in args.certs]
+    kind = KIND_TBS_CERTIFICATE if args.tbs else KIND_CERTIFICATE
+    job = (args.socket, args.template, ders, args.requests, kind, args.warmup)
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.clients) as pool:
+        results = pool.starmap(_client, [job] * args.clients)
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for result in results for latency in result)
+
+    print('{} requests from {} clients in {:.2f}s, {:.0f} requests/s'.format(
+        len(latencies), args.clients, elapsed, len(latencies) / elapsed))
+    for label, fraction in (('p50', .5), ('p90', .9), ('p99', .99), ('p99.9', .999)):
+        print('{:6} {:8.3f} ms'.format(label, percentile(latencies, fraction) * 1000))
+    print('{:6} {:8.3f} ms'.format('max', latencies[-1] * 1000))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
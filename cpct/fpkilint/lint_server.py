@@ -0,0 +1,421 @@
+"""
+Lint daemon for CA pre-issuance hooks. Keeps every profile parsed and compiled in memory and lints
+certificates (or TBS certificates) sent over a Unix domain socket.
+
+    cd cpct && python -m fpkilint.lint_server /run/cpct/lint.sock --workers 4
+
+Protocol, all integers big endian. Every message is a frame: 4 byte length, then the payload.
+A connection can carry any number of requests; each request is answered before the next is read.
+
+Request payload:
+    1 byte   kind, 0 = DER certificate, 1 = DER TBS certificate
+    2 bytes  template length, then the template path (utf-8), e.g. fbca/1.9/5-ee-signature.json
+    rest     DER
+
+Response payload:
+    1 byte   status, STATUS_OK or one of the error statuses below
+    if STATUS_OK:
+        1 byte   verdict, VERDICT_PASS / VERDICT_WARN / VERDICT_FAIL
+        2 bytes  finding count, then per finding:
+            1 byte   severity, SEVERITY_INFO / SEVERITY_WARN / SEVERITY_FAIL
+            1 byte   code length, then the code (utf-8), the row key of the web results: the profile
+                     section, e.g. key_usage, or the extension OID for other_extensions
+            2 bytes  message length, then the message (utf-8)
+    otherwise:
+        2 bytes  message length, then the error message (utf-8)
+"""
+from fpkilint.cert_utils import parse_certificate, parse_tbs_certificate
+from fpkilint.html_output import _get_row_key, load_all_profiles
+from fpkilint.profile_conformance import compile_profile, is_cert_profile, iter_cert_conformance
+import argparse
+import logging
+import os
+import signal
+import socket
+import struct
+import sys
+
+logger = logging.getLogger(__name__)
+
+KIND_CERTIFICATE = 0
+KIND_TBS_CERTIFICATE = 1
+
+STATUS_OK = 0
+STATUS_PARSE_ERROR = 1
+STATUS_UNKNOWN_PROFILE = 2
+STATUS_TIMEOUT = 3
+STATUS_ERROR = 4
+STATUS_BAD_REQUEST = 5
+
+VERDICT_PASS = 0
+VERDICT_WARN = 1
+VERDICT_FAIL = 2
+
+SEVERITY_INFO = 0
+SEVERITY_WARN = 1
+SEVERITY_FAIL = 2
+
+_severity_codes = {'INFO': SEVERITY_INFO, 'WARN': SEVERITY_WARN, 'FAIL': SEVERITY_FAIL}
+
+_frame_header = struct.Struct('>I')
+_request_header = struct.Struct('>BH')
+_max_frame_length = 1024 * 1024
+
+# an idle connection is closed after this many seconds so it doesn't hold a worker
+_idle_timeout = 60
+
+
+class LintServerError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class _LintTimeout(Exception):
+    pass
+
+
+def _recv_exactly(conn, length):
+    data = bytearray()
+    while len(data) < length:
+        chunk = conn.recv(length - len(data))
+        if not chunk:
+            return None
+        data += chunk
+
+    return bytes(data)
+
+
+def recv_frame(conn):
+    """
+    :return: the frame payload, or None if the connection was closed
+    """
+    header = _recv_exactly(conn, _frame_header.size)
+    if header is None:
+        return None
+
+    length, = _frame_header.unpack(header)
+    if length > _max_frame_length:
+        raise LintServerError(STATUS_BAD_REQUEST, "Frame too long ({} bytes)".format(length))
+
+    return _recv_exactly(conn, length)
+
+
+def send_frame(conn, payload):
+    conn.sendall(_frame_header.pack(len(payload)) + payload)
+
+
+def encode_request(der, template, kind=KIND_CERTIFICATE):
+    template = template.encode('utf-8')
+    return _request_header.pack(kind, len(template)) + template + der
+
+
+def decode_request(payload):
+    if len(payload) < _request_header.size:
+        raise LintServerError(STATUS_BAD_REQUEST, "Request too short")
+
+    kind, template_length = _request_header.unpack_from(payload)
+    start = _request_header.size
+    template = payload[start:start + template_length].decode('utf-8')
+
+    return kind, template, payload[start + template_length:]
+
+
+def _encode_string(value, length_format):
+    value = value.encode('utf-8')
+    limit = 256 ** struct.calcsize(length_format) - 1
+    if len(value) > limit:
+        # cut at a character boundary, the client has to be able to decode it
+        value = value[:limit].decode('utf-8', 'ignore').encode('utf-8')
+
+    return struct.pack('>' + length_format, len(value)) + value
+
+
+def encode_result(verdict, findings):
+    """
+    :param verdict: VERDICT_*
+    :param findings: list of (severity, code, message)
+    """
+    parts = [struct.pack('>BBH', STATUS_OK, verdict, len(findings))]
+    for severity, code, message in findings:
+        parts.append(struct.pack('>B', severity))
+        parts.append(_encode_string(code, 'B'))
+        parts.append(_encode_string(message, 'H'))
+
+    return b''.join(parts)
+
+
+def encode_error(status, message):
+    return struct.pack('>B', status) + _encode_string(message, 'H')
+
+
+def decode_response(payload):
+    """
+    :return: (verdict, [(severity, code, message), ...])
+    :raises LintServerError: the server answered with an error status
+    """
+    status = payload[0]
+    if status != STATUS_OK:
+        length, = struct.unpack_from('>H', payload, 1)
+        raise LintServerError(status, payload[3:3 + length].decode('utf-8'))
+
+    verdict, count = struct.unpack_from('>BH', payload, 1)
+    offset = 4
+    findings = []
+    for _ in range(count):
+        severity, code_length = struct.unpack_from('>BB', payload, offset)
+        offset += 2
+        code = payload[offset:offset + code_length].decode('utf-8')
+        offset += code_length
+        message_length, = struct.unpack_from('>H', payload, offset)
+        offset += 2
+        message = payload[offset:offset + message_length].decode('utf-8')
+        offset += message_length
+        findings.append((severity, code, message))
+
+    return verdict, findings
+
+
+def _load_input(kind, der):
+    if kind == KIND_CERTIFICATE:
+        return parse_certificate(der)
+
+    if kind == KIND_TBS_CERTIFICATE:
+        return parse_tbs_certificate(der)
+
+    raise LintServerError(STATUS_BAD_REQUEST, "Unknown input kind {}".format(kind))
+
+
+def lint(cert, cert_profile):
+    """
+    :param cert: x509.Certificate or x509.TbsCertificate
+    :param cert_profile: profile from compile_profile()
+    :return: (verdict, [(severity, code, message), ...])
+    """
+    findings = []
+    verdict = VERDICT_PASS
+
+    for r in iter_cert_conformance(cert, cert_profile):
+        for severity, message in r.findings:
+            severity = _severity_codes[severity]
+            findings.append((severity, _get_row_key(r), message))
+            if severity == SEVERITY_FAIL:
+                verdict = VERDICT_FAIL
+            elif severity == SEVERITY_WARN and verdict == VERDICT_PASS:
+                verdict = VERDICT_WARN
+
+    return verdict, findings
+
+
+def _on_alarm(signum, frame):
+    raise _LintTimeout()
+
+
+class LintServer:
+    """
+    Pre-forking server. The parent compiles every profile, binds the socket and forks the workers,
+    so they all start warm and share the compiled profiles. Each worker serves one connection at a time
+    and is replaced after max_requests requests, or when it dies.
+    """
+    def __init__(self, path, workers=4, timeout=5.0, max_requests=10000):
+        self.path = path
+        self.workers = workers
+        self.timeout = timeout
+        self.max_requests = max_requests
+        # CRL profiles are left out, a certificate linted against one is an unknown profile
+        self.profiles = {template: compile_profile(json_profile)
+                         for template, json_profile in load_all_profiles().items() if is_cert_profile(json_profile)}
+        self._children = set()
+        self._stopping = False
+        self._socket = None
+
+    def handle(self, payload):
+        """
+        :param payload: request frame payload
+        :return: response frame payload
+        """
+        try:
+            kind, template, der = decode_request(payload)
+        except (LintServerError, UnicodeDecodeError) as e:
+            return encode_error(STATUS_BAD_REQUEST, str(e))
+
+        cert_profile = self.profiles.get(template)
+        if cert_profile is None:
+            return encode_error(STATUS_UNKNOWN_PROFILE, "Unknown profile {}".format(template))
+
+        signal.setitimer(signal.ITIMER_REAL, self.timeout)
+        try:
+            try:
+                cert = _load_input(kind, der)
+            except LintServerError as e:
+                return encode_error(e.status, str(e))
+            except _LintTimeout:
+                raise
+            except Exception as e:
+                return encode_error(STATUS_PARSE_ERROR, str(e))
+
+            return encode_result(*lint(cert, cert_profile))
+        except _LintTimeout:
+            logger.warning('Lint of %s timed out after %ss', template, self.timeout)
+            return encode_error(STATUS_TIMEOUT, "Linting took longer than {} seconds".format(self.timeout))
+        except Exception as e:
+            logger.exception('Lint failed for %s', template)
+            return encode_error(STATUS_ERROR, '{}: {}'.format(type(e).__name__, e))
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    def _serve_connection(self, conn, requests):
+        conn.settimeout(_idle_timeout)
+        while requests < self.max_requests:
+            try:
+                payload = recv_frame(conn)
+            except LintServerError as e:
+                send_frame(conn, encode_error(e.status, str(e)))
+                break
+            if payload is None:
+                break
+            send_frame(conn, self.handle(payload))
+            requests += 1
+
+        return requests
+
+    def _worker_main(self):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGALRM, _on_alarm)
+
+        requests = 0
+        while requests < self.max_requests:
+            conn, address = self._socket.accept()
+            try:
+                requests = self._serve_connection(conn, requests)
+            except (OSError, socket.timeout):
+                pass
+            finally:
+                conn.close()
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._worker_main()
+            except BaseException:
+                logger.exception('Lint server worker failed')
+                code = 1
+            finally:
+                os._exit(code)
+
+        self._children.add(pid)
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+        for pid in self._children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def serve_forever(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self.path)
+        self._socket.listen(128)
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        logger.info('Lint server listening on %s with %d workers, %d profiles', self.path, self.workers,
+                    len(self.profiles))
+
+        try:
+            for _ in range(self.workers):
+                self._spawn()
+
+            while self._children:
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:
+                    break
+                except InterruptedError:
+                    continue
+
+                self._children.discard(pid)
+                if not self._stopping:
+                    self._spawn()
+        finally:
+            self._socket.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+class LintClient:
+    """
+    Keeps one connection to the lint server open. Workers are recycled and close idle connections, so
+    a request that finds the connection closed is retried once on a new one.
+
+        with LintClient('/run/cpct/lint.sock') as client:
+            verdict, findings = client.lint(der, 'fbca/1.9/5-ee-signature.json')
+    """
+    def __init__(self, path, timeout=None):
+        self.path = path
+        self.timeout = timeout
+        self.conn = None
+        self._connect()
+
+    def _connect(self):
+        self.conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.conn.settimeout(self.timeout)
+        self.conn.connect(self.path)
+
+    def _request(self, request):
+        try:
+            send_frame(self.conn, request)
+            return recv_frame(self.conn)
+        except (BrokenPipeError, ConnectionResetError):
+            return None
+
+    def lint(self, der, template, kind=KIND_CERTIFICATE):
+        """
+        :return: (verdict, [(severity, code, message), ...])
+        :raises LintServerError: the server answered with an error status
+        """
+        request = encode_request(der, template, kind)
+        payload = self._request(request)
+        if payload is None:
+            self.conn.close()
+            self._connect()
+            payload = self._request(request)
+            if payload is None:
+                raise LintServerError(STATUS_ERROR, "Connection closed by the lint server")
+
+        return decode_response(payload)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Certificate profile lint server')
+    parser.add_argument('socket', help='path of the unix domain socket to listen on')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--timeout', type=float, default=5.0, help='seconds allowed per certificate')
+    parser.add_argument('--max-requests', type=int, default=10000,
+                        help='requests a worker serves before it is replaced')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(levelname)s %(message)s')
+
+    LintServer(args.socket, args.workers, args.timeout, args.max_requests).serve_forever()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
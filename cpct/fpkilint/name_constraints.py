@@ -0,0 +1,269 @@
+"""
+Name constraints enforcement. A CA's nameConstraints extension is compiled once into matchers, then
+every name in the certificates below it is checked with a lookup per name instead of a comparison
+against every subtree:
+
+    dNSName        suffix trie of labels
+    rfc822Name     mailbox set, host set and suffix trie for .domain constraints
+    URI            host set and suffix trie for .domain constraints
+    iPAddress      set of networks per prefix length
+    directoryName  trie of normalized RDNs, matching a DN prefix
+
+Names are checked as in RFC 5280 6.1.3 (b) and (c): no name may be within an excluded subtree, and a
+name of a type that has permitted subtrees must be within one of them. The subject DN counts as a
+directoryName (when not empty) and emailAddress attributes in it as rfc822Names.
+"""
+from fpkilint.name_utils import get_dn_key, get_general_name_string, get_pretty_dn
+import ipaddress
+import urllib.parse
+
+# trie node keys that can't be labels
+_whole = object()
+_below = object()
+
+_email_address_oid = '1.2.840.113549.1.9.1'
+
+
+class _SuffixTrie:
+    """
+    Domains stored label by label from the right. A domain matches itself and everything below it, a
+    domain with a leading dot only what is below it.
+    """
+    def __init__(self):
+        self.root = {}
+
+    def add(self, domain):
+        below = domain.startswith('.')
+        node = self.root
+        for label in reversed(_split_domain(domain)):
+            node = node.setdefault(label, {})
+        node[_below if below else _whole] = True
+
+    def matches(self, domain):
+        labels = _split_domain(domain)
+        node = self.root
+        for label in reversed(labels):
+            if _whole in node or _below in node:
+                return True
+            node = node.get(label)
+            if node is None:
+                return False
+
+        return _whole in node
+
+
+def _split_domain(domain):
+    domain = domain.strip('.').lower()
+    if not domain:
+        return []
+
+    return domain.split('.')
+
+
+def _get_ip_network(contents):
+    """
+    :param contents: iPAddress constraint contents, address followed by mask
+    :return: ipaddress network
+    """
+    half = len(contents) // 2
+    address = int.from_bytes(contents[:half], 'big')
+    mask = int.from_bytes(contents[half:], 'big')
+    prefix_length = bin(mask).count('1')
+    if half == 4:
+        return ipaddress.IPv4Network((address & mask, prefix_length))
+
+    return ipaddress.IPv6Network((address & mask, prefix_length))
+
+
+class _Subtrees:
+    """
+    One side of a nameConstraints extension, permitted or excluded, compiled into matchers.
+    """
+    def __init__(self, general_subtrees):
+        self.types = set()
+        self.unsupported = []
+
+        self.dns = _SuffixTrie()
+        self.mailboxes = set()
+        self.mail_hosts = set()
+        self.mail_domains = _SuffixTrie()
+        self.uri_hosts = set()
+        self.uri_domains = _SuffixTrie()
+        self.networks = {}  # (version, prefix length): set of network addresses
+        self.directory_names = {}
+
+        for general_subtree in general_subtrees:
+            self._add(general_subtree['base'])
+
+    def _add(self, general_name):
+        name_type = general_name.name
+        value = general_name.native
+        self.types.add(name_type)
+
+        if name_type == 'dns_name':
+            self.dns.add(value)
+        elif name_type == 'rfc822_name':
+            if '@' in value:
+                self.mailboxes.add(_normalize_mailbox(value))
+            elif value.startswith('.'):
+                self.mail_domains.add(value)
+            else:
+                self.mail_hosts.add(value.lower())
+        elif name_type == 'uniform_resource_identifier':
+            if value.startswith('.'):
+                self.uri_domains.add(value)
+            else:
+                self.uri_hosts.add(value.lower())
+        elif name_type == 'ip_address':
+            contents = general_name.chosen.contents
+            if len(contents) not in (8, 32):
+                self.unsupported.append("iPAddress constraint with {} bytes".format(len(contents)))
+                return
+            network = _get_ip_network(contents)
+            key = (network.version, network.prefixlen)
+            self.networks.setdefault(key, set()).add(int(network.network_address))
+        elif name_type == 'directory_name':
+            node = self.directory_names
+            for rdn_key in get_dn_key(general_name.chosen).rdns:
+                node = node.setdefault(rdn_key, {})
+            node[_whole] = True
+        else:
+            self.unsupported.append(get_general_name_string(general_name))
+
+    def matches(self, name_type, value):
+        """
+        :param value: name as from get_constrained_names
+        """
+        if name_type == 'dns_name':
+            return self.dns.matches(value)
+
+        if name_type == 'rfc822_name':
+            mailbox = _normalize_mailbox(value)
+            host = mailbox.rpartition('@')[2]
+            return mailbox in self.mailboxes or host in self.mail_hosts or self.mail_domains.matches(host)
+
+        if name_type == 'uniform_resource_identifier':
+            host = _get_uri_host(value)
+            if host is None:
+                return False
+            return host in self.uri_hosts or self.uri_domains.matches(host)
+
+        if name_type == 'ip_address':
+            address = ipaddress.ip_address(value)
+            for (version, prefix_length), networks in self.networks.items():
+                if version != address.version:
+                    continue
+                shift = address.max_prefixlen - prefix_length
+                if (int(address) >> shift) << shift in networks:
+                    return True
+            return False
+
+        if name_type == 'directory_name':
+            node = self.directory_names
+            if _whole in node:
+                return True
+            for rdn_key in value:
+                node = node.get(rdn_key)
+                if node is None:
+                    return False
+                if _whole in node:
+                    return True
+            return False
+
+        return False
+
+
+def _normalize_mailbox(mailbox):
+    # the local part is case sensitive, the host isn't
+    local_part, separator, host = mailbox.rpartition('@')
+
+    return local_part + separator + host.lower()
+
+
+def _get_uri_host(uri):
+    try:
+        host = urllib.parse.urlsplit(uri).hostname
+    except ValueError:
+        return None
+
+    return host or None
+
+
+def get_constrained_names(tbs):
+    """
+    :param tbs: x509.TbsCertificate
+    :return: list of (name type, value, display string) for the names name constraints apply to; the
+    value of a directoryName is its tuple of normalized RDNs
+    """
+    names = []
+
+    subject = tbs['subject']
+    if len(subject.chosen) > 0:
+        names.append(('directory_name', get_dn_key(subject).rdns, get_pretty_dn(subject, ', ', '=')))
+        for rdn in subject.chosen:
+            for type_and_value in rdn:
+                if type_and_value['type'].dotted == _email_address_oid:
+                    email = type_and_value['value'].native
+                    names.append(('rfc822_name', email, 'emailAddress={}'.format(email)))
+
+    for extension in tbs['extensions']:
+        if extension['extn_id'].native != 'subject_alt_name':
+            continue
+        for general_name in extension['extn_value'].parsed:
+            name_type = general_name.name
+            if name_type == 'directory_name':
+                value = get_dn_key(general_name.chosen).rdns
+            elif name_type == 'ip_address':
+                value = str(ipaddress.ip_address(general_name.chosen.contents))
+            elif name_type in ('dns_name', 'rfc822_name', 'uniform_resource_identifier'):
+                value = general_name.native
+            else:
+                value = None
+            names.append((name_type, value, get_general_name_string(general_name)))
+
+    return names
+
+
+class NameConstraints:
+    """
+    A compiled nameConstraints extension.
+    """
+    def __init__(self, name_constraints):
+        """
+        :param name_constraints: x509.NameConstraints
+        """
+        self.permitted = None
+        self.excluded = None
+        if name_constraints['permitted_subtrees'].native:
+            self.permitted = _Subtrees(name_constraints['permitted_subtrees'])
+        if name_constraints['excluded_subtrees'].native:
+            self.excluded = _Subtrees(name_constraints['excluded_subtrees'])
+
+    @classmethod
+    def from_tbs(cls, tbs):
+        """
+        :return: NameConstraints for the certificate, None without the extension
+        """
+        for extension in tbs['extensions']:
+            if extension['extn_id'].native == 'name_constraints':
+                return cls(extension['extn_value'].parsed)
+
+        return None
+
+    def iter_violations(self, names):
+        """
+        :param names: from get_constrained_names
+        :return: generator of (display string, 'excluded' or 'not permitted')
+        """
+        for name_type, value, display in names:
+            if value is None:
+                # name forms there are no matchers for
+                if self.permitted is not None and name_type in self.permitted.types:
+                    yield display, 'not permitted'
+                continue
+            if self.excluded is not None and name_type in self.excluded.types and \
+                    self.excluded.matches(name_type, value):
+                yield display, 'excluded'
+            elif self.permitted is not None and name_type in self.permitted.types and \
+                    not self.permitted.matches(name_type, value):
+                yield display, 'not permitted'
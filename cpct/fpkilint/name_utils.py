@@ -1,5 +1,8 @@
 from asn1crypto import x509
 from fpkilint.display_maps import *
+import collections
+import hashlib
+import logging
 import textwrap
 import urllib.parse
 
@@ -37,6 +40,19 @@ from asn1crypto.core import (
     VOID,
 )
 
+logger = logging.getLogger(__name__)
+
+DNKey = collections.namedtuple('DNKey', 'normalized digest rdns')
+DNKey.__doc__ = """
+normalized: the DN prepared for comparison (RFC 5280 7.1, RFC 4518), utf-8
+digest: sha256 of normalized, two DNs match when their digests are equal
+rdns: tuple of the prepared RDNs, str, for prefix comparison
+"""
+
+# dn der: DNKey, see get_dn_key
+_dn_keys = {}
+_max_dn_keys = 65536
+
 
 def is_name_type_in_dn(oid_string, x509_name):
     if not isinstance(x509_name, x509.Name):
@@ -96,7 +112,7 @@ def get_abstract_string_type(abstract_string):
         string_type = 'Numeric'
     else:
         string_type = abstract_string.__class__.__name__
-        print('No case for ' + string_type + ' in get_abstract_string_type')
+        logger.debug('No case for %s in get_abstract_string_type', string_type)
 
     return string_type
 
@@ -291,6 +307,48 @@ def get_short_name_from_dn(name):
     return name.native[next(reversed(name.native))]
 
 
+def _get_rdn_key(rdn):
+    values = []
+    for type_and_value in rdn:
+        if isinstance(type_and_value['value'].native, str):
+            value = type_and_value.prepped_value
+        else:
+            value = type_and_value['value'].dump().hex()
+        values.append('{}={}'.format(type_and_value['type'].dotted, value))
+
+    # the values of a multi-valued RDN are a set
+    return '\x1f'.join(sorted(values))
+
+
+def get_dn_key(name):
+    """
+    Canonical form of a DN for matching names, computed once per distinct name and cached.
+    :param name: x509.Name
+    :return: DNKey
+    """
+    der = name.dump()
+    dn_key = _dn_keys.get(der)
+    if dn_key is not None:
+        return dn_key
+
+    rdns = tuple(_get_rdn_key(rdn) for rdn in name.chosen)
+    normalized = '\x1e'.join(rdns).encode('utf-8')
+    dn_key = DNKey(normalized, hashlib.sha256(normalized).digest(), rdns)
+
+    if len(_dn_keys) >= _max_dn_keys:
+        _dn_keys.clear()
+    _dn_keys[der] = dn_key
+
+    return dn_key
+
+
+def is_same_dn(name, other_name):
+    """
+    :return: whether the x509.Names match, RFC 5280 7.1
+    """
+    return get_dn_key(name).digest == get_dn_key(other_name).digest
+
+
 def binary_to_hex_string(byte_value, multi_line=None):
     if not isinstance(byte_value, bytes):
         return "You must pass in bytes..."
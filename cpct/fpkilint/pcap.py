@@ -0,0 +1,530 @@
+"""
+Certificates served by TLS endpoints, taken from packet captures. Reads pcap and pcapng files one packet
+at a time, reassembles each TCP stream far enough to read the TLS 1.0 - 1.2 handshake and lints the
+certificate chain from every server Certificate message. A certificate seen more than once (the same
+server, or the same intermediate behind many servers) is only linted the first time, as long as it is among
+the _max_seen_certificates most recently seen.
+
+    cd cpct && python -m fpkilint.pcap fbca/1.9/5-ee-signature.json capture.pcapng --workers 8 > results.jsonl
+
+Memory is bounded however big the capture is: a stream is only followed until its Certificate message
+(or until it's clear there won't be one in the clear, e.g. TLS 1.3), at most _max_streams streams are
+followed at once, at most _max_stream_buffer bytes are held per stream and at most
+_max_seen_certificates digests are kept to pass over repeated certificates.
+"""
+from fpkilint.batch import BatchItem, add_lint_arguments, iter_lint_batch, run_from_arguments
+import argparse
+import collections
+import functools
+import hashlib
+import ipaddress
+import struct
+import sys
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+_pcap_magic = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+_pcapng_section_header = b'\x0a\x0d\x0d\x0a'
+
+_pcapng_interface_description = 1
+_pcapng_packet = 2
+_pcapng_simple_packet = 3
+_pcapng_enhanced_packet = 6
+_pcapng_if_tsresol = 9
+_pcapng_read_blocks = (_pcapng_interface_description, _pcapng_packet, _pcapng_simple_packet, _pcapng_enhanced_packet)
+
+_ethertype_ipv4 = 0x0800
+_ethertype_ipv6 = 0x86DD
+_ethertype_vlan = (0x8100, 0x88A8, 0x9100)
+
+_ipv6_extension_headers = (0, 43, 60)
+_protocol_tcp = 6
+
+_tcp_fin = 0x01
+_tcp_syn = 0x02
+_tcp_rst = 0x04
+
+_tls_handshake = 22
+
+_handshake_client_hello = 1
+_handshake_server_hello = 2
+_handshake_certificate = 11
+
+_extension_supported_versions = 43
+_tls13_version = b'\x03\x04'
+
+_sequence_mask = 0xFFFFFFFF
+_half_sequence_space = 0x80000000
+
+_max_streams = 65536
+_max_stream_buffer = 1024 * 1024
+_max_out_of_order_segments = 256
+_max_packet_size = 256 * 1024
+_max_block_length = 16 * 1024 * 1024
+_max_seen_certificates = 100000
+
+
+class PcapError(ValueError):
+    pass
+
+
+def _read_exactly(f, length):
+    data = f.read(length)
+    if len(data) < length:
+        raise PcapError("Truncated capture")
+
+    return data
+
+
+def _skip(f, length):
+    while length > 0:
+        data = f.read(min(length, 64 * 1024))
+        if not data:
+            raise PcapError("Truncated capture")
+        length -= len(data)
+
+
+def _iter_pcap(f, magic):
+    endian, resolution = _pcap_magic[magic]
+    header = _read_exactly(f, 20)
+    # the upper bits of the link type field hold the FCS length
+    linktype = struct.unpack(endian + 'HHiIII', header)[5] & 0x0FFFFFFF
+    record = struct.Struct(endian + 'IIII')
+
+    while True:
+        header = f.read(record.size)
+        if not header:
+            return
+        if len(header) < record.size:
+            raise PcapError("Truncated capture")
+        seconds, fraction, captured_length, original_length = record.unpack(header)
+        if captured_length > _max_packet_size:
+            raise PcapError("Packet of {} bytes, the capture is corrupt".format(captured_length))
+        data = _read_exactly(f, captured_length)
+        yield seconds + fraction * resolution, linktype, data, captured_length < original_length
+
+
+def _get_tsresol(options, endian):
+    offset = 0
+    while offset + 4 <= len(options):
+        code, length = struct.unpack_from(endian + 'HH', options, offset)
+        if code == 0:
+            break
+        if code == _pcapng_if_tsresol and length >= 1:
+            value = options[offset + 4]
+            return 2 ** -(value & 0x7F) if value & 0x80 else 10 ** -value
+        offset += 4 + (length + 3) // 4 * 4
+
+    return 1e-6
+
+
+def _check_block_length(block_length):
+    # type, length and the trailing length take 12 bytes; anything past the cap is a corrupt length
+    if block_length < 12 or block_length % 4 or block_length > _max_block_length:
+        raise PcapError("Bad pcapng block length {}".format(block_length))
+
+
+def _iter_pcapng(f):
+    endian = None
+    interfaces = []
+
+    while True:
+        header = f.read(8)
+        if not header:
+            return
+        if len(header) < 8:
+            raise PcapError("Truncated capture")
+
+        if header[:4] == _pcapng_section_header:
+            byte_order = _read_exactly(f, 4)
+            endian = '<' if byte_order == b'\x4d\x3c\x2b\x1a' else '>'
+            block_type, block_length = struct.unpack(endian + 'II', header)
+            _check_block_length(block_length)
+            _skip(f, block_length - 12)
+            # a new section starts over with its own interfaces
+            interfaces = []
+            continue
+
+        if endian is None:
+            raise PcapError("Not a pcapng file")
+
+        block_type, block_length = struct.unpack(endian + 'II', header)
+        _check_block_length(block_length)
+
+        if block_type not in _pcapng_read_blocks:
+            # statistics, name resolution and the like
+            _skip(f, block_length - 8)
+            continue
+
+        if block_length > _max_packet_size + 64:
+            raise PcapError("Packet of {} bytes, the capture is corrupt".format(block_length))
+        body = _read_exactly(f, block_length - 8)[:-4]
+
+        if block_type == _pcapng_interface_description:
+            linktype, = struct.unpack_from(endian + 'H', body)
+            interfaces.append((linktype, _get_tsresol(body[8:], endian)))
+
+        elif block_type in (_pcapng_enhanced_packet, _pcapng_packet):
+            if block_type == _pcapng_packet:
+                interface, drops, high, low, captured_length, original_length = struct.unpack_from(
+                    endian + 'HHIIII', body)
+            else:
+                interface, high, low, captured_length, original_length = struct.unpack_from(endian + 'IIIII', body)
+            if interface >= len(interfaces):
+                raise PcapError("Packet for an undescribed interface")
+            linktype, resolution = interfaces[interface]
+            yield ((high << 32) | low) * resolution, linktype, body[20:20 + captured_length], \
+                captured_length < original_length
+
+        elif block_type == _pcapng_simple_packet:
+            if not interfaces:
+                raise PcapError("Packet for an undescribed interface")
+            original_length, = struct.unpack_from(endian + 'I', body)
+            data = body[4:4 + original_length]
+            yield None, interfaces[0][0], data, len(data) < original_length
+
+
+class _Prepend:
+    """
+    Puts bytes already read back in front of a file object.
+    """
+    def __init__(self, data, f):
+        self._data = data
+        self._file = f
+
+    def read(self, length):
+        data, self._data = self._data[:length], self._data[length:]
+        if len(data) < length:
+            data += self._file.read(length - len(data))
+        return data
+
+
+def iter_packets(f):
+    """
+    :param f: binary file object of a pcap or pcapng capture
+    :return: generator of (timestamp or None, link type, packet data, True if the packet was cut short)
+    """
+    magic = _read_exactly(f, 4)
+
+    if magic in _pcap_magic:
+        return _iter_pcap(f, magic)
+
+    if magic == _pcapng_section_header:
+        return _iter_pcapng(_Prepend(magic, f))
+
+    raise PcapError("Not a pcap or pcapng file")
+
+
+def _get_ip_packet(linktype, data):
+    """
+    :return: IPv4 or IPv6 packet inside the link layer frame, None for anything else
+    """
+    if linktype == LINKTYPE_ETHERNET:
+        if len(data) < 14:
+            return None
+        offset = 12
+        ethertype, = struct.unpack_from('>H', data, offset)
+        while ethertype in _ethertype_vlan and len(data) >= offset + 8:
+            offset += 4
+            ethertype, = struct.unpack_from('>H', data, offset)
+        if ethertype not in (_ethertype_ipv4, _ethertype_ipv6):
+            return None
+        return data[offset + 2:]
+
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        return data
+
+    if linktype == LINKTYPE_LINUX_SLL:
+        if len(data) < 16 or struct.unpack_from('>H', data, 14)[0] not in (_ethertype_ipv4, _ethertype_ipv6):
+            return None
+        return data[16:]
+
+    if linktype == LINKTYPE_LINUX_SLL2:
+        if len(data) < 20 or struct.unpack_from('>H', data, 0)[0] not in (_ethertype_ipv4, _ethertype_ipv6):
+            return None
+        return data[20:]
+
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        # the address family, which is different on every platform; the ip version says the same
+        return data[4:]
+
+    return None
+
+
+def _get_tcp_segment(ip):
+    """
+    :return: (source address, destination address, TCP header and payload), None if this isn't an
+    unfragmented TCP packet
+    """
+    if len(ip) < 20:
+        return None
+
+    version = ip[0] >> 4
+    if version == 4:
+        header_length = (ip[0] & 0x0F) * 4
+        total_length, fragment = struct.unpack_from('>H2xH', ip, 2)
+        if ip[9] != _protocol_tcp or fragment & 0x3FFF:
+            return None
+        if total_length == 0:
+            # captured before TCP segmentation offload split it up, the packet is as long as what was captured
+            total_length = len(ip)
+        return ip[12:16], ip[16:20], ip[header_length:total_length]
+
+    if version == 6 and len(ip) >= 40:
+        payload_length, = struct.unpack_from('>H', ip, 4)
+        next_header = ip[6]
+        payload = ip[40:40 + payload_length]
+        while next_header in _ipv6_extension_headers and len(payload) >= 8:
+            next_header, length = payload[0], (payload[1] + 1) * 8
+            payload = payload[length:]
+        if next_header != _protocol_tcp:
+            return None
+        return ip[8:24], ip[24:40], payload
+
+    return None
+
+
+def _parse_certificate_list(body):
+    if len(body) < 3:
+        raise PcapError("Truncated Certificate message")
+    end = 3 + int.from_bytes(body[:3], 'big')
+    if end > len(body):
+        raise PcapError("Truncated Certificate message")
+
+    certificates = []
+    offset = 3
+    while offset < end:
+        length = int.from_bytes(body[offset:offset + 3], 'big')
+        offset += 3
+        if offset + length > end:
+            raise PcapError("Truncated Certificate message")
+        certificates.append(body[offset:offset + length])
+        offset += length
+
+    return certificates
+
+
+def _is_tls13_server_hello(body):
+    # legacy_version, random, legacy_session_id, cipher_suite, legacy_compression_method, extensions
+    offset = 2 + 32
+    if len(body) <= offset:
+        return False
+    offset += 1 + body[offset] + 2 + 1
+    if len(body) < offset + 2:
+        return False
+    end = offset + 2 + int.from_bytes(body[offset:offset + 2], 'big')
+    offset += 2
+
+    while offset + 4 <= min(end, len(body)):
+        extension_type, length = struct.unpack_from('>HH', body, offset)
+        if extension_type == _extension_supported_versions:
+            return body[offset + 4:offset + 4 + length] == _tls13_version
+        offset += 4 + length
+
+    return False
+
+
+class _TLSStream:
+    """
+    One direction of a TCP connection, reassembled until its TLS Certificate message.
+    """
+    def __init__(self):
+        self.done = False
+        self._next_sequence = None
+        self._segments = {}
+        self._records = bytearray()
+        self._handshake = bytearray()
+
+    def add(self, sequence, syn, payload):
+        """
+        :return: the certificate chain, once the Certificate message is complete
+        """
+        if self._next_sequence is None:
+            self._next_sequence = (sequence + 1) & _sequence_mask if syn else sequence
+        if syn or not payload:
+            return None
+
+        if not self._add_segment(sequence, payload):
+            self._segments[sequence] = payload
+            if len(self._segments) > _max_out_of_order_segments:
+                self.done = True
+                return None
+
+        while self._segments:
+            for sequence in list(self._segments):
+                if self._add_segment(sequence, self._segments[sequence]):
+                    del self._segments[sequence]
+                    break
+            else:
+                break
+
+        return self._parse()
+
+    def _add_segment(self, sequence, payload):
+        """
+        :return: False if the segment is ahead of the stream
+        """
+        delta = (sequence - self._next_sequence) & _sequence_mask
+        if 0 < delta < _half_sequence_space:
+            return False
+
+        # a retransmission overlaps what's already been read
+        overlap = (_sequence_mask + 1 - delta) & _sequence_mask
+        if overlap < len(payload):
+            self._records += payload[overlap:]
+            self._next_sequence = (self._next_sequence + len(payload) - overlap) & _sequence_mask
+            if len(self._records) > _max_stream_buffer:
+                self.done = True
+
+        return True
+
+    def _parse(self):
+        while not self.done and len(self._records) >= 5:
+            content_type, major, minor, length = struct.unpack_from('>BBBH', self._records)
+            if content_type != _tls_handshake or major != 3:
+                # not tls, or past the part of the handshake that is in the clear
+                self.done = True
+                return None
+            if len(self._records) < 5 + length:
+                return None
+
+            self._handshake += self._records[5:5 + length]
+            del self._records[:5 + length]
+
+            # the rest of the record is passed over too once the stream is done
+            while not self.done and len(self._handshake) >= 4:
+                message_type = self._handshake[0]
+                length = int.from_bytes(self._handshake[1:4], 'big')
+                if len(self._handshake) < 4 + length:
+                    break
+                body = bytes(self._handshake[4:4 + length])
+                del self._handshake[:4 + length]
+
+                if message_type == _handshake_client_hello:
+                    # the client side, client certificates aren't wanted
+                    self.done = True
+                elif message_type == _handshake_server_hello and _is_tls13_server_hello(body):
+                    # the certificate is encrypted
+                    self.done = True
+                elif message_type == _handshake_certificate:
+                    self.done = True
+                    return _parse_certificate_list(body)
+
+            if len(self._handshake) > _max_stream_buffer:
+                self.done = True
+
+        return None
+
+
+def _format_address(address, port):
+    address = ipaddress.ip_address(address)
+    if address.version == 6:
+        return '[{}]:{}'.format(address, port)
+
+    return '{}:{}'.format(address, port)
+
+
+def iter_capture_chains(f):
+    """
+    :param f: binary file object of a pcap or pcapng capture
+    :return: generator of (timestamp, server address, client address, [certificate der, ...]), one for
+    each server Certificate message, the leaf certificate first
+    """
+    # stream key: (source address, source port, destination address, destination port), done streams
+    # are kept (as None) so the rest of their packets are passed over
+    streams = collections.OrderedDict()
+
+    for timestamp, linktype, data, truncated in iter_packets(f):
+        if truncated:
+            # leaves a hole in its stream, which stops it when the out of order segments run out
+            continue
+
+        ip = _get_ip_packet(linktype, data)
+        segment = _get_tcp_segment(ip) if ip is not None else None
+        if segment is None or len(segment[2]) < 20:
+            continue
+
+        source, destination, tcp = segment
+        source_port, destination_port, sequence = struct.unpack_from('>HHI', tcp)
+        flags = tcp[13]
+        payload = tcp[(tcp[12] >> 4) * 4:]
+        key = (source, source_port, destination, destination_port)
+
+        if flags & (_tcp_fin | _tcp_rst):
+            streams.pop(key, None)
+            continue
+
+        stream = streams.get(key, False)
+        if stream is None:
+            continue
+        if stream is False:
+            if not (flags & _tcp_syn or payload):
+                continue
+            stream = streams[key] = _TLSStream()
+            if len(streams) > _max_streams:
+                streams.popitem(last=False)
+
+        try:
+            chain = stream.add(sequence, flags & _tcp_syn, payload)
+        except PcapError:
+            chain = None
+            stream.done = True
+
+        if stream.done:
+            streams[key] = None
+
+        if chain:
+            yield timestamp, _format_address(source, source_port), _format_address(destination, destination_port), \
+                chain
+
+
+def iter_capture_items(paths):
+    """
+    :param paths: pcap or pcapng files
+    :return: generator of BatchItem, one per distinct certificate, with the server, client and the
+    certificate's position in the chain (0 for the leaf) it was first seen in
+    """
+    # digests of the certificates already yielded, least recently seen first
+    seen = collections.OrderedDict()
+
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                for timestamp, server, client, chain in iter_capture_chains(f):
+                    for position, der in enumerate(chain):
+                        digest = hashlib.sha256(der).digest()
+                        if digest in seen:
+                            seen.move_to_end(digest)
+                            continue
+                        seen[digest] = None
+                        if len(seen) > _max_seen_certificates:
+                            seen.popitem(last=False)
+                        yield BatchItem(path, None, der, None, {'server': server, 'client': client,
+                                                               'chain_position': position, 'timestamp': timestamp})
+        except (OSError, PcapError) as e:
+            yield BatchItem(path, None, None, str(e), None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Lint the TLS server certificates in packet captures')
+    add_lint_arguments(parser)
+    parser.add_argument('files', nargs='+', help='pcap or pcapng files')
+    args = parser.parse_args(argv)
+
+    return run_from_arguments(parser, args, functools.partial(iter_lint_batch, iter_capture_items(args.files)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Benchmark for fpkilint.policy_graph on synthetic bridge paths, the case that makes RFC 5280 policy tree
+processing blow up: every cross certificate asserts the same number of policies and maps each of its
+issuer's policies to all of them, so the tree would hold width ** depth nodes at the bottom.
+
+    python -m fpkilint.policy_bench --depth 4 8 16 32 --width 2 4 8 --runs 20
+"""
+from fpkilint.policy_graph import PolicyInfo, process_policies
+import argparse
+import sys
+import time
+
+
+def make_bridge_path(depth, width):
+    """
+    :return: [PolicyInfo, ...], depth cross certificates and an end entity certificate asserting
+    one policy of the last domain
+    """
+    path = []
+    for level in range(depth):
+        policies = tuple('2.16.840.1.101.3.2.1.{}.{}'.format(level, p) for p in range(width))
+        subject_policies = ['2.16.840.1.101.3.2.1.{}.{}'.format(level + 1, p) for p in range(width)]
+        mappings = tuple((issuer_policy, subject_policy) for issuer_policy in policies
+                         for subject_policy in subject_policies)
+        path.append(PolicyInfo(policies, mappings, None, None, None, False))
+
+    path.append(PolicyInfo(('2.16.840.1.101.3.2.1.{}.0'.format(depth),), (), None, None, None, False))
+
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Policy graph processing benchmark')
+    parser.add_argument('--depth', type=int, nargs='+', default=[4, 8, 16, 32], help='cross certificates in the path')
+    parser.add_argument('--width', type=int, nargs='+', default=[2, 4, 8], help='policies per domain')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    print('depth width  tree nodes     ms/path  policies')
+    for width in args.width:
+        for depth in args.depth:
+            path = make_bridge_path(depth, width)
+
+            start = time.perf_counter()
+            for i in range(args.runs):
+                result = process_policies(path)
+            elapsed = (time.perf_counter() - start) / args.runs
+
+            print('{:5} {:5} {:11.3g} {:11.3f}  {}'.format(depth, width, float(width) ** depth, elapsed * 1000,
+                                                          len(result.authorities_constrained)))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
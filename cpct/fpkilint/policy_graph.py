@@ -0,0 +1,241 @@
+"""
+Certificate policy processing for a whole path, RFC 5280 section 6.1 with the valid_policy_tree replaced
+by the valid_policy_graph of RFC 9618. In the tree a policy mapped to several policies at each of many
+bridge and cross certificates is copied under every parent, so the tree grows exponentially with the
+path length. In the graph each policy appears at most once per depth with all its parents, so the graph
+is never bigger than the path length times the number of policies asserted.
+
+Works on PolicyInfo, the policy extensions of a certificate, so paths can be processed (and
+benchmarked, see fpkilint.policy_bench) without the certificates themselves.
+"""
+from fpkilint.name_utils import is_same_dn
+import collections
+
+any_policy = '2.5.29.32.0'
+
+PolicyInfo = collections.namedtuple('PolicyInfo', 'policies mappings require_explicit_policy '
+                                                  'inhibit_policy_mapping inhibit_any_policy self_issued')
+PolicyInfo.__doc__ = """
+policies: tuple of dotted policy OIDs from certificatePolicies, None without the extension
+mappings: tuple of (issuerDomainPolicy, subjectDomainPolicy) from policyMappings
+require_explicit_policy: from policyConstraints, or None
+inhibit_policy_mapping: from policyConstraints, or None
+inhibit_any_policy: from inhibitAnyPolicy, or None
+self_issued: subject and issuer DNs match
+"""
+
+PolicyResult = collections.namedtuple('PolicyResult', 'authorities_constrained user_constrained '
+                                                      'explicit_policy_required error')
+PolicyResult.__doc__ = """
+authorities_constrained: set of policies the path is valid for, in the trust anchor's policy domain;
+    holds any_policy when the path is valid for any policy
+user_constrained: authorities_constrained intersected with the user initial policy set; the user initial
+    policy set itself when authorities_constrained holds any_policy
+explicit_policy_required: whether the path must be valid for a policy (explicit_policy reached 0)
+error: why the path fails policy processing, or None
+"""
+
+
+def get_policy_info(tbs):
+    """
+    :param tbs: x509.TbsCertificate
+    :return: PolicyInfo
+    """
+    policies = None
+    mappings = ()
+    require_explicit_policy = None
+    inhibit_policy_mapping = None
+    inhibit_any_policy = None
+
+    for extension in tbs['extensions']:
+        name = extension['extn_id'].native
+        if name == 'certificate_policies':
+            policies = tuple(p['policy_identifier'].dotted for p in extension['extn_value'].parsed)
+        elif name == 'policy_mappings':
+            mappings = tuple((m['issuer_domain_policy'].dotted, m['subject_domain_policy'].dotted)
+                             for m in extension['extn_value'].parsed)
+        elif name == 'policy_constraints':
+            policy_constraints = extension['extn_value'].parsed
+            require_explicit_policy = policy_constraints['require_explicit_policy'].native
+            inhibit_policy_mapping = policy_constraints['inhibit_policy_mapping'].native
+        elif name == 'inhibit_any_policy':
+            inhibit_any_policy = extension['extn_value'].parsed.native
+
+    return PolicyInfo(policies, mappings, require_explicit_policy, inhibit_policy_mapping, inhibit_any_policy,
+                      is_same_dn(tbs['subject'], tbs['issuer']))
+
+
+class _Node:
+    __slots__ = ('policy', 'parents', 'expected', 'children')
+
+    def __init__(self, policy, parents):
+        self.policy = policy
+        self.parents = parents
+        self.expected = {policy}
+        self.children = 0
+        for parent in parents:
+            parent.children += 1
+
+
+def _prune(levels, depth):
+    """
+    Removes the nodes above depth that no longer lead down to it.
+    """
+    for i in range(depth - 1, -1, -1):
+        childless = [policy for policy, node in levels[i].items() if node.children == 0]
+        if not childless:
+            return
+        for policy in childless:
+            for parent in levels[i].pop(policy).parents:
+                parent.children -= 1
+
+
+def _delete(levels, depth, policy):
+    node = levels[depth].pop(policy)
+    for parent in node.parents:
+        parent.children -= 1
+    _prune(levels, depth)
+
+
+def _add_policy_nodes(levels, depth, info, any_policy_allowed):
+    """
+    RFC 9618 6.1.3 (d)(1) and (2), adds the level for a certificate with certificatePolicies.
+    """
+    previous = levels[depth - 1]
+    level = {}
+
+    # parents of each expected policy, as in the expected_policy_set of the nodes at depth - 1
+    expecting = collections.defaultdict(list)
+    for node in previous.values():
+        for policy in node.expected:
+            expecting[policy].append(node)
+
+    any_policy_parent = previous.get(any_policy)
+    asserts_any_policy = False
+
+    for policy in info.policies:
+        if policy == any_policy:
+            asserts_any_policy = True
+            continue
+        if policy in level:
+            continue
+        parents = expecting.get(policy)
+        if parents:
+            level[policy] = _Node(policy, parents)
+        elif any_policy_parent is not None:
+            level[policy] = _Node(policy, [any_policy_parent])
+
+    if asserts_any_policy and any_policy_allowed:
+        for policy, parents in expecting.items():
+            if policy not in level:
+                level[policy] = _Node(policy, parents)
+
+    levels.append(level)
+    _prune(levels, depth)
+
+
+def _map_policies(levels, depth, info, policy_mapping):
+    """
+    RFC 9618 6.1.4 (b), applies a CA's policy mappings to the level it added.
+    """
+    mapped = collections.OrderedDict()
+    for issuer_policy, subject_policy in info.mappings:
+        mapped.setdefault(issuer_policy, []).append(subject_policy)
+
+    level = levels[depth]
+    for issuer_policy, subject_policies in mapped.items():
+        if policy_mapping > 0:
+            node = level.get(issuer_policy)
+            if node is None and any_policy in level and any_policy in levels[depth - 1]:
+                node = _Node(issuer_policy, [levels[depth - 1][any_policy]])
+                level[issuer_policy] = node
+            if node is not None:
+                node.expected = set(subject_policies)
+        elif issuer_policy in level:
+            _delete(levels, depth, issuer_policy)
+
+
+def _min(counter, value):
+    if value is None:
+        return counter
+
+    return min(counter, value)
+
+
+def process_policies(path, user_initial_policy_set=(any_policy,), initial_policy_mapping_inhibit=False,
+                     initial_explicit_policy=False, initial_any_policy_inhibit=False):
+    """
+    :param path: PolicyInfo for each certificate, starting with the one issued by the trust anchor and
+    ending with the target certificate
+    :return: PolicyResult
+    """
+    n = len(path)
+    explicit_policy = 0 if initial_explicit_policy else n + 1
+    inhibit_any = 0 if initial_any_policy_inhibit else n + 1
+    policy_mapping = 0 if initial_policy_mapping_inhibit else n + 1
+
+    levels = [{any_policy: _Node(any_policy, [])}]
+    error = None
+
+    for i, info in enumerate(path, 1):
+        last = i == n
+
+        if levels is not None:
+            if info.policies is None:
+                levels = None
+            else:
+                _add_policy_nodes(levels, i, info,
+                                  inhibit_any > 0 or (not last and info.self_issued))
+                if not levels[i]:
+                    levels = None
+
+        if levels is None and explicit_policy == 0 and error is None:
+            error = "Certificate {} of the path leaves no valid policy and an explicit policy is required".format(i)
+
+        if last:
+            break
+
+        if any(any_policy in mapping for mapping in info.mappings):
+            error = error or "Certificate {} of the path maps anyPolicy".format(i)
+        if levels is not None and info.mappings:
+            _map_policies(levels, i, info, policy_mapping)
+            if not levels[i]:
+                levels = None
+
+        if not info.self_issued:
+            explicit_policy = max(explicit_policy - 1, 0)
+            policy_mapping = max(policy_mapping - 1, 0)
+            inhibit_any = max(inhibit_any - 1, 0)
+
+        explicit_policy = _min(explicit_policy, info.require_explicit_policy)
+        policy_mapping = _min(policy_mapping, info.inhibit_policy_mapping)
+        inhibit_any = _min(inhibit_any, info.inhibit_any_policy)
+
+    if n > 0:
+        info = path[-1]
+        explicit_policy = max(explicit_policy - 1, 0)
+        if info.require_explicit_policy == 0:
+            explicit_policy = 0
+
+    authorities_constrained = set()
+    if levels is not None:
+        for level in levels[1:]:
+            for node in level.values():
+                if node.policy != any_policy and all(parent.policy == any_policy for parent in node.parents):
+                    authorities_constrained.add(node.policy)
+        if any_policy in levels[-1]:
+            authorities_constrained.add(any_policy)
+
+    user_initial_policy_set = set(user_initial_policy_set)
+    if any_policy in user_initial_policy_set:
+        user_constrained = set(authorities_constrained)
+    elif any_policy in authorities_constrained:
+        # RFC 5280 6.1.5 (g)(iii), the path is valid for every policy the user accepts
+        user_constrained = user_initial_policy_set
+    else:
+        user_constrained = authorities_constrained & user_initial_policy_set
+
+    if error is None and explicit_policy == 0 and not user_constrained:
+        error = "The path is not valid for any acceptable policy and an explicit policy is required"
+
+    return PolicyResult(authorities_constrained, user_constrained, explicit_policy == 0, error)
@@ -7,6 +7,10 @@ from collections import OrderedDict
 from fpkilint.certificate_policies import policies_display_map
 from fpkilint.binary_utils import *
 from fpkilint.name_utils import *
+from fpkilint.sct import SCTError, sct_list_oid, decode_sct_list_extension, get_timestamp_datetime, \
+    hash_algorithm_names, signature_algorithm_names
+from fpkilint.timing import timed
+from asn1crypto import crl
 
 # these are not all used, keeping them here as a matter of convenience
 from asn1crypto.core import (
@@ -42,6 +46,9 @@ from asn1crypto.core import (
     VideotexString,
     VOID,
 )
+import logging
+
+logger = logging.getLogger(__name__)
 
 lint_cert_newline = '\n'
 lint_cert_indent = '    '
@@ -49,6 +56,19 @@ lint_error_prefix = '**FAIL**'
 lint_warning_prefix = '**WARN**'
 lint_info_prefix = '**INFO**'
 
+precert_poison_oid = '1.3.6.1.4.1.11129.2.4.3'
+
+# how far an SCT timestamp can be from notBefore before it is flagged: a log may see the precertificate
+# a little before notBefore, and notBefore may be backdated a little before logging
+_sct_max_before_not_before = timedelta(hours=24)
+_sct_max_after_not_before = timedelta(hours=48)
+
+_finding_severity_map = {
+    lint_error_prefix: 'FAIL',
+    lint_warning_prefix: 'WARN',
+    lint_info_prefix: 'INFO',
+}
+
 
 class ConfigEntry:
     def __init__(self):
@@ -56,6 +76,22 @@ class ConfigEntry:
         self.oid = ""
 
 
+def _with_option_value(config_options, item, value):
+    """
+    Returns a copy of config_options with item set to value. Compiled profiles are shared by every
+    certificate linted against them, so the checks must not change their entries.
+    """
+    entry = ConfigEntry()
+    entry.value = value
+    if item in config_options:
+        entry.oid = config_options[item].oid
+
+    config_options = dict(config_options)
+    config_options[item] = entry
+
+    return config_options
+
+
 class OutputRow:
     def __init__(self, init_row_name=None, init_content=None, init_analysis=None, init_config_section=None):
         self.row_name = ""
@@ -64,6 +100,7 @@ class OutputRow:
         self.config_section = ""
         self.extension_oid = None
         self.extension_is_critical = False
+        self.findings = []  # [severity, message] for each error added, severity is FAIL, WARN or INFO
 
         if init_row_name is not None:
             self.row_name = init_row_name
@@ -91,8 +128,14 @@ class OutputRow:
 
         if preface != "":
             self.analysis += "{}: {}".format(preface, error_string)
+            self.findings.append([_finding_severity_map.get(preface, 'FAIL'), error_string])
         else:
             self.analysis += error_string
+            # no preface means this continues the previous finding
+            if self.findings:
+                self.findings[-1][1] += lint_cert_newline + error_string
+            else:
+                self.findings.append(['FAIL', error_string])
 
         return
 
@@ -162,7 +205,7 @@ def _lint_get_extension_options(config_options):
 def _process_common_extension_options(config_options, cert, r):
     """
     :param config_options: config options for this extension
-    :param cert: x509.Certificate
+    :param cert: x509.Certificate or x509.TbsCertificate
     :param r: output row object
     :return: None or the extension
     """
@@ -463,7 +506,9 @@ def lint_key_usage(config_options, cert):
 
         if 'key_encipherment' in key_usage.native:
             # error if key_encipherment and pub key is ec (should be key_agreement)
-            public_key_info = cert['tbs_certificate']['subject_public_key_info']
+            if isinstance(cert, x509.Certificate):
+                cert = cert['tbs_certificate']
+            public_key_info = cert['subject_public_key_info']
             if public_key_info.algorithm == 'ec':
                 r.add_error('keyEncipherment is not appropriate for ECC keys. keyAgreement should be used instead.')
 
@@ -657,7 +702,7 @@ teletex_bad_character_set = {35, 36, 92, 94, 96, 123, 125, 126, 169, 170, 172, 1
 def find_illegal_characters(asn_string):
 
     if not asn_string or not isinstance(asn_string, AbstractString):
-        print('not a string?')
+        logger.debug('find_illegal_characters called without a string')
         return None
 
     illegal_characters = []
@@ -715,7 +760,7 @@ def lint_asn_string(asn_string, string_description, r):
 
         error_string += ') found in {}'.format(string_description)
         r.add_error(error_string)
-        print(error_string)
+        logger.debug(error_string)
 
 
 def lint_dn_strings(name, r):
@@ -958,7 +1003,10 @@ def _lint_do_alt_name(r, config_options, alt_name_value):
 def lint_san(config_options, cert):
     r = OutputRow("Subject Alternate Name")
 
-    if len(cert.subject) == 0:
+    if isinstance(cert, x509.Certificate):
+        cert = cert['tbs_certificate']
+
+    if len(cert['subject']) == 0:
 
         option_is_critical = 0
 
@@ -969,7 +1017,7 @@ def lint_san(config_options, cert):
             # if subject dn is absent; san must be critical per 5280
             r.add_error('When Subject DN is absent, Subject Alternate Name is required to be critical',
                         lint_info_prefix)
-            config_options['is_critical'].value = '2'
+            config_options = _with_option_value(config_options, 'is_critical', '2')
 
     extension = _process_common_extension_options(config_options, cert, r)
 
@@ -1023,7 +1071,7 @@ def lint_eku(config_options, cert):
 
                 # if any eku is present and permitted, change required (2) values to optional (0)
                 if any_eku_present_and_allowed and config_options[ce].value == '2':
-                    config_options[ce].value = '0'
+                    config_options = _with_option_value(config_options, ce, '0')
 
                 _do_presence_test(r, config_options, ce,
                                   eku_display_string,
@@ -1099,7 +1147,7 @@ def lint_crldp(config_options, cert):
                 if dpname.name != 'full_name':
                     # todo find a sample cert with nameRelativeToCRLIssuer, should be able to pass to pretty dn function
                     r.add_content("{}{}".format(lint_cert_indent, der2asn(dpname.chosen.contents)))
-                    print('Found a nameRelativeToCRLIssuer <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
+                    logger.info('Found a nameRelativeToCRLIssuer')
 
                 else:
                     for general_name in dpname.chosen:
@@ -1482,14 +1530,23 @@ def lint_inhibit_any(config_options, cert):
 def lint_signature_algorithm(config_options, cert):
     r = OutputRow("Signature Algorithm")
 
-    sig_alg = cert['signature_algorithm']['algorithm']
-    tbs_alg = cert['tbs_certificate']['signature']['algorithm']
+    tbs_name = 'TBSCertificate'
+    if isinstance(cert, x509.Certificate):
+        sig_alg = cert['signature_algorithm']['algorithm']
+        tbs_alg = cert['tbs_certificate']['signature']['algorithm']
+    elif isinstance(cert, crl.CertificateList):
+        sig_alg = cert['signature_algorithm']['algorithm']
+        tbs_alg = cert['tbs_cert_list']['signature']['algorithm']
+        tbs_name = 'TBSCertList'
+    else:
+        # a tbs certificate isn't signed yet, the algorithm it will be signed with is all there is to check
+        sig_alg = tbs_alg = cert['signature']['algorithm']
 
     r.add_content("{} ({})".format(sig_alg.native.replace('_', '-'), sig_alg.dotted))
 
     if sig_alg != tbs_alg:
-        r.add_error("Signature algorithm ({}) does not match TBSCertificate::signature ({})".format(
-            sig_alg.dotted, tbs_alg.dotted))
+        r.add_error("Signature algorithm ({}) does not match {}::signature ({})".format(
+            sig_alg.dotted, tbs_name, tbs_alg.dotted))
 
     found = False
 
@@ -1512,23 +1569,26 @@ def lint_signature_algorithm(config_options, cert):
 # ('subject_unique_id', OctetBitString, {'implicit': 2, 'optional': True}),
 
 def lint_version(config_options, cert):
-    cert_version = int(cert['tbs_certificate']['version'])
+    if isinstance(cert, x509.Certificate):
+        cert = cert['tbs_certificate']
+
+    cert_version = int(cert['version'])
 
     r = OutputRow("Version", "v%i" % (cert_version + 1))
 
     if cert_version == 0:
 
-        if cert['tbs_certificate']['issuer_unique_id'] or cert['tbs_certificate']['subject_unique_id']:
+        if cert['issuer_unique_id'] or cert['subject_unique_id']:
             r.add_error('UniqueIdentifier(s) must not be present in a v1 certificate')
 
-    if not cert['tbs_certificate']['extensions']:
+    if not cert['extensions']:
         # no extensions
         if cert_version == 2:
             r.add_error('Certificates without extensions should be v2', lint_warning_prefix)
     else:
         # has extensions
         if cert_version != 2:
-            r.add_error('Extensions must not appear in {} certificates'.format(cert['tbs_certificate']['version'].native))
+            r.add_error('Extensions must not appear in {} certificates'.format(cert['version'].native))
 
     if 'min_version' in config_options and len(config_options['min_version'].value) > 0:
         min_version_num = int(config_options['min_version'].value)
@@ -1542,7 +1602,10 @@ def lint_version(config_options, cert):
 def lint_serial_number(config_options, cert):
     r = OutputRow("Serial Number")
 
-    serial_number = cert['tbs_certificate']['serial_number']
+    if isinstance(cert, x509.Certificate):
+        cert = cert['tbs_certificate']
+
+    serial_number = cert['serial_number']
     serial_bytes = serial_number.contents
 
     r.add_content('{}{}({} octets)'.format(' '.join('%02X' % c for c in serial_bytes),
@@ -1584,7 +1647,10 @@ def lint_serial_number(config_options, cert):
 def lint_subject_public_key_info(config_options, cert):
     r = OutputRow("Subject Public Key")
 
-    public_key_info = cert['tbs_certificate']['subject_public_key_info']
+    if isinstance(cert, x509.Certificate):
+        cert = cert['tbs_certificate']
+
+    public_key_info = cert['subject_public_key_info']
     public_key_alg = public_key_info['algorithm']['algorithm'].dotted
 
     r.add_content(
@@ -1684,8 +1750,11 @@ def lint_validity(config_options, cert):
     r = OutputRow("Validity Period")
     validity_period_maximum = 0
 
-    nb = cert['tbs_certificate']['validity']['not_before']
-    na = cert['tbs_certificate']['validity']['not_after']
+    if isinstance(cert, x509.Certificate):
+        cert = cert['tbs_certificate']
+
+    nb = cert['validity']['not_before']
+    na = cert['validity']['not_after']
 
     r.add_content(lint_and_format_x509_time(nb, 'Not Before', r))
     r.add_content(lint_and_format_x509_time(na, 'Not After', r))
@@ -1830,16 +1899,19 @@ def lint_dn(config_options, dn, row_name):
 
 def lint_subject(config_options, cert):
 
-    r = lint_dn(config_options, cert.subject, "Subject DN")
+    if isinstance(cert, x509.Certificate):
+        cert = cert['tbs_certificate']
+
+    r = lint_dn(config_options, cert['subject'], "Subject DN")
 
     if 'is_self_issued' in config_options and config_options['is_self_issued'].value != '0':
-        if config_options['is_self_issued'].value == '1' and cert.subject == cert.issuer:
+        if config_options['is_self_issued'].value == '1' and is_same_dn(cert['subject'], cert['issuer']):
             r.add_error("Certificate issuer and subject names match. Certificate may not be self issued.")
-        elif config_options['is_self_issued'].value == '2' and cert.subject != cert.issuer:
+        elif config_options['is_self_issued'].value == '2' and not is_same_dn(cert['subject'], cert['issuer']):
             r.add_error("Certificate issuer and subject names do not match.")
 
-    if len(cert.subject) == 0:
-        san, is_critical = get_extension_and_criticality(cert['tbs_certificate'], '2.5.29.17')
+    if len(cert['subject']) == 0:
+        san, is_critical = get_extension_and_criticality(cert, '2.5.29.17')
         # todo San must be critical when subject is missing
         if not san:
             r.add_content("Either Subject DN or SubjectAltName is required")
@@ -1850,19 +1922,107 @@ def lint_subject(config_options, cert):
 
 
 def lint_issuer(config_options, cert):
-    return lint_dn(config_options, cert.issuer, "Issuer DN")
+    if isinstance(cert, x509.Certificate):
+        cert = cert['tbs_certificate']
 
+    return lint_dn(config_options, cert['issuer'], "Issuer DN")
+
+
+def get_processed_extensions(cert_profile):
+    """
+    :param cert_profile: profile from compile_profile()
+    :return: set of the extension oids the profile has a section for, other_extensions lists the rest
+    """
+    processed_extensions = set()
+    for config_section in cert_profile:
+        for ce in cert_profile[config_section]:
+            if ce == 'present' and cert_profile[config_section][ce].oid != '':
+                processed_extensions.add(cert_profile[config_section][ce].oid)
+
+    return processed_extensions
+
+
+def _lint_precert_poison(r, extension):
+    # RFC 6962 section 3.1, the poison is what makes a precertificate unusable as a certificate, so it is
+    # critical by design and the profile's rule on other critical extensions doesn't apply to it
+    if extension['critical'].native is True:
+        r.add_content("Critical = TRUE")
+    else:
+        r.add_error("The precertificate poison extension must be critical")
+
+    r.add_content("Certificate Transparency precertificate")
+
+    if extension['extn_value'].contents != b'\x05\x00':
+        r.add_error("The precertificate poison extension value must be NULL")
+
+
+def _lint_sct_list(r, extension, cert):
+    """
+    Shows and checks the SCTs in the extension.
+    :return: False when the list could not be decoded
+    """
+    try:
+        scts = decode_sct_list_extension(extension)
+    except SCTError as e:
+        r.add_error("Could not decode the SCT list: {}".format(e))
+        return False
+
+    if not scts:
+        r.add_error("The SCT list is empty")
+
+    not_before = cert['validity']['not_before'].native
+    not_after = cert['validity']['not_after'].native
+    log_ids = set()
+
+    for sct_number, sct in enumerate(scts, 1):
+        if sct.version != 0:
+            r.add_content("[{}]{}Version {}".format(sct_number, lint_cert_indent, sct.version + 1))
+            r.add_error("SCT {} is not a version 1 SCT and can't be checked".format(sct_number),
+                        lint_warning_prefix)
+            continue
+
+        timestamp = get_timestamp_datetime(sct.timestamp)
+        hash_algorithm = hash_algorithm_names.get(sct.hash_algorithm, str(sct.hash_algorithm))
+        signature_algorithm = signature_algorithm_names.get(sct.signature_algorithm, str(sct.signature_algorithm))
+
+        r.add_content("[{}]{}Log ID: {}".format(sct_number, lint_cert_indent, sct.log_id))
+        r.add_content("{}{}Timestamp: {}".format(lint_cert_indent, lint_cert_indent, timestamp))
+        r.add_content("{}{}Signature: {} with {}".format(lint_cert_indent, lint_cert_indent, signature_algorithm,
+                                                         hash_algorithm))
+
+        if sct.log_id in log_ids:
+            r.add_error("SCT {} is from a log that already provided an SCT".format(sct_number),
+                        lint_warning_prefix)
+        log_ids.add(sct.log_id)
+
+        if hash_algorithm != 'sha256' or signature_algorithm not in ('rsa', 'ecdsa'):
+            r.add_error("SCT {} is signed with {} and {}, RFC 6962 requires sha256 with rsa or ecdsa".format(
+                sct_number, signature_algorithm, hash_algorithm), lint_warning_prefix)
+
+        if timestamp > not_after:
+            r.add_error("SCT {} timestamp is after notAfter".format(sct_number))
+        elif timestamp < not_before - _sct_max_before_not_before:
+            r.add_error("SCT {} timestamp is {} before notBefore".format(
+                sct_number, format_display_time_span(not_before - timestamp)), lint_warning_prefix)
+        elif timestamp > not_before + _sct_max_after_not_before:
+            r.add_error("notBefore is backdated {} before the SCT {} timestamp".format(
+                format_display_time_span(timestamp - not_before), sct_number), lint_warning_prefix)
+
+    return True
 
-_lint_processed_extensions = {
-    "processed extension oids go here"
-}
 
 # returns a list of rows
-def lint_other_extensions(config_options, cert):
+def lint_other_extensions(config_options, cert, processed_extensions):
     rows = OrderedDict()
     row_list = []
 
-    extensions = cert['tbs_certificate']['extensions']
+    if isinstance(cert, x509.Certificate):
+        cert = cert['tbs_certificate']
+
+    if isinstance(cert, crl.TbsCertList):
+        extensions = cert['crl_extensions']
+    else:
+        extensions = cert['extensions']
 
     if extensions is None:
         return rows
@@ -1871,7 +2031,7 @@ def lint_other_extensions(config_options, cert):
     others_critical = 0
 
     for e in extensions:
-        if e['extn_id'].dotted not in _lint_processed_extensions:
+        if e['extn_id'].dotted not in processed_extensions:
             # init_row_name = None, init_content = None, init_analysis = None, init_config_section = None):
             extension_name = map_extension_oid_to_display.get(e['extn_id'].dotted, "Unknown")
             if extension_name == 'Unknown':
@@ -1883,6 +2043,11 @@ def lint_other_extensions(config_options, cert):
                 rows[r.extension_oid].add_error('Multiple instances of this extension found in the certificate.')
                 rows[r.extension_oid].add_error('Only the first instance is shown.', lint_warning_prefix)
 
+            if r.extension_oid == precert_poison_oid:
+                _lint_precert_poison(r, e)
+                row_list.append(r)
+                continue
+
             if e['critical'].native is True:
                 others_critical += 1
                 r.add_content("Critical = TRUE")
@@ -1895,21 +2060,22 @@ def lint_other_extensions(config_options, cert):
                         config_options['other_non_critical_extensions_present'].value == '1':
                     r.add_error("Additional non-critical extensions are not permitted")
 
-            if e.contents is not None:
-                if e['extn_id'].dotted == '1.3.6.1.4.1.11129.2.4.2':
-                    print('sct')
+            if r.extension_oid == sct_list_oid and _lint_sct_list(r, e, cert):
+                row_list.append(r)
+                continue
 
+            if e.contents is not None:
                 der_string = None
                 try:
                     der_string = der2asn(e['extn_value'].contents)
                 except ValueError as value_exception:
-                    print(value_exception)
+                    logger.warning('Failed to parse extension %s: %s', e['extn_id'].dotted, value_exception)
                     r.add_content("Failed to parse extension value")
                     r.add_error(str(value_exception), "")
                     try:
                         der_string = der2asn(e.contents)
                     except ValueError as value_exception:
-                        print(value_exception)
+                        logger.warning('Failed to parse extension %s: %s', e['extn_id'].dotted, value_exception)
                         r.add_error(str(value_exception), "")
 
                 if der_string:
@@ -1965,10 +2131,11 @@ conformance_check_functions = OrderedDict([
 ])
 
 
-def check_cert_conformance(input_cert, json_profile):
-    if not isinstance(input_cert, x509.Certificate):
-        raise TypeError("input_cert must be an x509.Certificate")
-
+def compile_profile(json_profile):
+    """
+    :param json_profile: json list, e.g. from json.load()
+    :return: {section: {item: ConfigEntry}}, can be passed to check_cert_conformance in place of the json
+    """
     if not isinstance(json_profile, list):
         raise TypeError("json_profile must json list, e.g. from json.load()")
 
@@ -1982,45 +2149,89 @@ def check_cert_conformance(input_cert, json_profile):
         pce.oid = entry['OID']
         cert_profile[entry['Section']][entry['Item']] = pce
 
-    # add the oids for all extensions we handle to _lint_processed_extensions list
-    # at the end, use that list to add unprocessed extensions to the output
-    for config_section in cert_profile:
-        for ce in cert_profile[config_section]:
-            if ce == 'present' and cert_profile[config_section][ce].oid != '':
-                _lint_processed_extensions.add(cert_profile[config_section][ce].oid)
+    return cert_profile
 
-    output_rows = OrderedDict()  # {}
-    profile_info_section = None
-    other_extensions_section = None
-    other_extensions_rows = None
+
+def _get_cert_profile(json_profile):
+    if isinstance(json_profile, dict):
+        return json_profile
+
+    return compile_profile(json_profile)
+
+
+def is_cert_profile(json_profile):
+    """
+    :param json_profile: json list, e.g. from json.load(), or a profile from compile_profile()
+    :return: whether the certificate checks know every section; they don't know the sections of a CRL
+    profile (see fpkilint.crl_conformance)
+    """
+    return all(config_section in conformance_check_functions or config_section in ('other_extensions', 'profile')
+               for config_section in _get_cert_profile(json_profile))
+
+
+def get_profile_info_section(json_profile):
+    return _get_cert_profile(json_profile).get('profile')
+
+
+def iter_cert_conformance(input_cert, json_profile):
+    """
+    Runs the conformance checks one section at a time, yielding each row as soon as it is complete.
+    Rows come out in the order of conformance_check_functions, followed by the other extension rows.
+    A TbsCertificate is checked the same way, only the checks on the outer signature fields are skipped.
+    :param input_cert: x509.Certificate or x509.TbsCertificate
+    :param json_profile: json list, e.g. from json.load(), or a profile from compile_profile()
+    :return: generator of OutputRow
+    """
+    if not isinstance(input_cert, (x509.Certificate, x509.TbsCertificate)):
+        raise TypeError("input_cert must be an x509.Certificate or x509.TbsCertificate")
+
+    cert_profile = _get_cert_profile(json_profile)
 
     for config_section in cert_profile:
-        # print(config_section)
-        if config_section in conformance_check_functions:
-            try:
+        if config_section not in conformance_check_functions and \
+                config_section not in ('other_extensions', 'profile'):
+            logger.error('Unrecognized config section: %s', config_section)
+
+    for config_section in conformance_check_functions:
+        if config_section not in cert_profile:
+            continue
+        try:
+            with timed('check.' + config_section):
                 r = conformance_check_functions[config_section](cert_profile[config_section], input_cert)
-            except ValueError as e:
-                print(e)
-                r = OutputRow(config_section, "Failed to parse content", str(e))
-            r.config_section = config_section
-            if len(r.content) > 0 or len(r.analysis) > 0:
-                # can add 'PASS' to r.analysis here if desired
-                output_rows[config_section] = r
-        elif config_section == 'other_extensions':
-            other_extensions_section = cert_profile[config_section]
-        elif config_section == 'profile':
-            profile_info_section = cert_profile[config_section]
-        else:
-            print("ERROR - Unrecognized config section:  {}".format(config_section))
+        except ValueError as e:
+            logger.warning('Failed to parse content for %s: %s', config_section, e)
+            r = OutputRow(config_section, "Failed to parse content")
+            r.add_error(str(e), "")
+        r.config_section = config_section
+        if len(r.content) > 0 or len(r.analysis) > 0:
+            # can add 'PASS' to r.analysis here if desired
+            yield r
+
+    if 'other_extensions' in cert_profile:
+        with timed('check.other_extensions'):
+            other_extensions_rows = lint_other_extensions(cert_profile['other_extensions'], input_cert,
+                                                          get_processed_extensions(cert_profile))
+        for r in other_extensions_rows.values():
+            yield r
 
-    if other_extensions_section:
-        other_extensions_rows = lint_other_extensions(other_extensions_section, input_cert)
 
-    # sort the rows in order they appear in conformance_check_functions
-    for key in conformance_check_functions:
-        if key in output_rows:
-            output_rows.move_to_end(key)
+def check_cert_conformance(input_cert, json_profile):
+    """
+    :return: (rows by config section, other extension rows by oid or None when the profile has no
+    other_extensions section, profile section or None)
+    """
+    output_rows = OrderedDict()  # {}
+    other_extensions_rows = None
+    cert_profile = _get_cert_profile(json_profile)
+    if 'other_extensions' in cert_profile:
+        other_extensions_rows = OrderedDict()
+
+    for r in iter_cert_conformance(input_cert, cert_profile):
+        if r.config_section == 'other_extensions':
+            other_extensions_rows[r.extension_oid] = r
+        else:
+            output_rows[r.config_section] = r
 
-    return output_rows, other_extensions_rows, profile_info_section
+    return output_rows, other_extensions_rows, get_profile_info_section(cert_profile)
 
 
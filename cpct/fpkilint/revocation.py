@@ -0,0 +1,471 @@
+"""
+Revocation index, the serial numbers on a set of local CRLs so lint results can say which certificates
+are already revoked. CRLs are read with fpkilint.crl_stream when the index is updated; after that a lookup
+is a binary search in a memory mapped file.
+
+    cd cpct && python -m fpkilint.revocation update fleet.crlidx crls/*.crl
+    cd cpct && python -m fpkilint.batch fbca/1.9/5-ee-signature.json certs/*.pem --revocation-index fleet.crlidx
+
+A scope is the certificates of one issuer on one CRL, the CRL being its issuer and issuing distribution
+point (an indirect CRL has a scope per certificateIssuer). Each scope has a sorted array of the entries
+of its complete CRL and another for its latest delta CRL, which is replaced rather than merged as delta
+CRLs are cumulative from their base.
+
+Updating is incremental. Files whose size and modification time haven't changed since the last update
+aren't read again, a complete CRL only replaces its scopes when its CRL number is higher (thisUpdate for
+CRLs without a number), and a delta CRL only replaces the delta array when its base is no newer than the
+complete CRL in the index. Scopes no CRL changed are copied over as they are.
+
+Layout, all integers big endian:
+    header    8 byte magic, 4 byte version, 8 byte metadata offset, 8 byte metadata length
+    data      the record arrays; a record is the serial number (offset binary in the array's width, so the
+              bytes sort like the numbers), 1 byte CRLReason (0xFF without a reasonCode) and the
+              revocation date as 14 bytes YYYYMMDDHHMMSS
+    metadata  JSON: for each scope the issuer DN digest (see name_utils.get_dn_key), where its arrays
+              are and the CRLs they came from; the size and modification time of each CRL file read
+"""
+from asn1crypto import crl, x509
+from fpkilint.cert_utils import get_extension_and_criticality
+from fpkilint.crl_stream import CRLReader, get_time_key
+from fpkilint.name_utils import get_dn_key
+import argparse
+import collections
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+_magic = b'CPCTRIDX'
+_version = 1
+_header = struct.Struct('>8sIQQ')
+_date_size = 14
+_no_reason = 0xFF
+_remove_from_crl = 8
+
+_crl_number_oid = '2.5.29.20'
+_delta_crl_indicator_oid = '2.5.29.27'
+_idp_oid = '2.5.29.28'
+_reason_code_oid = '2.5.29.21'
+_certificate_issuer_oid = '2.5.29.29'
+
+RevocationStatus = collections.namedtuple('RevocationStatus', 'status reason revocation_date this_update')
+RevocationStatus.__doc__ = """
+status: 'revoked', 'not_revoked' when the CRLs of the issuer don't list the certificate, 'unknown' when
+there is no CRL for the issuer in the index
+reason: CRLReason name, e.g. 'key_compromise', None without a reasonCode
+revocation_date: YYYY-MM-DDTHH:MM:SSZ
+this_update: thisUpdate of the CRL the status comes from, same format
+"""
+
+CRLSummary = collections.namedtuple('CRLSummary', 'crl_id issuer crl_number base_crl_number this_update '
+                                                  'next_update')
+CRLSummary.__doc__ = """
+crl_id: hex sha256 of the issuer DN digest and the issuingDistributionPoint, shared by a CRL and its deltas
+issuer: hex issuer DN digest
+crl_number: int, None without a cRLNumber
+base_crl_number: int for a delta CRL, None for a complete CRL
+this_update, next_update: YYYYMMDDHHMMSS, next_update None when absent
+"""
+
+
+class RevocationIndexError(Exception):
+    pass
+
+
+def _get_serial_width(serial_number):
+    return ((serial_number if serial_number >= 0 else ~serial_number).bit_length() + 8) // 8
+
+
+def _get_serial_key(serial_number, width):
+    return (serial_number + (1 << (width * 8 - 1))).to_bytes(width, 'big')
+
+
+def _format_time_key(time_key):
+    if time_key is None:
+        return None
+
+    return '{}-{}-{}T{}:{}:{}Z'.format(time_key[:4], time_key[4:6], time_key[6:8], time_key[8:10],
+                                        time_key[10:12], time_key[12:14])
+
+
+def _get_reason_name(reason):
+    if reason == _no_reason:
+        return None
+
+    return crl.CRLReason._map.get(reason, str(reason))
+
+
+def _encode_records(entries):
+    """
+    :param entries: {serial number: reason byte and revocation date key}
+    :return: (width, count, record bytes)
+    """
+    width = max((_get_serial_width(serial_number) for serial_number in entries), default=1)
+    records = [_get_serial_key(serial_number, width) + entry for serial_number, entry in sorted(entries.items())]
+
+    return width, len(records), b''.join(records)
+
+
+def summarize_crl(certificate_list):
+    """
+    :param certificate_list: crl.CertificateList, e.g. from CRLReader.read_trailer
+    :return: CRLSummary
+    """
+    tbs = certificate_list['tbs_cert_list']
+    issuer = get_dn_key(tbs['issuer']).digest
+    idp = get_extension_and_criticality(tbs, _idp_oid)[0]
+    crl_id = hashlib.sha256(issuer + (idp['extn_value'].contents if idp is not None else b'')).hexdigest()
+
+    crl_number = get_extension_and_criticality(tbs, _crl_number_oid)[0]
+    if crl_number is not None:
+        crl_number = crl_number['extn_value'].parsed.native
+    base_crl_number = get_extension_and_criticality(tbs, _delta_crl_indicator_oid)[0]
+    if base_crl_number is not None:
+        base_crl_number = base_crl_number['extn_value'].parsed.native
+
+    this_update = tbs['this_update']
+    next_update = tbs['next_update']
+    if next_update.name is not None:
+        next_update = get_time_key(next_update.name, next_update.chosen.contents).decode('ascii')
+    else:
+        next_update = None
+
+    return CRLSummary(crl_id, issuer.hex(), crl_number, base_crl_number,
+                      get_time_key(this_update.name, this_update.chosen.contents).decode('ascii'), next_update)
+
+
+def read_crl_entries(path, crl_issuer):
+    """
+    Reads the entries of a CRL file.
+    :param crl_issuer: hex issuer DN digest of the CRL, the issuer of its entries up to the first
+    certificateIssuer
+    :return: {hex issuer DN digest: {serial number: reason byte and revocation date key}}, the record
+    without its serial number so that a big CRL holds one small bytes object per entry
+    """
+    revoked = {}
+    issuer_entries = revoked.setdefault(crl_issuer, {})
+
+    with open(path, 'rb') as f:
+        crl_reader = CRLReader(f)
+        for revoked_entry in crl_reader.iter_entries():
+            if revoked_entry.error is not None:
+                raise RevocationIndexError("{} at offset {}: {}".format(path, revoked_entry.offset,
+                                                                        revoked_entry.error))
+
+            reason = _no_reason
+            if revoked_entry.extensions is not None:
+                for extension in revoked_entry.extensions:
+                    oid = extension['extn_id'].dotted
+                    if oid == _reason_code_oid:
+                        reason = int.from_bytes(extension['extn_value'].parsed.contents, 'big') & 0xFF
+                    elif oid == _certificate_issuer_oid:
+                        for general_name in extension['extn_value'].parsed:
+                            if general_name.name == 'directory_name':
+                                issuer = get_dn_key(general_name.chosen).digest.hex()
+                                issuer_entries = revoked.setdefault(issuer, {})
+                                break
+
+            serial_number = int.from_bytes(revoked_entry.serial_number, 'big', signed=True)
+            issuer_entries[serial_number] = bytes([reason]) + get_time_key(*revoked_entry.revocation_date)
+
+    return revoked
+
+
+class RevocationIndex:
+    """
+    Read only view of a revocation index file.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise RevocationIndexError("{} is empty".format(path))
+
+        try:
+            magic, version, metadata_offset, metadata_length = _header.unpack_from(self._mmap)
+        except struct.error:
+            magic, version = None, None
+        if magic != _magic or version != _version:
+            self.close()
+            raise RevocationIndexError("{} is not a version {} revocation index".format(path, _version))
+
+        if metadata_offset + metadata_length != len(self._mmap):
+            self.close()
+            raise RevocationIndexError("{} is truncated".format(path))
+
+        metadata = json.loads(self._mmap[metadata_offset:metadata_offset + metadata_length].decode('utf-8'))
+        self.scopes = metadata['scopes']
+        self.sources = metadata['sources']
+
+        # issuer DN digest: scopes
+        self._issuer_scopes = {}
+        for scope in self.scopes:
+            self._issuer_scopes.setdefault(bytes.fromhex(scope['issuer']), []).append(scope)
+
+    def read_records(self, records):
+        """
+        :param records: the 'base' or 'delta' of a scope
+        :return: the record bytes
+        """
+        size = (records['width'] + 1 + _date_size) * records['count']
+
+        return self._mmap[records['offset']:records['offset'] + size]
+
+    def _find(self, records, serial_number):
+        """
+        :return: (reason, revocation date key) of serial_number in the record array, None when it isn't there
+        """
+        width = records['width']
+        if records['count'] == 0 or _get_serial_width(serial_number) > width:
+            return None
+
+        key = _get_serial_key(serial_number, width)
+        size = width + 1 + _date_size
+        start = records['offset']
+        data = self._mmap
+        low, high = 0, records['count']
+        while low < high:
+            middle = (low + high) // 2
+            position = start + middle * size
+            middle_key = data[position:position + width]
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return data[position + width], data[position + width + 1:position + size].decode('ascii')
+
+        return None
+
+    def lookup(self, issuer, serial_number):
+        """
+        :param issuer: issuer DN digest, see name_utils.get_dn_key
+        :param serial_number: int
+        :return: RevocationStatus
+        """
+        scopes = self._issuer_scopes.get(issuer)
+        if not scopes:
+            return RevocationStatus('unknown', None, None, None)
+
+        for scope in scopes:
+            entry = None
+            this_update = scope['this_update']
+            if scope['delta'] is not None:
+                entry = self._find(scope['delta'], serial_number)
+                this_update = scope['delta']['this_update']
+            if entry is None:
+                entry = self._find(scope['base'], serial_number)
+            if entry is not None and entry[0] != _remove_from_crl:
+                return RevocationStatus('revoked', _get_reason_name(entry[0]), _format_time_key(entry[1]),
+                                        _format_time_key(this_update))
+
+        return RevocationStatus('not_revoked', None, None,
+                                _format_time_key(max(scope['delta']['this_update'] if scope['delta'] else
+                                                     scope['this_update'] for scope in scopes)))
+
+    def get_status(self, cert):
+        """
+        :param cert: x509.Certificate or x509.TbsCertificate
+        :return: RevocationStatus
+        """
+        tbs = cert['tbs_certificate'] if isinstance(cert, x509.Certificate) else cert
+
+        return self.lookup(get_dn_key(tbs['issuer']).digest, tbs['serial_number'].native)
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _is_newer(summary, scope):
+    if summary.crl_number is not None and scope['crl_number'] is not None:
+        return summary.crl_number > scope['crl_number']
+
+    return summary.this_update > scope['this_update']
+
+
+def _write_index(path, scopes, sources, old_index):
+    """
+    Writes the index next to path and moves it into place.
+    :param scopes: scope dicts, a 'base' or 'delta' with 'data' is new, without it is read from old_index
+    """
+    temp_path = path + '.tmp'
+
+    with open(temp_path, 'wb') as f:
+        f.write(_header.pack(_magic, _version, 0, 0))
+        offset = _header.size
+
+        for scope in scopes:
+            for name in ('base', 'delta'):
+                records = scope[name]
+                if records is None:
+                    continue
+                data = records.pop('data', None)
+                if data is None:
+                    data = old_index.read_records(records)
+                f.write(data)
+                records['offset'] = offset
+                offset += len(data)
+
+        metadata = json.dumps({'scopes': scopes, 'sources': sources}, sort_keys=True).encode('utf-8')
+        f.write(metadata)
+        f.seek(0)
+        f.write(_header.pack(_magic, _version, offset, len(metadata)))
+
+    os.replace(temp_path, path)
+
+
+def update_index(path, crl_paths, log=None):
+    """
+    Creates or updates a revocation index, see the module docstring.
+    :param crl_paths: der, pem or base64 CRL files
+    :param log: log(message) for each CRL file not used and why
+    :return: Counter of what happened to the files: 'complete' and 'delta' CRLs used, 'unchanged' files,
+    'older' CRLs and delta CRLs 'without base' not used, 'failed' files
+    """
+    log = log or (lambda message: None)
+    counts = collections.Counter()
+    old_index = RevocationIndex(path) if os.path.exists(path) else None
+
+    try:
+        # (crl id, issuer): scope
+        scopes = {}
+        sources = {}
+        if old_index is not None:
+            scopes = {(scope['crl'], scope['issuer']): dict(scope) for scope in old_index.scopes}
+            sources = dict(old_index.sources)
+
+        changed = []
+        for crl_path in crl_paths:
+            source = os.path.abspath(crl_path)
+            try:
+                stat = os.stat(crl_path)
+                if sources.get(source) == [stat.st_size, stat.st_mtime_ns]:
+                    counts['unchanged'] += 1
+                    continue
+                with open(crl_path, 'rb') as f:
+                    summary = summarize_crl(CRLReader(f).read_trailer())
+            except (OSError, ValueError) as e:
+                log('{}: {}'.format(crl_path, e))
+                counts['failed'] += 1
+                continue
+            changed.append((summary, crl_path, source, [stat.st_size, stat.st_mtime_ns]))
+
+        # complete CRLs before the deltas that build on them, older CRLs before newer ones
+        changed.sort(key=lambda c: (c[0].base_crl_number is not None, c[0].crl_number or 0, c[0].this_update))
+
+        for summary, crl_path, source, signature in changed:
+            crl_scopes = [scope for scope in scopes.values() if scope['crl'] == summary.crl_id]
+            # any scope of a CRL carries its numbers
+            current = crl_scopes[0] if crl_scopes else None
+
+            if summary.base_crl_number is None:
+                if current is not None and not _is_newer(summary, current):
+                    log('{}: CRL number {} is not newer than the index'.format(crl_path, summary.crl_number))
+                    counts['older'] += 1
+                    sources[source] = signature
+                    continue
+            elif summary.crl_number is None:
+                log('{}: delta CRL without a CRL number'.format(crl_path))
+                counts['failed'] += 1
+                continue
+            elif current is None or current['crl_number'] is None or \
+                    summary.base_crl_number > current['crl_number']:
+                log('{}: no complete CRL for base CRL number {}'.format(crl_path, summary.base_crl_number))
+                counts['without base'] += 1
+                continue
+            elif summary.crl_number <= current['crl_number'] or \
+                    (current['delta'] is not None and summary.crl_number <= current['delta']['crl_number']):
+                log('{}: delta CRL number {} is not newer than the index'.format(crl_path, summary.crl_number))
+                counts['older'] += 1
+                sources[source] = signature
+                continue
+
+            try:
+                revoked = read_crl_entries(crl_path, summary.issuer)
+            except (OSError, ValueError, RevocationIndexError) as e:
+                log('{}: {}'.format(crl_path, e))
+                counts['failed'] += 1
+                continue
+
+            if summary.base_crl_number is None:
+                for scope in crl_scopes:
+                    del scopes[(scope['crl'], scope['issuer'])]
+                for issuer, entries in revoked.items():
+                    # removeFromCRL only means something on a delta CRL
+                    entries = {serial_number: entry for serial_number, entry in entries.items()
+                               if entry[0] != _remove_from_crl}
+                    width, count, data = _encode_records(entries)
+                    scopes[(summary.crl_id, issuer)] = {
+                        'crl': summary.crl_id, 'issuer': issuer, 'source': source,
+                        'crl_number': summary.crl_number, 'this_update': summary.this_update,
+                        'next_update': summary.next_update,
+                        'base': {'width': width, 'count': count, 'data': data}, 'delta': None}
+                counts['complete'] += 1
+            else:
+                for issuer in set(revoked) | {scope['issuer'] for scope in crl_scopes}:
+                    scope = scopes.setdefault((summary.crl_id, issuer), {
+                        'crl': summary.crl_id, 'issuer': issuer, 'source': current['source'],
+                        'crl_number': current['crl_number'], 'this_update': current['this_update'],
+                        'next_update': current['next_update'],
+                        'base': {'width': 1, 'count': 0, 'data': b''}, 'delta': None})
+                    width, count, data = _encode_records(revoked.get(issuer, {}))
+                    scope['delta'] = {'source': source, 'crl_number': summary.crl_number,
+                                      'this_update': summary.this_update, 'next_update': summary.next_update,
+                                      'width': width, 'count': count, 'data': data}
+                counts['delta'] += 1
+
+            sources[source] = signature
+
+        _write_index(path, [scopes[key] for key in sorted(scopes)], sources, old_index)
+    finally:
+        if old_index is not None:
+            old_index.close()
+
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Index the revoked serial numbers on local CRLs')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    update_parser = commands.add_parser('update', help='create a revocation index or add CRLs to one')
+    update_parser.add_argument('index')
+    update_parser.add_argument('files', nargs='+', help='der, pem or base64 CRL files')
+
+    show_parser = commands.add_parser('show', help='list the scopes in a revocation index')
+    show_parser.add_argument('index')
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'update':
+            counts = update_index(args.index, args.files, lambda message: print(message, file=sys.stderr))
+            print(', '.join('{} {}'.format(count, name) for name, count in sorted(counts.items())) or
+                  'nothing to do', file=sys.stderr)
+            return 0
+
+        with RevocationIndex(args.index) as index:
+            for scope in index.scopes:
+                delta = scope['delta']
+                print('{} crl {} number {} thisUpdate {}: {} revoked{}'.format(
+                    scope['issuer'][:16], scope['crl'][:16], scope['crl_number'],
+                    _format_time_key(scope['this_update']), scope['base']['count'],
+                    ', delta number {}: {} entries'.format(delta['crl_number'], delta['count']) if delta else ''))
+    except (OSError, RevocationIndexError) as e:
+        parser.error(str(e))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Signed certificate timestamp lists, RFC 6962 section 3.3. The extension value is an OCTET STRING holding
+a TLS encoded SignedCertificateTimestampList:
+
+    opaque SerializedSCT<1..2^16-1>;
+    struct { SerializedSCT sct_list<1..2^16-1>; } SignedCertificateTimestampList;
+
+    struct {
+        Version sct_version;                      1 byte, v1(0)
+        LogID id;                                 32 bytes, sha256 of the log's public key
+        uint64 timestamp;                         ms since the epoch
+        CtExtensions extensions;                  opaque<0..2^16-1>
+        digitally-signed struct { ... };          hash and signature algorithm bytes, opaque<0..2^16-1>
+    } SignedCertificateTimestamp;
+
+There are only a few dozen logs, so log IDs are interned: each distinct ID is formatted once and every
+SCT from that log shares the same string.
+"""
+from asn1crypto import core
+from datetime import datetime, timezone
+import base64
+import collections
+import struct
+
+sct_list_oid = '1.3.6.1.4.1.11129.2.4.2'
+
+SCT = collections.namedtuple('SCT', 'version log_id timestamp extensions hash_algorithm signature_algorithm '
+                                    'signature')
+SCT.__doc__ = """
+version: 0 for v1
+log_id: base64 of the log ID, interned
+timestamp: ms since the epoch
+extensions: bytes
+hash_algorithm: TLS HashAlgorithm, 4 is sha256
+signature_algorithm: TLS SignatureAlgorithm, 1 is rsa and 3 is ecdsa
+signature: bytes
+"""
+
+hash_algorithm_names = {0: 'none', 1: 'md5', 2: 'sha1', 3: 'sha224', 4: 'sha256', 5: 'sha384', 6: 'sha512'}
+signature_algorithm_names = {0: 'anonymous', 1: 'rsa', 2: 'dsa', 3: 'ecdsa'}
+
+# log ID bytes: base64 str
+_log_ids = {}
+_max_log_ids = 4096
+
+_sct_header = struct.Struct('>B32sQ')
+
+
+class SCTError(ValueError):
+    pass
+
+
+def _intern_log_id(log_id):
+    log_id_string = _log_ids.get(log_id)
+    if log_id_string is None:
+        if len(_log_ids) >= _max_log_ids:
+            _log_ids.clear()
+        log_id_string = base64.b64encode(log_id).decode('ascii')
+        _log_ids[log_id] = log_id_string
+
+    return log_id_string
+
+
+def _read_opaque(data, offset):
+    if offset + 2 > len(data):
+        raise SCTError("Truncated SCT list")
+    length = int.from_bytes(data[offset:offset + 2], 'big')
+    end = offset + 2 + length
+    if end > len(data):
+        raise SCTError("Truncated SCT list")
+
+    return data[offset + 2:end], end
+
+
+def decode_sct(data):
+    """
+    :param data: SerializedSCT contents
+    :return: SCT
+    """
+    if data[:1] != b'\x00':
+        # only the version of a later version SCT can be read
+        if not data:
+            raise SCTError("Empty SCT")
+        return SCT(data[0], None, None, None, None, None, None)
+
+    if len(data) < _sct_header.size:
+        raise SCTError("Truncated SCT")
+    version, log_id, timestamp = _sct_header.unpack_from(data)
+    extensions, offset = _read_opaque(data, _sct_header.size)
+    if offset + 2 > len(data):
+        raise SCTError("Truncated SCT")
+    hash_algorithm, signature_algorithm = data[offset], data[offset + 1]
+    signature, offset = _read_opaque(data, offset + 2)
+    if offset != len(data):
+        raise SCTError("Unexpected data after the SCT signature")
+
+    return SCT(version, _intern_log_id(log_id), timestamp, extensions, hash_algorithm, signature_algorithm,
+               signature)
+
+
+def decode_sct_list(data):
+    """
+    :param data: SignedCertificateTimestampList
+    :return: list of SCT
+    """
+    sct_list, offset = _read_opaque(data, 0)
+    if offset != len(data):
+        raise SCTError("Unexpected data after the SCT list")
+
+    scts = []
+    offset = 0
+    while offset < len(sct_list):
+        serialized_sct, offset = _read_opaque(sct_list, offset)
+        scts.append(decode_sct(serialized_sct))
+
+    return scts
+
+
+def decode_sct_list_extension(extension):
+    """
+    :param extension: x509.Extension with sct_list_oid
+    :return: list of SCT
+    """
+    try:
+        data = core.OctetString.load(extension['extn_value'].contents, strict=True).native
+    except ValueError as e:
+        raise SCTError("SCT list is not an OCTET STRING: {}".format(e))
+
+    return decode_sct_list(data)
+
+
+def get_timestamp_datetime(timestamp):
+    """
+    :param timestamp: SCT timestamp, ms since the epoch
+    :return: aware datetime in UTC
+    """
+    return datetime.fromtimestamp(timestamp / 1000, timezone.utc)
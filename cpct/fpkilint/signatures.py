@@ -0,0 +1,398 @@
+"""
+Certificate signature verification in pure Python, for chain mode: RSA PKCS#1 v1.5 (RFC 8017 8.2.2),
+RSA-PSS (RFC 8017 8.1.2, RFC 4055 parameters) and ECDSA on P-256, P-384 and P-521 (FIPS 186-4).
+
+Decoded public keys are cached by the der of their SubjectPublicKeyInfo, so a corpus issued by a few CAs
+decodes each CA key once. For an EC key the cache also holds a table of multiples of the key's point, and
+each curve has one for its generator; verifying is then a single pass of combined 4 bit window
+multiplication, with no per-certificate work on either point beyond table lookups.
+
+This is for linting, not for deciding trust: there is no protection against timing side channels, which
+doesn't matter when only public values are involved.
+"""
+from asn1crypto import algos, core
+import hashlib
+
+_hash_names = ('sha1', 'sha224', 'sha256', 'sha384', 'sha512')
+
+# public key info der: _RSAKey or _ECKey, see get_public_key
+_public_keys = {}
+_max_public_keys = 1024
+
+_window_bits = 4
+
+
+class SignatureError(ValueError):
+    """
+    The signature could not be checked: unsupported algorithm, bad key or malformed signature.
+    """
+    pass
+
+
+class _Curve:
+    def __init__(self, name, p, n, b, gx, gy):
+        self.name = name
+        self.p = p
+        self.n = n
+        self.b = b
+        self.size = (p.bit_length() + 7) // 8
+        self.generator_table = None
+        self.generator = (gx, gy)
+
+    def is_on_curve(self, x, y):
+        return (y * y - (x * x * x - 3 * x + self.b)) % self.p == 0
+
+    def get_generator_table(self):
+        if self.generator_table is None:
+            self.generator_table = _make_table(self, self.generator)
+
+        return self.generator_table
+
+
+_curves = {
+    'secp256r1': _Curve(
+        'P-256',
+        0xffffffff00000001000000000000000000000000ffffffffffffffffffffffff,
+        0xffffffff00000000ffffffffffffffffbce6faada7179e84f3b9cac2fc632551,
+        0x5ac635d8aa3a93e7b3ebbd55769886bc651d06b0cc53b0f63bce3c3e27d2604b,
+        0x6b17d1f2e12c4247f8bce6e563a440f277037d812deb33a0f4a13945d898c296,
+        0x4fe342e2fe1a7f9b8ee7eb4a7c0f9e162bce33576b315ececbb6406837bf51f5),
+    'secp384r1': _Curve(
+        'P-384',
+        0xfffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffeffffffff0000000000000000ffffffff,
+        0xffffffffffffffffffffffffffffffffffffffffffffffffc7634d81f4372ddf581a0db248b0a77aecec196accc52973,
+        0xb3312fa7e23ee7e4988e056be3f82d19181d9c6efe8141120314088f5013875ac656398d8a2ed19d2a85c8edd3ec2aef,
+        0xaa87ca22be8b05378eb1c71ef320ad746e1d3b628ba79b9859f741e082542a385502f25dbf55296c3a545e3872760ab7,
+        0x3617de4a96262c6f5d9e98bf9292dc29f8f41dbd289a147ce9da3113b5f0b8c00a60b1ce1d7e819d7a431d7c90ea0e5f),
+    'secp521r1': _Curve(
+        'P-521',
+        (1 << 521) - 1,
+        0x01fffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffa51868783bf2f966b7fcc0148f709a5d03bb5c9b8899c47aebb6fb71e91386409,
+        0x0051953eb9618e1c9a1f929a21a0b68540eea2da725b99b315f3b8b489918ef109e156193951ec7e937b1652c0bd3bb1bf073573df883d2c34f1ef451fd46b503f00,
+        0x00c6858e06b70404e9cd9e3ecb662395b4429c648139053fb521f828af606b4d3dbaa14b5e77efe75928fe1dc127a2ffa8de3348b3c1856a429bf97e7e31c2e5bd66,
+        0x011839296a789a3bc0045c8a5fb42c7d1bd998f54449579b446817afbd17273e662c97ee72995ef42640c550b9013fad0761353c7086a272c24088be94769fd16650),
+}
+
+
+# points are affine (x, y) tuples or jacobian (x, y, z) tuples, None is the point at infinity; all three
+# curves have a = -3
+
+def _double(curve, point):
+    if point is None:
+        return None
+    x, y, z = point
+    if y == 0:
+        return None
+
+    p = curve.p
+    delta = z * z % p
+    gamma = y * y % p
+    beta = x * gamma % p
+    alpha = 3 * (x - delta) * (x + delta) % p
+    x3 = (alpha * alpha - 8 * beta) % p
+    z3 = ((y + z) * (y + z) - gamma - delta) % p
+    y3 = (alpha * (4 * beta - x3) - 8 * gamma * gamma) % p
+
+    return x3, y3, z3
+
+
+def _add_affine(curve, point, affine):
+    """
+    :return: jacobian point + affine point
+    """
+    if affine is None:
+        return point
+    if point is None:
+        return affine[0], affine[1], 1
+
+    p = curve.p
+    x1, y1, z1 = point
+    x2, y2 = affine
+    z1z1 = z1 * z1 % p
+    h = (x2 * z1z1 - x1) % p
+    r = (y2 * z1 * z1z1 - y1) % p
+    if h == 0:
+        if r == 0:
+            return _double(curve, point)
+        return None
+
+    hh = h * h % p
+    hhh = h * hh % p
+    v = x1 * hh % p
+    x3 = (r * r - hhh - 2 * v) % p
+    y3 = (r * (v - x3) - y1 * hhh) % p
+    z3 = z1 * h % p
+
+    return x3, y3, z3
+
+
+def _to_affine(curve, point):
+    if point is None:
+        return None
+
+    x, y, z = point
+    p = curve.p
+    z_inverse = pow(z, -1, p)
+    z_inverse_squared = z_inverse * z_inverse % p
+
+    return x * z_inverse_squared % p, y * z_inverse_squared * z_inverse % p
+
+
+def _make_table(curve, affine):
+    """
+    :return: [None, P, 2P, ... 15P] as affine points
+    """
+    table = [None, affine]
+    point = (affine[0], affine[1], 1)
+    for i in range(2, 1 << _window_bits):
+        point = _add_affine(curve, point, affine)
+        table.append(_to_affine(curve, point))
+
+    return table
+
+
+def _multiply_add(curve, u1, table1, u2, table2):
+    """
+    :return: affine u1 * P1 + u2 * P2, with the tables from _make_table
+    """
+    mask = (1 << _window_bits) - 1
+    point = None
+    for shift in range((curve.n.bit_length() + _window_bits - 1) // _window_bits * _window_bits - _window_bits,
+                       -1, -_window_bits):
+        for i in range(_window_bits):
+            point = _double(curve, point)
+        point = _add_affine(curve, point, table1[(u1 >> shift) & mask])
+        point = _add_affine(curve, point, table2[(u2 >> shift) & mask])
+
+    return _to_affine(curve, point)
+
+
+def _get_hash(hash_name):
+    if hash_name not in _hash_names:
+        raise SignatureError("Unsupported hash algorithm {}".format(hash_name))
+
+    return hashlib.new(hash_name)
+
+
+def _mgf1(hash_name, seed, length):
+    output = b''
+    counter = 0
+    while len(output) < length:
+        output += hashlib.new(hash_name, seed + counter.to_bytes(4, 'big')).digest()
+        counter += 1
+
+    return output[:length]
+
+
+class _RSAKey:
+    def __init__(self, public_key):
+        """
+        :param public_key: keys.RSAPublicKey
+        """
+        self.n = public_key['modulus'].native
+        self.e = public_key['public_exponent'].native
+        self.size = (self.n.bit_length() + 7) // 8
+
+    def _encrypt(self, signature):
+        if len(signature) != self.size:
+            return None
+        s = int.from_bytes(signature, 'big')
+        if s >= self.n:
+            return None
+
+        return pow(s, self.e, self.n)
+
+    def verify(self, signature_algorithm, data, signature):
+        algorithm = signature_algorithm.signature_algo
+        if algorithm == 'rsassa_pkcs1v15':
+            return self._verify_pkcs1v15(signature_algorithm.hash_algo, data, signature)
+        if algorithm == 'rsassa_pss':
+            return self._verify_pss(signature_algorithm['parameters'], data, signature)
+
+        raise SignatureError("{} signature with an RSA key".format(algorithm))
+
+    def _verify_pkcs1v15(self, hash_name, data, signature):
+        digest = _get_hash(hash_name)
+        digest.update(data)
+
+        m = self._encrypt(signature)
+        if m is None:
+            return False
+        encoded = m.to_bytes(self.size, 'big')
+
+        separator = encoded.find(b'\x00', 2)
+        if encoded[:2] != b'\x00\x01' or separator < 10 or encoded[2:separator].strip(b'\xff'):
+            return False
+
+        try:
+            digest_info = algos.DigestInfo.load(encoded[separator + 1:], strict=True)
+            return digest_info['digest_algorithm']['algorithm'].native == hash_name and \
+                digest_info['digest'].native == digest.digest()
+        except ValueError:
+            return False
+
+    def _verify_pss(self, parameters, data, signature):
+        hash_name = parameters['hash_algorithm']['algorithm'].native
+        mask_gen = parameters['mask_gen_algorithm']
+        if mask_gen['algorithm'].native != 'mgf1':
+            raise SignatureError("Unsupported PSS mask generation function {}".format(mask_gen['algorithm'].native))
+        mgf_hash_name = mask_gen['parameters']['algorithm'].native
+        salt_length = parameters['salt_length'].native
+        if parameters['trailer_field'].native not in (1, 'trailer_field_bc'):
+            raise SignatureError("Unsupported PSS trailer field")
+
+        digest = _get_hash(hash_name)
+        _get_hash(mgf_hash_name)
+        digest.update(data)
+        m_hash = digest.digest()
+        h_length = len(m_hash)
+
+        m = self._encrypt(signature)
+        if m is None:
+            return False
+        em_bits = self.n.bit_length() - 1
+        em_length = (em_bits + 7) // 8
+        if m.bit_length() > em_bits or em_length < h_length + salt_length + 2:
+            return False
+        encoded = m.to_bytes(em_length, 'big')
+        if encoded[-1] != 0xbc:
+            return False
+
+        masked_db = encoded[:em_length - h_length - 1]
+        h = encoded[em_length - h_length - 1:-1]
+        db = bytearray(a ^ b for a, b in zip(masked_db, _mgf1(mgf_hash_name, h, len(masked_db))))
+        db[0] &= 0xff >> (8 * em_length - em_bits)
+
+        padding_length = em_length - h_length - salt_length - 2
+        if any(db[:padding_length]) or db[padding_length] != 1:
+            return False
+        salt = bytes(db[len(db) - salt_length:]) if salt_length else b''
+
+        return hashlib.new(hash_name, b'\x00' * 8 + m_hash + salt).digest() == h
+
+
+class _ECKey:
+    def __init__(self, curve, point):
+        """
+        :param point: ECPoint bytes
+        """
+        self.curve = curve
+        self.point = _decode_point(curve, point)
+        self.table = _make_table(curve, self.point)
+
+    def verify(self, signature_algorithm, data, signature):
+        if signature_algorithm.signature_algo != 'ecdsa':
+            raise SignatureError("{} signature with an EC key".format(signature_algorithm.signature_algo))
+
+        digest = _get_hash(signature_algorithm.hash_algo)
+        digest.update(data)
+
+        try:
+            values = algos.DSASignature.load(signature, strict=True)
+            r = values['r'].native
+            s = values['s'].native
+        except ValueError:
+            return False
+
+        curve = self.curve
+        n = curve.n
+        if not 0 < r < n or not 0 < s < n:
+            return False
+
+        e = int.from_bytes(digest.digest(), 'big')
+        excess_bits = 8 * digest.digest_size - n.bit_length()
+        if excess_bits > 0:
+            e >>= excess_bits
+
+        w = pow(s, -1, n)
+        point = _multiply_add(curve, e * w % n, curve.get_generator_table(), r * w % n, self.table)
+
+        return point is not None and point[0] % n == r
+
+
+def _decode_point(curve, point):
+    size = curve.size
+    if len(point) == 2 * size + 1 and point[0] == 4:
+        x = int.from_bytes(point[1:size + 1], 'big')
+        y = int.from_bytes(point[size + 1:], 'big')
+    elif len(point) == size + 1 and point[0] in (2, 3):
+        x = int.from_bytes(point[1:], 'big')
+        # p = 3 mod 4 for all three curves
+        y = pow((x * x * x - 3 * x + curve.b) % curve.p, (curve.p + 1) // 4, curve.p)
+        if y & 1 != point[0] & 1:
+            y = curve.p - y
+    else:
+        raise SignatureError("Bad {} public key point".format(curve.name))
+
+    if not (x < curve.p and y < curve.p and curve.is_on_curve(x, y)):
+        raise SignatureError("{} public key point is not on the curve".format(curve.name))
+
+    return x, y
+
+
+def _decode_public_key(public_key_info):
+    algorithm = public_key_info.algorithm
+    if algorithm in ('rsa', 'rsassa_pss'):
+        return _RSAKey(public_key_info['public_key'].parsed)
+
+    if algorithm == 'ec':
+        curve_type, curve_name = public_key_info.curve
+        if curve_type != 'named' or curve_name not in _curves:
+            raise SignatureError("Unsupported curve {}".format(curve_name))
+        return _ECKey(_curves[curve_name], public_key_info['public_key'].native)
+
+    raise SignatureError("Unsupported public key algorithm {}".format(algorithm))
+
+
+def get_public_key(public_key_info):
+    """
+    :param public_key_info: keys.PublicKeyInfo
+    :return: decoded key, cached
+    """
+    der = public_key_info.dump()
+    public_key = _public_keys.get(der)
+    if public_key is not None:
+        return public_key
+
+    try:
+        public_key = _decode_public_key(public_key_info)
+    except SignatureError:
+        raise
+    except (ValueError, TypeError) as e:
+        raise SignatureError("Could not decode the public key: {}".format(e))
+
+    if len(_public_keys) >= _max_public_keys:
+        _public_keys.clear()
+    _public_keys[der] = public_key
+
+    return public_key
+
+
+def verify_signature(public_key_info, signature_algorithm, data, signature):
+    """
+    :param public_key_info: keys.PublicKeyInfo of the signer
+    :param signature_algorithm: algos.SignedDigestAlgorithm
+    :return: whether the signature verifies
+    :raises SignatureError: the signature can't be checked
+    """
+    public_key = get_public_key(public_key_info)
+    try:
+        return public_key.verify(signature_algorithm, data, signature)
+    except SignatureError:
+        raise
+    except (ValueError, KeyError) as e:
+        raise SignatureError(str(e))
+
+
+def verify_certificate_signature(cert, issuer_public_key_info):
+    """
+    :param cert: x509.Certificate
+    :return: whether cert's signature verifies with the issuer's public key
+    :raises SignatureError: the signature can't be checked
+    """
+    signature = cert['signature_value']
+    if not isinstance(signature, core.OctetBitString):
+        raise SignatureError("Signature is not a BIT STRING")
+
+    return verify_signature(issuer_public_key_info, cert['signature_algorithm'], cert['tbs_certificate'].dump(),
+                            signature.native)
@@ -49,8 +49,9 @@ def process_add_certificate(cert, profile_file, output_file):
     output_file.write(_header)
     output_file.write(_cols)
 
-    for i, (key, r) in enumerate(other_extensions_rows.items()):
-        output_rows[key] = r
+    if other_extensions_rows is not None:
+        for i, (key, r) in enumerate(other_extensions_rows.items()):
+            output_rows[key] = r
 
     for i, (key, r) in enumerate(output_rows.items()):
 
@@ -0,0 +1,83 @@
+import contextvars
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+_current_timer = contextvars.ContextVar('fpkilint_timer', default=None)
+
+
+class PhaseTimer:
+    """
+    Accumulates wall clock time (and call counts) per named phase, e.g. 'parse', 'check.key_usage',
+    'der2ascii'. Phases that run more than once are summed.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = OrderedDict()
+
+    def add(self, name, seconds, count=1):
+        if name in self.phases:
+            self.phases[name][0] += seconds
+            self.phases[name][1] += count
+        else:
+            self.phases[name] = [seconds, count]
+
+    def merge(self, phases):
+        for name, (seconds, count) in phases.items():
+            self.add(name, seconds, count)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self):
+        """
+        :return: Server-Timing header value, durations in milliseconds
+        """
+        metrics = []
+        for name, (seconds, count) in self.phases.items():
+            metric = '{};dur={:.2f}'.format(name, seconds * 1000)
+            if count > 1:
+                metric += ';desc="{} calls"'.format(count)
+            metrics.append(metric)
+
+        metrics.append('total;dur={:.2f}'.format(self.elapsed() * 1000))
+
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        return OrderedDict((name, {'ms': round(seconds * 1000, 3), 'count': count})
+                           for name, (seconds, count) in self.phases.items())
+
+
+def get_timer():
+    return _current_timer.get()
+
+
+@contextmanager
+def use_timer(timer):
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+@contextmanager
+def timed(name):
+    """
+    Times the block into the active PhaseTimer, if there is one.
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+    else:
+        with timer.phase(name):
+            yield
@@ -0,0 +1,223 @@
+from fpkilint.cert_utils import parse_certificate_or_tbs
+from fpkilint.html_output import iter_analyze_certificate, load_all_profiles
+from fpkilint.timing import PhaseTimer, get_timer, timed, use_timer
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# seconds to wait for a worker to exit on its own before it is killed
+_stop_grace_period = 1.0
+
+
+class LintTimeout(Exception):
+    pass
+
+
+class LintWorkerError(Exception):
+    pass
+
+
+class LintParseError(Exception):
+    pass
+
+
+def _worker_main(conn):
+    """
+    Lint worker process. Receives (der or pem certificate or tbs certificate, profile template) jobs and
+    answers each with a 'header' message, one 'row' message per row and 'done' with the worker side
+    phase timings.
+    Parse failures are answered with 'parse_error', anything else with 'error'. None stops the worker.
+    """
+    # the parent handles ctrl-c and stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    load_all_profiles()
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+
+        if job is None:
+            break
+
+        byte_data, template = job
+        timer = PhaseTimer()
+
+        with use_timer(timer):
+            try:
+                with timed('parse'):
+                    cert = parse_certificate_or_tbs(byte_data)
+            except Exception as e:
+                conn.send(('parse_error', str(e), timer.phases))
+                continue
+
+            try:
+                results = iter_analyze_certificate(cert, template)
+                conn.send(('header', next(results)))
+                for row in results:
+                    conn.send(('row', row))
+            except Exception as e:
+                logger.exception('Lint failed for %s', template)
+                conn.send(('error', '{}: {}'.format(type(e).__name__, e), timer.phases))
+                continue
+
+        conn.send(('done', timer.phases))
+
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(_stop_grace_period)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class LintWorkerPool:
+    """
+    Pool of pre-warmed lint worker processes. Each job has a wall clock limit; a worker that does not
+    finish in time is killed and replaced, and every worker is replaced after max_jobs jobs so memory
+    does not creep.
+
+    Thread safe: every job takes a worker for itself, callers wait for a free one.
+    """
+    def __init__(self, size, timeout, max_jobs, start_method='forkserver'):
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+        self._context = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver':
+            self._context.set_forkserver_preload(['fpkilint.html_output'])
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = set()
+        self._closed = False
+
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        worker = _Worker(self._context)
+        with self._lock:
+            self._workers.add(worker)
+
+        return worker
+
+    def _discard(self, worker, kill):
+        with self._lock:
+            self._workers.discard(worker)
+        if kill:
+            worker.kill()
+        else:
+            worker.stop()
+
+    def _release(self, worker, healthy):
+        if not healthy:
+            self._discard(worker, kill=True)
+        elif worker.jobs >= self.max_jobs:
+            self._discard(worker, kill=False)
+        else:
+            self._idle.put(worker)
+            return
+
+        if not self._closed:
+            self._idle.put(self._spawn())
+
+    def iter_lint(self, byte_data, template):
+        """
+        Lints a certificate in a worker process, see html_output.iter_analyze_certificate.
+        Worker side phase timings are added to the active PhaseTimer.
+        :param byte_data: der or pem certificate or tbs certificate
+        :param template: profile template path, e.g. fbca/1.9/5-ee-signature.json
+        :return: generator, the header dict followed by the row dicts
+        :raises LintParseError: the certificate could not be parsed
+        :raises LintTimeout: the job took longer than the pool timeout, the worker was killed
+        :raises LintWorkerError: linting failed or the worker died
+        """
+        if self._closed:
+            raise LintWorkerError("Lint worker pool is closed")
+
+        worker = self._idle.get()
+        if not worker.process.is_alive():
+            logger.warning('Lint worker %s died while idle, replacing it', worker.process.pid)
+            self._discard(worker, kill=True)
+            worker = self._spawn()
+
+        deadline = time.monotonic() + self.timeout
+        healthy = False
+
+        try:
+            worker.jobs += 1
+            try:
+                worker.conn.send((byte_data, template))
+            except OSError as e:
+                raise LintWorkerError("Could not send job to lint worker: {}".format(e))
+
+            while True:
+                if not worker.conn.poll(max(deadline - time.monotonic(), 0)):
+                    logger.warning('Lint of %s timed out after %ss, killing worker %s', template, self.timeout,
+                                   worker.process.pid)
+                    raise LintTimeout("Linting took longer than {} seconds".format(self.timeout))
+
+                try:
+                    message = worker.conn.recv()
+                except EOFError:
+                    raise LintWorkerError("Lint worker exited with code {}".format(worker.process.exitcode))
+
+                if message[0] in ('header', 'row'):
+                    yield message[1]
+                    continue
+
+                timer = get_timer()
+                if timer is not None:
+                    timer.merge(message[-1])
+
+                if message[0] == 'done':
+                    healthy = True
+                    return
+
+                # the worker is fine after a parse or lint error, it answered the whole job
+                healthy = True
+                if message[0] == 'parse_error':
+                    raise LintParseError(message[1])
+                raise LintWorkerError(message[1])
+        finally:
+            # a caller that stops early leaves the worker mid job, it can't be reused
+            self._release(worker, healthy)
+
+    def lint(self, byte_data, template):
+        """
+        :return: (header dict, list of row dicts), see iter_lint
+        """
+        results = self.iter_lint(byte_data, template)
+        header = next(results)
+
+        return header, list(results)
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
@@ -0,0 +1,17 @@
+import os
+import shutil
+import tempfile
+
+# shared directory for prometheus_client multiprocess mode, must be set before the workers import it
+os.environ.setdefault('prometheus_multiproc_dir', os.path.join(tempfile.gettempdir(), 'cpct-metrics'))
+
+
+def on_starting(server):
+    # samples left by a previous master are stale
+    shutil.rmtree(os.environ['prometheus_multiproc_dir'], ignore_errors=True)
+    os.makedirs(os.environ['prometheus_multiproc_dir'])
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
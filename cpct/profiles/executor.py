@@ -0,0 +1,173 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from django.conf import settings
+from fpkilint.timing import timed, use_timer
+from fpkilint.worker_pool import LintWorkerPool
+from .scheduler import INTERACTIVE, BATCH, BACKGROUND, LintScheduler, TokenBuckets, Overloaded, get_client_key
+import asyncio
+import atexit
+import functools
+import threading
+import time
+
+# cache access and template rendering are blocking, the async views run them here so the event loop
+# keeps serving other requests
+_executor = ThreadPoolExecutor(max_workers=settings.LINT_MAX_THREADS, thread_name_prefix='lint')
+
+# linting goes through the scheduler, one thread per lint worker process so queued jobs wait in the
+# scheduler's priority queues rather than for a worker
+_scheduler = LintScheduler(settings.LINT_WORKERS, {
+    INTERACTIVE: settings.LINT_QUEUE_LIMITS['interactive'],
+    BATCH: settings.LINT_QUEUE_LIMITS['batch'],
+    BACKGROUND: settings.LINT_QUEUE_LIMITS['background'],
+})
+_client_buckets = TokenBuckets(settings.LINT_CLIENT_RATE, settings.LINT_CLIENT_BURST)
+
+_lint_pool = None
+_lint_pool_lock = threading.Lock()
+
+
+def get_lint_pool():
+    """
+    The lint worker processes are started on first use so each web worker gets its own, after gunicorn
+    has forked it.
+    """
+    global _lint_pool
+
+    with _lint_pool_lock:
+        if _lint_pool is None:
+            _lint_pool = LintWorkerPool(settings.LINT_WORKERS, settings.LINT_TIMEOUT,
+                                        settings.LINT_MAX_JOBS_PER_WORKER)
+            atexit.register(_lint_pool.close)
+
+    return _lint_pool
+
+
+def _run_timed(timer, phase, func, *args, **kwargs):
+    with use_timer(timer):
+        if phase is None:
+            return func(*args, **kwargs)
+        with timed(phase):
+            return func(*args, **kwargs)
+
+
+async def offload(request, phase, func, *args, **kwargs):
+    """
+    Runs func(*args, **kwargs) on the lint executor, timing it as phase (if not None) in the request's
+    PhaseTimer.
+    """
+    loop = asyncio.get_event_loop()
+    job = functools.partial(_run_timed, getattr(request, 'timer', None), phase, func, *args, **kwargs)
+
+    return await loop.run_in_executor(_executor, job)
+
+
+def _run_scheduled(timer, phase, submitted, func, *args):
+    with use_timer(timer):
+        if timer is not None:
+            timer.add('queue', time.perf_counter() - submitted)
+        with timed(phase):
+            return func(*args)
+
+
+def admit_client(request, cost=1):
+    """
+    Takes cost tokens from the client's bucket.
+    :raises Overloaded: the client is over its rate
+    """
+    retry_after = _client_buckets.take(get_client_key(request), cost)
+    if retry_after:
+        raise Overloaded("Too many certificates from this client", retry_after)
+
+
+async def schedule_lint(request, priority, phase, func, *args, cost=1):
+    """
+    Like offload, but for linting: the client pays cost tokens and the job waits its turn in the
+    scheduler. Time spent waiting is recorded as the 'queue' phase.
+    :raises Overloaded: the client is over its rate or the queue for priority is full
+    """
+    if cost:
+        admit_client(request, cost)
+
+    future = _scheduler.submit(priority, _run_scheduled, getattr(request, 'timer', None), phase,
+                               time.perf_counter(), func, *args)
+
+    return await asyncio.wrap_future(future)
+
+
+
+def _put_items(first, stopped, func, *args):
+    """
+    Runs the generator func(*args) to the end, or until stopped is set. first resolves to (first item,
+    future for the next item), and so on; the future after the last item resolves to None or to the
+    exception that stopped the generator.
+    """
+    slot = first
+    try:
+        results = func(*args)
+        try:
+            for item in results:
+                next_slot = Future()
+                slot.set_result((item, next_slot))
+                slot = next_slot
+                if stopped.is_set():
+                    break
+        finally:
+            results.close()
+    except BaseException as e:
+        slot.set_exception(e)
+    else:
+        slot.set_result(None)
+
+
+class ScheduledStream:
+    """
+    Async iterator over the items of a generator running as one scheduler job, see schedule_stream.
+    It isn't tied to an event loop: under ASGI the view awaits the first item in its own loop and the
+    response is streamed from the server's.
+    """
+    def __init__(self, job, first, stopped):
+        self._job = job
+        self._next = first
+        self._stopped = stopped
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._next is None:
+            raise StopAsyncIteration
+
+        slot = await asyncio.wrap_future(self._next)
+        if slot is None:
+            self._next = None
+            raise StopAsyncIteration
+
+        item, self._next = slot
+        return item
+
+    async def aclose(self):
+        """
+        Stops the job, if it is still queued or running.
+        """
+        self._next = None
+        self._stopped.set()
+        self._job.cancel()
+
+
+def schedule_stream(request, priority, phase, func, *args, cost=1):
+    """
+    schedule_lint for a generator function such as LintWorkerPool.iter_lint: the whole generator is one
+    scheduler job, so a streamed result keeps its scheduler thread until the last row rather than just
+    for the first.
+    :return: ScheduledStream of the items, aclose it to stop early
+    :raises Overloaded: the client is over its rate or the queue for priority is full
+    """
+    if cost:
+        admit_client(request, cost)
+
+    first = Future()
+    stopped = threading.Event()
+    job = _scheduler.submit(priority, _run_scheduled, getattr(request, 'timer', None), phase,
+                            time.perf_counter(), _put_items, first, stopped, func, *args)
+
+    return ScheduledStream(job, first, stopped)
@@ -1,4 +1,5 @@
 from django import forms
+from django.core.validators import RegexValidator
 
 
 class UploadFileForm(forms.Form):
@@ -6,3 +7,12 @@ class UploadFileForm(forms.Form):
     profile = forms.CharField()
     type = forms.CharField()
     version = forms.CharField()
+    stream = forms.CharField(required=False)
+
+
+class LookupForm(forms.Form):
+    # the page may send upper case hex, the view looks it up in lower case
+    sha256 = forms.CharField(min_length=64, max_length=64, validators=[RegexValidator(r'^[0-9a-fA-F]{64}\Z')])
+    profile = forms.CharField()
+    type = forms.CharField()
+    version = forms.CharField()
@@ -0,0 +1,70 @@
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import multiprocess
+import os
+
+# gunicorn.conf.py points prometheus_multiproc_dir at a shared directory so every worker process
+# writes its samples there and /metrics aggregates all of them.
+
+_latency_buckets = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+lint_requests = Counter('cpct_lint_requests_total', 'Certificate uploads by outcome', ['outcome'])
+phase_seconds = Histogram('cpct_phase_seconds', 'Time spent per request phase', ['phase'],
+                          buckets=_latency_buckets)
+check_seconds = Histogram('cpct_check_seconds', 'Time spent per conformance check', ['check'],
+                          buckets=_latency_buckets)
+request_seconds = Histogram('cpct_request_seconds', 'Total request time', ['path'], buckets=_latency_buckets)
+# code is the conformance check, e.g. key_usage, or the extension oid for other extensions
+findings = Counter('cpct_findings_total', 'Findings by code, severity and profile', ['code', 'severity', 'profile'])
+result_cache_requests = Counter('cpct_result_cache_requests_total', 'Lint result cache lookups', ['result'])
+der2ascii_calls = Counter('cpct_der2ascii_calls_total', 'der2ascii subprocess invocations')
+
+_metric_paths = {'/file/', '/lookup/', '/metrics', '/metrics/'}
+
+
+def record_outcome(outcome):
+    lint_requests.labels(outcome).inc()
+
+
+def record_cache_lookup(hit):
+    result_cache_requests.labels('hit' if hit else 'miss').inc()
+
+
+def record_findings(rows, profile):
+    for row in rows:
+        for finding in row['findings']:
+            findings.labels(finding['code'], finding['severity'], profile).inc()
+
+
+def observe_timer(timer, path):
+    """
+    :param timer: fpkilint.timing.PhaseTimer for a finished request
+    :param path: request path, only known endpoints get their own label
+    """
+    for name, (seconds, count) in timer.phases.items():
+        if name.startswith('check.'):
+            check_seconds.labels(name[len('check.'):]).observe(seconds)
+        else:
+            phase_seconds.labels(name).observe(seconds)
+
+        if name == 'der2ascii':
+            der2ascii_calls.inc(count)
+
+    if path.startswith('/fragment/'):
+        path = '/fragment/'
+    elif path not in _metric_paths:
+        path = 'other'
+
+    request_seconds.labels(path).observe(timer.elapsed())
+
+
+def get_metrics():
+    """
+    :return: (body, content type) for the /metrics endpoint
+    """
+    if 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
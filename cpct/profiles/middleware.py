@@ -0,0 +1,120 @@
+from django.middleware.gzip import GZipMiddleware
+from fpkilint.timing import PhaseTimer, use_timer
+from .metrics import observe_timer
+import asyncio
+import functools
+import json
+import logging
+
+logger = logging.getLogger('cpct.timing')
+
+_gzip_middleware = GZipMiddleware()
+
+
+class ServerTimingMiddleware:
+    """
+    Times every request per phase (parse, check.<section>, der2ascii, text_to_html, render...).
+    The phases are returned in a Server-Timing header, logged as one JSON line per request and fed to the
+    latency histograms in profiles.metrics.
+    Streamed responses send the header with the phases finished before streaming began; the log line
+    is written once the last chunk has been sent and includes everything.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # tells Django this middleware is a coroutine when running under ASGI
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        timer = PhaseTimer()
+        # async views run their work on other threads, they pick the timer up from the request
+        request.timer = timer
+
+        with use_timer(timer):
+            response = self.get_response(request)
+
+        return self._finish(timer, request, response)
+
+    async def __acall__(self, request):
+        timer = PhaseTimer()
+        request.timer = timer
+
+        with use_timer(timer):
+            response = await self.get_response(request)
+
+        return self._finish(timer, request, response)
+
+    def _finish(self, timer, request, response):
+        response['Server-Timing'] = timer.server_timing()
+
+        if getattr(response, 'is_async', False):
+            response.streaming_content = self._async_timed_stream(response.streaming_content, timer, request,
+                                                                  response)
+        elif response.streaming:
+            response.streaming_content = self._timed_stream(response.streaming_content, timer, request, response)
+        else:
+            self._log(timer, request, response)
+
+        return response
+
+    def _timed_stream(self, content, timer, request, response):
+        # the chunks are produced after __call__ has returned, so activate the timer around each one
+        iterator = iter(content)
+        while True:
+            with use_timer(timer):
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    break
+            yield chunk
+
+        self._log(timer, request, response)
+
+    async def _async_timed_stream(self, content, timer, request, response):
+        try:
+            while True:
+                with use_timer(timer):
+                    try:
+                        chunk = await content.__anext__()
+                    except StopAsyncIteration:
+                        break
+                yield chunk
+        finally:
+            await content.aclose()
+
+        self._log(timer, request, response)
+
+    def _log(self, timer, request, response):
+        observe_timer(timer, request.path)
+
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'streaming': response.streaming,
+            'total_ms': round(timer.elapsed() * 1000, 3),
+            'phases': timer.as_dict(),
+        }))
+
+
+def gzip_result(view):
+    """
+    gzip_page for the async result views. Only result pages and fragments are compressed: they carry no
+    CSRF token, so compressing them can't give it away (BREACH). Streamed results are sent as they are,
+    GZipMiddleware would hold the rows back until its compressor filled a block.
+    """
+    @functools.wraps(view)
+    async def wrapped_view(request, *args, **kwargs):
+        response = await view(request, *args, **kwargs)
+        if response.streaming:
+            return response
+
+        return _gzip_middleware.process_response(request, response)
+
+    return wrapped_view
@@ -0,0 +1,105 @@
+from django.core.cache import cache
+from django.conf import settings
+from fpkilint.html_output import get_profile_digest
+import hashlib
+import re
+
+_sha256_regex = re.compile(r'^[0-9a-f]{64}$')
+
+# part of every result id, bump it when a change to the linter or the result templates changes the
+# result of a certificate that is already cached
+_result_version = 1
+
+
+def get_sha256(byte_data):
+    return hashlib.sha256(byte_data).hexdigest()
+
+
+def get_file_sha256(file):
+    """
+    :param file: UploadedFile, read in chunks and left at the start
+    """
+    sha256 = hashlib.sha256()
+    for chunk in file.chunks():
+        sha256.update(chunk)
+    file.seek(0)
+
+    return sha256.hexdigest()
+
+
+def is_sha256(value):
+    return isinstance(value, str) and _sha256_regex.match(value) is not None
+
+
+def get_result_id(sha256, template):
+    """
+    :return: id of the result of linting the file with this sha256 against template; a new linter
+    version or an edit to the profile gives a new id, so stale results are never returned
+    """
+    return get_sha256('{}:{}:{}:{}'.format(_result_version, get_profile_digest(template), sha256,
+                                           template).encode())
+
+
+def _result_key(result_id):
+    return 'lint-result:{}'.format(result_id)
+
+
+def _fragment_key(result_id, row_key):
+    return 'lint-fragment:{}:{}'.format(result_id, row_key)
+
+
+def get_result(result_id):
+    if not is_sha256(result_id):
+        return None
+
+    return cache.get(_result_key(result_id))
+
+
+def get_cached_result(sha256, template):
+    """
+    :param sha256: lower case hex sha256 of the uploaded file
+    :param template: profile template path, e.g. fbca/1.9/5-ee-signature.json
+    :return: the stored result.html context or None
+    """
+    if not is_sha256(sha256):
+        return None
+
+    return get_result(get_result_id(sha256, template))
+
+
+def store_result(sha256, template, result):
+    """
+    Stores the result.html context and returns it with result_id added. The result_id is what the
+    result page uses to fetch deferred row content.
+    """
+    result_id = get_result_id(sha256, template)
+    result = dict(result, result_id=result_id)
+    cache.set(_result_key(result_id), result, settings.LINT_RESULT_CACHE_TIMEOUT)
+
+    return result
+
+
+def store_fragment(result_id, row_key, content):
+    """
+    Stores the full content of a row while its result is still being streamed, the result itself is
+    only stored after the last row.
+    """
+    cache.set(_fragment_key(result_id, row_key), content, settings.LINT_RESULT_CACHE_TIMEOUT)
+
+
+def get_fragment(result_id, row_key):
+    """
+    :return: full content of a row from the stored result, or from store_fragment while the result is
+    being streamed; None when neither is there
+    """
+    result = get_result(result_id)
+    if result is not None:
+        for row in result.get('rows', ()):
+            if row['key'] == row_key:
+                return row['content']
+        return None
+
+    if not is_sha256(result_id):
+        return None
+
+    return cache.get(_fragment_key(result_id, row_key))
@@ -0,0 +1,144 @@
+from concurrent.futures import Future
+import heapq
+import itertools
+import math
+import threading
+import time
+
+# lower runs first: interactive uploads, then api batch items, then background jobs
+INTERACTIVE = 0
+BATCH = 1
+BACKGROUND = 2
+
+# weight of the newest job in the running average job time used for Retry-After
+_job_time_weight = 0.1
+
+
+class Overloaded(Exception):
+    """
+    Raised instead of queueing work that would have to wait too long.
+    :ivar retry_after: seconds the client should wait before trying again
+    """
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class TokenBuckets:
+    """
+    One token bucket per client. A client can use burst tokens at once, tokens come back at rate
+    per second. The buckets are kept in this process only, each web worker process limits a client
+    on its own (see LINT_CLIENT_RATE in settings).
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, client, tokens=1):
+        """
+        :return: 0 if the tokens were taken, otherwise the seconds until the client has enough
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            available, last = self._buckets.get(client, (self.burst, now))
+            available = min(self.burst, available + (now - last) * self.rate)
+
+            if available < tokens:
+                self._buckets[client] = (available, now)
+                return (tokens - available) / self.rate
+
+            self._buckets[client] = (available - tokens, now)
+
+            if len(self._buckets) > 10000:
+                self._prune(now)
+
+        return 0
+
+    def _prune(self, now):
+        # buckets that have refilled completely are the same as no bucket
+        for client, (available, last) in list(self._buckets.items()):
+            if available + (now - last) * self.rate >= self.burst:
+                del self._buckets[client]
+
+
+class LintScheduler:
+    """
+    Runs lint jobs on a fixed number of threads, one per lint worker process. Waiting jobs are kept in
+    a bounded queue per priority and a free thread always takes the oldest job of the highest priority.
+    When a priority's queue is full submit fails right away with Overloaded.
+    """
+    def __init__(self, threads, queue_limits, thread_name_prefix='lint-scheduler'):
+        """
+        :param threads: number of jobs that run at once
+        :param queue_limits: {priority: max waiting jobs}
+        """
+        self.queue_limits = queue_limits
+        self._threads = threads
+        self._queue = []
+        self._waiting = {priority: 0 for priority in queue_limits}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._job_time = 1.0
+
+        for i in range(threads):
+            thread = threading.Thread(target=self._run, name='{}_{}'.format(thread_name_prefix, i), daemon=True)
+            thread.start()
+
+    def submit(self, priority, func, *args, **kwargs):
+        """
+        :return: concurrent.futures.Future for func(*args, **kwargs)
+        :raises Overloaded: the queue for priority is full
+        """
+        future = Future()
+
+        with self._condition:
+            if self._waiting[priority] >= self.queue_limits[priority]:
+                raise Overloaded("Too many certificates are waiting to be linted", self._retry_after(priority))
+
+            self._waiting[priority] += 1
+            heapq.heappush(self._queue, (priority, next(self._sequence), future, func, args, kwargs))
+            self._condition.notify()
+
+        return future
+
+    def _retry_after(self, priority):
+        # everything at this priority or above has to run first
+        ahead = sum(waiting for p, waiting in self._waiting.items() if p <= priority)
+        return ahead * self._job_time / self._threads
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                priority, sequence, future, func, args, kwargs = heapq.heappop(self._queue)
+                self._waiting[priority] -= 1
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            start = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+            with self._condition:
+                self._job_time += (time.monotonic() - start - self._job_time) * _job_time_weight
+
+
+def get_client_key(request):
+    """
+    The client address used for rate limiting. Behind the router the last X-Forwarded-For entry is the
+    address the router saw, earlier entries come from the client and can't be trusted.
+    """
+    forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded_for:
+        return forwarded_for.split(',')[-1].strip()
+
+    return request.META.get('REMOTE_ADDR', '')
@@ -0,0 +1,74 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.http import StreamingHttpResponse
+
+
+class AsyncStreamingHttpResponse(StreamingHttpResponse):
+    """
+    StreamingHttpResponse for an async iterator, e.g. an async generator that awaits each lint row.
+    Django 3.1 streams a sync iterator on the event loop, which would block every other request while a
+    row is produced; StreamingASGIHandler sends this one with async for instead. ASGI only.
+    """
+    is_async = True
+
+    @property
+    def streaming_content(self):
+        return self._iter_bytes(self._iterator)
+
+    @streaming_content.setter
+    def streaming_content(self, value):
+        self._set_streaming_content(value)
+
+    def _set_streaming_content(self, value):
+        # async generators are closed with aclose when the response is sent, not through response.close()
+        self._iterator = value
+
+    async def _iter_bytes(self, iterator):
+        try:
+            async for chunk in iterator:
+                yield self.make_bytes(chunk)
+        finally:
+            await iterator.aclose()
+
+    def __iter__(self):
+        raise TypeError("{} can only be sent by StreamingASGIHandler".format(self.__class__.__name__))
+
+    def getvalue(self):
+        raise TypeError("{} can only be sent by StreamingASGIHandler".format(self.__class__.__name__))
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    ASGIHandler that can also send an AsyncStreamingHttpResponse, see cpct.asgi.
+    """
+    async def send_response(self, response, send):
+        if not getattr(response, 'is_async', False):
+            return await super().send_response(response, send)
+
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for c in response.cookies.values():
+            response_headers.append((b'Set-Cookie', c.output(header='').encode('ascii').strip()))
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': response_headers,
+        })
+
+        content = response.streaming_content
+        try:
+            async for part in content:
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            # stops the lint job if the client went away mid stream
+            await content.aclose()
+
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
@@ -0,0 +1,83 @@
+from django.test import SimpleTestCase
+from fpkilint.batch import BatchItem, iter_file_items, iter_lint_batch, write_results
+import hashlib
+import io
+import json
+import os
+
+_certs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'certs')
+
+_template = 'fbca/1.9/5-ee-signature.json'
+
+
+def _path(file_name):
+    return os.path.join(_certs_dir, file_name)
+
+
+class FileItemTests(SimpleTestCase):
+    def test_items(self):
+        paths = [_path('parse_cert_binary.cer'), _path('parse_cert_not_cert.pem'), _path('parse_cert_not_cert.p7b'),
+                 _path('missing.cer')]
+        items = list(iter_file_items(paths))
+
+        self.assertEqual([(item.source, item.offset) for item in items],
+                         [(paths[0], 0), (paths[1], None), (paths[2], 45), (paths[3], None)])
+        self.assertEqual(items[0].der, items[2].der)
+        # a file without certificates gets a result too, so every input shows up in the output
+        self.assertEqual(items[1], BatchItem(paths[1], None, None, 'No certificates found', None))
+        self.assertIsNone(items[3].der)
+        self.assertIn('No such file', items[3].error)
+
+
+class LintBatchTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(_path('parse_cert_binary.cer'), 'rb') as f:
+            cls.der = f.read()
+
+    def test_results_in_input_order(self):
+        items = [BatchItem('a', 0, self.der, None, {'n': 0}),
+                 BatchItem('b', 10, None, 'Truncated', None),
+                 BatchItem('c', None, b'\x30\x03\x02\x01\x01', None, None)]
+        items += [BatchItem('d', i, self.der, None, {'n': i}) for i in range(1, 40)]
+
+        results = list(iter_lint_batch(iter(items), _template, workers=2))
+
+        self.assertEqual([item for item, result in results], items)
+        self.assertEqual([(result['source'], result['offset']) for item, result in results],
+                         [(item.source, item.offset) for item in items])
+
+        result = results[0][1]
+        self.assertEqual(result['sha256'], hashlib.sha256(self.der).hexdigest())
+        self.assertEqual(result['metadata'], {'n': 0})
+        self.assertIn(result['verdict'], ('PASS', 'WARN', 'FAIL'))
+        self.assertTrue(all('severity' in finding and 'code' in finding for finding in result['findings']))
+        self.assertEqual([r for item, r in results[3:]], [dict(result, source='d', offset=i, metadata={'n': i})
+                                                           for i in range(1, 40)])
+
+        self.assertEqual(results[1][1], {'source': 'b', 'offset': 10, 'error': 'Truncated'})
+        self.assertTrue(results[2][1]['error'].startswith('Could not be parsed'))
+
+    def test_reads_ahead_a_bounded_number(self):
+        read = []
+
+        def items():
+            for i in range(200):
+                read.append(i)
+                yield BatchItem('a', i, self.der, None, None)
+
+        results = iter_lint_batch(items(), _template, workers=1)
+        next(results)
+        # _read_ahead certificates per worker
+        self.assertLessEqual(len(read), 16)
+        results.close()
+
+    def test_write_results(self):
+        results = [(None, {'source': 'a', 'verdict': 'PASS'}), (None, {'source': 'b', 'error': 'Truncated'}),
+                   (None, {'source': 'c', 'verdict': 'FAIL'}), (None, {'source': 'd', 'verdict': 'FAIL'})]
+        output = io.StringIO()
+
+        self.assertEqual(write_results(results, output), {'PASS': 1, 'WARN': 0, 'FAIL': 2, 'ERROR': 1})
+        self.assertEqual([json.loads(line) for line in output.getvalue().splitlines()],
+                         [result for item, result in results])
@@ -0,0 +1,101 @@
+from asn1crypto import pem
+from django.test import SimpleTestCase
+from fpkilint import cert_bundle
+from fpkilint.cert_bundle import is_zip, iter_bundle_certificates
+from unittest import mock
+import io
+import os
+import zipfile
+
+_testdata_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata')
+
+
+def _read(*path):
+    with open(os.path.join(_testdata_dir, *path), 'rb') as f:
+        return f.read()
+
+
+def _zip(files, compression=zipfile.ZIP_DEFLATED):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w', compression) as archive:
+        for name, contents in files:
+            if contents is None:
+                archive.writestr(zipfile.ZipInfo(name), b'')
+            else:
+                archive.writestr(name, contents)
+    return data.getvalue()
+
+
+def _entries(data, name='upload'):
+    return [(entry.name, entry.der, entry.error) for entry in iter_bundle_certificates(io.BytesIO(data), name)]
+
+
+class BundleTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.der = _read('certs', 'parse_cert_binary.cer')
+        cls.p7b = _read('certs', 'parse_cert_not_cert.p7b')
+        cls.key = _read('certs', 'parse_cert_not_cert.pem')
+        cls.root = pem.unarmor(_read('chain', 'root.pem'))[2]
+
+    def test_files(self):
+        bundle = _read('chain', 'root.pem') + b'\n' + pem.armor('CERTIFICATE', self.der)
+        self.assertEqual(_entries(self.der, 'a.cer'), [('a.cer', self.der, None)])
+        self.assertEqual(_entries(self.p7b, 'a.p7b'), [('a.p7b', self.der, None)])
+        self.assertEqual(_entries(bundle, 'chain.pem'), [('chain.pem#1', self.root, None),
+                                                         ('chain.pem#2', self.der, None)])
+        self.assertEqual(_entries(self.key, 'key.pem'), [('key.pem', None, 'No certificates found')])
+
+    def test_errors_are_named(self):
+        # a certificate cut short after a good one
+        entries = _entries(self.der + self.der[:100], 'two.der')
+        self.assertEqual([(name, der) for name, der, error in entries], [('two.der#1', self.der), ('two.der#2', None)])
+        self.assertRegex(entries[1][2], r' at offset {}$'.format(len(self.der)))
+
+    def test_is_zip(self):
+        data = io.BytesIO(b'xx' + _zip([('a.cer', self.der)]))
+        data.seek(2)
+        self.assertTrue(is_zip(data))
+        self.assertEqual(data.tell(), 2)
+        self.assertFalse(is_zip(io.BytesIO(self.der)))
+
+    def test_zip(self):
+        data = _zip([('certs/', None), ('certs/root.pem', _read('chain', 'root.pem')), ('certs/a.p7b', self.p7b),
+                     ('__MACOSX/certs/._a.p7b', b'resource fork'), ('certs/.DS_Store', b'finder'),
+                     ('.hidden/b.cer', self.der), ('key.pem', self.key), ('both.pem', self.der + self.root)],
+                    zipfile.ZIP_STORED)
+        self.assertEqual(_entries(data, 'certs.zip'), [
+            ('certs.zip/certs/root.pem', self.root, None),
+            ('certs.zip/certs/a.p7b', self.der, None),
+            ('certs.zip/key.pem', None, 'No certificates found'),
+            ('certs.zip/both.pem#1', self.der, None),
+            ('certs.zip/both.pem#2', self.root, None),
+        ])
+
+    def test_big_entries(self):
+        data = _zip([('zeros.cer', bytes(1000)), ('a.cer', self.der)])
+        with mock.patch.object(cert_bundle, '_max_entry_size', 999):
+            self.assertEqual(_entries(data, 'u.zip'), [('u.zip/zeros.cer', None, 'Too big to be a certificate'),
+                                                       ('u.zip/a.cer', None, 'Too big to be a certificate')])
+        with mock.patch.object(cert_bundle, '_max_entry_size', len(self.der)):
+            self.assertEqual([name for name, der, error in _entries(data, 'u.zip') if der], ['u.zip/a.cer'])
+
+    def test_broken_entries(self):
+        data = bytearray(_zip([('a.cer', self.der), ('b.cer', self.der)], zipfile.ZIP_STORED))
+        # the contents of a.cer no longer match its CRC, and b.cer is marked as encrypted
+        data[data.index(self.der) + 500] ^= 0xFF
+        b_header = data.index(b'PK\x03\x04', 1)
+        data[b_header + 6] |= 1
+        b_central = data.index(b'PK\x01\x02', data.index(b'PK\x01\x02') + 1)
+        data[b_central + 8] |= 1
+
+        entries = _entries(bytes(data), 'u.zip')
+        self.assertEqual([(name, der) for name, der, error in entries], [('u.zip/a.cer', None), ('u.zip/b.cer', None)])
+        self.assertTrue(all(error.startswith('Could not be extracted: ') for name, der, error in entries))
+        self.assertIn('CRC', entries[0][2])
+        self.assertIn('encrypted', entries[1][2])
+
+    def test_bad_zip(self):
+        with self.assertRaises(zipfile.BadZipFile):
+            list(iter_bundle_certificates(io.BytesIO(_zip([('a.cer', self.der)])[:50]), 'u.zip'))
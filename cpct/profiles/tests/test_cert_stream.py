@@ -0,0 +1,138 @@
+from django.test import SimpleTestCase
+from fpkilint import cert_stream
+from fpkilint.cert_stream import iter_certificates
+from unittest import mock
+import base64
+import io
+import os
+
+_certs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'certs')
+
+
+def _read(file_name):
+    with open(os.path.join(_certs_dir, file_name), 'rb') as f:
+        return f.read()
+
+
+def _pem(der, label=b'CERTIFICATE'):
+    lines = [base64.b64encode(der[i:i + 48]) for i in range(0, len(der), 48)]
+    return b'-----BEGIN ' + label + b'-----\n' + b'\n'.join(lines) + b'\n-----END ' + label + b'-----\n'
+
+
+def _entries(data):
+    return list(iter_certificates(io.BytesIO(data)))
+
+
+class CertStreamTests(SimpleTestCase):
+    der = _read('parse_cert_binary.cer')
+    p7b = _read('parse_cert_not_cert.p7b')
+
+    def assertCertificates(self, data, offsets):
+        entries = _entries(data)
+        self.assertEqual([(entry.offset, entry.der, entry.error) for entry in entries],
+                         [(offset, self.der, None) for offset in offsets])
+
+    def test_der(self):
+        self.assertCertificates(self.der, [0])
+
+    def test_back_to_back_der(self):
+        self.assertCertificates(self.der * 3, [0, len(self.der), 2 * len(self.der)])
+
+    def test_base64(self):
+        self.assertCertificates(_read('parse_cert_base64.cer'), [0])
+
+    def test_pem(self):
+        self.assertCertificates(_read('parse_cert_pem.cer'), [0])
+
+    def test_pem_bundle_with_text_and_keys(self):
+        key = _read('parse_cert_not_cert.pem')
+        pem = _pem(self.der)
+        data = b'subject=CN=one\n' + pem + key + b'\nsubject=CN=two\n' + pem
+        self.assertCertificates(data, [15, data.rindex(b'-----BEGIN CERTIFICATE')])
+
+    def test_pem_headers(self):
+        pem = _pem(self.der).replace(b'-----\n', b'-----\nProc-Type: 4,ENCRYPTED\n\n', 1)
+        self.assertCertificates(pem, [0])
+
+    def test_pkcs7(self):
+        self.assertCertificates(self.p7b, [45])
+
+    def test_base64_pkcs7(self):
+        self.assertCertificates(base64.b64encode(self.p7b), [45])
+
+    def test_pem_pkcs7(self):
+        # certificates in a pem block are reported at its BEGIN line
+        data = b'\n' + _pem(self.p7b, b'PKCS7') + _pem(self.der)
+        self.assertCertificates(data, [1, 1 + len(_pem(self.p7b, b'PKCS7'))])
+
+    def test_der_after_pkcs7(self):
+        self.assertCertificates(self.p7b + self.der, [45, len(self.p7b)])
+
+    def test_no_certificates(self):
+        self.assertEqual(_entries(b''), [])
+        self.assertEqual(_entries(b'\n\n  '), [])
+        self.assertEqual(_entries(_read('parse_cert_not_cert.pem')), [])
+
+    def test_truncated_der(self):
+        entries = _entries(self.der + self.der[:-10])
+        self.assertEqual([entry.der for entry in entries], [self.der, None])
+        self.assertEqual((entries[1].offset, entries[1].error), (len(self.der), "Truncated"))
+
+    def test_truncated_pkcs7(self):
+        # reported at the start of the PKCS #7, the certificate isn't found
+        for size in (30, 500):
+            with self.subTest(size=size):
+                self.assertEqual([(entry.offset, entry.der, entry.error) for entry in _entries(self.p7b[:size])],
+                                 [(0, None, "Truncated")])
+
+        # a certificate read before the end is cut off is still returned
+        self.assertEqual([(entry.offset, entry.der, entry.error) for entry in _entries(self.p7b[:-1])],
+                         [(45, self.der, None), (0, None, "Truncated header")])
+
+    def test_garbage_after_der(self):
+        entries = _entries(self.der + b'\x04\x03abc' + self.der)
+        self.assertEqual([entry.der for entry in entries], [self.der, None])
+        self.assertEqual(entries[1].error, "Not a certificate")
+
+    def test_indefinite_length(self):
+        entries = _entries(b'\x30\x80' + self.der[4:])
+        self.assertEqual([(entry.offset, entry.der, entry.error) for entry in entries],
+                         [(0, None, "Not a certificate")])
+
+    def test_bad_pem_base64(self):
+        data = _pem(self.der).replace(b'MII', b'M*I', 1) + _pem(self.der)
+        entries = _entries(data)
+        self.assertEqual([entry.der for entry in entries], [None, self.der])
+        self.assertTrue(entries[0].error.startswith("Bad base64"))
+
+    def test_missing_end_line(self):
+        data = _pem(self.der) + _pem(self.der)[:-30]
+        entries = _entries(data)
+        self.assertEqual([entry.der for entry in entries], [self.der, None])
+        self.assertEqual(entries[1].error, "No END line for CERTIFICATE")
+
+    def test_certificate_too_big(self):
+        with mock.patch.object(cert_stream, 'max_certificate_size', 1000):
+            entries = _entries(self.der + self.der)
+            self.assertEqual([(entry.offset, entry.der) for entry in entries], [(0, None), (len(self.der), None)])
+            self.assertEqual(entries[0].error, "Certificate is bigger than 1000 bytes")
+
+            entries = _entries(_pem(self.der) + _pem(self.der))
+            self.assertEqual([(entry.offset, entry.der) for entry in entries],
+                             [(0, None), (len(_pem(self.der)), None)])
+            self.assertEqual(entries[1].error, "Certificate is bigger than 1000 bytes")
+
+    def test_small_reads(self):
+        # chunk boundaries fall inside headers, base64 lines and BEGIN lines
+        class SmallReads(io.BytesIO):
+            def read(self, size=-1):
+                return super().read(7 if size is None or size < 0 else min(size, 7))
+
+            def readinto(self, b):
+                return super().readinto(memoryview(b)[:7])
+
+        for data in (self.der * 2, _pem(self.der) * 2, base64.b64encode(self.p7b), _pem(self.p7b, b'PKCS7')):
+            with self.subTest(start=data[:12]):
+                entries = list(iter_certificates(SmallReads(data)))
+                self.assertEqual([entry.der for entry in entries], [self.der] * len(entries))
+                self.assertEqual(len(entries), 2 if data.startswith((b'\x30', b'-----BEGIN C')) else 1)
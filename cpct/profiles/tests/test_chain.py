@@ -0,0 +1,190 @@
+from asn1crypto import pem, x509
+from django.test import SimpleTestCase
+from fpkilint.chain import ChainCertificate, ChainLinter, ChainPath, IssuerIndex, build_path, \
+    iter_chain_conformance, lint_chain_basic_constraints, lint_chain_name_constraints, lint_chain_path, \
+    lint_chain_signatures
+from fpkilint.lint_server import SEVERITY_FAIL
+from fpkilint.policy_graph import any_policy
+import os
+import pickle
+
+_chain_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'chain')
+
+P1 = '2.16.840.1.101.3.2.1.3.1'
+P2 = '2.16.840.1.101.3.2.1.3.2'
+
+
+def _read_der(name):
+    with open(os.path.join(_chain_dir, name + '.pem'), 'rb') as f:
+        return pem.unarmor(f.read())[2]
+
+
+def _load(name):
+    return ChainCertificate.load(_read_der(name))
+
+
+def _findings(r):
+    return [(severity, message) for severity, message in r.findings]
+
+
+class ChainTestCase(SimpleTestCase):
+    names = ('root', 'root_new', 'root_rollover', 'leaf', 'intermediate', 'leaf_example', 'leaf_excluded', 'sub_ca',
+             'leaf_sub_ca')
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.certs = {name: _load(name) for name in cls.names}
+
+    def index(self, *names):
+        return IssuerIndex(self.certs[name] for name in names)
+
+    def path(self, cert, *pool):
+        certs, complete = build_path(self.certs[cert], self.index(*pool))
+        return [name for c in certs for name in self.names if self.certs[name] is c], complete
+
+
+class SelfSignedTests(ChainTestCase):
+    def test_self_signed(self):
+        self.assertEqual({name: (cert.self_issued, cert.self_signed) for name, cert in self.certs.items()
+                          if cert.self_issued},
+                         {'root': (True, True), 'root_new': (True, True), 'root_rollover': (True, False)})
+        self.assertFalse(self.certs['leaf'].self_signed)
+
+    def test_tbs_certificate(self):
+        # without a signature the AKID decides
+        rollover = ChainCertificate(self.certs['root_rollover'].tbs)
+        root = ChainCertificate(self.certs['root'].tbs)
+        self.assertEqual((rollover.self_signed, root.self_signed), (False, True))
+
+    def test_bad_self_signature(self):
+        der = bytearray(_read_der('root'))
+        der[-1] ^= 1
+        # the AKID matches, but the signature is what is checked when there is one
+        self.assertFalse(ChainCertificate.load(bytes(der)).self_signed)
+
+
+class BuildPathTests(ChainTestCase):
+    def test_key_rollover(self):
+        # the path goes through the rollover certificate to the old root
+        self.assertEqual(self.path('leaf', 'root', 'root_rollover'), (['leaf', 'root_rollover', 'root'], True))
+        # and ends at the new root once that is in the pool
+        self.assertEqual(self.path('leaf', 'root', 'root_rollover', 'root_new'), (['leaf', 'root_new'], True))
+
+    def test_incomplete(self):
+        self.assertEqual(self.path('leaf', 'root_rollover'), (['leaf', 'root_rollover'], False))
+        self.assertEqual(self.path('leaf'), (['leaf'], False))
+        self.assertEqual(self.path('leaf_sub_ca', 'sub_ca', 'root'), (['leaf_sub_ca', 'sub_ca'], False))
+
+    def test_intermediates(self):
+        pool = ('root', 'root_new', 'root_rollover', 'intermediate', 'sub_ca')
+        self.assertEqual(self.path('leaf_sub_ca', *pool), (['leaf_sub_ca', 'sub_ca', 'intermediate', 'root'], True))
+        self.assertEqual(self.path('root', *pool), (['root'], True))
+
+    def test_find_issuers(self):
+        # by AKID first, the self-signed one ahead of the rollover; then by subject DN
+        issuers = self.index('root', 'root_rollover', 'root_new').find_issuers(self.certs['leaf'])
+        self.assertEqual(issuers, [self.certs['root_new'], self.certs['root_rollover'], self.certs['root']])
+
+    def test_index(self):
+        index = self.index('root', 'root', 'intermediate')
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.find_issuers(self.certs['root']), [])
+
+
+class ChainCheckTests(ChainTestCase):
+    def chain(self, *names):
+        certs = [self.certs[name] for name in names]
+        return ChainPath(certs, certs[-1].self_signed, {'user_initial_policy_set': (any_policy,)})
+
+    def findings(self, chain):
+        return {r.config_section: _findings(r) for r in iter_chain_conformance(chain) if r.findings}
+
+    def test_good_path(self):
+        chain = self.chain('leaf_example', 'intermediate', 'root')
+        self.assertEqual(self.findings(chain), {})
+        self.assertEqual(chain.policies.authorities_constrained, {P1})
+        self.assertEqual(lint_chain_path(chain).content.count('Test'), 2)
+
+    def test_key_rollover_path(self):
+        # no certificate asserts a policy
+        self.assertEqual(self.findings(self.chain('leaf', 'root_rollover', 'root')),
+                         {'chain_policies': [('WARN', 'The path is not valid for any of the acceptable policies')]})
+
+    def test_name_constraints(self):
+        self.assertEqual(_findings(lint_chain_name_constraints(self.chain('leaf_excluded', 'intermediate', 'root'))),
+                         [('FAIL', 'DNS Name: www.example.org in Excluded Leaf is not permitted by the name '
+                                   'constraints of Test Intermediate'),
+                          ('FAIL', 'DNS Name: host.bad.example.com in Excluded Leaf is excluded by the name '
+                                   'constraints of Test Intermediate')])
+
+    def test_path_length(self):
+        chain = self.chain('leaf_sub_ca', 'sub_ca', 'intermediate', 'root')
+        self.assertEqual(_findings(lint_chain_basic_constraints(chain)),
+                         [('FAIL', 'Test Intermediate allows a path length of 0 but is followed by 1 intermediate '
+                                   'CAs')])
+
+    def test_policies(self):
+        result = self.chain('leaf_excluded', 'intermediate', 'root').policies
+        self.assertEqual((result.authorities_constrained, result.user_constrained), ({P2}, {P2}))
+
+        chain = self.chain('leaf_excluded', 'intermediate', 'root')
+        chain.policy_settings = {'user_initial_policy_set': (P1,)}
+        self.assertEqual(self.findings(chain)['chain_policies'],
+                         [('WARN', 'The path is not valid for any of the acceptable policies')])
+
+    def test_bad_signature(self):
+        der = bytearray(_read_der('leaf_example'))
+        der[-1] ^= 1
+        chain = ChainPath([ChainCertificate.load(bytes(der)), self.certs['intermediate'], self.certs['root']], True)
+        self.assertEqual(_findings(lint_chain_signatures(chain)),
+                         [('FAIL', "www.example.com issued by Test Intermediate: the signature does not verify "
+                                   "with the issuer's public key")])
+
+    def test_wrong_issuer(self):
+        findings = self.findings(self.chain('leaf_example', 'root'))
+        self.assertEqual(set(findings), {'chain_akid', 'chain_issuer', 'chain_signatures'})
+        self.assertEqual(findings['chain_akid'],
+                         [('FAIL', "www.example.com issued by Test Root: AKID does not match the issuer's SKID")])
+        self.assertEqual(findings['chain_issuer'],
+                         [('FAIL', "www.example.com issued by Test Root: issuer DN does not match the issuer's "
+                                   "subject DN")])
+
+    def test_leaf_as_issuer(self):
+        findings = self.findings(self.chain('leaf_example', 'leaf_excluded'))
+        self.assertEqual(findings['chain_basic_constraints'],
+                         [('FAIL', 'www.example.com issued by Excluded Leaf: the issuer is not a CA'),
+                          ('FAIL', "www.example.com issued by Excluded Leaf: the issuer's key usage does not include "
+                                   "keyCertSign")])
+
+    def test_incomplete_paths(self):
+        self.assertEqual(self.findings(self.chain('leaf_example')),
+                         {'chain_path': [('FAIL', 'No issuer was found in the CA pool')]})
+        self.assertEqual(self.findings(self.chain('leaf_example', 'intermediate')),
+                         {'chain_path': [('WARN', 'Path ends at Test Intermediate, its issuer is not in the CA pool')]})
+
+
+class ChainLinterTests(ChainTestCase):
+    def test_linter(self):
+        linter = ChainLinter([_read_der(name) for name in ('root', 'intermediate', 'sub_ca')],
+                             {'user_initial_policy_set': (P1,)})
+        # sent to the batch workers pickled
+        linter = pickle.loads(pickle.dumps(linter))
+
+        findings, fields = linter(self.certs['leaf_sub_ca'].cert)
+        self.assertEqual(findings, [(SEVERITY_FAIL, 'chain_basic_constraints',
+                                     'Test Intermediate allows a path length of 0 but is followed by 1 intermediate '
+                                     'CAs')])
+        self.assertEqual(fields, {'chain': [{'sha256': self.certs[name].sha256.hex(), 'subject': name_}
+                                            for name, name_ in (('sub_ca', 'Test Sub CA'),
+                                                                ('intermediate', 'Test Intermediate'),
+                                                                ('root', 'Test Root'))],
+                                  'chain_complete': True,
+                                  'policies': {'authorities_constrained': [P1], 'user_constrained': [P1]}})
+
+        # the old root has the leaf's issuer DN, so the path is built through it and the link fails the checks
+        findings, fields = linter(x509.Certificate.load(_read_der('leaf')))
+        self.assertEqual((fields['chain'], fields['chain_complete']),
+                         ([{'sha256': self.certs['root'].sha256.hex(), 'subject': 'Test Root'}], True))
+        self.assertEqual([code for severity, code, message in findings if severity == SEVERITY_FAIL],
+                         ['chain_akid', 'chain_signatures'])
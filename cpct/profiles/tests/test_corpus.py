@@ -0,0 +1,106 @@
+from django.test import SimpleTestCase
+from fpkilint.batch import BatchItem, iter_lint_batch
+from fpkilint.corpus import Corpus, CorpusError, iter_lint_corpus, pack
+import hashlib
+import os
+import tempfile
+
+_certs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'certs')
+
+_template = 'fbca/1.9/5-ee-signature.json'
+
+
+class CorpusTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(os.path.join(_certs_dir, 'parse_cert_binary.cer'), 'rb') as f:
+            cls.der = f.read()
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'test.corpus')
+
+    def write(self, data):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_round_trip(self):
+        entries = [self.der, b'\x30\x03\x02\x01\x01', self.der[:100]]
+        self.assertEqual(pack(self.path, iter(entries)), 3)
+
+        with Corpus(self.path) as corpus:
+            self.assertEqual(len(corpus), 3)
+            self.assertEqual([bytes(corpus[number]) for number in range(3)], entries)
+
+            offset, length, sha256 = corpus.entry(1)
+            self.assertEqual((offset, length, sha256), (32 + len(self.der), 5, hashlib.sha256(entries[1]).digest()))
+
+            with self.assertRaises(IndexError):
+                corpus[3]
+            with self.assertRaises(IndexError):
+                corpus.entry(-1)
+
+    def test_empty_corpus(self):
+        self.assertEqual(pack(self.path, []), 0)
+        with Corpus(self.path) as corpus:
+            self.assertEqual(len(corpus), 0)
+
+    def test_close_with_certificate_held(self):
+        pack(self.path, [self.der])
+        corpus = Corpus(self.path)
+        der = corpus[0]
+        with self.assertRaises(BufferError):
+            corpus.close()
+        der.release()
+        corpus.close()
+
+    def test_empty_file(self):
+        self.write(b'')
+        with self.assertRaisesRegex(CorpusError, 'is empty'):
+            Corpus(self.path)
+
+    def test_not_a_corpus(self):
+        for data in (b'CPCTPACK', self.der, b'CPCTPACK\x00\x00\x00\x02' + bytes(20)):
+            with self.subTest(data=data[:12]):
+                self.write(data)
+                with self.assertRaisesRegex(CorpusError, 'is not a version 1 corpus file'):
+                    Corpus(self.path)
+
+    def test_truncated(self):
+        pack(self.path, [self.der, self.der])
+        data = self.read()
+        for size in (len(data) - 1, len(data) - 44, 100):
+            with self.subTest(size=size):
+                self.write(data[:size])
+                with self.assertRaisesRegex(CorpusError, 'is truncated'):
+                    Corpus(self.path)
+
+        self.write(data + b'\x00')
+        with self.assertRaisesRegex(CorpusError, 'is truncated'):
+            Corpus(self.path)
+
+    def test_lint_matches_batch(self):
+        # more than one range, with a certificate that can't be parsed
+        entries = [self.der] * 70 + [b'\x30\x03\x02\x01\x01'] + [self.der] * 60
+        pack(self.path, entries)
+
+        results = [result for item, result in iter_lint_corpus(self.path, _template, workers=2)]
+        batch_results = [result for item, result in
+                         iter_lint_batch((BatchItem(self.path, None, der, None, None) for der in entries), _template,
+                                         workers=2)]
+
+        self.assertEqual(len(results), len(entries))
+        with Corpus(self.path) as corpus:
+            self.assertEqual([result['offset'] for result in results],
+                             [corpus.entry(number)[0] for number in range(len(entries))])
+        self.assertEqual([result['sha256'] for result in results],
+                         [hashlib.sha256(der).hexdigest() for der in entries])
+        self.assertEqual([dict(result, offset=None) for result in results],
+                         [dict(result, offset=None) for result in batch_results])
+        self.assertTrue(results[70]['error'].startswith('Could not be parsed'))
@@ -0,0 +1,237 @@
+from asn1crypto import crl, pem, x509
+from django.test import SimpleTestCase
+from fpkilint import crl_conformance
+from fpkilint.crl_conformance import EntryChecker, is_crl_profile, lint_crl_file
+from fpkilint.crl_stream import RevokedEntry
+from fpkilint.html_output import load_all_profiles
+from fpkilint.profile_conformance import compile_profile, lint_error_prefix, lint_warning_prefix
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+import os
+import tempfile
+
+_chain_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'chain')
+
+_template = 'fbca/1.9/4-crl.json'
+
+THIS_UPDATE = x509.Time(name='utc_time', value=datetime(2026, 10, 1, tzinfo=timezone.utc))
+
+
+def _load_cert(name):
+    with open(os.path.join(_chain_dir, name + '.pem'), 'rb') as f:
+        return x509.Certificate.load(pem.unarmor(f.read())[2])
+
+
+def _extension(extn_id, value, critical=False):
+    return {'extn_id': extn_id, 'critical': critical, 'extn_value': value}
+
+
+def _revoked(serial_bytes, revocation_date=('utc_time', b'260930000000Z'), extensions=None):
+    if extensions is not None:
+        extensions = crl.CRLEntryExtensions(extensions)
+    return RevokedEntry(100, serial_bytes, revocation_date, extensions, None)
+
+
+class EntryCheckerTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.config_options = compile_profile(load_all_profiles()[_template])['revoked_certificates']
+
+    def check(self, *revoked_entries, config_options=None):
+        entry_checker = EntryChecker(self.config_options if config_options is None else config_options, THIS_UPDATE)
+        for revoked_entry in revoked_entries:
+            entry_checker.check(revoked_entry)
+        return entry_checker.summary
+
+    def assertFindings(self, revoked_entry, findings):
+        self.assertEqual([(preface, message) for preface, message in self.check(revoked_entry).findings], findings)
+
+    def test_good(self):
+        summary = self.check(_revoked(b'\x01'), _revoked(b'\x00\x80' + b'\x01' * 18),
+                             _revoked(b'\x02', extensions=[_extension('crl_reason', 'key_compromise')]))
+        self.assertEqual((summary.count, summary.with_extensions, dict(summary.reasons), dict(summary.findings)),
+                         (3, 1, {'key_compromise': 1}, {}))
+
+    def test_serial_numbers(self):
+        encoding = "Invalid serial number encoding. INTEGER must be encoded with the minimum number of octets"
+        for serial_bytes, findings in (
+                (b'\x00\x01', [(lint_error_prefix, encoding)]),
+                (b'\xff\x80', [(lint_error_prefix, encoding), (lint_warning_prefix, "Serial number is negative")]),
+                (b'\x00', [(lint_warning_prefix, "Serial number is zero")]),
+                (b'\x01' * 21, [(lint_error_prefix, "Serial number is longer than 20 octets")])):
+            with self.subTest(serial_bytes=serial_bytes.hex()):
+                self.assertFindings(_revoked(serial_bytes), findings)
+
+    def test_revocation_dates(self):
+        for revocation_date, findings in (
+                (('utc_time', b'261001000001Z'), [(lint_warning_prefix, "revocationDate is after thisUpdate")]),
+                (('utc_time', b'2609300000Z'), [(lint_error_prefix, "revocationDate format is not YYMMDDHHMMSSZ")]),
+                (('utc_time', b'260930000000+0000'), [(lint_error_prefix, "revocationDate is not expressed in GMT")]),
+                (('general_time', b'20260930000000Z'), [(lint_error_prefix, "revocationDate must be UTCTime for "
+                                                                            "dates before 2050")])):
+            with self.subTest(revocation_date=revocation_date):
+                self.assertFindings(_revoked(b'\x01', revocation_date), findings)
+
+    def test_entry_extensions(self):
+        for extensions, findings in (
+                ([_extension('crl_reason', 'unspecified', True)],
+                 [(lint_error_prefix, "reasonCode must not be critical"),
+                  (lint_warning_prefix, "reasonCode unspecified should be omitted (RFC5280)")]),
+                ([_extension('invalidity_date', datetime(2026, 9, 30, 0, 0, 1, tzinfo=timezone.utc))],
+                 [(lint_warning_prefix, "invalidityDate is after revocationDate")]),
+                ([_extension('hold_instruction_code', '1.2.840.10040.2.3')],
+                 [(lint_error_prefix, "holdInstructionCode is not permitted")]),
+                ([_extension('certificate_issuer', [x509.GeneralName(name='dns_name', value='example.com')])],
+                 [(lint_error_prefix, "certificateIssuer is not permitted"),
+                  (lint_error_prefix, "certificateIssuer must be critical")]),
+                ([_extension('crl_reason', 'superseded'), _extension('crl_reason', 'superseded')],
+                 [(lint_error_prefix, "Entry has more than one 2.5.29.21 extension")]),
+                ([_extension('1.2.3.4', b'\x05\x00', True), _extension('1.2.3.5', b'\x05\x00')],
+                 [(lint_error_prefix, "Unrecognized critical entry extension 1.2.3.4")])):
+            with self.subTest(extensions=[extension['extn_id'] for extension in extensions]):
+                self.assertFindings(_revoked(b'\x01', extensions=extensions), findings)
+
+    def test_required_extensions(self):
+        config_options = dict(self.config_options)
+        config_options['reason_code'] = mock.Mock(value='2')
+        config_options['other_entry_extensions'] = mock.Mock(value='1')
+
+        summary = self.check(_revoked(b'\x01'),
+                             _revoked(b'\x02', extensions=[_extension('1.2.3.5', b'\x05\x00')]),
+                             config_options=config_options)
+        self.assertEqual(dict(summary.findings), {
+            (lint_error_prefix, "reasonCode is missing"): [2, 100, b'\x01'],
+            (lint_error_prefix, "Entry extension 1.2.3.5 is not permitted"): [1, 100, b'\x02'],
+        })
+
+    def test_counts(self):
+        remove = [_extension('crl_reason', 'remove_from_crl')]
+        summary = self.check(_revoked(b'\x00\x01'), _revoked(b'\x00\x02'), _revoked(b'\x03', extensions=remove),
+                             _revoked(b'\x04', extensions=remove),
+                             RevokedEntry(200, None, None, None, 'Entry is bigger than 64 bytes'))
+
+        self.assertEqual(list(summary.findings.values()), [[2, 100, b'\x00\x01'], [1, 200, None]])
+        self.assertEqual(summary.remove_from_crl, [2, 100, b'\x03'])
+        self.assertEqual(dict(summary.reasons), {'remove_from_crl': 2})
+
+        with mock.patch.object(crl_conformance, '_max_entry_findings', 1):
+            summary = self.check(_revoked(b'\x00\x01'), _revoked(b'\x00'), _revoked(b'\x00'))
+        self.assertEqual((len(summary.findings), summary.other_findings), (1, 2))
+
+
+class LintCRLFileTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.crl_profile = compile_profile(load_all_profiles()[_template])
+        cls.root = _load_cert('root')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        self.this_update = now - timedelta(hours=1)
+        self.next_update = now + timedelta(days=1)
+
+    def write_crl(self, entries=(), crl_extensions=(), issuer=None, next_update=None):
+        if issuer is None:
+            issuer = self.root
+        tbs = {
+            'version': 'v2',
+            'signature': {'algorithm': 'sha256_ecdsa'},
+            'issuer': issuer.subject,
+            'this_update': x509.Time(name='utc_time', value=self.this_update),
+            'next_update': x509.Time(name='utc_time', value=next_update or self.next_update),
+            'crl_extensions': [_extension('authority_key_identifier', {'key_identifier': self.root.key_identifier}),
+                               _extension('crl_number', 42)] + list(crl_extensions),
+        }
+        if entries:
+            tbs['revoked_certificates'] = [
+                {'user_certificate': serial, 'revocation_date': x509.Time(name='utc_time', value=self.this_update),
+                 'crl_entry_extensions': extensions or None} for serial, extensions in entries]
+
+        path = os.path.join(self.directory, 'test.crl')
+        with open(path, 'wb') as f:
+            f.write(crl.CertificateList({'tbs_cert_list': tbs, 'signature_algorithm': {'algorithm': 'sha256_ecdsa'},
+                                         'signature': b'\x30\x06\x02\x01\x01\x02\x01\x01'}).dump())
+        return path
+
+    def lint(self, path, issuer_cert=None):
+        result = lint_crl_file(path, self.crl_profile, issuer_cert)
+        return result, [(finding['severity'], finding['code'], finding['message']) for finding in result['findings']]
+
+    def test_good(self):
+        path = self.write_crl([(1, None), (2, [_extension('crl_reason', 'key_compromise')])])
+        result, findings = self.lint(path, self.root)
+
+        self.assertEqual(findings, [])
+        self.assertEqual(result, {'source': path, 'verdict': 'PASS', 'findings': [], 'entries': 2, 'crl_number': '42',
+                                  'this_update': self.this_update.isoformat(),
+                                  'next_update': self.next_update.isoformat()})
+
+    def test_issuer_cert(self):
+        # the intermediate has another DN and key
+        intermediate = _load_cert('intermediate')
+        result, findings = self.lint(self.write_crl(), intermediate)
+        self.assertEqual(result['verdict'], 'FAIL')
+        self.assertEqual(findings, [
+            ('FAIL', 'issuer', 'CRL issuer does not match the subject of the issuing CA certificate (CN=Test '
+                               'Intermediate, O=Test, C=US)'),
+            ('FAIL', 'akid', 'Key ID does not match the SKID of the issuing CA certificate ({})'.format(
+                intermediate.key_identifier.hex().upper())),
+        ])
+
+        # a CA without cRLSign
+        result, findings = self.lint(self.write_crl(issuer=_load_cert('leaf_example')), _load_cert('leaf_example'))
+        self.assertIn(('FAIL', 'issuer', 'The issuing CA certificate does not assert cRLSign'), findings)
+
+    def test_crl_findings(self):
+        path = self.write_crl([(1, [_extension('crl_reason', 'remove_from_crl')])],
+                              [_extension('1.2.3.4', b'\x05\x00', True)],
+                              next_update=self.this_update + timedelta(hours=200))
+        with open(path, 'rb') as f:
+            der = f.read()
+        offset = der.index(crl.CertificateList.load(der)['tbs_cert_list']['revoked_certificates'][0].dump())
+        result, findings = self.lint(path)
+
+        self.assertEqual(result['verdict'], 'FAIL')
+        self.assertEqual([(severity, code) for severity, code, message in findings],
+                         [('FAIL', 'validity'), ('FAIL', 'revoked_certificates'), ('FAIL', 'other_extensions')])
+        self.assertEqual(findings[:2], [
+            ('FAIL', 'validity', 'nextUpdate is more than 180 hours after thisUpdate'),
+            ('FAIL', 'revoked_certificates', 'reasonCode removeFromCRL is only permitted in delta CRLs (serial 01 at '
+                                             'offset {})'.format(offset)),
+        ])
+
+    def test_delta_crl(self):
+        path = self.write_crl([(1, [_extension('crl_reason', 'remove_from_crl')])],
+                              [_extension('delta_crl_indicator', 42, True)])
+        result, findings = self.lint(path)
+        # removeFromCRL is fine in a delta CRL
+        self.assertEqual(findings, [('FAIL', 'delta_crl_indicator',
+                                     'Base CRL number must be less than the CRL number')])
+
+    def test_unreadable(self):
+        path = os.path.join(self.directory, 'garbage.crl')
+        with open(path, 'wb') as f:
+            f.write(b'\x30\x82\x01\x00\x30')
+        self.assertEqual(lint_crl_file(path, self.crl_profile),
+                         {'source': path, 'error': 'Could not be read: Truncated header'})
+
+        # past the header the offset is known
+        with open(self.write_crl([(1, None)]), 'rb') as f:
+            der = f.read()
+        with open(path, 'wb') as f:
+            f.write(der[:-1])
+        self.assertRegex(lint_crl_file(path, self.crl_profile)['error'], r'^Could not be read at offset \d+: Truncated')
+
+        missing = os.path.join(self.directory, 'missing.crl')
+        self.assertIn('No such file', lint_crl_file(missing, self.crl_profile)['error'])
+
+    def test_profiles(self):
+        json_profiles = load_all_profiles()
+        self.assertTrue(is_crl_profile(self.crl_profile))
+        self.assertFalse(is_crl_profile(compile_profile(json_profiles['fbca/1.9/5-ee-signature.json'])))
@@ -0,0 +1,170 @@
+from asn1crypto import crl, pem, x509
+from django.test import SimpleTestCase
+from fpkilint import crl_stream
+from fpkilint.crl_stream import CRLError, CRLReader, _der_sequence, get_time_key
+from datetime import datetime, timezone
+from unittest import mock
+import base64
+import io
+
+THIS_UPDATE = datetime(2026, 10, 1, tzinfo=timezone.utc)
+NEXT_UPDATE = datetime(2026, 10, 8, tzinfo=timezone.utc)
+REVOKED = datetime(2026, 9, 30, tzinfo=timezone.utc)
+
+
+def _entry(serial, extensions=None):
+    entry = {'user_certificate': serial, 'revocation_date': x509.Time(name='utc_time', value=REVOKED)}
+    if extensions:
+        entry['crl_entry_extensions'] = extensions
+    return entry
+
+
+def _crl(entries, crl_extensions=None):
+    tbs = {
+        'version': 'v2',
+        'signature': {'algorithm': 'sha256_rsa'},
+        'issuer': x509.Name.build({'country_name': 'US', 'organization_name': 'Test', 'common_name': 'Test Root'}),
+        'this_update': x509.Time(name='utc_time', value=THIS_UPDATE),
+        'next_update': x509.Time(name='utc_time', value=NEXT_UPDATE),
+    }
+    if entries:
+        tbs['revoked_certificates'] = entries
+    if crl_extensions:
+        tbs['crl_extensions'] = crl_extensions
+
+    return crl.CertificateList({'tbs_cert_list': tbs, 'signature_algorithm': {'algorithm': 'sha256_rsa'},
+                                'signature': b'\x01' * 64}).dump()
+
+
+def _read(data):
+    crl_reader = CRLReader(io.BytesIO(data))
+    entries = list(crl_reader.iter_entries())
+    return crl_reader, entries, crl_reader.read_trailer()
+
+
+class CRLReaderTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        reason = {'extn_id': 'crl_reason', 'critical': False, 'extn_value': 'key_compromise'}
+        cls.der = _crl([_entry(1), _entry(0x1234, [reason]), _entry(2 ** 152 + 5)],
+                       [{'extn_id': 'crl_number', 'critical': False, 'extn_value': 42}])
+        cls.certificate_list = crl.CertificateList.load(cls.der)
+
+    def assertCRL(self, data):
+        crl_reader, entries, trailer = _read(data)
+
+        self.assertEqual(crl_reader.header['issuer'], self.certificate_list['tbs_cert_list']['issuer'])
+        self.assertEqual(crl_reader.header['next_update'].native, NEXT_UPDATE)
+        self.assertEqual(crl_reader.entry_count, 3)
+
+        revoked = self.certificate_list['tbs_cert_list']['revoked_certificates']
+        self.assertEqual([entry.serial_number for entry in entries],
+                         [r['user_certificate'].contents for r in revoked])
+        self.assertEqual([entry.offset for entry in entries],
+                         [self.der.index(r.dump()) for r in revoked])
+        self.assertEqual({entry.revocation_date for entry in entries}, {('utc_time', b'260930000000Z')})
+        self.assertEqual([None if entry.extensions is None else entry.extensions.native for entry in entries],
+                         [None, [r.native for r in revoked[1]['crl_entry_extensions']], None])
+        self.assertEqual({entry.error for entry in entries}, {None})
+
+        self.assertEqual(trailer['tbs_cert_list']['crl_extensions'].native,
+                         self.certificate_list['tbs_cert_list']['crl_extensions'].native)
+        self.assertEqual(trailer['signature'].native, b'\x01' * 64)
+        self.assertIsNone(trailer['tbs_cert_list']['revoked_certificates'].native)
+
+    def test_formats(self):
+        b64 = base64.b64encode(self.der)
+        folded = b'\r\n'.join(b64[i:i + 64] for i in range(0, len(b64), 64))
+        inputs = {
+            'der': self.der,
+            'pem': pem.armor('X509 CRL', self.der),
+            'pem after text': b'CRL of the Test Root\n' + pem.armor('X509 CRL', self.der) + b'trailing text\n',
+            'pem with headers': b'-----BEGIN X509 CRL-----\nProc-Type: 4,CRL\n' + folded +
+                                b'\n-----END X509 CRL-----\n',
+            'base64': b64,
+            'folded base64': b'\n\n' + folded + b'\r\n',
+        }
+        for name, data in inputs.items():
+            with self.subTest(name=name):
+                self.assertCRL(data)
+
+    def test_skipped_entries(self):
+        crl_reader = CRLReader(io.BytesIO(self.der))
+        trailer = crl_reader.read_trailer()
+        self.assertEqual(trailer['tbs_cert_list']['crl_extensions'][0]['extn_value'].native, 42)
+        self.assertEqual(crl_reader.entry_count, 0)
+        with self.assertRaisesRegex(CRLError, 'already been read'):
+            list(crl_reader.iter_entries())
+
+    def test_without_entries(self):
+        for crl_extensions in (None, [{'extn_id': 'crl_number', 'critical': False, 'extn_value': 1}]):
+            with self.subTest(crl_extensions=crl_extensions):
+                crl_reader, entries, trailer = _read(_crl([], crl_extensions))
+                self.assertEqual(entries, [])
+                self.assertEqual(bool(trailer['tbs_cert_list']['crl_extensions']), crl_extensions is not None)
+
+        # v1 without nextUpdate
+        certificate_list = crl.CertificateList.load(_crl([_entry(1)]))
+        tbs = certificate_list['tbs_cert_list']
+        del tbs['version']
+        del tbs['next_update']
+        crl_reader, entries, trailer = _read(certificate_list.dump(force=True))
+        self.assertEqual((len(entries), crl_reader.header['version'].native, crl_reader.header['next_update'].native),
+                         (1, None, None))
+
+    def test_truncated(self):
+        for length in range(len(self.der)):
+            with self.subTest(length=length):
+                with self.assertRaises(ValueError):
+                    _read(self.der[:length])
+
+    def test_trailing_data(self):
+        tbs = self.certificate_list['tbs_cert_list']
+        signature_parts = [self.certificate_list['signature_algorithm'].dump(),
+                           self.certificate_list['signature'].dump()]
+
+        der = _der_sequence([_der_sequence([tbs.contents, b'\x05\x00'])] + signature_parts)
+        with self.assertRaisesRegex(CRLError, 'at the end of the TBSCertList'):
+            _read(der)
+
+        der = _der_sequence([tbs.dump()] + signature_parts + [b'\x05\x00'])
+        with self.assertRaisesRegex(CRLError, 'after the signature'):
+            _read(der)
+
+    def test_not_a_crl(self):
+        for data, message in ((b'', 'No CRL found'), (b'\n \n', 'No CRL found'),
+                              (b'hello, world!\n', 'No X509 CRL pem block'),
+                              (pem.armor('CERTIFICATE', b'\x30\x00'), 'No X509 CRL pem block'),
+                              (b'\x30\x02\x31\x00', 'Expected tag 0x30'), (b'\x30\x03\x30\x01\x05', 'Truncated')):
+            with self.subTest(data=data):
+                with self.assertRaisesRegex(ValueError, message):
+                    _read(data)
+
+        der = self.der.replace(b'\x17\x0d261001', b'\x04\x0d261001')
+        with self.assertRaisesRegex(CRLError, 'thisUpdate is not a UTCTime'):
+            _read(der)
+
+    def test_bad_entries(self):
+        entry = self.certificate_list['tbs_cert_list']['revoked_certificates'][0].dump()
+        offset = self.der.index(entry)
+
+        # a SET instead of a SEQUENCE, an OCTET STRING for the serial number
+        for bad_entry, error in ((b'\x31' + entry[1:], 'Expected a SEQUENCE, found tag 0x31'),
+                                 (entry[:2] + b'\x04' + entry[3:], 'Not a revokedCertificates entry')):
+            with self.subTest(error=error):
+                crl_reader, entries, trailer = _read(self.der.replace(entry, bad_entry))
+                self.assertEqual(entries[0], (offset, None, None, None, error))
+                self.assertEqual([e.error for e in entries[1:]], [None, None])
+
+        with mock.patch.object(crl_stream, 'max_entry_size', len(entry) + 1):
+            crl_reader, entries, trailer = _read(self.der)
+        # only the first entry, serial number 1 without extensions, is that small
+        error = 'Entry is bigger than {} bytes'.format(len(entry) + 1)
+        self.assertEqual([e.error for e in entries], [None, error, error])
+
+    def test_time_keys(self):
+        self.assertEqual(get_time_key('utc_time', b'491231235959Z'), b'20491231235959')
+        self.assertEqual(get_time_key('utc_time', b'500101000000Z'), b'19500101000000')
+        self.assertEqual(get_time_key('general_time', b'20500101000000Z'), b'20500101000000')
+        self.assertLess(get_time_key('utc_time', b'491231235959Z'), get_time_key('general_time', b'20500101000000Z'))
@@ -0,0 +1,246 @@
+from django.test import SimpleTestCase
+from fpkilint import ct_log
+from fpkilint.ct_log import CTLogError, get_tile_start_index, iter_dump_file_items, iter_dump_files, \
+    iter_json_items, iter_tile_items, parse_merkle_tree_leaf
+from unittest import mock
+import base64
+import gzip
+import io
+import json
+import os
+import struct
+import tempfile
+
+CERT = b'\x30\x03\x02\x01\x01'
+TBS = b'\x30\x03\x02\x01\x02'
+PRECERT = b'\x30\x03\x02\x01\x03'
+ISSUER_KEY_HASH = bytes(range(32))
+
+
+def _opaque(value, length_size):
+    return len(value).to_bytes(length_size, 'big') + value
+
+
+def _timestamped_entry(timestamp, entry_type, der):
+    entry = struct.pack('>QH', timestamp, entry_type)
+    if entry_type == ct_log.PRECERT_ENTRY:
+        entry += ISSUER_KEY_HASH
+    return entry + _opaque(der, 3) + _opaque(b'', 2)
+
+
+def _leaf(timestamp, entry_type, der):
+    return b'\x00\x00' + _timestamped_entry(timestamp, entry_type, der)
+
+
+def _x509_json_entry(timestamp=1000, index=None):
+    entry = {'leaf_input': base64.b64encode(_leaf(timestamp, ct_log.X509_ENTRY, CERT)).decode(),
+             'extra_data': base64.b64encode(_opaque(b'', 3)).decode()}
+    if index is not None:
+        entry['index'] = index
+    return entry
+
+
+def _precert_json_entry(timestamp=2000):
+    extra_data = _opaque(PRECERT, 3) + _opaque(b'', 3)
+    return {'leaf_input': base64.b64encode(_leaf(timestamp, ct_log.PRECERT_ENTRY, TBS)).decode(),
+            'extra_data': base64.b64encode(extra_data).decode()}
+
+
+def _tile_entry(timestamp, entry_type, der, pre_certificate=None):
+    entry = _timestamped_entry(timestamp, entry_type, der)
+    if entry_type == ct_log.PRECERT_ENTRY:
+        entry += _opaque(pre_certificate, 3)
+    return entry + _opaque(bytes(32), 2)
+
+
+def _json_items(text, precertificates=False):
+    return list(iter_json_items(io.StringIO(text), 'test.json', precertificates))
+
+
+class MerkleTreeLeafTests(SimpleTestCase):
+    def test_x509_entry(self):
+        self.assertEqual(parse_merkle_tree_leaf(_leaf(1234, ct_log.X509_ENTRY, CERT)), (1234, ct_log.X509_ENTRY, CERT))
+
+    def test_precert_entry(self):
+        self.assertEqual(parse_merkle_tree_leaf(_leaf(1234, ct_log.PRECERT_ENTRY, TBS)),
+                         (1234, ct_log.PRECERT_ENTRY, TBS))
+
+    def test_bad_leaves(self):
+        leaf = _leaf(1234, ct_log.X509_ENTRY, CERT)
+        for bad, message in ((b'\x01' + leaf[1:], 'Not a version 1'), (leaf[:5], 'Truncated entry'),
+                             (leaf[:-3], 'Truncated entry'), (leaf + b'\x00', 'Unexpected data after the entry'),
+                             (leaf[:10] + b'\x00\x05' + leaf[12:], 'Unknown entry type 5')):
+            with self.subTest(message=message):
+                with self.assertRaisesRegex(CTLogError, message):
+                    parse_merkle_tree_leaf(bad)
+
+
+class JSONItemTests(SimpleTestCase):
+    def test_get_entries_response(self):
+        text = json.dumps({'entries': [_x509_json_entry(index=7), _precert_json_entry()]})
+        items = _json_items(text)
+
+        self.assertEqual([(item.der, item.error) for item in items], [(CERT, None), (TBS, None)])
+        self.assertEqual([item.metadata for item in items],
+                         [{'entry': 0, 'log_index': 7, 'timestamp': 1000, 'entry_type': 'x509_entry'},
+                          {'entry': 1, 'timestamp': 2000, 'entry_type': 'precert_entry'}])
+
+    def test_precertificates(self):
+        text = json.dumps({'entries': [_x509_json_entry(), _precert_json_entry()]})
+        self.assertEqual([item.der for item in _json_items(text, precertificates=True)], [CERT, PRECERT])
+
+        entry = _precert_json_entry()
+        del entry['extra_data']
+        items = _json_items(json.dumps([entry]), precertificates=True)
+        self.assertEqual([(item.der, item.error) for item in items], [(None, "Entry has no precertificate")])
+
+    def test_formats(self):
+        # responses back to back, one entry per line and arrays of entries
+        entries = [_x509_json_entry(timestamp) for timestamp in range(6)]
+        texts = [json.dumps({'entries': entries[:3]}) + json.dumps({'entries': entries[3:]}),
+                 '\n'.join(json.dumps(entry) for entry in entries) + '\n',
+                 json.dumps(entries[:2]) + '\n' + json.dumps(entries[2:]),
+                 json.dumps({'other': [1, {'entries': 2}], 'entries': entries}, indent=4)]
+        for text in texts:
+            with self.subTest(text=text[:20]):
+                items = _json_items(text)
+                self.assertEqual([item.metadata['timestamp'] for item in items], list(range(6)))
+                self.assertEqual([item.metadata['entry'] for item in items], list(range(6)))
+
+    def test_empty(self):
+        for text in ('', '  \n', '[]', '{"entries": []}'):
+            with self.subTest(text=text):
+                self.assertEqual(_json_items(text), [])
+
+    def test_chunk_boundaries(self):
+        entries = [_x509_json_entry(timestamp) for timestamp in range(20)]
+        text = json.dumps({'entries': entries}, indent=1) + json.dumps(entries[:5]) + '\n17'
+        with mock.patch.object(ct_log, '_json_chunk_size', 7):
+            items = _json_items(text)
+
+        self.assertEqual([item.metadata['timestamp'] for item in items[:-1]], list(range(20)) + list(range(5)))
+        self.assertEqual(items[-1].error, "Expected get-entries JSON")
+
+    def test_bad_entries(self):
+        bad_base64 = _x509_json_entry()
+        bad_base64['leaf_input'] = 'AAA'
+        truncated = _x509_json_entry()
+        truncated['leaf_input'] = base64.b64encode(_leaf(1, ct_log.X509_ENTRY, CERT)[:-4]).decode()
+        text = json.dumps({'entries': [_x509_json_entry(0), 'entry', {}, bad_base64, truncated,
+                                       _x509_json_entry(5)]})
+
+        items = _json_items(text)
+        self.assertEqual([item.metadata['entry'] for item in items], list(range(6)))
+        self.assertEqual([item.der for item in items], [CERT, None, None, None, None, CERT])
+        self.assertEqual(items[1].error, "Bad entry: expected a JSON object")
+        self.assertEqual(items[2].error, "Bad entry: 'leaf_input'")
+        self.assertTrue(items[3].error.startswith("Bad entry: "))
+        self.assertEqual(items[4].error, "Bad entry: Truncated entry")
+
+    def test_bad_json(self):
+        text = json.dumps({'entries': [_x509_json_entry(0), _x509_json_entry(1)]})
+        for bad in (text[:-20], text[:-1], text.replace(',', ';', 1), '{1: 2}'):
+            with self.subTest(text=bad[-20:]):
+                items = _json_items(bad)
+                self.assertIsNone(items[-1].der)
+                self.assertTrue(items[-1].error.startswith("Bad JSON"))
+                self.assertEqual(items[-1].metadata, {'entry': len(items) - 1})
+
+    def test_value_too_big(self):
+        text = json.dumps({'entries': [_x509_json_entry(0), {'padding': 'x' * 1000}]})
+        with mock.patch.object(ct_log, '_json_chunk_size', 64), mock.patch.object(ct_log, '_max_json_value_size', 500):
+            items = _json_items(text)
+
+        self.assertEqual([item.der for item in items], [CERT, None])
+        self.assertEqual(items[1].error, "JSON value is bigger than 500 bytes")
+
+
+class TileItemTests(SimpleTestCase):
+    tile = _tile_entry(1, ct_log.X509_ENTRY, CERT) + _tile_entry(2, ct_log.PRECERT_ENTRY, TBS, PRECERT) + \
+        _tile_entry(3, ct_log.X509_ENTRY, CERT)
+
+    def test_tile(self):
+        items = list(iter_tile_items(self.tile, 'tile', 512))
+        self.assertEqual([(item.der, item.error) for item in items], [(CERT, None), (TBS, None), (CERT, None)])
+        self.assertEqual([item.offset for item in items],
+                         [0, len(_tile_entry(1, ct_log.X509_ENTRY, CERT)),
+                          len(self.tile) - len(_tile_entry(3, ct_log.X509_ENTRY, CERT))])
+        self.assertEqual([item.metadata['log_index'] for item in items], [512, 513, 514])
+        self.assertEqual([item.metadata['timestamp'] for item in items], [1, 2, 3])
+
+        items = list(iter_tile_items(self.tile, 'tile', precertificates=True))
+        self.assertEqual([item.der for item in items], [CERT, PRECERT, CERT])
+        self.assertNotIn('log_index', items[0].metadata)
+
+    def test_truncated_tile(self):
+        items = list(iter_tile_items(self.tile[:-1], 'tile'))
+        self.assertEqual([(item.der, item.error) for item in items],
+                         [(CERT, None), (TBS, None), (None, "Truncated entry")])
+
+    def test_unknown_entry_type(self):
+        tile = self.tile[:8] + b'\x00\x02' + self.tile[10:]
+        self.assertEqual([(item.offset, item.error) for item in iter_tile_items(tile, 'tile')],
+                         [(0, "Unknown entry type 2")])
+
+    def test_tile_start_index(self):
+        self.assertEqual(get_tile_start_index('mirror/tile/data/005'), 5 * 256)
+        self.assertEqual(get_tile_start_index('mirror/tile/data/x001/x234/067'), 1234067 * 256)
+        self.assertEqual(get_tile_start_index('mirror/tile/data/x001/234.p/17'), 1234 * 256)
+        self.assertIsNone(get_tile_start_index('mirror/tile/0/005'))
+        self.assertIsNone(get_tile_start_index('mirror/tile/data/05'))
+
+
+class DumpFileTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, path, data):
+        path = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_dump_files(self):
+        text = json.dumps({'entries': [_x509_json_entry(1), _precert_json_entry(2)]}).encode()
+        tile = _tile_entry(3, ct_log.X509_ENTRY, CERT)
+        paths = [self.write('a.json', text), self.write('b.jsonl.gz', gzip.compress(text)),
+                 self.write('tile/data/001', tile), self.write('tile/data/001.p/1', tile),
+                 self.write('tile/data/002.p/1', tile), self.write('notes.txt', b'notes')]
+
+        self.assertEqual(list(iter_dump_files([self.directory])), [paths[0], paths[1], paths[2], paths[4]])
+
+        for path in paths[:2]:
+            self.assertEqual([item.der for item in iter_dump_file_items(path)], [CERT, TBS])
+        items = list(iter_dump_file_items(paths[4]))
+        self.assertEqual([(item.der, item.metadata['log_index']) for item in items], [(CERT, 512)])
+
+    def test_bad_files(self):
+        items = list(iter_dump_file_items(os.path.join(self.directory, 'missing.json')))
+        self.assertEqual([item.der for item in items], [None])
+        self.assertIn('No such file', items[0].error)
+
+        # truncated gzip files
+        path = self.write('bad.json.gz', gzip.compress(json.dumps([_x509_json_entry()]).encode())[:-8])
+        self.assertEqual([(item.der, item.error) for item in iter_dump_file_items(path)],
+                         [(None, "Compressed file ended before the end-of-stream marker was reached")])
+        # entries read before the end of a truncated file are kept
+        data = gzip.compress(json.dumps([_x509_json_entry(timestamp) for timestamp in range(2000)]).encode())
+        path = self.write('long.json.gz', data[:len(data) // 2])
+        with mock.patch.object(ct_log, '_json_chunk_size', 1024):
+            items = list(iter_dump_file_items(path))
+        self.assertGreater(len(items), 100)
+        self.assertEqual([item.der for item in items], [CERT] * (len(items) - 1) + [None])
+        self.assertEqual(items[-1].metadata, {'entry': len(items) - 1})
+
+        path = self.write('tile/data/003', gzip.compress(_tile_entry(3, ct_log.X509_ENTRY, CERT))[:-8])
+        self.assertEqual([item.der for item in iter_dump_file_items(path)], [None])
+
+        path = self.write('bad.json', b'{"entries": ["\xff"]}')
+        self.assertEqual([item.der for item in iter_dump_file_items(path)], [None])
+
+        with mock.patch.object(ct_log, '_max_tile_size', 10):
+            path = self.write('tile/data/000', _tile_entry(3, ct_log.X509_ENTRY, CERT))
+            self.assertEqual([item.error for item in iter_dump_file_items(path)], ["Too big to be a data tile"])
@@ -0,0 +1,156 @@
+from django.test import SimpleTestCase
+from fpkilint.db_export import ExportError, _parse_metadata_columns, decode_certificate_value, iter_csv_items, \
+    iter_export_items
+import base64
+import io
+import os
+import sqlite3
+import tempfile
+
+_certs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'certs')
+
+
+class DecodeTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(os.path.join(_certs_dir, 'parse_cert_binary.cer'), 'rb') as f:
+            cls.der = f.read()
+        with open(os.path.join(_certs_dir, 'parse_cert_pem.cer'), 'rb') as f:
+            cls.pem = f.read().decode('ascii')
+
+    def test_encodings(self):
+        b64 = base64.b64encode(self.der).decode('ascii')
+        values = {
+            'der': self.der,
+            'memoryview': memoryview(self.der),
+            'base64': b64,
+            'base64 bytes': b64.encode('ascii'),
+            'folded base64': '\r\n'.join(b64[i:i + 64] for i in range(0, len(b64), 64)),
+            'hex': self.der.hex(),
+            'upper case hex': self.der.hex().upper(),
+            '0x hex': '0x' + self.der.hex(),
+            'postgres bytea hex': '\\x' + self.der.hex(),
+            'spaced hex': ' '.join(self.der.hex()[i:i + 2] for i in range(0, len(self.der) * 2, 2)),
+            'pem': self.pem,
+            'padded pem': '\n  ' + self.pem + '\n',
+        }
+        for name, value in values.items():
+            with self.subTest(name=name):
+                self.assertEqual(decode_certificate_value(value), self.der)
+
+    def test_bad_values(self):
+        for value, message in ((None, 'No certificate'), ('', 'No certificate'), (b'', 'No certificate'),
+                               (b'\x04\xff', 'Binary value is not der'), (42, 'holds a int'),
+                               ('3082abc', 'Bad hex'), ('not a certificate!', 'Not base64, hex or pem'),
+                               ('-----BEGIN CERTIFICATE-----\nMII\n', 'Bad pem')):
+            with self.subTest(value=value):
+                with self.assertRaisesRegex(ExportError, message):
+                    decode_certificate_value(value)
+
+    def test_metadata_columns(self):
+        self.assertEqual(_parse_metadata_columns(None), {})
+        self.assertEqual(_parse_metadata_columns(['RequestID', 'template=CertificateTemplate']),
+                         {'RequestID': 'RequestID', 'template': 'CertificateTemplate'})
+
+
+class ExportTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(os.path.join(_certs_dir, 'parse_cert_binary.cer'), 'rb') as f:
+            cls.der = f.read()
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_csv(self):
+        b64 = base64.b64encode(self.der).decode('ascii')
+        text = 'RequestID;Cert;Template\r\n1;{};"web; server"\r\n2;;user\r\n3;"{}";user\r\n'.format(
+            b64, '\n'.join(b64[i:i + 64] for i in range(0, len(b64), 64)))
+        items = list(iter_csv_items(io.StringIO(text, newline=''), 'issued.csv', 'Cert',
+                                    {'RequestID': 'RequestID', 'template': 'Template'}, ';'))
+
+        self.assertEqual([(item.der, item.error) for item in items],
+                         [(self.der, None), (None, 'No certificate in the row'), (self.der, None)])
+        self.assertEqual([item.metadata for item in items],
+                         [{'row': 1, 'RequestID': '1', 'template': 'web; server'},
+                          {'row': 2, 'RequestID': '2', 'template': 'user'},
+                          {'row': 3, 'RequestID': '3', 'template': 'user'}])
+
+    def test_csv_missing_column(self):
+        text = 'RequestID,Cert\r\n1,{}\r\n'.format(self.der.hex())
+        items = list(iter_csv_items(io.StringIO(text, newline=''), 'issued.csv', 'Certificate', {}))
+        self.assertEqual([(item.der, item.error) for item in items], [(None, "No column 'Certificate'")])
+
+        items = list(iter_csv_items(io.StringIO(text, newline=''), 'issued.csv', 'Cert', {'serial': 'Serial'}))
+        self.assertEqual([(item.der, item.error) for item in items], [(None, "No column 'Serial'")])
+
+    def test_csv_files(self):
+        path = os.path.join(self.directory, 'issued.csv')
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            f.write('Cert,Name\r\n{},Ünïcode\r\n'.format(self.der.hex()))
+        bad_path = os.path.join(self.directory, 'bad.csv')
+        with open(bad_path, 'wb') as f:
+            f.write(b'Cert\r\n\xff\xfe\r\n')
+        missing_path = os.path.join(self.directory, 'missing.csv')
+
+        items = list(iter_export_items([path, bad_path, missing_path], 'Cert', {'Name': 'Name'}))
+
+        # the byte order mark isn't part of the first column name
+        self.assertEqual([(item.source, item.der) for item in items], [(path, self.der), (bad_path, None),
+                                                                       (missing_path, None)])
+        self.assertEqual(items[0].metadata, {'row': 1, 'Name': 'Ünïcode'})
+        self.assertIn('No such file', items[2].error)
+
+    def test_sqlite(self):
+        path = os.path.join(self.directory, 'ca.sqlite')
+        connection = sqlite3.connect(path)
+        connection.execute('CREATE TABLE issued (der BLOB, serial BLOB, profile TEXT, number INTEGER)')
+        connection.executemany('INSERT INTO issued VALUES (?, ?, ?, ?)',
+                               [(self.der, b'\x01\xab', 'web', 1), (None, b'\x02', 'web', 2),
+                                (base64.b64encode(self.der).decode('ascii'), None, 'user', 3)])
+        connection.commit()
+        connection.close()
+
+        items = list(iter_export_items([path], 'der', {'serial': 'serial', 'number': 'number', 'template': 'p'},
+                                       query='SELECT der, serial, profile AS p, number FROM issued ORDER BY number'))
+
+        self.assertEqual([(item.source, item.der, item.error) for item in items],
+                         [(path, self.der, None), (path, None, 'No certificate in the row'), (path, self.der, None)])
+        # blobs are written as hex
+        self.assertEqual([item.metadata for item in items],
+                         [{'row': 1, 'serial': '01ab', 'number': 1, 'template': 'web'},
+                          {'row': 2, 'serial': '02', 'number': 2, 'template': 'web'},
+                          {'row': 3, 'serial': None, 'number': 3, 'template': 'user'}])
+
+        self.assertEqual([item.error for item in iter_export_items([path], 'der', {})],
+                         ['SQLite databases need a --query'])
+
+        items = list(iter_export_items([path], 'der', {}, query='SELECT der FROM missing'))
+        self.assertEqual([(item.der, item.error) for item in items], [(None, 'no such table: missing')])
+
+        # read only
+        items = list(iter_export_items([path], 'der', {}, query='DELETE FROM issued'))
+        self.assertIn('readonly', items[0].error)
+
+    def test_sqlite_file_name(self):
+        # characters that mean something in a uri
+        path = os.path.join(self.directory, 'ca #1 100%?.sqlite')
+        connection = sqlite3.connect(path)
+        connection.execute('CREATE TABLE issued (der BLOB)')
+        connection.execute('INSERT INTO issued VALUES (?)', (self.der,))
+        connection.commit()
+        connection.close()
+
+        items = list(iter_export_items([path], 'der', {}, query='SELECT der FROM issued'))
+        self.assertEqual([(item.source, item.der, item.error) for item in items], [(path, self.der, None)])
+
+        # a relative path
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        self.addCleanup(os.chdir, cwd)
+        items = list(iter_export_items([os.path.basename(path)], 'der', {}, query='SELECT der FROM issued'))
+        self.assertEqual([(item.der, item.error) for item in items], [(self.der, None)])
@@ -0,0 +1,157 @@
+from django.test import SimpleTestCase
+from fpkilint import ldif
+from fpkilint.ldif import LDIFError, iter_ldif_file_items, iter_ldif_items, split_certificate_pair
+from unittest import mock
+import base64
+import io
+import os
+import pathlib
+import tempfile
+
+CERT = b'\x30\x03\x02\x01\x01'
+OTHER_CERT = b'\x30\x03\x02\x01\x02'
+
+_certs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'certs')
+
+
+def _fold(line, width=76, newline=b'\n'):
+    parts = [line[:width]] + [b' ' + line[i:i + width - 1] for i in range(width, len(line), width - 1)]
+    return newline.join(parts) + newline
+
+
+def _pair(forward=None, reverse=None):
+    contents = b''
+    if forward is not None:
+        contents += b'\xa0' + bytes([len(forward)]) + forward
+    if reverse is not None:
+        contents += b'\xa1' + bytes([len(reverse)]) + reverse
+    return b'\x30' + bytes([len(contents)]) + contents
+
+
+def _items(data, **kwargs):
+    return list(iter_ldif_items(io.BytesIO(data), 'test.ldif', **kwargs))
+
+
+class LDIFTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(os.path.join(_certs_dir, 'parse_cert_binary.cer'), 'rb') as f:
+            cls.der = f.read()
+
+    def test_entries(self):
+        first = b'dn: cn=One,o=Test\n' + _fold(b'userCertificate;binary:: ' + base64.b64encode(self.der))
+        second = b'dn: cn=Two,o=Test\nobjectClass: person\ncACertificate:: ' + base64.b64encode(CERT) + b'\n'
+        data = b'version: 1\n\n' + first + b'\n' + second
+        items = _items(data)
+
+        self.assertEqual([(item.offset, item.der, item.error) for item in items],
+                         [(len(b'version: 1\n\ndn: cn=One,o=Test\n'), self.der, None),
+                          (data.index(b'cACertificate'), CERT, None)])
+        self.assertEqual([item.metadata for item in items],
+                         [{'dn': 'cn=One,o=Test', 'attribute': 'userCertificate;binary'},
+                          {'dn': 'cn=Two,o=Test', 'attribute': 'cACertificate'}])
+
+    def test_folding(self):
+        # folded at any byte, CRLF line endings, the dn itself folded and base64 encoded
+        dn = 'cn=Ünïcode Name with a long value that needs folding,ou=People,o=Test'.encode('utf-8')
+        for width in (2, 10, 76):
+            with self.subTest(width=width):
+                data = _fold(b'dn:: ' + base64.b64encode(dn), width, b'\r\n') + \
+                    _fold(b'userCertificate:: ' + base64.b64encode(self.der), width, b'\r\n')
+                items = _items(data)
+                self.assertEqual([(item.der, item.metadata['dn']) for item in items], [(self.der, dn.decode('utf-8'))])
+
+    def test_comments(self):
+        data = b'# userCertificate:: ' + base64.b64encode(CERT) + b'\n  continued comment\ndn: cn=One\n' + \
+            b'# another\nuserCertificate:: ' + base64.b64encode(OTHER_CERT) + b'\n'
+        self.assertEqual([(item.der, item.metadata['dn']) for item in _items(data)], [(OTHER_CERT, 'cn=One')])
+
+    def test_dn_resets_at_blank_line(self):
+        data = b'dn: cn=One\n\nuserCertificate:: ' + base64.b64encode(CERT) + b'\n'
+        self.assertEqual([item.metadata['dn'] for item in _items(data)], [None])
+
+    def test_change_records(self):
+        data = b'dn: cn=One\nchangetype: modify\nreplace: userCertificate;binary\nuserCertificate;binary:: ' + \
+            base64.b64encode(CERT) + b'\n-\nadd: cACertificate\ncACertificate:: ' + base64.b64encode(OTHER_CERT) + \
+            b'\n- \n\ndn: cn=Two\nchangetype: add\nuserCertificate:: ' + base64.b64encode(CERT) + b'\n'
+        items = _items(data)
+
+        self.assertEqual([(item.der, item.error, item.metadata) for item in items],
+                         [(CERT, None, {'dn': 'cn=One', 'attribute': 'userCertificate;binary'}),
+                          (OTHER_CERT, None, {'dn': 'cn=One', 'attribute': 'cACertificate'}),
+                          (CERT, None, {'dn': 'cn=Two', 'attribute': 'userCertificate'})])
+
+    def test_attributes(self):
+        data = b'dn: cn=One\nuserCertificate:: ' + base64.b64encode(CERT) + b'\ncACertificate:: ' + \
+            base64.b64encode(OTHER_CERT) + b'\nuserSMIMECertificate:: ' + base64.b64encode(CERT) + b'\n'
+        self.assertEqual([item.der for item in _items(data)], [CERT, OTHER_CERT])
+        self.assertEqual([item.der for item in _items(data, attributes=('cacertificate', 'usersmimecertificate'))],
+                         [OTHER_CERT, CERT])
+
+    def test_cross_certificate_pairs(self):
+        data = b'dn: cn=CA\ncrossCertificatePair;binary:: ' + base64.b64encode(_pair(CERT, OTHER_CERT)) + \
+            b'\ncrossCertificatePair:: ' + base64.b64encode(_pair(reverse=OTHER_CERT)) + b'\n'
+        items = _items(data)
+
+        self.assertEqual([(item.der, item.metadata.get('pair')) for item in items],
+                         [(CERT, 'forward'), (OTHER_CERT, 'reverse'), (OTHER_CERT, 'reverse')])
+        self.assertEqual(items[0].offset, items[1].offset)
+
+    def test_bad_cross_certificate_pairs(self):
+        for der, message in ((b'\x31\x00', 'not a SEQUENCE'), (b'\x30\x05\xa0\x03', 'Bad crossCertificatePair'),
+                             (b'\x30\x02\x04\x00', 'Unexpected element'), (_pair(CERT) + b'\x00', 'Bad crossCert'),
+                             (b'\x30\x05\xa2\x03\x02\x01\x01', 'Unexpected element')):
+            with self.subTest(der=der.hex()):
+                with self.assertRaisesRegex(LDIFError, message):
+                    split_certificate_pair(der)
+
+        self.assertEqual(split_certificate_pair(_pair()), [])
+
+    def test_bad_lines(self):
+        data = b'dn: cn=One\nnot an attribute\nuserCertificate:: AB*C\nuserCertificate:: ' + \
+            base64.b64encode(CERT) + b'\ncrossCertificatePair:: MAA=\ncrossCertificatePair:: MQA=\n'
+        items = _items(data)
+
+        self.assertEqual([item.der for item in items], [None, None, CERT, None])
+        self.assertEqual(items[0].error, "Not an LDIF attribute line")
+        self.assertTrue(items[1].error.startswith("Bad base64"))
+        self.assertEqual(items[3].error, "crossCertificatePair is not a SEQUENCE")
+        self.assertEqual(items[1].metadata, {'dn': 'cn=One', 'attribute': 'userCertificate'})
+
+    def test_bad_dn(self):
+        data = b'dn:: /w==\nuserCertificate:: ' + base64.b64encode(CERT) + b'\n'
+        items = _items(data)
+        self.assertEqual([(item.der, item.metadata) for item in items],
+                         [(None, None), (CERT, {'dn': None, 'attribute': 'userCertificate'})])
+        self.assertTrue(items[0].error.startswith("Bad dn"))
+
+    def test_file_values(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = pathlib.Path(directory.name, 'cert 1.der')
+        path.write_bytes(self.der)
+
+        data = b'dn: cn=One\nuserCertificate;binary:< ' + path.as_uri().encode() + b'\n' + \
+            b'userCertificate:< http://example.com/cert.der\n' + \
+            b'userCertificate:< ' + pathlib.Path(directory.name, 'missing.der').as_uri().encode() + b'\n'
+        items = _items(data)
+
+        self.assertEqual([item.der for item in items], [self.der, None, None])
+        self.assertEqual(items[1].error, "Only file:// values can be read, not http://example.com/cert.der")
+        self.assertIn('No such file', items[2].error)
+
+        with mock.patch.object(ldif, '_max_value_size', 100):
+            items = _items(data)
+        self.assertEqual(items[0].error, "{} is too big to be a certificate".format(path.as_uri()))
+
+    def test_files(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'export.ldif')
+        with open(path, 'wb') as f:
+            f.write(b'dn: cn=One\nuserCertificate:: ' + base64.b64encode(CERT))
+
+        missing = os.path.join(directory.name, 'missing.ldif')
+        items = list(iter_ldif_file_items([path, missing]))
+        self.assertEqual([(item.source, item.der) for item in items], [(path, CERT), (missing, None)])
@@ -0,0 +1,184 @@
+from asn1crypto import core, pem, x509
+from django.test import SimpleTestCase
+from fpkilint import lint_server
+from fpkilint.html_output import iter_analyze_certificate, load_all_profiles
+from fpkilint.lint_server import KIND_TBS_CERTIFICATE, SEVERITY_FAIL, STATUS_BAD_REQUEST, STATUS_PARSE_ERROR, \
+    STATUS_UNKNOWN_PROFILE, VERDICT_FAIL, LintClient, LintServer, LintServerError, decode_request, \
+    decode_response, encode_error, encode_request, encode_result, lint, recv_frame, send_frame
+from fpkilint.profile_conformance import compile_profile
+from unittest import mock
+import multiprocessing
+import os
+import socket
+import struct
+import tempfile
+import time
+
+_chain_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'chain')
+
+_template = 'fbca/1.9/5-ee-signature.json'
+
+
+def _leaf():
+    with open(os.path.join(_chain_dir, 'leaf.pem'), 'rb') as f:
+        return x509.Certificate.load(pem.unarmor(f.read())[2])
+
+
+def _with_unknown_extension(cert):
+    tbs = cert['tbs_certificate'].copy()
+    tbs['extensions'] = list(tbs['extensions']) + [{'extn_id': '1.2.3.4', 'critical': True,
+                                                    'extn_value': core.Null().dump()}]
+    return x509.TbsCertificate.load(tbs.dump(force=True))
+
+
+class ProtocolTests(SimpleTestCase):
+    def setUp(self):
+        self.server, self.client = socket.socketpair()
+        self.addCleanup(self.server.close)
+        self.addCleanup(self.client.close)
+
+    def test_frames(self):
+        for payload in (b'', b'x', bytes(range(256)) * 300):
+            with self.subTest(length=len(payload)):
+                send_frame(self.client, payload)
+                self.assertEqual(recv_frame(self.server), payload)
+
+    def test_closed(self):
+        self.client.close()
+        self.assertIsNone(recv_frame(self.server))
+
+    def test_short_frame(self):
+        # the length says 100 bytes but the connection is dropped after 10
+        self.client.sendall(struct.pack('>I', 100) + bytes(10))
+        self.client.shutdown(socket.SHUT_WR)
+        self.assertIsNone(recv_frame(self.server))
+
+    def test_oversized_frame(self):
+        self.client.sendall(struct.pack('>I', lint_server._max_frame_length + 1))
+        with self.assertRaises(LintServerError) as context:
+            recv_frame(self.server)
+        self.assertEqual(context.exception.status, STATUS_BAD_REQUEST)
+
+    def test_request(self):
+        der = bytes(range(100))
+        self.assertEqual(decode_request(encode_request(der, _template, KIND_TBS_CERTIFICATE)),
+                         (KIND_TBS_CERTIFICATE, _template, der))
+        with self.assertRaisesRegex(LintServerError, 'too short'):
+            decode_request(b'\x00\x00')
+
+    def test_response(self):
+        findings = [(SEVERITY_FAIL, 'key_usage', 'Digital Signature is missing'), (0, '1.2.3.4', 'é' * 40000)]
+        verdict, decoded = decode_response(encode_result(VERDICT_FAIL, findings))
+        self.assertEqual(verdict, VERDICT_FAIL)
+        self.assertEqual(decoded[0], findings[0])
+        # messages are cut to what the 2 byte length can say, at a character boundary
+        self.assertEqual(decoded[1][:2], findings[1][:2])
+        self.assertTrue(decoded[1][2].startswith('é' * 30000))
+
+        with self.assertRaises(LintServerError) as context:
+            decode_response(encode_error(STATUS_UNKNOWN_PROFILE, 'Unknown profile x'))
+        self.assertEqual((context.exception.status, str(context.exception)), (STATUS_UNKNOWN_PROFILE,
+                                                                                'Unknown profile x'))
+
+
+class LintTests(SimpleTestCase):
+    def test_codes_match_web_results(self):
+        cert_profile = compile_profile(load_all_profiles()[_template])
+        tbs = _with_unknown_extension(_leaf())
+
+        verdict, findings = lint(tbs, cert_profile)
+        web_codes = [finding['code'] for row in list(iter_analyze_certificate(tbs, _template))[1:]
+                     for finding in row['findings']]
+
+        self.assertEqual(verdict, VERDICT_FAIL)
+        self.assertEqual([code for severity, code, message in findings], web_codes)
+        # other extensions are coded by oid, like their rows in the results
+        self.assertIn((SEVERITY_FAIL, '1.2.3.4', 'Additional critical extensions are not permitted'), findings)
+
+
+class LintServerTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.directory.name, 'lint.sock')
+
+        # a worker serves two requests and is replaced
+        server = LintServer(cls.path, workers=1, max_requests=2)
+        cls.process = multiprocessing.get_context('fork').Process(target=server.serve_forever)
+        cls.process.start()
+
+        deadline = time.monotonic() + 30
+        while not os.path.exists(cls.path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.process.terminate()
+        cls.process.join(10)
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.cert = _leaf()
+
+    def connect(self):
+        client = LintClient(self.path, timeout=30)
+        self.addCleanup(client.close)
+        return client
+
+    def test_lint(self):
+        client = self.connect()
+        cert_profile = compile_profile(load_all_profiles()[_template])
+        tbs = _with_unknown_extension(self.cert)
+
+        self.assertEqual(client.lint(self.cert.dump(), _template), lint(self.cert, cert_profile))
+        self.assertEqual(client.lint(tbs.dump(), _template, KIND_TBS_CERTIFICATE), lint(tbs, cert_profile))
+
+    def test_errors(self):
+        client = self.connect()
+        for der, template, status in ((self.cert.dump(), 'no/such/profile.json', STATUS_UNKNOWN_PROFILE),
+                                      (b'not a certificate', _template, STATUS_PARSE_ERROR)):
+            with self.subTest(status=status), self.assertRaises(LintServerError) as context:
+                client.lint(der, template)
+            self.assertEqual(context.exception.status, status)
+
+    def test_recycled_worker(self):
+        # every second request finds its connection closed by a replaced worker and is retried once
+        client = self.connect()
+        expected = client.lint(self.cert.dump(), _template)
+        for i in range(5):
+            with self.subTest(request=i):
+                self.assertEqual(client.lint(self.cert.dump(), _template), expected)
+
+    def test_dropped_connection(self):
+        client = self.connect()
+        expected = client.lint(self.cert.dump(), _template)
+        client.conn.shutdown(socket.SHUT_RDWR)
+        self.assertEqual(client.lint(self.cert.dump(), _template), expected)
+
+        # a connection that can't be made again is an error
+        with mock.patch.object(client, '_request', return_value=None), mock.patch.object(client, '_connect'):
+            with self.assertRaisesRegex(LintServerError, 'Connection closed'):
+                client.lint(self.cert.dump(), _template)
+
+    def test_bad_frames(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(30)
+            conn.connect(self.path)
+            conn.sendall(struct.pack('>I', lint_server._max_frame_length + 1))
+            with self.assertRaises(LintServerError) as context:
+                decode_response(recv_frame(conn))
+            self.assertEqual(context.exception.status, STATUS_BAD_REQUEST)
+            # and the connection is closed
+            self.assertIsNone(recv_frame(conn))
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(30)
+            conn.connect(self.path)
+            conn.sendall(struct.pack('>I', 100) + bytes(10))
+            conn.shutdown(socket.SHUT_WR)
+            self.assertIsNone(recv_frame(conn))
+
+        # the server still answers
+        self.assertEqual(self.connect().lint(self.cert.dump(), _template)[0], VERDICT_FAIL)
@@ -0,0 +1,158 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from fpkilint.timing import PhaseTimer
+from fpkilint.worker_pool import LintWorkerPool
+from prometheus_client import REGISTRY
+from profiles import executor, metrics
+from profiles.scheduler import TokenBuckets
+from unittest import mock
+import collections
+import os
+
+_certs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'certs')
+
+_template = 'fbca/1.9/5-ee-signature.json'
+# profile, version and cert type of _template in profiles.json
+_form = {'profile': '1', 'version': '0', 'type': '3'}
+
+_locmem_caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-metrics'}}
+
+
+def _value(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def _read(file_name):
+    with open(os.path.join(_certs_dir, file_name), 'rb') as f:
+        return f.read()
+
+
+class ObserveTimerTests(SimpleTestCase):
+    def test_observe_timer(self):
+        timer = PhaseTimer()
+        timer.add('parse', 0.002)
+        timer.add('check.key_usage', 0.0001)
+        timer.add('der2ascii', 0.003, count=4)
+
+        before = {(name, value): _value(name, **{label: value}) for name, label, value in (
+            ('cpct_phase_seconds_count', 'phase', 'parse'), ('cpct_phase_seconds_sum', 'phase', 'parse'),
+            ('cpct_check_seconds_count', 'check', 'key_usage'),
+            ('cpct_request_seconds_count', 'path', '/fragment/'), ('cpct_request_seconds_count', 'path', 'other'))}
+        der2ascii_calls = _value('cpct_der2ascii_calls_total')
+
+        metrics.observe_timer(timer, '/fragment/0123/extensions/')
+        metrics.observe_timer(PhaseTimer(), '/no/such/page/')
+
+        self.assertEqual(_value('cpct_phase_seconds_count', phase='parse'),
+                         before['cpct_phase_seconds_count', 'parse'] + 1)
+        self.assertAlmostEqual(_value('cpct_phase_seconds_sum', phase='parse'),
+                               before['cpct_phase_seconds_sum', 'parse'] + 0.002)
+        # checks have their own histogram
+        self.assertEqual(_value('cpct_check_seconds_count', check='key_usage'),
+                         before['cpct_check_seconds_count', 'key_usage'] + 1)
+        self.assertEqual(_value('cpct_phase_seconds_count', phase='check.key_usage'), 0)
+        self.assertEqual(_value('cpct_der2ascii_calls_total'), der2ascii_calls + 4)
+        # fragment paths share a label, unknown paths are 'other'
+        for path in ('/fragment/', 'other'):
+            self.assertEqual(_value('cpct_request_seconds_count', path=path),
+                             before['cpct_request_seconds_count', path] + 1)
+
+    def test_get_metrics(self):
+        metrics.record_outcome('ok')
+        body, content_type = metrics.get_metrics()
+        self.assertIn(b'cpct_lint_requests_total{outcome="ok"}', body)
+        self.assertTrue(content_type.startswith('text/plain'))
+
+
+@override_settings(CACHES=_locmem_caches,
+                   STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class UploadMetricsTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.der = _read('parse_cert_binary.cer')
+        cls.pool = LintWorkerPool(1, 30, 100)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        for name, value in (('_lint_pool', self.pool), ('_client_buckets', TokenBuckets(100, 100))):
+            patcher = mock.patch.object(executor, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def upload(self, data, file_name='cert.cer', **fields):
+        return self.client.post('/file/', dict(_form, file=SimpleUploadedFile(file_name, data), **fields))
+
+    def outcomes(self):
+        return {outcome: _value('cpct_lint_requests_total', outcome=outcome)
+                for outcome in ('ok', 'parse_error', 'timeout', 'overloaded', 'invalid_form', 'invalid_template',
+                                'invalid_request', 'unrecoverable_error')}
+
+    def assertOutcome(self, before, outcome):
+        expected = dict(before)
+        expected[outcome] += 1
+        self.assertEqual(self.outcomes(), expected)
+
+    def test_success(self):
+        header, rows = self.pool.lint(self.der, _template)
+        finding_counts = collections.Counter((finding['code'], finding['severity'])
+                                             for row in rows for finding in row['findings'])
+        self.assertTrue(finding_counts)
+
+        def findings():
+            return {(code, severity): _value('cpct_findings_total', code=code, severity=severity, profile=_template)
+                    for code, severity in finding_counts}
+
+        histograms = (('cpct_phase_seconds_count', {'phase': 'lint'}),
+                      ('cpct_phase_seconds_count', {'phase': 'queue'}),
+                      ('cpct_check_seconds_count', {'check': 'key_usage'}),
+                      ('cpct_request_seconds_count', {'path': '/file/'}))
+
+        outcomes = self.outcomes()
+        findings_before = findings()
+        histograms_before = [_value(name, **labels) for name, labels in histograms]
+
+        with self.assertLogs('cpct.timing'):
+            response = self.upload(self.der)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertOutcome(outcomes, 'ok')
+        self.assertEqual(findings(), {key: findings_before[key] + count for key, count in finding_counts.items()})
+        # the check timings come from the lint worker process
+        self.assertEqual([_value(name, **labels) for name, labels in histograms],
+                         [value + 1 for value in histograms_before])
+
+    def assertRejected(self, outcome, upload, status=200):
+        outcomes = self.outcomes()
+        findings = _value('cpct_findings_total', code='key_usage', severity='FAIL', profile=_template)
+        requests = _value('cpct_request_seconds_count', path='/file/')
+
+        with self.assertLogs('cpct.timing'):
+            response = upload()
+
+        self.assertEqual(response.status_code, status)
+        self.assertOutcome(outcomes, outcome)
+        self.assertEqual(_value('cpct_findings_total', code='key_usage', severity='FAIL', profile=_template),
+                         findings)
+        self.assertEqual(_value('cpct_request_seconds_count', path='/file/'), requests + 1)
+
+    def test_rejected(self):
+        self.assertRejected('invalid_request', lambda: self.client.get('/file/'))
+        self.assertRejected('invalid_form',
+                            lambda: self.client.post('/file/', {'file': SimpleUploadedFile('a.cer', self.der)}))
+        self.assertRejected('invalid_template', lambda: self.upload(self.der, profile='99'))
+        self.assertRejected('parse_error', lambda: self.upload(_read('parse_cert_not_cert.pem'), 'key.pem'))
+        # read as a certificate, but the lint worker can't parse it
+        self.assertRejected('parse_error', lambda: self.upload(b'\x30\x82\x01\x00' + bytes(256)))
+
+        with mock.patch.object(executor, '_client_buckets', TokenBuckets(1, 0)):
+            self.assertRejected('overloaded', lambda: self.upload(self.der), 503)
+
+        timeout_pool = LintWorkerPool(1, 0.0001, 100)
+        self.addCleanup(timeout_pool.close)
+        with mock.patch.object(executor, '_lint_pool', timeout_pool), self.assertLogs('fpkilint.worker_pool'):
+            self.assertRejected('timeout', lambda: self.upload(self.der))
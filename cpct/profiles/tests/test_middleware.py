@@ -0,0 +1,124 @@
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from fpkilint.timing import timed
+from fpkilint.worker_pool import LintWorkerPool
+from profiles.executor import offload, schedule_lint
+from profiles.middleware import ServerTimingMiddleware
+from profiles.result_cache import get_result_id, store_fragment
+from profiles.scheduler import INTERACTIVE
+import asyncio
+import json
+import os
+import re
+import time
+
+_certs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'certs')
+
+_template = 'fbca/1.9/5-ee-signature.json'
+
+_locmem_caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                              'LOCATION': 'test-middleware'}}
+
+_metric = re.compile(r'(?P<name>[\w.]+);dur=(?P<ms>\d+\.\d{2})(;desc="(?P<count>\d+) calls")?')
+
+
+def _sleep_in_phase(name, seconds):
+    with timed(name):
+        time.sleep(seconds)
+
+
+class ServerTimingTests(SimpleTestCase):
+    def assertServerTiming(self, response):
+        """
+        :return: {phase: (ms, count)} from the Server-Timing header, total included
+        """
+        phases = {}
+        for metric in response['Server-Timing'].split(', '):
+            match = _metric.fullmatch(metric)
+            self.assertIsNotNone(match, metric)
+            phases[match['name']] = (float(match['ms']), int(match['count'] or 1))
+
+        self.assertEqual(list(phases)[-1], 'total')
+        self.assertGreaterEqual(phases['total'][0], max(ms for ms, count in phases.values()))
+        return phases
+
+    @override_settings(CACHES=_locmem_caches)
+    def test_view(self):
+        cache.clear()
+        result_id = get_result_id('0' * 64, _template)
+        store_fragment(result_id, 'extensions', '<pre>content</pre>')
+
+        with self.assertLogs('cpct.timing') as logs:
+            response = self.client.get('/fragment/{}/extensions/'.format(result_id))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.assertServerTiming(response)), ['cache', 'total'])
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line['path'], line['status'], list(line['phases'])),
+                         ('/fragment/{}/extensions/'.format(result_id), 200, ['cache']))
+
+    def test_phase_counts(self):
+        async def view(request):
+            for i in range(3):
+                await offload(request, 'render', time.sleep, 0.001)
+            return HttpResponse()
+
+        with self.assertLogs('cpct.timing'):
+            response = async_to_sync(ServerTimingMiddleware(view))(RequestFactory().get('/'))
+        ms, count = self.assertServerTiming(response)['render']
+        self.assertEqual(count, 3)
+        self.assertGreaterEqual(ms, 3)
+
+    def test_concurrent_requests(self):
+        # the requests' offloaded work overlaps on the executor threads, each phase lands on its own request
+        async def view(request):
+            name = request.GET['name']
+            await asyncio.gather(offload(request, 'outer.' + name, _sleep_in_phase, 'inner.' + name, 0.02),
+                                 offload(request, None, _sleep_in_phase, 'untimed.' + name, 0.01))
+            return HttpResponse()
+
+        middleware = ServerTimingMiddleware(view)
+        factory = RequestFactory()
+
+        async def requests():
+            return await asyncio.gather(*(middleware(factory.get('/', {'name': name})) for name in 'abc'))
+
+        with self.assertLogs('cpct.timing') as logs:
+            responses = async_to_sync(requests)()
+        self.assertEqual(len(logs.records), 3)
+
+        for name, response in zip('abc', responses):
+            with self.subTest(name=name):
+                phases = self.assertServerTiming(response)
+                self.assertEqual(set(phases), {'outer.' + name, 'inner.' + name, 'untimed.' + name, 'total'})
+
+    def test_worker_pool_phases(self):
+        pool = LintWorkerPool(1, 30, 100)
+        self.addCleanup(pool.close)
+        with open(os.path.join(_certs_dir, 'parse_cert_binary.cer'), 'rb') as f:
+            der = f.read()
+
+        async def lint_view(request):
+            await schedule_lint(request, INTERACTIVE, 'lint', pool.lint, der, _template, cost=0)
+            return HttpResponse()
+
+        async def render_view(request):
+            await offload(request, 'render', time.sleep, 0.01)
+            return HttpResponse()
+
+        factory = RequestFactory()
+
+        async def requests():
+            return await asyncio.gather(ServerTimingMiddleware(lint_view)(factory.get('/lint/')),
+                                        ServerTimingMiddleware(render_view)(factory.get('/render/')))
+
+        with self.assertLogs('cpct.timing'):
+            lint_response, render_response = async_to_sync(requests)()
+
+        # the phases timed in the worker process come back with the job and are added to its request
+        phases = self.assertServerTiming(lint_response)
+        self.assertTrue({'queue', 'lint', 'parse', 'check.key_usage'} <= set(phases))
+        self.assertGreaterEqual(phases['lint'][0], phases['check.key_usage'][0])
+        self.assertEqual(list(self.assertServerTiming(render_response)), ['render', 'total'])
@@ -0,0 +1,165 @@
+from asn1crypto import pem, x509
+from django.test import SimpleTestCase
+from fpkilint.name_constraints import NameConstraints, get_constrained_names
+import os
+
+_chain_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'chain')
+
+
+def _general_name(name_type, value):
+    # IP addresses are written with a prefix length in a constraint and without one in a SAN
+    if name_type == 'directory_name':
+        return x509.GeneralName(name=name_type, value=x509.Name.build(value))
+    return x509.GeneralName(name=name_type, value=value)
+
+
+def _subtrees(names):
+    return [{'base': _general_name(name_type, value)} for name_type, value in names]
+
+
+def _constraints(permitted=(), excluded=()):
+    value = {}
+    if permitted:
+        value['permitted_subtrees'] = _subtrees(permitted)
+    if excluded:
+        value['excluded_subtrees'] = _subtrees(excluded)
+    return NameConstraints(x509.NameConstraints(value))
+
+
+def _tbs(subject, alt_names=()):
+    with open(os.path.join(_chain_dir, 'leaf_example.pem'), 'rb') as f:
+        tbs = x509.Certificate.load(pem.unarmor(f.read())[2])['tbs_certificate'].copy()
+
+    tbs['subject'] = x509.Name.build(subject)
+    extensions = [extension for extension in tbs['extensions'] if extension['extn_id'].native != 'subject_alt_name']
+    if alt_names:
+        extensions.append({'extn_id': 'subject_alt_name', 'critical': False,
+                           'extn_value': [_general_name(name_type, value) for name_type, value in alt_names]})
+    tbs['extensions'] = extensions
+
+    return x509.TbsCertificate.load(tbs.dump(force=True))
+
+
+def _violations(constraints, subject, alt_names=()):
+    return list(constraints.iter_violations(get_constrained_names(_tbs(subject, alt_names))))
+
+
+class DNSNameTests(SimpleTestCase):
+    def check(self, constraint, names):
+        constraints = _constraints(permitted=[('dns_name', constraint)])
+        for name, matches in names.items():
+            with self.subTest(constraint=constraint, name=name):
+                self.assertEqual(constraints.permitted.matches('dns_name', name), matches)
+
+    def test_domain(self):
+        self.check('example.com', {'example.com': True, 'www.example.com': True, 'a.b.example.com': True,
+                                   'WWW.Example.COM': True, 'example.com.': True, 'badexample.com': False,
+                                   'example.org': False, 'com': False, 'www.example.com.evil': False})
+
+    def test_leading_dot(self):
+        self.check('.example.com', {'example.com': False, 'www.example.com': True, 'a.b.example.com': True,
+                                    'xexample.com': False})
+
+    def test_host(self):
+        self.check('www.example.com', {'www.example.com': True, 'a.www.example.com': True, 'example.com': False,
+                                       'mail.example.com': False})
+
+
+class OtherNameTypeTests(SimpleTestCase):
+    def test_rfc822_name(self):
+        constraints = _constraints(permitted=[('rfc822_name', 'User@example.com'), ('rfc822_name', 'example.org'),
+                                              ('rfc822_name', '.example.net')])
+        for name, matches in {'User@example.com': True, 'User@EXAMPLE.com': True, 'user@example.com': False,
+                              'other@example.com': False, 'anyone@example.org': True, 'anyone@mail.example.org': False,
+                              'anyone@mail.example.net': True, 'anyone@example.net': False}.items():
+            with self.subTest(name=name):
+                self.assertEqual(constraints.permitted.matches('rfc822_name', name), matches)
+
+    def test_uri(self):
+        constraints = _constraints(permitted=[('uniform_resource_identifier', 'host.example.com'),
+                                              ('uniform_resource_identifier', '.example.org')])
+        for name, matches in {'https://host.example.com/path': True, 'ldap://HOST.example.com:389/cn=x': True,
+                              'https://user@host.example.com/': True, 'https://other.example.com/': False,
+                              'http://www.example.org/': True, 'http://example.org/': False,
+                              'urn:uuid:1234': False, 'http://[::1/': False}.items():
+            with self.subTest(name=name):
+                self.assertEqual(constraints.permitted.matches('uniform_resource_identifier', name), matches)
+
+    def test_ip_address(self):
+        constraints = _constraints(permitted=[('ip_address', '192.0.2.0/24'), ('ip_address', '198.51.100.7/32'),
+                                              ('ip_address', '2001:db8::/32')])
+        for name, matches in {'192.0.2.1': True, '192.0.3.1': False, '198.51.100.7': True, '198.51.100.8': False,
+                              '2001:db8::1': True, '2001:db9::1': False, '::ffff:192.0.2.1': False}.items():
+            with self.subTest(name=name):
+                self.assertEqual(constraints.permitted.matches('ip_address', name), matches)
+
+    def test_directory_name(self):
+        constraints = _constraints(permitted=[('directory_name', {'country_name': 'US', 'organization_name': 'Test'})])
+        for subject, matches in (({'country_name': 'US', 'organization_name': 'Test', 'common_name': 'A'}, True),
+                                 ({'country_name': 'US', 'organization_name': '  TEST '}, True),
+                                 ({'country_name': 'US', 'organization_name': 'Other', 'common_name': 'A'}, False),
+                                 ({'country_name': 'US'}, False)):
+            with self.subTest(subject=subject):
+                names = get_constrained_names(_tbs(subject))
+                self.assertEqual(constraints.permitted.matches('directory_name', names[0][1]), matches)
+
+    def test_unsupported(self):
+        constraints = _constraints(permitted=[('registered_id', '1.2.3.4')],
+                                   excluded=[('ip_address', '192.0.2.0/24')])
+        self.assertEqual(constraints.permitted.unsupported, ['Registered ID: 1.2.3.4'])
+        self.assertEqual(constraints.excluded.unsupported, [])
+
+
+class ViolationTests(SimpleTestCase):
+    subject = {'country_name': 'US', 'organization_name': 'Test', 'common_name': 'Leaf'}
+
+    def test_constrained_names(self):
+        subject = dict(self.subject, email_address='leaf@example.com')
+        names = get_constrained_names(_tbs(subject, [('dns_name', 'www.example.com'), ('ip_address', '192.0.2.1'),
+                                                     ('rfc822_name', 'a@example.com'),
+                                                     ('registered_id', '1.2.3.4')]))
+        self.assertEqual([(name_type, value) for name_type, value, display in names[1:]],
+                         [('rfc822_name', 'leaf@example.com'), ('dns_name', 'www.example.com'),
+                          ('ip_address', '192.0.2.1'), ('rfc822_name', 'a@example.com'), ('registered_id', None)])
+        self.assertEqual(names[0][0], 'directory_name')
+
+        # an empty subject isn't a name
+        self.assertEqual(get_constrained_names(_tbs({}, [('dns_name', 'www.example.com')]))[0][0], 'dns_name')
+
+    def test_excluded_ahead_of_permitted(self):
+        constraints = _constraints(permitted=[('dns_name', 'example.com')], excluded=[('dns_name', 'bad.example.com')])
+        self.assertEqual(_violations(constraints, self.subject, [('dns_name', 'www.example.com'),
+                                                                 ('dns_name', 'x.bad.example.com'),
+                                                                 ('dns_name', 'example.org')]),
+                         [('DNS Name: x.bad.example.com', 'excluded'), ('DNS Name: example.org', 'not permitted')])
+
+    def test_types_without_constraints(self):
+        # only dNSNames are constrained, the directoryName and the IP address aren't
+        constraints = _constraints(permitted=[('dns_name', 'example.com')])
+        self.assertEqual(_violations(constraints, self.subject, [('ip_address', '203.0.113.1')]), [])
+
+    def test_email_address_in_subject(self):
+        constraints = _constraints(excluded=[('rfc822_name', 'example.org')])
+        subject = dict(self.subject, email_address='leaf@example.org')
+        self.assertEqual(_violations(constraints, subject), [('emailAddress=leaf@example.org', 'excluded')])
+
+    def test_unmatchable_name_type(self):
+        # there are no matchers for registeredID, it can't be shown to be permitted
+        constraints = _constraints(permitted=[('registered_id', '1.2.3.4')])
+        self.assertEqual(_violations(constraints, self.subject, [('registered_id', '1.2.3.4')]),
+                         [('Registered ID: 1.2.3.4', 'not permitted')])
+
+    def test_from_tbs(self):
+        self.assertIsNone(NameConstraints.from_tbs(_tbs(self.subject)))
+        with open(os.path.join(_chain_dir, 'intermediate.pem'), 'rb') as f:
+            tbs = x509.Certificate.load(pem.unarmor(f.read())[2])['tbs_certificate']
+        constraints = NameConstraints.from_tbs(tbs)
+        self.assertTrue(constraints.permitted.matches('dns_name', 'www.example.com'))
+        self.assertTrue(constraints.excluded.matches('dns_name', 'x.bad.example.com'))
+
+    def test_ip_network_masks(self):
+        constraints = _constraints(excluded=[('ip_address', '10.0.0.0/8')])
+        self.assertEqual(_violations(constraints, self.subject, [('ip_address', '10.1.2.3'),
+                                                                 ('ip_address', '11.0.0.1'),
+                                                                 ('ip_address', '::ffff:10.1.2.3')]),
+                         [('IP Address: 10.1.2.3', 'excluded')])
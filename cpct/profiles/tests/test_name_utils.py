@@ -0,0 +1,81 @@
+from asn1crypto import x509
+from django.test import SimpleTestCase
+from fpkilint import name_utils
+from fpkilint.name_utils import get_dn_key, is_same_dn
+from unittest import mock
+
+
+def _value(name_type, value, string_type='utf8_string'):
+    return x509.NameTypeAndValue({'type': name_type, 'value': x509.DirectoryString(name=string_type, value=value)})
+
+
+def _name(*rdns):
+    """
+    :param rdns: RDNs from the root down, each a list of (type, value) or (type, value, string type)
+    """
+    return x509.Name(name='', value=x509.RDNSequence([x509.RelativeDistinguishedName([_value(*v) for v in rdn])
+                                                      for rdn in rdns]))
+
+
+class DNKeyTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(name_utils, '_dn_keys', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertSameDN(self, name, other_name, same=True):
+        self.assertEqual(is_same_dn(name, other_name), same)
+        self.assertEqual(get_dn_key(name) == get_dn_key(other_name), same)
+
+    def test_case_folding(self):
+        self.assertSameDN(_name([('country_name', 'US', 'printable_string')],
+                                [('organization_name', 'U.S. Government')]),
+                          _name([('country_name', 'us', 'printable_string')],
+                                [('organization_name', 'u.s. GOVERNMENT')]))
+
+    def test_whitespace(self):
+        # leading and trailing spaces are dropped and inner runs of spaces count as one
+        self.assertSameDN(_name([('common_name', 'Test  Root   CA')]), _name([('common_name', ' Test Root CA  ')]))
+        self.assertSameDN(_name([('common_name', 'Test Root CA')]), _name([('common_name', 'TestRoot CA')]), False)
+
+    def test_string_types(self):
+        for string_type in ('printable_string', 'bmp_string', 'universal_string', 'teletex_string'):
+            with self.subTest(string_type=string_type):
+                self.assertSameDN(_name([('common_name', 'Test Root', string_type)]),
+                                  _name([('common_name', 'test root', 'utf8_string')]))
+
+    def test_multi_valued_rdn(self):
+        # the values of an RDN are a set, the RDNs themselves are in order
+        first = _name([('country_name', 'US', 'printable_string')],
+                      [('organizational_unit_name', 'PKI'), ('common_name', 'Test')])
+        second = _name([('country_name', 'US', 'printable_string')],
+                       [('common_name', 'test'), ('organizational_unit_name', 'pki')])
+        self.assertSameDN(first, second)
+
+        self.assertSameDN(_name([('organization_name', 'Test')], [('common_name', 'Test')]),
+                          _name([('common_name', 'Test')], [('organization_name', 'Test')]), False)
+        self.assertSameDN(_name([('organization_name', 'Test')], [('common_name', 'Test')]),
+                          _name([('organization_name', 'Test'), ('common_name', 'Test')]), False)
+        # a value is not matched across attribute types
+        self.assertSameDN(_name([('common_name', 'Test')]), _name([('organization_name', 'Test')]), False)
+
+    def test_prefix(self):
+        issuer = _name([('country_name', 'US', 'printable_string')], [('organization_name', 'Test')])
+        subject = _name([('country_name', 'us', 'printable_string')], [('organization_name', 'TEST')],
+                        [('common_name', 'Leaf')])
+        self.assertEqual(get_dn_key(subject).rdns[:2], get_dn_key(issuer).rdns)
+
+    def test_cache(self):
+        name = _name([('common_name', 'Test Root', 'printable_string')])
+        dn_key = get_dn_key(name)
+
+        self.assertIs(get_dn_key(x509.Name.load(name.dump())), dn_key)
+        # a different encoding of the same DN is its own entry, with an equal key
+        other_key = get_dn_key(_name([('common_name', 'test root')]))
+        self.assertIsNot(other_key, dn_key)
+        self.assertEqual(other_key, dn_key)
+        self.assertEqual(len(name_utils._dn_keys), 2)
+
+        with mock.patch.object(name_utils, '_max_dn_keys', 2):
+            self.assertEqual(get_dn_key(_name([('common_name', 'TEST ROOT')])), dn_key)
+        self.assertEqual(len(name_utils._dn_keys), 1)
@@ -0,0 +1,314 @@
+from django.test import SimpleTestCase
+from fpkilint import pcap
+from fpkilint.pcap import PcapError, iter_capture_chains, iter_capture_items, iter_packets
+from unittest import mock
+import io
+import ipaddress
+import os
+import struct
+import tempfile
+
+CERT = b'\x30\x03\x02\x01\x01'
+OTHER_CERT = b'\x30\x03\x02\x01\x02'
+
+CLIENT = ipaddress.ip_address('10.0.0.1').packed
+SERVER = ipaddress.ip_address('10.0.0.2').packed
+CLIENT6 = ipaddress.ip_address('2001:db8::1').packed
+SERVER6 = ipaddress.ip_address('2001:db8::2').packed
+
+_syn = 0x02
+_ack = 0x10
+_fin = 0x01
+
+
+def _tcp(source_port, destination_port, sequence, flags, payload):
+    return struct.pack('>HHIIBBHHH', source_port, destination_port, sequence, 0, 5 << 4, flags, 65535, 0, 0) + payload
+
+
+def _ipv4(source, destination, payload, fragment=0):
+    return struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(payload), 0, fragment, 64, 6, 0, source, destination) + \
+        payload
+
+
+def _ipv6(source, destination, payload):
+    return struct.pack('>IHBB16s16s', 6 << 28, len(payload), 6, 64, source, destination) + payload
+
+
+def _ethernet(ip, vlan=False):
+    ethertype = b'\x86\xdd' if ip[0] >> 4 == 6 else b'\x08\x00'
+    return bytes(6) + bytes(6) + (b'\x81\x00\x00\x05' if vlan else b'') + ethertype + ip
+
+
+def _pcap(packets, linktype=pcap.LINKTYPE_ETHERNET, endian='<'):
+    """
+    :param packets: frames, or (frame, captured length) for packets cut short
+    """
+    data = struct.pack(endian + 'IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, linktype)
+    for number, packet in enumerate(packets):
+        frame, captured_length = packet if isinstance(packet, tuple) else (packet, len(packet))
+        data += struct.pack(endian + 'IIII', 1000 + number, 500000, captured_length, len(frame))
+        data += frame[:captured_length]
+    return data
+
+
+def _pcapng_block(block_type, body):
+    body += bytes(-len(body) % 4)
+    return struct.pack('<II', block_type, 12 + len(body)) + body + struct.pack('<I', 12 + len(body))
+
+
+def _handshake(message_type, body):
+    return bytes([message_type]) + len(body).to_bytes(3, 'big') + body
+
+
+def _records(handshake, size=16384):
+    return b''.join(b'\x16\x03\x03' + len(handshake[i:i + size]).to_bytes(2, 'big') + handshake[i:i + size]
+                    for i in range(0, len(handshake), size))
+
+
+def _server_hello(tls13=False):
+    extensions = struct.pack('>HH', 65281, 1) + b'\x00'
+    if tls13:
+        extensions += struct.pack('>HH', 43, 2) + b'\x03\x04'
+    body = b'\x03\x03' + bytes(32) + b'\x00' + b'\x13\x01' + b'\x00' + len(extensions).to_bytes(2, 'big') + extensions
+    return _handshake(2, body)
+
+
+def _certificate(chain):
+    certificates = b''.join(len(der).to_bytes(3, 'big') + der for der in chain)
+    return _handshake(11, len(certificates).to_bytes(3, 'big') + certificates)
+
+
+def _server_flight(chain, record_size=16384, tls13=False):
+    return _records(_server_hello(tls13) + _certificate(chain) + _handshake(14, b''), record_size)
+
+
+class _Connection:
+    """
+    Packets of one TCP connection, as IP packets.
+    """
+    def __init__(self, client=CLIENT, server=SERVER, client_port=50000, server_sequence=1000):
+        self.ip = _ipv6 if len(client) == 16 else _ipv4
+        self.client = client
+        self.server = server
+        self.client_port = client_port
+        self.client_sequence = 5000
+        self.server_sequence = server_sequence
+
+    def handshake(self):
+        return [self.ip(self.client, self.server, _tcp(self.client_port, 443, self.client_sequence - 1, _syn, b'')),
+                self.ip(self.server, self.client,
+                        _tcp(443, self.client_port, self.server_sequence - 1 & 0xFFFFFFFF, _syn | _ack, b''))]
+
+    def from_client(self, payload):
+        packet = self.ip(self.client, self.server, _tcp(self.client_port, 443, self.client_sequence, _ack, payload))
+        self.client_sequence += len(payload)
+        return packet
+
+    def server_segment(self, payload, offset=0, flags=_ack):
+        sequence = self.server_sequence + offset & 0xFFFFFFFF
+        return self.ip(self.server, self.client, _tcp(443, self.client_port, sequence, flags, payload))
+
+    def from_server(self, payload, size=1400):
+        return [self.server_segment(payload[i:i + size], i) for i in range(0, len(payload), size)]
+
+    def connection(self, chain, size=1400):
+        return self.handshake() + [self.from_client(_records(_handshake(1, bytes(40))))] + \
+            self.from_server(_server_flight(chain), size)
+
+
+def _chains(data):
+    return list(iter_capture_chains(io.BytesIO(data)))
+
+
+class CaptureTests(SimpleTestCase):
+    def assertCaptureChains(self, data, chains):
+        results = _chains(data)
+        self.assertEqual([chain for timestamp, server, client, chain in results], chains)
+        return results
+
+    def assertChains(self, packets, chains):
+        return self.assertCaptureChains(_pcap([_ethernet(ip) for ip in packets]), chains)
+
+    def test_chain(self):
+        results = self.assertChains(_Connection().connection([CERT, OTHER_CERT]), [[CERT, OTHER_CERT]])
+        timestamp, server, client, chain = results[0]
+        self.assertEqual((server, client), ('10.0.0.2:443', '10.0.0.1:50000'))
+        self.assertEqual(timestamp, 1003.5)
+
+    def test_split_records_and_segments(self):
+        connection = _Connection()
+        packets = connection.handshake() + connection.from_server(_server_flight([CERT, OTHER_CERT], record_size=3), 7)
+        self.assertChains(packets, [[CERT, OTHER_CERT]])
+
+    def test_out_of_order_and_retransmitted(self):
+        connection = _Connection()
+        flight = _server_flight([CERT, OTHER_CERT])
+        segments = connection.from_server(flight, 10)
+        # reversed, with a retransmission that overlaps the data already read
+        packets = connection.handshake() + segments[:2] + [connection.server_segment(flight[5:25], 5)] + \
+            segments[2:][::-1] + segments
+        self.assertChains(packets, [[CERT, OTHER_CERT]])
+
+    def test_sequence_wraparound(self):
+        connection = _Connection(server_sequence=0xFFFFFFFF - 40)
+        self.assertChains(connection.connection([CERT], size=16), [[CERT]])
+
+    def test_capture_started_mid_connection(self):
+        connection = _Connection()
+        self.assertChains(connection.from_server(_server_flight([CERT]), 20), [[CERT]])
+
+    def test_two_connections_interleaved(self):
+        first = _Connection().connection([CERT], 20)
+        second = _Connection(client_port=50001).connection([OTHER_CERT], 20)
+        packets = [packet for pair in zip(first, second) for packet in pair]
+        results = self.assertChains(packets, [[CERT], [OTHER_CERT]])
+        self.assertEqual([client for timestamp, server, client, chain in results],
+                         ['10.0.0.1:50000', '10.0.0.1:50001'])
+
+    def test_no_chain(self):
+        connection = _Connection()
+        flights = {'tls 1.3': _server_flight([CERT], tls13=True),
+                   'not tls': b'HTTP/1.1 200 OK\r\n\r\n' + _server_flight([CERT]),
+                   'tls 1.0 alert': b'\x15\x03\x01\x00\x02\x02\x28'}
+        for name, flight in flights.items():
+            with self.subTest(name=name):
+                self.assertChains(connection.handshake() + connection.from_server(flight), [])
+
+    def test_client_certificates_left_out(self):
+        connection = _Connection()
+        client_flight = _records(_handshake(1, bytes(40)) + _certificate([CERT]))
+        self.assertChains(connection.handshake() + [connection.from_client(client_flight)], [])
+
+    def test_bad_certificate_message(self):
+        connection = _Connection()
+        flight = _records(_server_hello() + _handshake(11, b'\x00\x00\x10\x00\x00\x05' + CERT))
+        self.assertChains(connection.handshake() + connection.from_server(flight) + connection.connection([CERT])[2:],
+                          [])
+
+    def test_packets_cut_short(self):
+        # the missing bytes leave a hole in the stream
+        connection = _Connection()
+        segments = [_ethernet(ip) for ip in connection.from_server(_server_flight([CERT]), 10)]
+        packets = segments[:2] + [(segments[2], len(segments[2]) - 5)] + segments[3:]
+        self.assertCaptureChains(_pcap(packets), [])
+
+        # until it is retransmitted
+        self.assertCaptureChains(_pcap(packets + [segments[2]]), [[CERT]])
+
+    def test_stream_ends(self):
+        connection = _Connection()
+        segments = connection.from_server(_server_flight([CERT]), 10)
+        fin = connection.server_segment(b'', 10, _ack | _fin)
+        # the stream starts over after the FIN, at what is now its first segment
+        self.assertChains(segments[:1] + [fin] + segments[1:], [])
+
+    def test_fragments_and_other_protocols(self):
+        connection = _Connection()
+        packets = [_ipv4(SERVER, CLIENT, packet[20:], fragment=0x2000) for packet in connection.from_server(
+            _server_flight([CERT]), 10)]
+        udp = bytearray(connection.from_server(_server_flight([CERT]))[0])
+        udp[9] = 17
+        self.assertChains(packets + [bytes(udp)], [])
+
+    def test_segmentation_offload(self):
+        # a capture taken before the NIC splits up a large segment has 0 for the IPv4 total length
+        packets = [ip[:2] + b'\x00\x00' + ip[4:] for ip in _Connection().connection([CERT, OTHER_CERT], size=4000)]
+        self.assertChains(packets, [[CERT, OTHER_CERT]])
+
+    def test_ipv6(self):
+        results = self.assertChains(_Connection(CLIENT6, SERVER6).connection([CERT]), [[CERT]])
+        self.assertEqual(results[0][1:3], ('[2001:db8::2]:443', '[2001:db8::1]:50000'))
+
+    def test_link_types(self):
+        packets = _Connection().connection([CERT])
+        frames = {
+            'vlan': (pcap.LINKTYPE_ETHERNET, [_ethernet(ip, vlan=True) for ip in packets]),
+            'raw': (pcap.LINKTYPE_RAW, packets),
+            'ipv4': (pcap.LINKTYPE_IPV4, packets),
+            'sll': (pcap.LINKTYPE_LINUX_SLL, [bytes(14) + b'\x08\x00' + ip for ip in packets]),
+            'sll2': (pcap.LINKTYPE_LINUX_SLL2, [b'\x08\x00' + bytes(18) + ip for ip in packets]),
+            'null': (pcap.LINKTYPE_NULL, [b'\x02\x00\x00\x00' + ip for ip in packets]),
+        }
+        for name, (linktype, frames) in frames.items():
+            with self.subTest(name=name):
+                self.assertCaptureChains(_pcap(frames, linktype), [[CERT]])
+
+    def test_big_endian_pcap(self):
+        self.assertCaptureChains(_pcap([_ethernet(ip) for ip in _Connection().connection([CERT])], endian='>'),
+                                 [[CERT]])
+
+    def test_pcapng(self):
+        packets = [_ethernet(ip) for ip in _Connection().connection([CERT])]
+        tsresol = struct.pack('<HHB3x', 9, 1, 9) + struct.pack('<HH', 0, 0)
+        data = _pcapng_block(0x0A0D0D0A, struct.pack('<IHHq', 0x1A2B3C4D, 1, 0, -1))
+        data += _pcapng_block(1, struct.pack('<HHI', pcap.LINKTYPE_ETHERNET, 0, 65535) + tsresol)
+        # statistics, skipped
+        data += _pcapng_block(5, bytes(20))
+        timestamp = 1500000000123456789
+        for frame in packets[:-1]:
+            data += _pcapng_block(6, struct.pack('<IIIII', 0, timestamp >> 32, timestamp & 0xFFFFFFFF, len(frame),
+                                                 len(frame)) + frame)
+        data += _pcapng_block(3, struct.pack('<I', len(packets[-1])) + packets[-1])
+
+        results = _chains(data)
+        self.assertEqual([chain for timestamp, server, client, chain in results], [[CERT]])
+        self.assertIsNone(results[0][0])
+
+        results = _chains(data[:-len(_pcapng_block(3, struct.pack('<I', len(packets[-1])) + packets[-1]))] +
+                          _pcapng_block(6, struct.pack('<IIIII', 0, timestamp >> 32, timestamp & 0xFFFFFFFF,
+                                                       len(packets[-1]), len(packets[-1])) + packets[-1]))
+        self.assertAlmostEqual(results[0][0], 1500000000.123456789, places=6)
+
+    def test_bad_captures(self):
+        capture = _pcap([_ethernet(ip) for ip in _Connection().connection([CERT])])
+        record_too_big = _pcap([]) + struct.pack('<IIII', 0, 0, pcap._max_packet_size + 1, 0)
+        section = _pcapng_block(0x0A0D0D0A, struct.pack('<IHHq', 0x1A2B3C4D, 1, 0, -1))
+        short_section = struct.pack('<II', 0x0A0D0D0A, 8) + struct.pack('<I', 0x1A2B3C4D) + bytes(16)
+        huge_block = section + struct.pack('<II', 5, pcap._max_block_length + 4) + bytes(100)
+        for data, message in ((b'', 'Truncated capture'), (b'GIF89a', 'Not a pcap or pcapng file'),
+                              (capture[:-1], 'Truncated capture'), (capture[:30], 'Truncated capture'),
+                              (record_too_big, 'the capture is corrupt'),
+                              (section + _pcapng_block(6, bytes(20)), 'undescribed interface'),
+                              (short_section, 'Bad pcapng block length 8'),
+                              (section + struct.pack('<II', 6, 4) + bytes(20), 'Bad pcapng block length 4'),
+                              (huge_block, 'Bad pcapng block length')):
+            with self.subTest(message=message, size=len(data)):
+                with self.assertRaisesRegex(PcapError, message):
+                    list(_chains(data))
+
+    def test_packets(self):
+        packets = list(iter_packets(io.BytesIO(_pcap([b'one', (b'two', 2)], linktype=pcap.LINKTYPE_RAW))))
+        self.assertEqual(packets, [(1000.5, pcap.LINKTYPE_RAW, b'one', False), (1001.5, pcap.LINKTYPE_RAW, b'tw', True)])
+
+
+class CaptureItemTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'capture.pcap')
+        packets = _Connection().connection([CERT, OTHER_CERT]) + \
+            _Connection(client_port=50001).connection([OTHER_CERT, CERT])
+        with open(self.path, 'wb') as f:
+            f.write(_pcap([_ethernet(ip) for ip in packets]))
+
+    def test_items(self):
+        path = self.path
+        bad_path = os.path.join(os.path.dirname(path), 'bad.pcap')
+        with open(bad_path, 'wb') as f:
+            f.write(b'GIF89a')
+
+        items = list(iter_capture_items([path, path, bad_path]))
+
+        # each certificate is linted once, where it was first seen
+        self.assertEqual([(item.source, item.der) for item in items], [(path, CERT), (path, OTHER_CERT),
+                                                                       (bad_path, None)])
+        self.assertEqual(items[1].metadata, {'server': '10.0.0.2:443', 'client': '10.0.0.1:50000',
+                                             'chain_position': 1, 'timestamp': items[0].metadata['timestamp']})
+        self.assertEqual(items[2].error, 'Not a pcap or pcapng file')
+
+    def test_seen_certificates_are_bounded(self):
+        # only the most recently seen certificate is remembered, so CERT is linted again in the second connection
+        with mock.patch.object(pcap, '_max_seen_certificates', 1):
+            items = list(iter_capture_items([self.path]))
+        self.assertEqual([(item.der, item.metadata['client']) for item in items],
+                         [(CERT, '10.0.0.1:50000'), (OTHER_CERT, '10.0.0.1:50000'), (CERT, '10.0.0.1:50001')])
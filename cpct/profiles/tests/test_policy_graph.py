@@ -0,0 +1,126 @@
+from django.test import SimpleTestCase
+from fpkilint.policy_graph import PolicyInfo, any_policy, process_policies
+
+P1 = '2.16.840.1.101.3.2.1.3.1'
+P2 = '2.16.840.1.101.3.2.1.3.2'
+P9 = '2.16.840.1.101.3.2.1.48.9'
+
+
+def _info(policies=(), mappings=(), require_explicit_policy=None, inhibit_policy_mapping=None,
+          inhibit_any_policy=None, self_issued=False):
+    return PolicyInfo(None if policies is None else tuple(policies), tuple(mappings), require_explicit_policy,
+                      inhibit_policy_mapping, inhibit_any_policy, self_issued)
+
+
+class UserConstrainedTests(SimpleTestCase):
+    # authorities-constrained {P1, anyPolicy}: the CA and the end entity assert both
+    path = [_info([P1, any_policy]), _info([P1, any_policy])]
+
+    def test_authorities_constrained(self):
+        result = process_policies(self.path)
+        self.assertEqual(result.authorities_constrained, {P1, any_policy})
+        self.assertEqual(result.user_constrained, {P1, any_policy})
+
+    def test_any_policy_gives_the_user_set(self):
+        self.assertEqual(process_policies(self.path, user_initial_policy_set=[P2]).user_constrained, {P2})
+        self.assertEqual(process_policies(self.path, user_initial_policy_set=[P1]).user_constrained, {P1})
+        self.assertEqual(process_policies(self.path, user_initial_policy_set=[P1, P2]).user_constrained,
+                         {P1, P2})
+
+    def test_intersection_without_any_policy(self):
+        path = [_info([P1, P2]), _info([P1])]
+        self.assertEqual(process_policies(path, user_initial_policy_set=[P1, P9]).user_constrained, {P1})
+        self.assertEqual(process_policies(path, user_initial_policy_set=[P2]).user_constrained, set())
+
+
+class PolicyMappingTests(SimpleTestCase):
+    # a bridge maps its P1 to the subject domain's P9, the end entity asserts P9
+    path = [_info([P1], mappings=[(P1, P9)]), _info([P9])]
+
+    def test_mapping(self):
+        result = process_policies(self.path)
+        self.assertIsNone(result.error)
+        self.assertEqual(result.authorities_constrained, {P1})
+        self.assertEqual(process_policies(self.path, user_initial_policy_set=[P9]).user_constrained, set())
+
+    def test_mapping_to_several_policies(self):
+        path = [_info([P1], mappings=[(P1, P9), (P1, P2)]), _info([P2])]
+        self.assertEqual(process_policies(path).authorities_constrained, {P1})
+
+    def test_mapping_any_policy_is_an_error(self):
+        path = [_info([any_policy], mappings=[(any_policy, P9)]), _info([P9])]
+        self.assertIn("maps anyPolicy", process_policies(path).error)
+
+    def test_initial_policy_mapping_inhibit(self):
+        result = process_policies(self.path, initial_policy_mapping_inhibit=True)
+        self.assertEqual(result.authorities_constrained, set())
+
+    def test_inhibit_policy_mapping_zero(self):
+        path = [_info([P1], inhibit_policy_mapping=0)] + self.path
+        self.assertEqual(process_policies(path).authorities_constrained, set())
+
+    def test_inhibit_policy_mapping_skips_certificates(self):
+        # one more certificate may still map
+        path = [_info([P1], inhibit_policy_mapping=1)] + self.path
+        self.assertEqual(process_policies(path).authorities_constrained, {P1})
+
+        path = [_info([P1], inhibit_policy_mapping=1), _info([P1])] + self.path
+        self.assertEqual(process_policies(path).authorities_constrained, set())
+
+
+class ExplicitPolicyTests(SimpleTestCase):
+    def test_no_policies_allowed_without_require_explicit_policy(self):
+        result = process_policies([_info([P1]), _info(None)])
+        self.assertIsNone(result.error)
+        self.assertFalse(result.explicit_policy_required)
+        self.assertEqual(result.authorities_constrained, set())
+
+    def test_require_explicit_policy(self):
+        result = process_policies([_info([P1], require_explicit_policy=0), _info(None)])
+        self.assertTrue(result.explicit_policy_required)
+        self.assertIn("explicit policy is required", result.error)
+
+    def test_require_explicit_policy_with_unacceptable_policy(self):
+        path = [_info([P1], require_explicit_policy=0), _info([P1])]
+        self.assertIsNone(process_policies(path).error)
+        result = process_policies(path, user_initial_policy_set=[P2])
+        self.assertIn("not valid for any acceptable policy", result.error)
+
+    def test_require_explicit_policy_skips_certificates(self):
+        # the end entity is the second certificate after the one that requires it
+        path = [_info([P1], require_explicit_policy=3), _info([P1]), _info(None)]
+        self.assertFalse(process_policies(path).explicit_policy_required)
+
+        path = [_info([P1], require_explicit_policy=2), _info([P1]), _info(None)]
+        self.assertTrue(process_policies(path).explicit_policy_required)
+
+    def test_initial_explicit_policy(self):
+        result = process_policies([_info(None)], initial_explicit_policy=True)
+        self.assertTrue(result.explicit_policy_required)
+        self.assertIsNotNone(result.error)
+
+
+class AnyPolicyTests(SimpleTestCase):
+    def test_inhibit_any_policy(self):
+        path = [_info([P1], inhibit_any_policy=0), _info([any_policy]), _info([P1])]
+        self.assertEqual(process_policies(path).authorities_constrained, set())
+
+    def test_any_policy_in_self_issued_intermediate(self):
+        # RFC 5280 6.1.3 (d)(2): anyPolicy still counts in a self-issued intermediate, e.g. a key rollover
+        path = [_info([P1], inhibit_any_policy=0), _info([any_policy], self_issued=True), _info([P1])]
+        result = process_policies(path)
+        self.assertEqual(result.authorities_constrained, {P1})
+        self.assertEqual(result.user_constrained, {P1})
+
+    def test_any_policy_in_self_issued_end_entity(self):
+        path = [_info([P1], inhibit_any_policy=0), _info([any_policy], self_issued=True)]
+        self.assertEqual(process_policies(path).authorities_constrained, set())
+
+    def test_self_issued_does_not_count_against_skip_certs(self):
+        path = [_info([P1], inhibit_any_policy=1), _info([P1], self_issued=True), _info([any_policy]),
+                _info([P1])]
+        self.assertEqual(process_policies(path).authorities_constrained, {P1})
+
+    def test_initial_any_policy_inhibit(self):
+        result = process_policies([_info([any_policy])], initial_any_policy_inhibit=True)
+        self.assertEqual(result.authorities_constrained, set())
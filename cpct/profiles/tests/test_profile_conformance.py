@@ -0,0 +1,164 @@
+from asn1crypto import pem, x509
+from django.test import SimpleTestCase
+from fpkilint.cert_utils import get_5280_method_1_key_id, parse_certificate_or_tbs, parse_tbs_certificate
+from fpkilint.html_output import load_all_profiles
+from fpkilint.profile_conformance import _with_option_value, check_cert_conformance, compile_profile, \
+    is_cert_profile, iter_cert_conformance, lint_skid
+from fpkilint.strapdown_output import process_add_certificate
+from collections import OrderedDict
+import io
+import json
+import os
+import tempfile
+
+_testdata_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata')
+
+_template = 'fbca/1.9/5-ee-signature.json'
+
+
+def _load(*path):
+    with open(os.path.join(_testdata_dir, *path), 'rb') as f:
+        data = f.read()
+    if pem.detect(data):
+        data = pem.unarmor(data)[2]
+    return x509.Certificate.load(data)
+
+
+def _rows(cert, cert_profile):
+    return [(r.config_section, r.extension_oid, r.row_name, r.content, r.analysis, r.findings,
+             r.extension_is_critical) for r in iter_cert_conformance(cert, cert_profile)]
+
+
+def _row(cert, cert_profile, config_section):
+    row, = [r for r in iter_cert_conformance(cert, cert_profile) if r.config_section == config_section]
+    return row
+
+
+def _with_skid(cert, key_id):
+    extensions = [extension for extension in cert['tbs_certificate']['extensions']
+                  if extension['extn_id'].native != 'key_identifier']
+    extensions.append({'extn_id': 'key_identifier', 'critical': False, 'extn_value': key_id})
+    return _with_extensions(cert, extensions)
+
+
+def _with_extensions(cert, extensions):
+    tbs = cert['tbs_certificate'].copy()
+    tbs['extensions'] = extensions
+    return x509.Certificate.load(x509.Certificate({'tbs_certificate': tbs,
+                                                   'signature_algorithm': cert['signature_algorithm'],
+                                                   'signature_value': cert['signature_value']}).dump(force=True))
+
+
+class TbsCertificateTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.certs = {name: _load('chain', name + '.pem') for name in ('root', 'intermediate', 'leaf', 'leaf_sub_ca')}
+        cls.certs['binary'] = _load('certs', 'parse_cert_binary.cer')
+        cls.profiles = {template: compile_profile(json_profile)
+                        for template, json_profile in load_all_profiles().items() if is_cert_profile(json_profile)}
+
+    def test_rows_match(self):
+        for name, cert in self.certs.items():
+            for template, cert_profile in self.profiles.items():
+                with self.subTest(cert=name, template=template):
+                    self.assertEqual(_rows(cert['tbs_certificate'], cert_profile), _rows(cert, cert_profile))
+
+    def test_parse(self):
+        cert = self.certs['leaf']
+        tbs_der = cert['tbs_certificate'].dump()
+        self.assertIsInstance(parse_certificate_or_tbs(cert.dump()), x509.Certificate)
+        self.assertIsInstance(parse_certificate_or_tbs(tbs_der), x509.TbsCertificate)
+        self.assertEqual(parse_tbs_certificate(cert.dump()).dump(), tbs_der)
+        self.assertEqual(parse_tbs_certificate(tbs_der).dump(), tbs_der)
+
+    def test_signature_algorithm(self):
+        cert = self.certs['leaf']
+        cert_profile = self.profiles[_template]
+        row = _row(cert['tbs_certificate'], cert_profile, 'signature_algorithm')
+        self.assertEqual(row.content, 'sha256-ecdsa (1.2.840.10045.4.3.2)')
+
+        # signed with something other than what the tbs certificate says
+        mismatched = x509.Certificate.load(cert.dump())
+        mismatched['signature_algorithm'] = {'algorithm': 'sha384_ecdsa'}
+        mismatched = x509.Certificate.load(mismatched.dump(force=True))
+        findings = _row(mismatched, cert_profile, 'signature_algorithm').findings
+        self.assertTrue(any('does not match TBSCertificate::signature (1.2.840.10045.4.3.2)' in message
+                            for severity, message in findings))
+        # a tbs certificate has no outer algorithm to compare
+        self.assertEqual(_row(mismatched['tbs_certificate'], cert_profile, 'signature_algorithm').findings,
+                         row.findings)
+
+    def test_key_identifiers(self):
+        cert_profile = self.profiles[_template]
+        for name, cert in self.certs.items():
+            with self.subTest(cert=name):
+                tbs = cert['tbs_certificate']
+                self.assertEqual(get_5280_method_1_key_id(tbs), get_5280_method_1_key_id(cert))
+                self.assertEqual(get_5280_method_1_key_id(tbs), tbs['subject_public_key_info'].sha1)
+                for config_section in ('skid', 'akid'):
+                    self.assertEqual(_row(tbs, cert_profile, config_section).content,
+                                     _row(cert, cert_profile, config_section).content)
+
+        leaf = self.certs['leaf']
+        self.assertEqual(_row(leaf['tbs_certificate'], cert_profile, 'skid').content,
+                         'Key ID: ' + leaf.key_identifier.hex().upper())
+        self.assertEqual(_row(leaf['tbs_certificate'], cert_profile, 'akid').content,
+                         'Key ID: ' + leaf.authority_key_identifier.hex().upper())
+
+    def test_skid_method_one(self):
+        config_options = _with_option_value(self.profiles[_template]['skid'], 'require_method_one', '1')
+        cert = self.certs['leaf']
+        expected = get_5280_method_1_key_id(cert)
+
+        for key_id, errors in ((expected, []), (bytes(20), ['Was not generated using RFC5280 method 1'])):
+            changed = _with_skid(cert, key_id)
+            for item in (changed, changed['tbs_certificate']):
+                with self.subTest(key_id=key_id.hex(), type=type(item).__name__):
+                    findings = lint_skid(config_options, item).findings
+                    self.assertEqual(len(findings), 2 * len(errors))
+                    for error in errors:
+                        self.assertIn(error, findings[0][1])
+                        self.assertIn(expected.hex().upper(), findings[1][1])
+
+
+class CheckConformanceTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        leaf = _load('chain', 'leaf.pem')
+        # an extension the profile doesn't know
+        cls.cert = _with_extensions(leaf, list(leaf['tbs_certificate']['extensions']) + [
+            {'extn_id': '1.3.6.1.4.1.99999.1', 'critical': False, 'extn_value': b'\x05\x00'}])
+        cls.json_profile = load_all_profiles()[_template]
+
+    def test_rows(self):
+        output_rows, other_extensions_rows, profile_info = check_cert_conformance(self.cert, self.json_profile)
+        rows = list(iter_cert_conformance(self.cert, self.json_profile))
+
+        self.assertIsInstance(other_extensions_rows, OrderedDict)
+        self.assertEqual(list(other_extensions_rows), ['1.3.6.1.4.1.99999.1'])
+        self.assertEqual([(r.row_name, r.content, r.analysis) for r in output_rows.values()] +
+                         [(r.row_name, r.content, r.analysis) for r in other_extensions_rows.values()],
+                         [(r.row_name, r.content, r.analysis) for r in rows])
+        self.assertEqual(list(output_rows), [r.config_section for r in rows if r.config_section != 'other_extensions'])
+        self.assertIn('cert_type', profile_info)
+
+    def test_no_other_extensions(self):
+        # callers tell a profile without these sections apart by None
+        json_profile = [entry for entry in self.json_profile if entry['Section'] not in ('other_extensions', 'profile')]
+        output_rows, other_extensions_rows, profile_info = check_cert_conformance(self.cert, json_profile)
+        self.assertTrue(output_rows)
+        self.assertIsNone(other_extensions_rows)
+        self.assertIsNone(profile_info)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            profile_file = os.path.join(temp_dir, 'profile.json')
+            for profile in (self.json_profile, json_profile):
+                with self.subTest(other_extensions=profile is self.json_profile):
+                    with open(profile_file, 'w') as f:
+                        json.dump(profile, f)
+                    output_file = io.StringIO()
+                    process_add_certificate(self.cert, profile_file, output_file)
+                    self.assertIn('| **Key Usage** ', output_file.getvalue())
+                    self.assertEqual('1.3.6.1.4.1.99999.1' in output_file.getvalue(), profile is self.json_profile)
@@ -0,0 +1,95 @@
+from asn1crypto import x509
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from fpkilint import html_output
+from fpkilint.html_output import iter_analyze_certificate
+from prometheus_client import REGISTRY
+from profiles import result_cache
+from profiles.result_cache import get_cached_result, get_result_id, get_sha256, store_result
+from unittest import mock
+import os
+
+_certs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'certs')
+
+_template = 'fbca/1.9/5-ee-signature.json'
+# profile, version and cert type of _template in profiles.json
+_form = {'profile': '1', 'version': '0', 'type': '3'}
+
+_locmem_caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                              'LOCATION': 'test-result-cache'}}
+
+
+def _lookups(result):
+    return REGISTRY.get_sample_value('cpct_result_cache_requests_total', {'result': result}) or 0
+
+
+@override_settings(CACHES=_locmem_caches,
+                   STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class LookupResultTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(os.path.join(_certs_dir, 'parse_cert_binary.cer'), 'rb') as f:
+            cls.der = f.read()
+        cls.sha256 = get_sha256(cls.der)
+        header, *rows = iter_analyze_certificate(x509.Certificate.load(cls.der), _template)
+        cls.result = dict(header, rows=rows)
+
+    def setUp(self):
+        cache.clear()
+
+    def lookup(self, sha256, **fields):
+        with self.assertLogs('cpct.timing'):
+            return self.client.post('/lookup/', dict(_form, sha256=sha256, **fields))
+
+    def test_result_id(self):
+        result_id = get_result_id(self.sha256, _template)
+        self.assertTrue(result_cache.is_sha256(result_id))
+        self.assertNotEqual(get_result_id(self.sha256, 'fbca/1.9/6-ee-key-management.json'), result_id)
+
+        # stored results are not used by a newer linter, or after the profile was edited
+        with mock.patch.object(result_cache, '_result_version', result_cache._result_version + 1):
+            self.assertNotEqual(get_result_id(self.sha256, _template), result_id)
+        with mock.patch.dict(html_output._profile_digests, {_template: '0' * 64}):
+            self.assertNotEqual(get_result_id(self.sha256, _template), result_id)
+        self.assertEqual(get_result_id(self.sha256, _template), result_id)
+
+    def test_hit(self):
+        store_result(self.sha256, _template, self.result)
+        hits = _lookups('hit')
+
+        # the upload page hashes the file in the browser, upper or lower case
+        for sha256 in (self.sha256, self.sha256.upper()):
+            with self.subTest(sha256=sha256):
+                response = self.lookup(sha256)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'id="result-table"')
+                self.assertContains(response, get_result_id(self.sha256, _template))
+
+        self.assertEqual(_lookups('hit'), hits + 2)
+
+    def test_miss(self):
+        store_result(self.sha256, _template, self.result)
+        misses = _lookups('miss')
+
+        # another certificate, or the same one against another profile
+        self.assertEqual(self.lookup('0' * 64).status_code, 204)
+        self.assertEqual(self.lookup(self.sha256, type='4').status_code, 204)
+        self.assertEqual(_lookups('miss'), misses + 2)
+
+    def test_malformed(self):
+        store_result(self.sha256, _template, self.result)
+        lookups = _lookups('hit') + _lookups('miss')
+
+        for sha256 in (self.sha256[:63], self.sha256 + '0', 'g' * 64, self.sha256[:62] + '\n0', ''):
+            with self.subTest(sha256=sha256):
+                self.assertEqual(self.lookup(sha256).status_code, 204)
+        self.assertEqual(self.lookup(self.sha256, profile='99').status_code, 204)
+        self.assertIsNone(get_cached_result('g' * 64, _template))
+
+        # they are not lookups
+        self.assertEqual(_lookups('hit') + _lookups('miss'), lookups)
+
+        with self.assertLogs('cpct.timing'):
+            response = self.client.get('/lookup/')
+        self.assertContains(response, 'Invalid Request')
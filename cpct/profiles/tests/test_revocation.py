@@ -0,0 +1,262 @@
+from asn1crypto import crl, pem, x509
+from django.test import SimpleTestCase
+from fpkilint.name_utils import get_dn_key
+from fpkilint.revocation import RevocationIndex, RevocationIndexError, RevocationStatus, _get_serial_key, \
+    _get_serial_width, summarize_crl, update_index
+from datetime import datetime, timedelta, timezone
+import os
+import random
+import tempfile
+
+_chain_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'chain')
+
+ISSUER = x509.Name.build({'country_name': 'US', 'organization_name': 'Test', 'common_name': 'Test Root'})
+OTHER_ISSUER = x509.Name.build({'country_name': 'US', 'organization_name': 'Test', 'common_name': 'Other CA'})
+
+THIS_UPDATE = datetime(2026, 10, 1, tzinfo=timezone.utc)
+REVOKED = datetime(2026, 9, 30, 12, 30, tzinfo=timezone.utc)
+
+
+def _extension(extn_id, value, critical=False):
+    return {'extn_id': extn_id, 'critical': critical, 'extn_value': value}
+
+
+def _entry(serial, reason=None, certificate_issuer=None):
+    extensions = []
+    if reason is not None:
+        extensions.append(_extension('crl_reason', reason))
+    if certificate_issuer is not None:
+        extensions.append(_extension('certificate_issuer', [x509.GeneralName(name='dns_name', value='example.com'),
+                                                            x509.GeneralName(name='directory_name',
+                                                                             value=certificate_issuer)], True))
+
+    return {'user_certificate': serial, 'revocation_date': x509.Time(name='utc_time', value=REVOKED),
+            'crl_entry_extensions': extensions or None}
+
+
+def _crl(entries, crl_number=None, base_crl_number=None, this_update=THIS_UPDATE, issuer=ISSUER, idp=None):
+    crl_extensions = []
+    if crl_number is not None:
+        crl_extensions.append(_extension('crl_number', crl_number))
+    if base_crl_number is not None:
+        crl_extensions.append(_extension('delta_crl_indicator', base_crl_number, True))
+    if idp is not None:
+        crl_extensions.append(_extension('issuing_distribution_point', idp, True))
+
+    tbs = {
+        'version': 'v2',
+        'signature': {'algorithm': 'sha256_ecdsa'},
+        'issuer': issuer,
+        'this_update': x509.Time(name='utc_time', value=this_update),
+        'next_update': x509.Time(name='utc_time', value=this_update + timedelta(days=7)),
+        'revoked_certificates': entries or None,
+        'crl_extensions': crl_extensions or None,
+    }
+
+    return crl.CertificateList({'tbs_cert_list': tbs, 'signature_algorithm': {'algorithm': 'sha256_ecdsa'},
+                                'signature': b'\x30\x06\x02\x01\x01\x02\x01\x01'})
+
+
+class SerialKeyTests(SimpleTestCase):
+    def test_widths(self):
+        for serial_number, width in ((0, 1), (127, 1), (128, 2), (-128, 1), (-129, 2), (2 ** 159, 21)):
+            with self.subTest(serial_number=serial_number):
+                self.assertEqual(_get_serial_width(serial_number), width)
+
+    def test_keys_sort_like_the_numbers(self):
+        rng = random.Random(1)
+        serial_numbers = [0, 1, -1, 127, -128, 255, 2 ** 63, -2 ** 63] + \
+            [rng.randrange(-2 ** 159, 2 ** 159) for i in range(100)]
+        width = max(_get_serial_width(serial_number) for serial_number in serial_numbers)
+        self.assertEqual(sorted(serial_numbers, key=lambda serial_number: _get_serial_key(serial_number, width)),
+                         sorted(serial_numbers))
+
+
+class SummarizeTests(SimpleTestCase):
+    def test_summary(self):
+        summary = summarize_crl(_crl([], 7))
+        self.assertEqual((summary.crl_number, summary.base_crl_number, summary.this_update, summary.next_update),
+                         (7, None, '20261001000000', '20261008000000'))
+        self.assertEqual(summary.issuer, get_dn_key(ISSUER).digest.hex())
+
+        delta = summarize_crl(_crl([], 8, 7))
+        self.assertEqual((delta.crl_id, delta.base_crl_number), (summary.crl_id, 7))
+
+        # another distribution point is another CRL
+        partition = summarize_crl(_crl([], 7, idp={'only_contains_ca_certs': True}))
+        self.assertNotEqual(partition.crl_id, summary.crl_id)
+        self.assertEqual(partition.issuer, summary.issuer)
+
+
+class RevocationIndexTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.index_path = os.path.join(self.directory, 'test.crlidx')
+        self.issuer = get_dn_key(ISSUER).digest
+        self.messages = []
+
+    def write(self, name, certificate_list, armor=False):
+        path = os.path.join(self.directory, name)
+        der = certificate_list.dump()
+        with open(path, 'wb') as f:
+            f.write(pem.armor('X509 CRL', der) if armor else der)
+        return path
+
+    def update(self, *paths):
+        counts = update_index(self.index_path, paths, self.messages.append)
+        return {name: count for name, count in counts.items() if count}
+
+    def lookup(self, *serial_numbers, issuer=None):
+        with RevocationIndex(self.index_path) as index:
+            return [index.lookup(issuer or self.issuer, serial_number) for serial_number in serial_numbers]
+
+    def statuses(self, *serial_numbers, issuer=None):
+        return [status.status for status in self.lookup(*serial_numbers, issuer=issuer)]
+
+    def test_complete_crl(self):
+        path = self.write('base.crl', _crl([_entry(5, 'key_compromise'), _entry(-3), _entry(2 ** 152 + 1),
+                                            _entry(9, 'remove_from_crl')], 1), armor=True)
+        self.assertEqual(self.update(path), {'complete': 1})
+
+        self.assertEqual(self.lookup(5, -3), [
+            RevocationStatus('revoked', 'key_compromise', '2026-09-30T12:30:00Z', '2026-10-01T00:00:00Z'),
+            RevocationStatus('revoked', None, '2026-09-30T12:30:00Z', '2026-10-01T00:00:00Z'),
+        ])
+        # removeFromCRL on a complete CRL is not a revocation, and 4 is shorter than the widest serial number
+        self.assertEqual(self.statuses(2 ** 152 + 1, 9, 4, 2 ** 200), ['revoked', 'not_revoked', 'not_revoked',
+                                                                      'not_revoked'])
+        self.assertEqual(self.lookup(4)[0].this_update, '2026-10-01T00:00:00Z')
+        self.assertEqual(self.statuses(5, issuer=get_dn_key(OTHER_ISSUER).digest), ['unknown'])
+
+    def test_empty_crl(self):
+        self.update(self.write('base.crl', _crl([], 1)))
+        self.assertEqual(self.statuses(0, 5, -1), ['not_revoked'] * 3)
+
+    def test_newer_complete_crl(self):
+        first = self.write('1.crl', _crl([_entry(1), _entry(2)], 1))
+        second = self.write('2.crl', _crl([_entry(2), _entry(3)], 2, this_update=THIS_UPDATE + timedelta(days=1)))
+
+        # given in any order, they are applied oldest first
+        self.assertEqual(self.update(second, first), {'complete': 2})
+        self.assertEqual(self.statuses(1, 2, 3), ['not_revoked', 'revoked', 'revoked'])
+        self.assertEqual(self.update(first, second), {'unchanged': 2})
+
+        older = self.write('1b.crl', _crl([_entry(1)], 1))
+        self.assertEqual(self.update(older), {'older': 1})
+        self.assertEqual(self.messages, ['{}: CRL number 1 is not newer than the index'.format(older)])
+        self.assertEqual(self.statuses(1), ['not_revoked'])
+
+    def test_crls_without_numbers(self):
+        first = self.write('1.crl', _crl([_entry(1)]))
+        second = self.write('2.crl', _crl([_entry(2)], this_update=THIS_UPDATE + timedelta(hours=1)))
+        self.assertEqual(self.update(first), {'complete': 1})
+        self.assertEqual(self.update(second), {'complete': 1})
+        self.assertEqual(self.statuses(1, 2), ['not_revoked', 'revoked'])
+        self.assertEqual(self.update(self.write('3.crl', _crl([_entry(1)]))), {'older': 1})
+
+    def test_delta_crls(self):
+        base = self.write('base.crl', _crl([_entry(1), _entry(2, 'certificate_hold')], 10))
+        delta = self.write('delta11.crl', _crl([_entry(2, 'remove_from_crl'), _entry(3, 'superseded')], 11, 10,
+                                               THIS_UPDATE + timedelta(hours=6)))
+        self.assertEqual(self.update(delta, base), {'complete': 1, 'delta': 1})
+
+        statuses = self.lookup(1, 2, 3, 4)
+        self.assertEqual([status.status for status in statuses], ['revoked', 'not_revoked', 'revoked', 'not_revoked'])
+        self.assertEqual(statuses[2].reason, 'superseded')
+        # the base entries are current as of the delta
+        self.assertEqual({status.this_update for status in statuses}, {'2026-10-01T06:00:00Z'})
+
+        # delta CRLs are cumulative, the newer one replaces the older
+        delta = self.write('delta12.crl', _crl([_entry(4)], 12, 10, THIS_UPDATE + timedelta(hours=12)))
+        self.assertEqual(self.update(delta), {'delta': 1})
+        self.assertEqual(self.statuses(1, 2, 3, 4), ['revoked', 'revoked', 'not_revoked', 'revoked'])
+
+        self.assertEqual(self.update(self.write('delta11b.crl', _crl([], 11, 10))), {'older': 1})
+
+        # a new complete CRL drops the delta
+        self.assertEqual(self.update(self.write('base13.crl', _crl([_entry(1)], 13))), {'complete': 1})
+        self.assertEqual(self.statuses(1, 2, 4), ['revoked', 'not_revoked', 'not_revoked'])
+        with RevocationIndex(self.index_path) as index:
+            self.assertEqual([(scope['crl_number'], scope['delta']) for scope in index.scopes], [(13, None)])
+
+    def test_unusable_delta_crls(self):
+        self.update(self.write('base.crl', _crl([_entry(1)], 10)))
+
+        self.assertEqual(self.update(self.write('newer_base.crl', _crl([_entry(2)], 12, 11)),
+                                     self.write('no_number.crl', _crl([_entry(2)], None, 10)),
+                                     self.write('not_newer.crl', _crl([_entry(2)], 10, 10))),
+                         {'without base': 1, 'failed': 1, 'older': 1})
+        self.assertEqual(self.statuses(1, 2), ['revoked', 'not_revoked'])
+
+        # without any complete CRL
+        os.remove(self.index_path)
+        self.assertEqual(self.update(self.write('delta.crl', _crl([_entry(2)], 11, 10))), {'without base': 1})
+        self.assertEqual(self.statuses(2), ['unknown'])
+
+    def test_indirect_crl(self):
+        path = self.write('indirect.crl', _crl([_entry(1), _entry(2, certificate_issuer=OTHER_ISSUER), _entry(3)], 1,
+                                               idp={'indirect_crl': True}))
+        self.update(path)
+
+        # entries after a certificateIssuer belong to that issuer
+        other_issuer = get_dn_key(OTHER_ISSUER).digest
+        self.assertEqual(self.statuses(1, 2, 3), ['revoked', 'not_revoked', 'not_revoked'])
+        self.assertEqual(self.statuses(1, 2, 3, issuer=other_issuer), ['not_revoked', 'revoked', 'revoked'])
+
+        # a delta CRL for one of the issuers updates both scopes
+        delta = self.write('delta.crl', _crl([_entry(4)], 2, 1, idp={'indirect_crl': True}))
+        self.assertEqual(self.update(delta), {'delta': 1})
+        self.assertEqual(self.statuses(1, 4), ['revoked', 'revoked'])
+        self.assertEqual(self.statuses(2, 4, issuer=other_issuer), ['revoked', 'not_revoked'])
+
+    def test_scopes_are_kept(self):
+        self.update(self.write('root.crl', _crl([_entry(1)], 1)))
+        self.update(self.write('other.crl', _crl([_entry(2)], 1, issuer=OTHER_ISSUER)))
+        self.update(self.write('partition.crl', _crl([_entry(3)], 1, idp={'only_contains_ca_certs': True})))
+
+        # one issuer with two CRLs
+        self.assertEqual(self.statuses(1, 2, 3), ['revoked', 'not_revoked', 'revoked'])
+        self.assertEqual(self.statuses(1, 2, issuer=get_dn_key(OTHER_ISSUER).digest), ['not_revoked', 'revoked'])
+
+    def test_get_status(self):
+        with open(os.path.join(_chain_dir, 'leaf_example.pem'), 'rb') as f:
+            cert = x509.Certificate.load(pem.unarmor(f.read())[2])
+        self.update(self.write('intermediate.crl', _crl([_entry(cert.serial_number)], 1, issuer=cert.issuer)))
+
+        with RevocationIndex(self.index_path) as index:
+            self.assertEqual(index.get_status(cert).status, 'revoked')
+            self.assertEqual(index.get_status(cert['tbs_certificate']).status, 'revoked')
+
+    def test_bad_crl_files(self):
+        garbage = os.path.join(self.directory, 'garbage.crl')
+        with open(garbage, 'wb') as f:
+            f.write(b'not a CRL')
+        der = _crl([_entry(1)] * 3, 1).dump()
+        bad_entry = os.path.join(self.directory, 'bad_entry.crl')
+        with open(bad_entry, 'wb') as f:
+            entry = crl.RevokedCertificate(_entry(1)).dump()
+            f.write(der.replace(entry, b'\x31' + entry[1:], 1))
+
+        self.assertEqual(self.update(garbage, bad_entry, os.path.join(self.directory, 'missing.crl')), {'failed': 3})
+        self.assertIn('{}: {} at offset {}: Expected a SEQUENCE, found tag 0x31'.format(bad_entry, bad_entry,
+                                                                                        der.index(entry)),
+                      self.messages)
+        self.assertEqual(self.statuses(1), ['unknown'])
+
+    def test_bad_index_files(self):
+        for data, message in ((b'', 'is empty'), (b'CPCTRIDX', 'is not a version 1 revocation index'),
+                              (b'CPCTRIDX\x00\x00\x00\x02' + bytes(16), 'is not a version 1 revocation index')):
+            with self.subTest(data=data):
+                with open(self.index_path, 'wb') as f:
+                    f.write(data)
+                with self.assertRaisesRegex(RevocationIndexError, message):
+                    RevocationIndex(self.index_path)
+
+        os.remove(self.index_path)
+        self.update(self.write('base.crl', _crl([_entry(1)], 1)))
+        with open(self.index_path, 'rb+') as f:
+            f.truncate(os.path.getsize(self.index_path) - 1)
+        with self.assertRaisesRegex(RevocationIndexError, 'is truncated'):
+            RevocationIndex(self.index_path)
@@ -0,0 +1,99 @@
+from django.test import RequestFactory, SimpleTestCase
+from profiles import scheduler
+from profiles.scheduler import BACKGROUND, BATCH, INTERACTIVE, LintScheduler, Overloaded, TokenBuckets, \
+    get_client_key
+from unittest import mock
+import threading
+
+
+class LintSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.scheduler = LintScheduler(1, {INTERACTIVE: 2, BATCH: 2, BACKGROUND: 1}, 'test-scheduler')
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.started = threading.Event()
+
+        def block():
+            self.started.set()
+            self.release.wait(10)
+
+        # holds the only thread so the jobs submitted next wait in the queue
+        self.blocking = self.scheduler.submit(INTERACTIVE, block)
+        self.assertTrue(self.started.wait(10))
+
+    def test_priorities(self):
+        order = []
+        futures = [self.scheduler.submit(priority, order.append, name)
+                   for priority, name in ((BACKGROUND, 'background'), (BATCH, 'batch 1'), (INTERACTIVE, 'upload 1'),
+                                          (BATCH, 'batch 2'), (INTERACTIVE, 'upload 2'))]
+        self.release.set()
+        for future in futures:
+            future.result(10)
+
+        self.assertEqual(order, ['upload 1', 'upload 2', 'batch 1', 'batch 2', 'background'])
+
+    def test_queue_limits(self):
+        self.scheduler.submit(BACKGROUND, int)
+        with self.assertRaises(Overloaded) as context:
+            self.scheduler.submit(BACKGROUND, int)
+        # the one waiting job at an average of a second
+        self.assertEqual(context.exception.retry_after, 1)
+
+        # the other priorities have their own queues
+        self.scheduler.submit(INTERACTIVE, int)
+        self.scheduler.submit(INTERACTIVE, int)
+        with self.assertRaises(Overloaded) as context:
+            self.scheduler.submit(INTERACTIVE, int)
+        self.assertEqual(context.exception.retry_after, 2)
+        self.assertEqual(str(context.exception), "Too many certificates are waiting to be linted")
+
+    def test_results(self):
+        cancelled = self.scheduler.submit(INTERACTIVE, self.fail, 'cancelled jobs are not run')
+        self.assertTrue(cancelled.cancel())
+        failing = self.scheduler.submit(INTERACTIVE, int, 'x')
+        self.release.set()
+
+        with self.assertRaises(ValueError):
+            failing.result(10)
+        self.assertEqual(self.scheduler.submit(BATCH, int, '7').result(10), 7)
+        self.assertIsNone(self.blocking.result(10))
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_take(self):
+        buckets = TokenBuckets(rate=2, burst=4)
+        with mock.patch.object(scheduler.time, 'monotonic', return_value=100.0) as monotonic:
+            self.assertEqual(buckets.take('a', 3), 0)
+            self.assertEqual(buckets.take('a', 2), 0.5)
+            self.assertEqual(buckets.take('b', 4), 0)
+
+            # a second later two more tokens are back, but never more than burst
+            monotonic.return_value = 101.0
+            self.assertEqual(buckets.take('a', 3), 0)
+            monotonic.return_value = 1000.0
+            self.assertEqual(buckets.take('a', 5), 0.5)
+            self.assertEqual(buckets.take('a', 4), 0)
+
+    def test_prune(self):
+        buckets = TokenBuckets(rate=1, burst=1)
+        with mock.patch.object(scheduler.time, 'monotonic', return_value=0.0) as monotonic:
+            for i in range(10001):
+                buckets.take(i)
+            monotonic.return_value = 0.5
+            buckets.take('last')
+            # none has refilled yet
+            self.assertEqual(len(buckets._buckets), 10002)
+
+            monotonic.return_value = 2.0
+            buckets.take('after')
+            self.assertEqual(list(buckets._buckets), ['after'])
+
+
+class ClientKeyTests(SimpleTestCase):
+    def test_client_key(self):
+        factory = RequestFactory()
+        self.assertEqual(get_client_key(factory.get('/', REMOTE_ADDR='192.0.2.1')), '192.0.2.1')
+        # only the entry the router added can be trusted
+        self.assertEqual(get_client_key(factory.get('/', REMOTE_ADDR='10.0.0.1',
+                                                    HTTP_X_FORWARDED_FOR='203.0.113.9, 198.51.100.2 ')),
+                         '198.51.100.2')
@@ -0,0 +1,133 @@
+from asn1crypto import pem, x509
+from django.test import SimpleTestCase
+from fpkilint import sct
+from fpkilint.profile_conformance import OutputRow, _lint_sct_list
+from fpkilint.sct import SCTError, decode_sct, decode_sct_list, decode_sct_list_extension, get_timestamp_datetime, \
+    sct_list_oid
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+import base64
+import os
+import struct
+
+_chain_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'chain')
+
+LOG_1 = bytes(range(32))
+LOG_2 = bytes(range(32, 64))
+
+
+def _opaque(data):
+    return len(data).to_bytes(2, 'big') + data
+
+
+def _sct(log_id=LOG_1, timestamp=0, extensions=b'', hash_algorithm=4, signature_algorithm=3, signature=b'sig'):
+    return struct.pack('>B32sQ', 0, log_id, timestamp) + _opaque(extensions) + \
+        bytes([hash_algorithm, signature_algorithm]) + _opaque(signature)
+
+
+def _sct_list(*scts):
+    return _opaque(b''.join(_opaque(s) for s in scts))
+
+
+def _extension(data):
+    return x509.Extension({'extn_id': sct_list_oid, 'critical': False, 'extn_value': data})
+
+
+def _ms(when):
+    return int(when.timestamp() * 1000)
+
+
+class DecodeTests(SimpleTestCase):
+    def test_decode(self):
+        scts = decode_sct_list(_sct_list(_sct(timestamp=1500000000123, extensions=b'ext'),
+                                         _sct(LOG_2, hash_algorithm=2, signature_algorithm=1, signature=b'')))
+
+        self.assertEqual(scts, [
+            (0, base64.b64encode(LOG_1).decode('ascii'), 1500000000123, b'ext', 4, 3, b'sig'),
+            (0, base64.b64encode(LOG_2).decode('ascii'), 0, b'', 2, 1, b''),
+        ])
+        self.assertEqual(get_timestamp_datetime(1500000000123),
+                         datetime(2017, 7, 14, 2, 40, 0, 123000, tzinfo=timezone.utc))
+
+    def test_log_ids_are_interned(self):
+        first, second = decode_sct_list(_sct_list(_sct(), _sct()))
+        self.assertIs(first.log_id, second.log_id)
+
+        with mock.patch.object(sct, '_log_ids', {}), mock.patch.object(sct, '_max_log_ids', 1):
+            first, second, third = decode_sct_list(_sct_list(_sct(), _sct(LOG_2), _sct()))
+            self.assertEqual(len(sct._log_ids), 1)
+        self.assertEqual(first.log_id, third.log_id)
+
+    def test_later_versions(self):
+        self.assertEqual(decode_sct(b'\x01anything'), (1, None, None, None, None, None, None))
+
+    def test_truncated(self):
+        data = _sct(extensions=b'ext')
+        for length in range(len(data)):
+            with self.subTest(length=length):
+                with self.assertRaises(SCTError):
+                    decode_sct(data[:length])
+
+        sct_list = _sct_list(data)
+        for length in range(len(sct_list)):
+            with self.subTest(list_length=length):
+                with self.assertRaises(SCTError):
+                    decode_sct_list(sct_list[:length])
+
+    def test_trailing_data(self):
+        with self.assertRaisesRegex(SCTError, 'after the SCT signature'):
+            decode_sct(_sct() + b'\x00')
+        with self.assertRaisesRegex(SCTError, 'after the SCT list'):
+            decode_sct_list(_sct_list(_sct()) + b'\x00')
+
+    def test_extension(self):
+        self.assertEqual(len(decode_sct_list_extension(_extension(_sct_list(_sct(), _sct(LOG_2))))), 2)
+
+        # the extension value must be a DER OCTET STRING holding the list
+        oid = x509.ExtensionId(sct_list_oid).dump()
+        extension = x509.Extension.load(b'\x30' + bytes([len(oid) + 4]) + oid + b'\x04\x02\x30\x00')
+        with self.assertRaisesRegex(SCTError, 'not an OCTET STRING'):
+            decode_sct_list_extension(extension)
+
+
+class LintTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(os.path.join(_chain_dir, 'leaf_example.pem'), 'rb') as f:
+            cls.tbs = x509.Certificate.load(pem.unarmor(f.read())[2])['tbs_certificate']
+        cls.not_before = cls.tbs['validity']['not_before'].native
+        cls.not_after = cls.tbs['validity']['not_after'].native
+
+    def lint(self, data):
+        r = OutputRow()
+        decoded = _lint_sct_list(r, _extension(data), self.tbs)
+        return decoded, [(severity, message) for severity, message in r.findings]
+
+    def test_good(self):
+        decoded, findings = self.lint(_sct_list(_sct(timestamp=_ms(self.not_before)),
+                                                _sct(LOG_2, timestamp=_ms(self.not_before - timedelta(hours=1)),
+                                                     signature_algorithm=1)))
+        self.assertEqual((decoded, findings), (True, []))
+
+    def test_findings(self):
+        decoded, findings = self.lint(_sct_list(
+            _sct(timestamp=_ms(self.not_after + timedelta(seconds=1))),
+            _sct(timestamp=_ms(self.not_before - timedelta(days=2))),
+            _sct(LOG_2, timestamp=_ms(self.not_before + timedelta(days=3)), hash_algorithm=2),
+            b'\x01future version',
+        ))
+        self.assertTrue(decoded)
+        self.assertEqual(findings, [
+            ('FAIL', 'SCT 1 timestamp is after notAfter'),
+            ('WARN', 'SCT 2 is from a log that already provided an SCT'),
+            ('WARN', 'SCT 2 timestamp is 2 days, 0:00:00 before notBefore'),
+            ('WARN', 'SCT 3 is signed with ecdsa and sha1, RFC 6962 requires sha256 with rsa or ecdsa'),
+            ('WARN', 'notBefore is backdated 3 days, 0:00:00 before the SCT 3 timestamp'),
+            ('WARN', "SCT 4 is not a version 1 SCT and can't be checked"),
+        ])
+
+    def test_bad_lists(self):
+        self.assertEqual(self.lint(_opaque(b'')), (True, [('FAIL', 'The SCT list is empty')]))
+        self.assertEqual(self.lint(_sct_list(_sct())[:-1]),
+                         (False, [('FAIL', 'Could not decode the SCT list: Truncated SCT list')]))
@@ -0,0 +1,247 @@
+from asn1crypto import algos, core, keys
+from django.test import SimpleTestCase
+from fpkilint.signatures import SignatureError, verify_signature
+import os
+
+_vectors_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'signatures')
+
+_curve_names = {'P-256': 'secp256r1', 'P-384': 'secp384r1', 'P-521': 'secp521r1'}
+_curve_sizes = {'secp256r1': 32, 'secp384r1': 48, 'secp521r1': 66}
+
+_p256_p = 0xffffffff00000001000000000000000000000000ffffffffffffffffffffffff
+_p256_n = 0xffffffff00000000ffffffffffffffffbce6faada7179e84f3b9cac2fc632551
+_p256_b = 0x5ac635d8aa3a93e7b3ebbd55769886bc651d06b0cc53b0f63bce3c3e27d2604b
+
+
+def _read_rsp(file_name):
+    """
+    :return: list of (section, fields) for each vector in a NIST CAVP .rsp file; fields shared by the
+    vectors of a section, e.g. the RSA modulus n, are included
+    """
+    with open(os.path.join(_vectors_dir, file_name)) as f:
+        paragraphs = f.read().split('\n\n')
+
+    vectors = []
+    section = None
+    shared = {}
+    for paragraph in paragraphs:
+        lines = [line.strip() for line in paragraph.splitlines() if line.strip() and not line.startswith('#')]
+        if not lines:
+            continue
+        if lines[0].startswith('['):
+            section = lines[0].strip('[]')
+            shared = {}
+            continue
+
+        fields = dict((key.strip(), value.strip()) for key, value in (line.split('=', 1) for line in lines))
+        if 'Result' in fields:
+            vectors.append((section, dict(shared, **fields)))
+        else:
+            shared.update(fields)
+
+    return vectors
+
+
+def _ec_key(curve, x, y):
+    size = _curve_sizes[curve]
+    return _ec_key_from_point(curve, b'\x04' + x.to_bytes(size, 'big') + y.to_bytes(size, 'big'))
+
+
+def _ec_key_from_point(curve, point):
+    return keys.PublicKeyInfo({
+        'algorithm': {'algorithm': 'ec', 'parameters': keys.ECDomainParameters(name='named', value=curve)},
+        'public_key': point,
+    })
+
+
+def _rsa_key(n, e):
+    return keys.PublicKeyInfo({
+        'algorithm': {'algorithm': 'rsa', 'parameters': core.Null()},
+        'public_key': keys.RSAPublicKey({'modulus': n, 'public_exponent': e}),
+    })
+
+
+def _ecdsa_signature(r, s):
+    return algos.DSASignature({'r': r, 's': s}).dump()
+
+
+def _pss_algorithm(hash_name, salt_length):
+    return algos.SignedDigestAlgorithm({
+        'algorithm': 'rsassa_pss',
+        'parameters': {
+            'hash_algorithm': {'algorithm': hash_name},
+            'mask_gen_algorithm': {'algorithm': 'mgf1', 'parameters': {'algorithm': hash_name}},
+            'salt_length': salt_length,
+        },
+    })
+
+
+class ECDSAVectorTests(SimpleTestCase):
+    vectors = _read_rsp('ecdsa_sigver.rsp')
+
+    def test_vectors(self):
+        self.assertEqual(len(self.vectors), 105)
+
+        for section, fields in self.vectors:
+            curve_name, hash_name = section.split(',')
+            curve = _curve_names[curve_name]
+            hash_name = hash_name.replace('-', '').lower()
+            with self.subTest(section=section, msg=fields['Msg'][:16], result=fields['Result']):
+                public_key_info = _ec_key(curve, int(fields['Qx'], 16), int(fields['Qy'], 16))
+                signature = _ecdsa_signature(int(fields['R'], 16), int(fields['S'], 16))
+                algorithm = algos.SignedDigestAlgorithm({'algorithm': hash_name + '_ecdsa'})
+                self.assertEqual(verify_signature(public_key_info, algorithm, bytes.fromhex(fields['Msg']), signature),
+                                 fields['Result'].startswith('P'))
+
+
+class ECDSAEdgeCaseTests(SimpleTestCase):
+    algorithm = algos.SignedDigestAlgorithm({'algorithm': 'sha256_ecdsa'})
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        section, fields = next((section, fields) for section, fields in _read_rsp('ecdsa_sigver.rsp')
+                               if section == 'P-256,SHA-256' and fields['Result'].startswith('P'))
+        cls.x = int(fields['Qx'], 16)
+        cls.y = int(fields['Qy'], 16)
+        cls.r = int(fields['R'], 16)
+        cls.s = int(fields['S'], 16)
+        cls.message = bytes.fromhex(fields['Msg'])
+
+    def verify(self, public_key_info, signature):
+        return verify_signature(public_key_info, self.algorithm, self.message, signature)
+
+    def test_valid(self):
+        self.assertTrue(self.verify(_ec_key('secp256r1', self.x, self.y), _ecdsa_signature(self.r, self.s)))
+
+    def test_compressed_point(self):
+        point = bytes([2 + (self.y & 1)]) + self.x.to_bytes(32, 'big')
+        self.assertTrue(self.verify(_ec_key_from_point('secp256r1', point), _ecdsa_signature(self.r, self.s)))
+
+        # the other y is the negated point, a different key
+        point = bytes([3 - (self.y & 1)]) + self.x.to_bytes(32, 'big')
+        self.assertFalse(self.verify(_ec_key_from_point('secp256r1', point), _ecdsa_signature(self.r, self.s)))
+
+    def test_point_not_on_curve(self):
+        with self.assertRaisesRegex(SignatureError, 'not on the curve'):
+            self.verify(_ec_key('secp256r1', self.x, self.y + 1), _ecdsa_signature(self.r, self.s))
+
+    def test_point_coordinate_not_reduced(self):
+        # (x, y) is on the curve, (x + p, y) is the same point mod p but not a valid encoding
+        x = next(x for x in range(1, 1000)
+                 if pow((x * x * x - 3 * x + _p256_b) % _p256_p, (_p256_p - 1) // 2, _p256_p) == 1)
+        y = pow((x * x * x - 3 * x + _p256_b) % _p256_p, (_p256_p + 1) // 4, _p256_p)
+        with self.assertRaisesRegex(SignatureError, 'not on the curve'):
+            self.verify(_ec_key('secp256r1', x + _p256_p, y), _ecdsa_signature(self.r, self.s))
+
+        # and (x, y) itself decodes; the signature is for another key
+        self.assertFalse(self.verify(_ec_key('secp256r1', x, y), _ecdsa_signature(self.r, self.s)))
+
+    def test_compressed_point_without_y(self):
+        # an x for which x^3 - 3x + b has no square root
+        x = next(x for x in range(1, 1000)
+                 if pow((x * x * x - 3 * x + _p256_b) % _p256_p, (_p256_p - 1) // 2, _p256_p) != 1)
+        point = b'\x02' + x.to_bytes(32, 'big')
+        with self.assertRaisesRegex(SignatureError, 'not on the curve'):
+            self.verify(_ec_key_from_point('secp256r1', point), _ecdsa_signature(self.r, self.s))
+
+    def test_bad_point_encoding(self):
+        for point in (b'', b'\x00', b'\x04' + self.x.to_bytes(32, 'big'),
+                      b'\x05' + self.x.to_bytes(32, 'big') + self.y.to_bytes(32, 'big'),
+                      b'\x04' + self.x.to_bytes(32, 'big') + self.y.to_bytes(33, 'big')):
+            with self.subTest(point=point.hex()[:8]):
+                with self.assertRaisesRegex(SignatureError, 'Bad P-256 public key point'):
+                    self.verify(_ec_key_from_point('secp256r1', point), _ecdsa_signature(self.r, self.s))
+
+    def test_unsupported_curve(self):
+        with self.assertRaisesRegex(SignatureError, 'Unsupported curve'):
+            self.verify(_ec_key_from_point('secp224r1', b'\x04' + b'\x01' * 56), _ecdsa_signature(self.r, self.s))
+
+    def test_signature_values_out_of_range(self):
+        public_key_info = _ec_key('secp256r1', self.x, self.y)
+        for r, s in ((0, self.s), (self.r, 0), (_p256_n, self.s), (self.r, _p256_n), (self.r + _p256_n, self.s),
+                     (-self.r, self.s)):
+            with self.subTest(r=r, s=s):
+                self.assertFalse(self.verify(public_key_info, _ecdsa_signature(r, s)))
+
+    def test_malformed_signature(self):
+        public_key_info = _ec_key('secp256r1', self.x, self.y)
+        signature = _ecdsa_signature(self.r, self.s)
+        for bad in (b'', signature[:-1], signature + b'\x00', b'\x31' + signature[1:]):
+            with self.subTest(signature=bad.hex()[:8]):
+                self.assertFalse(self.verify(public_key_info, bad))
+
+    def test_wrong_algorithm(self):
+        with self.assertRaisesRegex(SignatureError, 'with an EC key'):
+            verify_signature(_ec_key('secp256r1', self.x, self.y), algos.SignedDigestAlgorithm({'algorithm': 'sha256_rsa'}),
+                             self.message, _ecdsa_signature(self.r, self.s))
+
+
+class RSAVectorTests(SimpleTestCase):
+    def test_pkcs1v15_vectors(self):
+        vectors = _read_rsp('rsa_pkcs1v15_sigver.rsp')
+        self.assertEqual(len(vectors), 54)
+
+        for section, fields in vectors:
+            hash_name = fields['SHAAlg'].lower()
+            with self.subTest(section=section, msg=fields['Msg'][:16], result=fields['Result']):
+                public_key_info = _rsa_key(int(fields['n'], 16), int(fields['e'], 16))
+                algorithm = algos.SignedDigestAlgorithm({'algorithm': hash_name + '_rsa'})
+                self.assertEqual(verify_signature(public_key_info, algorithm, bytes.fromhex(fields['Msg']),
+                                                  bytes.fromhex(fields['S'])),
+                                 fields['Result'].startswith('P'))
+
+    def test_pss_vectors(self):
+        vectors = _read_rsp('rsa_pss_sigver.rsp')
+        self.assertEqual(len(vectors), 54)
+
+        for section, fields in vectors:
+            hash_name = fields['SHAAlg'].lower()
+            with self.subTest(section=section, msg=fields['Msg'][:16], result=fields['Result']):
+                public_key_info = _rsa_key(int(fields['n'], 16), int(fields['e'], 16))
+                algorithm = _pss_algorithm(hash_name, len(bytes.fromhex(fields['SaltVal'])))
+                self.assertEqual(verify_signature(public_key_info, algorithm, bytes.fromhex(fields['Msg']),
+                                                  bytes.fromhex(fields['S'])),
+                                 fields['Result'].startswith('P'))
+
+
+class RSAEdgeCaseTests(SimpleTestCase):
+    algorithm = algos.SignedDigestAlgorithm({'algorithm': 'sha256_rsa'})
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        section, fields = next((section, fields) for section, fields in _read_rsp('rsa_pkcs1v15_sigver.rsp')
+                               if fields['SHAAlg'] == 'SHA256' and fields['Result'].startswith('P'))
+        cls.n = int(fields['n'], 16)
+        cls.public_key_info = _rsa_key(cls.n, int(fields['e'], 16))
+        cls.message = bytes.fromhex(fields['Msg'])
+        cls.signature = bytes.fromhex(fields['S'])
+
+    def verify(self, signature, algorithm=None):
+        return verify_signature(self.public_key_info, algorithm or self.algorithm, self.message, signature)
+
+    def test_valid(self):
+        self.assertTrue(self.verify(self.signature))
+
+    def test_signature_length(self):
+        self.assertFalse(self.verify(self.signature[1:]))
+        self.assertFalse(self.verify(b'\x00' + self.signature))
+
+    def test_signature_not_below_modulus(self):
+        self.assertFalse(self.verify(self.n.to_bytes(len(self.signature), 'big')))
+        self.assertFalse(self.verify(b'\xff' * len(self.signature)))
+
+    def test_other_hash(self):
+        self.assertFalse(self.verify(self.signature, algos.SignedDigestAlgorithm({'algorithm': 'sha384_rsa'})))
+
+    def test_unsupported_hash(self):
+        with self.assertRaisesRegex(SignatureError, 'Unsupported hash algorithm md5'):
+            self.verify(self.signature, algos.SignedDigestAlgorithm({'algorithm': 'md5_rsa'}))
+
+    def test_pss_signature_with_pkcs1v15_padding(self):
+        self.assertFalse(self.verify(self.signature, _pss_algorithm('sha256', 32)))
+
+    def test_wrong_algorithm(self):
+        with self.assertRaisesRegex(SignatureError, 'with an RSA key'):
+            self.verify(self.signature, algos.SignedDigestAlgorithm({'algorithm': 'sha256_ecdsa'}))
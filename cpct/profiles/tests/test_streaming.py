@@ -0,0 +1,134 @@
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from fpkilint.worker_pool import LintWorkerPool
+from profiles import executor
+from profiles.result_cache import get_cached_result, get_sha256
+from profiles.scheduler import BACKGROUND, BATCH, INTERACTIVE, LintScheduler, TokenBuckets
+from profiles.streaming import StreamingASGIHandler
+from unittest import mock
+import os
+
+_certs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'certs')
+
+_template = 'fbca/1.9/5-ee-signature.json'
+# profile, version and cert type of _template in profiles.json
+_form = {'profile': '1', 'version': '0', 'type': '3'}
+
+_locmem_caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                              'LOCATION': 'test-streaming'}}
+
+_csrf_token = 'a' * 64
+
+
+class _ClientGone(Exception):
+    pass
+
+
+def _scope(body_length):
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST', 'scheme': 'http',
+        'path': '/file/', 'raw_path': b'/file/', 'query_string': b'', 'root_path': '',
+        'client': ('192.0.2.1', 50000), 'server': ('testserver', 80),
+        'headers': [(b'host', b'testserver'), (b'content-type', MULTIPART_CONTENT.encode('ascii')),
+                    (b'content-length', str(body_length).encode('ascii')),
+                    (b'cookie', 'csrftoken={}'.format(_csrf_token).encode('ascii'))],
+    }
+
+
+@override_settings(CACHES=_locmem_caches)
+class StreamedUploadTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(os.path.join(_certs_dir, 'parse_cert_binary.cer'), 'rb') as f:
+            cls.der = f.read()
+        cls.pool = LintWorkerPool(1, 30, 100)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        for name, value in (('_lint_pool', self.pool), ('_client_buckets', TokenBuckets(100, 100))):
+            patcher = mock.patch.object(executor, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # the handler loads the middleware, so it sees the test settings
+        self.application = StreamingASGIHandler()
+
+    def upload(self, stop_after=None):
+        """
+        Posts the certificate to the ASGI application, the way the upload page does.
+        :param stop_after: the client goes away after this many body messages
+        :return: the messages sent
+        """
+        body = encode_multipart(BOUNDARY, dict(_form, stream='1', csrfmiddlewaretoken=_csrf_token,
+                                               file=SimpleUploadedFile('cert.cer', self.der)))
+        messages = []
+        requests = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if stop_after is not None and len(messages) > stop_after:
+                raise _ClientGone()
+            messages.append(message)
+
+        if stop_after is None:
+            with self.assertLogs('cpct.timing'):
+                async_to_sync(self.application)(_scope(len(body)), receive, send)
+        else:
+            with self.assertRaises(_ClientGone):
+                async_to_sync(self.application)(_scope(len(body)), receive, send)
+
+        return messages
+
+    def test_streamed_rows(self):
+        header, rows = self.pool.lint(self.der, _template)
+        messages = self.upload()
+
+        start = messages[0]
+        self.assertEqual((start['type'], start['status']), ('http.response.start', 200))
+        headers = dict(start['headers'])
+        self.assertEqual(headers[b'X-Accel-Buffering'], b'no')
+        self.assertIn(b'total;dur=', headers[b'Server-Timing'])
+        self.assertNotIn(b'Content-Encoding', headers)
+
+        # the result header, one message per row, then the footer
+        bodies = [message['body'] for message in messages[1:-1]]
+        self.assertTrue(all(message['more_body'] for message in messages[1:-1]))
+        self.assertEqual(messages[-1], {'type': 'http.response.body'})
+        self.assertEqual(len(bodies), len(rows) + 2)
+        self.assertIn(b'id="result-table"', bodies[0])
+        for row, body in zip(rows, bodies[1:-1]):
+            self.assertIn(row['name'].encode('utf-8'), body)
+        self.assertIn(b'shortName', bodies[-1])
+
+        # and the whole result is stored once the last row is sent
+        result = get_cached_result(get_sha256(self.der), _template)
+        self.assertEqual(result['rows'], rows)
+
+    def test_client_gone(self):
+        messages = self.upload(stop_after=2)
+        self.assertEqual(len(messages), 3)
+
+        # the lint job is stopped mid stream, the next upload still gets every row
+        self.assertEqual(self.upload()[-1], {'type': 'http.response.body'})
+
+    def test_overloaded(self):
+        # no room in any queue
+        scheduler = LintScheduler(1, {INTERACTIVE: 0, BATCH: 0, BACKGROUND: 0}, 'test-streaming')
+        with mock.patch.object(executor, '_scheduler', scheduler):
+            messages = self.upload()
+
+        self.assertEqual(messages[0]['status'], 503)
+        self.assertEqual(dict(messages[0]['headers'])[b'Retry-After'], b'1')
+        self.assertIn(b'Too many certificates are waiting to be linted',
+                      b''.join(message.get('body', b'') for message in messages[1:]))
@@ -0,0 +1,73 @@
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from profiles.middleware import gzip_result
+from profiles.result_cache import get_fragment, get_result_id, store_fragment, store_result
+import gzip
+
+SHA256 = '0' * 64
+TEMPLATE = 'fbca/1.9/5-ee-signature.json'
+
+_locmem_caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-views'}}
+
+
+class GzipResultTests(SimpleTestCase):
+    def call(self, response):
+        async def view(request):
+            return response
+
+        request = RequestFactory().get('/fragment/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        return async_to_sync(gzip_result(view))(request)
+
+    def test_compressed(self):
+        content = b'<tr><td>row</td></tr>' * 100
+        response = self.call(HttpResponse(content))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), content)
+
+    def test_streamed_results_are_not_compressed(self):
+        response = self.call(StreamingHttpResponse(iter([b'<table>' * 100, b'</table>'])))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), b'<table>' * 100 + b'</table>')
+
+
+@override_settings(CACHES=_locmem_caches)
+class FragmentTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.result_id = get_result_id(SHA256, TEMPLATE)
+
+    def test_fragment_while_streaming(self):
+        self.assertIsNone(get_fragment(self.result_id, 'extensions.1'))
+        store_fragment(self.result_id, 'extensions.1', '<pre>streaming</pre>')
+        self.assertEqual(get_fragment(self.result_id, 'extensions.1'), '<pre>streaming</pre>')
+
+        # once the result is stored it is the one used
+        store_result(SHA256, TEMPLATE, {'rows': [{'key': 'extensions.1', 'content': '<pre>stored</pre>'}]})
+        self.assertEqual(get_fragment(self.result_id, 'extensions.1'), '<pre>stored</pre>')
+        self.assertIsNone(get_fragment(self.result_id, 'extensions.2'))
+
+        self.assertIsNone(get_fragment('not a result id', 'extensions.1'))
+
+    def test_fragment_view(self):
+        content = '<pre>{}</pre>'.format('30 82 01 0a ' * 200)
+        store_fragment(self.result_id, 'subject_public_key', content)
+
+        response = self.client.get('/fragment/{}/subject_public_key/'.format(self.result_id),
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content).decode(), content)
+
+        response = self.client.get('/fragment/{}/other/'.format(self.result_id))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn(b'Result has expired', response.content)
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_upload_page_is_not_compressed(self):
+        # it carries the CSRF token
+        response = self.client.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn(b'csrfmiddlewaretoken', response.content)
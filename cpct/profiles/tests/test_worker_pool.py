@@ -0,0 +1,109 @@
+from django.test import SimpleTestCase
+from fpkilint.timing import PhaseTimer, use_timer
+from fpkilint.worker_pool import LintParseError, LintTimeout, LintWorkerError, LintWorkerPool
+import os
+
+_certs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testdata', 'certs')
+
+_template = 'fbca/1.9/5-ee-signature.json'
+
+
+class LintWorkerPoolTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(os.path.join(_certs_dir, 'parse_cert_binary.cer'), 'rb') as f:
+            cls.der = f.read()
+
+    def pool(self, timeout=30, max_jobs=100):
+        pool = LintWorkerPool(1, timeout, max_jobs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def pids(self, pool):
+        return {worker.process.pid for worker in pool._workers}
+
+    def assertLints(self, pool):
+        header, rows = pool.lint(self.der, _template)
+        self.assertEqual(header['type'], 'FBCA End Entity Signature')
+        self.assertTrue(rows)
+        return rows
+
+    def test_lint(self):
+        pool = self.pool()
+        timer = PhaseTimer()
+        with use_timer(timer):
+            rows = self.assertLints(pool)
+
+        self.assertEqual(rows, self.assertLints(pool))
+        # the worker side phases are merged into the caller's timer
+        self.assertIn('parse', timer.as_dict())
+        self.assertEqual([worker.jobs for worker in pool._workers], [2])
+
+    def test_timeout(self):
+        pool = self.pool(timeout=0.0001)
+        pids = self.pids(pool)
+
+        with self.assertRaisesRegex(LintTimeout, 'longer than 0.0001 seconds'):
+            pool.lint(self.der, _template)
+
+        # the worker was killed and replaced, the pool still serves the next job
+        self.assertEqual(len(pool._workers), 1)
+        self.assertFalse(pids & self.pids(pool))
+        pool.timeout = 30
+        self.assertLints(pool)
+
+    def test_max_jobs(self):
+        pool = self.pool(max_jobs=1)
+        seen = set()
+        for i in range(3):
+            pids = self.pids(pool)
+            self.assertFalse(pids & seen)
+            seen |= pids
+            self.assertLints(pool)
+        self.assertEqual(len(seen), 3)
+
+    def test_parse_error(self):
+        pool = self.pool()
+        pids = self.pids(pool)
+
+        with self.assertRaises(LintParseError):
+            pool.lint(b'not a certificate', _template)
+
+        # the worker answered the job and is kept
+        self.assertEqual(self.pids(pool), pids)
+        self.assertLints(pool)
+
+    def test_lint_error(self):
+        pool = self.pool()
+        with self.assertRaisesRegex(LintWorkerError, 'FileNotFoundError'):
+            pool.lint(self.der, 'no/such/template.json')
+        self.assertLints(pool)
+
+    def test_stopped_early(self):
+        pool = self.pool()
+        pids = self.pids(pool)
+
+        results = pool.iter_lint(self.der, _template)
+        next(results)
+        results.close()
+
+        # mid job, the worker can't be reused
+        self.assertFalse(pids & self.pids(pool))
+        self.assertLints(pool)
+
+    def test_dead_worker(self):
+        pool = self.pool()
+        worker, = pool._workers
+        worker.process.kill()
+        worker.process.join()
+
+        self.assertLints(pool)
+        self.assertNotIn(worker, pool._workers)
+
+    def test_closed(self):
+        pool = self.pool()
+        pool.close()
+        self.assertEqual(pool._workers, set())
+        with self.assertRaisesRegex(LintWorkerError, 'closed'):
+            pool.lint(self.der, _template)
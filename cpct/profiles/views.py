@@ -1,63 +1,355 @@
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
 from fpkilint.html_output import *
 from django.http import HttpResponse, JsonResponse, HttpResponseRedirect
-from .forms import UploadFileForm
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from .forms import UploadFileForm, LookupForm
+from .result_cache import get_sha256, get_file_sha256, get_result_id, get_result, get_cached_result, store_result, store_fragment, \
+    get_fragment
+from .executor import offload, schedule_lint, schedule_stream, admit_client, get_lint_pool
+from .scheduler import INTERACTIVE, BATCH, Overloaded
+from .middleware import gzip_result
+from .streaming import AsyncStreamingHttpResponse
+from fpkilint.worker_pool import LintParseError, LintTimeout
+from fpkilint.cert_bundle import is_zip, iter_bundle_certificates
+from . import metrics
+import asyncio
+import itertools
 import json
 import os
 module_dir = os.path.dirname(__file__)  # get current directory
 
+_timeout_message = "<div class='callout callout-danger' style=border-radius:5px;>Linting this certificate took too long</div>"
+_overloaded_message = "<div class='callout callout-danger' style=border-radius:5px;>{} - please try again in {} seconds</div>"
+_expired_message = "<div class='callout callout-danger' style=border-radius:5px;>Result has expired</div>"
 
-def dashboard(request):
+_severity_order = {'FAIL': 0, 'WARN': 1, 'INFO': 2}
+_worst_finding_count = 3
+
+
+def _load_profiles():
     file_path = os.path.join(module_dir, 'profiles.json')
     with open(file_path) as f:
         profiles = f.read()
 
+    return profiles
+
+
+def _get_template(profiles, cleaned_data):
+    profile = int(cleaned_data['profile'])
+    type = int(cleaned_data['type'])
+    version = int(cleaned_data['version'])
+    data = json.loads(profiles)
+
+    return data['profiles'][profile]['versions'][version]['cert_types'][type]['template']
+
+
+def dashboard(request):
+    profiles = _load_profiles()
+
     form = UploadFileForm()
 
     return render(request, 'upload.html', {'form': form, 'profiles': profiles})
 
 
-def upload_file(request):
-    file_path = os.path.join(module_dir, 'profiles.json')
-    with open(file_path) as f:
-        profiles = f.read()
+@gzip_result
+async def lookup_result(request):
+    """
+    Hash-first upload. The upload page posts the SHA-256 of the file and the profile selection; if that
+    certificate was already linted against the same template the stored result is returned, otherwise
+    204 tells the page to upload the file.
+    """
+    if request.method != 'POST':
+        return HttpResponse("<div class='callout callout-danger' style=border-radius:5px;>Invalid Request (not POST)</div>")
+
+    form = LookupForm(request.POST)
+    if not form.is_valid():
+        return HttpResponse(status=204)
+
+    try:
+        template = _get_template(_load_profiles(), form.cleaned_data)
+    except:
+        return HttpResponse(status=204)
+
+    result = await offload(request, 'cache', get_cached_result, form.cleaned_data['sha256'].lower(), template)
+    metrics.record_cache_lookup(result is not None)
+    if result is None:
+        return HttpResponse(status=204)
+
+    return await offload(request, 'render', render, request, _get_result_template(result), result)
+
+
+def _get_result_template(result):
+    if 'certificates' in result:
+        return 'bundle_result.html'
+    return 'result.html'
+
+
+@gzip_result
+async def stored_result(request, result_id):
+    """
+    Returns a stored result page, the bundle summary links to each certificate's result this way.
+    """
+    result = await offload(request, 'cache', get_result, result_id)
+    if result is None:
+        return HttpResponse(_expired_message, status=404)
+
+    return await offload(request, 'render', render, request, _get_result_template(result), result)
+
+
+@gzip_result
+async def result_fragment(request, result_id, row_key):
+    """
+    Returns the full content of a row that the result page only showed a summary for.
+    """
+    content = await offload(request, 'cache', get_fragment, result_id, row_key)
+    if content is None:
+        return HttpResponse(_expired_message, status=404)
+
+    return HttpResponse(content)
+
+
+async def _stream_result(request, header, results, sha256, template):
+    # the header is flushed right away, then one table row per conformance check as it completes
+    result_id = get_result_id(sha256, template)
+    yield await offload(request, 'render', render_to_string, 'result_header.html', header)
+
+    rows = []
+    try:
+        async for row in results:
+            rows.append(row)
+            if row['summary'] is not None:
+                # the link to the full content works before the whole result is stored
+                await offload(request, 'cache', store_fragment, result_id, row['key'], row['content'])
+            yield await offload(request, 'render', render_to_string, 'result_row.html',
+                                {'r': row, 'result_id': result_id})
+    except LintTimeout:
+        metrics.record_outcome('timeout')
+        yield "</tbody></table>" + _timeout_message
+        return
+    except Exception:
+        metrics.record_outcome('unrecoverable_error')
+        yield "</tbody></table><div class='callout callout-danger' style=border-radius:5px;>Unrecoverable Error</div>"
+        return
+    finally:
+        await results.aclose()
+
+    metrics.record_outcome('ok')
+    metrics.record_findings(rows, template)
+
+    yield await offload(request, 'render', render_to_string, 'result_footer.html', header)
+
+    result = dict(header, rows=rows)
+    await offload(request, 'cache', store_result, sha256, template, result)
+
+
+def _overloaded_response(e):
+    response = HttpResponse(_overloaded_message.format(e, e.retry_after), status=503)
+    response['Retry-After'] = str(e.retry_after)
+    return response
+
+
+def _read_upload(file):
+    """
+    Reads the upload one chunk and one certificate at a time.
+    :return: (sha256 of the file, whether it is a zip, BundleEntry list); one more entry than
+    LINT_BUNDLE_MAX_CERTIFICATES at most, so the summary can say the bundle was cut short
+    """
+    sha256 = get_file_sha256(file)
+    zip_file = is_zip(file)
+    certificates = iter_bundle_certificates(file, file.name)
+
+    return sha256, zip_file, list(itertools.islice(certificates, settings.LINT_BUNDLE_MAX_CERTIFICATES + 1))
+
+
+def _summarize_certificate(name, short_name=None, rows=(), error=None):
+    counts = {'FAIL': 0, 'WARN': 0, 'INFO': 0}
+    findings = []
+    for row in rows:
+        for finding in row['findings']:
+            counts[finding['severity']] += 1
+            if finding['severity'] != 'INFO':
+                findings.append(finding)
+    findings.sort(key=lambda finding: _severity_order[finding['severity']])
+
+    if error is not None:
+        verdict = 'ERROR'
+    elif counts['FAIL']:
+        verdict = 'FAIL'
+    elif counts['WARN']:
+        verdict = 'WARN'
+    else:
+        verdict = 'PASS'
+
+    return {'name': name, 'short_name': short_name, 'verdict': verdict, 'counts': counts,
+            'worst_findings': findings[:_worst_finding_count], 'error': error, 'result_id': None}
+
+
+async def _lint_bundle_certificate(request, semaphore, name, cert_data, error, template):
+    """
+    :return: (result header or None, certificate summary for bundle_result.html)
+    """
+    if cert_data is None:
+        return None, _summarize_certificate(name, error=error)
+
+    async with semaphore:
+        try:
+            # bundles queue behind single uploads
+            header, rows = await schedule_lint(request, BATCH, 'lint', get_lint_pool().lint, cert_data, template,
+                                               cost=0)
+        except LintParseError:
+            metrics.record_outcome('parse_error')
+            return None, _summarize_certificate(name, error="Could not be parsed")
+        except LintTimeout:
+            metrics.record_outcome('timeout')
+            return None, _summarize_certificate(name, error="Linting took too long")
+        except Overloaded as e:
+            metrics.record_outcome('overloaded')
+            return None, _summarize_certificate(name, error=str(e))
+        except:
+            metrics.record_outcome('unrecoverable_error')
+            return None, _summarize_certificate(name, error="Unrecoverable Error")
+
+    metrics.record_outcome('ok')
+    metrics.record_findings(rows, template)
+
+    summary = _summarize_certificate(name, header['short_name'], rows)
+    result = await offload(request, 'cache', store_result, get_sha256(cert_data), template, dict(header, rows=rows))
+    summary['result_id'] = result['result_id']
+
+    return header, summary
+
+
+async def _upload_bundle(request, file_name, sha256, certificates, template):
+    """
+    Lints every certificate in a zip, pem bundle or .p7b across the lint workers and returns the summary
+    table, which links to each certificate's own result.
+    """
+    if not certificates:
+        metrics.record_outcome('parse_error')
+        return HttpResponse(
+            "<div class='callout callout-danger' style=border-radius:5px;>No certificates found in the file</div>")
+
+    truncated = len(certificates) > settings.LINT_BUNDLE_MAX_CERTIFICATES
+    certificates = certificates[:settings.LINT_BUNDLE_MAX_CERTIFICATES]
+
+    # a bundle empties the client's bucket, but even a full bucket's worth is always let in
+    try:
+        admit_client(request, min(len(certificates), settings.LINT_CLIENT_BURST))
+    except Overloaded as e:
+        metrics.record_outcome('overloaded')
+        return _overloaded_response(e)
+
+    # at most one lint job per worker from this upload at a time, so it doesn't fill the batch queue
+    semaphore = asyncio.Semaphore(settings.LINT_WORKERS)
+    results = await asyncio.gather(*[_lint_bundle_certificate(request, semaphore, name, cert_data, error, template)
+                                     for name, cert_data, error in certificates])
+
+    headers = [header for header, summary in results if header is not None]
+    summaries = [summary for header, summary in results]
+
+    # the profile description comes with each lint result, there is none when nothing could be linted
+    result = dict(headers[0] if headers else {})
+    result.update({
+        'short_name': file_name,
+        'certificates': summaries,
+        'truncated': truncated,
+        'counts': {verdict: sum(1 for summary in summaries if summary['verdict'] == verdict)
+                   for verdict in ('PASS', 'WARN', 'FAIL', 'ERROR')},
+    })
+    result = await offload(request, 'cache', store_result, sha256, template, result)
+
+    return await offload(request, 'render', render, request, 'bundle_result.html', result)
+
+
+@gzip_result
+async def upload_file(request):
+    profiles = _load_profiles()
 
     if request.method == 'POST':
         form = UploadFileForm(request.POST, request.FILES)
         if form.is_valid():
             file = request.FILES['file']
+
+            try:
+                template = _get_template(profiles, form.cleaned_data)
+            except:
+                metrics.record_outcome('invalid_template')
+                return HttpResponse("<div class='callout callout-danger' style=border-radius:5px;>Invalid Template</div>")
+
             try:
-                cert = parse_certificate(file.read())
+                sha256, zip_file, certificates = await offload(request, 'extract', _read_upload, file)
             except:
+                metrics.record_outcome('parse_error')
                 return HttpResponse(
                     "<div class='callout callout-danger' style=border-radius:5px;>File could not be parsed</div>")
 
-            profile = int(form.cleaned_data['profile'])
-            type = int(form.cleaned_data['type'])
-            version = int(form.cleaned_data['version'])
-            data = json.loads(profiles)
+            if zip_file or len(certificates) != 1:
+                return await _upload_bundle(request, file.name, sha256, certificates, template)
 
-            try:
-                template = data['profiles'][profile]['versions'][version]['cert_types'][type]['template']
-            except:
-                return HttpResponse("<div class='callout callout-danger' style=border-radius:5px;>Invalid Template</div>")
+            file_data = certificates[0].der
+            if file_data is None:
+                metrics.record_outcome('parse_error')
+                return HttpResponse(
+                    "<div class='callout callout-danger' style=border-radius:5px;>File could not be parsed</div>")
+
+            # parsing and linting run in a worker process (see fpkilint.worker_pool) so a pathological
+            # certificate is stopped after settings.LINT_TIMEOUT instead of hanging the request
+            lint_pool = get_lint_pool()
 
-            # rows, type, string, url, short_name = analyze_certificate(cert, template)
+            # the rows are streamed by cpct.asgi's StreamingASGIHandler; under WSGI (manage.py runserver)
+            # the whole result is returned at once
+            stream = form.cleaned_data['stream'] and isinstance(request, ASGIRequest)
 
             try:
-                rows, type, string, url, short_name = analyze_certificate(cert, template)
+                if stream:
+                    results = schedule_stream(request, INTERACTIVE, 'lint', lint_pool.iter_lint, file_data,
+                                              template)
+                    header = await results.__anext__()
+                else:
+                    header, rows = await schedule_lint(request, INTERACTIVE, 'lint', lint_pool.lint, file_data,
+                                                       template)
+            except Overloaded as e:
+                metrics.record_outcome('overloaded')
+                return _overloaded_response(e)
+            except LintParseError:
+                metrics.record_outcome('parse_error')
+                return HttpResponse(
+                    "<div class='callout callout-danger' style=border-radius:5px;>File could not be parsed</div>")
+            except LintTimeout:
+                metrics.record_outcome('timeout')
+                return HttpResponse(_timeout_message)
             except:
+                metrics.record_outcome('unrecoverable_error')
                 return HttpResponse(
                     "<div class='callout callout-danger' style=border-radius:5px;>Unrecoverable Error</div>")
 
-            return render(request, 'result.html', {'rows': rows, 'type': type, 'string': string, 'url': url,
-                                                   'short_name': short_name})
+            if stream:
+                response = AsyncStreamingHttpResponse(_stream_result(request, header, results, sha256, template))
+                response['X-Accel-Buffering'] = 'no'
+                return response
+
+            metrics.record_outcome('ok')
+            metrics.record_findings(rows, template)
+
+            result = dict(header, rows=rows)
+            result = await offload(request, 'cache', store_result, sha256, template, result)
+
+            return await offload(request, 'render', render, request, 'result.html', result)
         else:
+            metrics.record_outcome('invalid_form')
             return HttpResponse("<div class='callout callout-danger' style=border-radius:5px;>You must select a profile.</div>")
     else:
+        metrics.record_outcome('invalid_request')
         return HttpResponse("<div class='callout callout-danger' style=border-radius:5px;>Invalid Request (not POST)</div>")
 
 
+async def metrics_view(request):
+    body, content_type = await offload(request, None, metrics.get_metrics)
+    return HttpResponse(body, content_type=content_type)
+
+
 def help(request):
     return render(request, 'help.html')
 
@@ -0,0 +1,33 @@
+#!/bin/sh
+# Regenerates the chain test certificates. The keys are thrown away.
+set -e
+cd "$(dirname "$0")"
+keys=$(mktemp -d)
+trap 'rm -rf "$keys"' EXIT
+
+for k in old new intermediate sub_ca leaf; do
+    openssl ecparam -name prime256v1 -genkey -noout -out "$keys/$k.key"
+done
+
+issue() {
+    # issue <cert> <subject> <key> <issuer cert> <issuer key> <serial> <days> <extensions>
+    openssl req -new -key "$keys/$3.key" -subj "$2" -config ca.cnf -out "$keys/$1.csr"
+    openssl x509 -req -in "$keys/$1.csr" -CA "$4.pem" -CAkey "$keys/$5.key" -set_serial "$6" -days "$7" \
+        -extfile ca.cnf -extensions "$8" -out "$1.pem"
+}
+
+# the root and its key rollover: root_new is the new key self-signed, root_rollover the new key signed
+# with the old one
+openssl req -x509 -new -key "$keys/old.key" -subj "/C=US/O=Test/CN=Test Root" -days 7300 -set_serial 1 \
+    -extensions root -config ca.cnf -out root.pem
+openssl req -x509 -new -key "$keys/new.key" -subj "/C=US/O=Test/CN=Test Root" -days 7300 -set_serial 2 \
+    -extensions root -config ca.cnf -out root_new.pem
+issue root_rollover "/C=US/O=Test/CN=Test Root" new root old 3 7000 root
+issue leaf "/C=US/O=Test/CN=Rollover Leaf" leaf root_new new 4 3650 leaf
+
+# name constraints, policies and a path length constraint below the old root
+issue intermediate "/C=US/O=Test/CN=Test Intermediate" intermediate root old 5 7000 intermediate
+issue leaf_example "/C=US/O=Test/CN=www.example.com" leaf intermediate intermediate 6 3650 leaf_example
+issue leaf_excluded "/C=US/O=Test/CN=Excluded Leaf" leaf intermediate intermediate 7 3650 leaf_excluded
+issue sub_ca "/C=US/O=Test/CN=Test Sub CA" sub_ca intermediate intermediate 8 6000 sub_ca
+issue leaf_sub_ca "/C=US/O=Test/CN=Sub CA Leaf" leaf sub_ca sub_ca 9 3650 leaf_example